@@ -2,7 +2,13 @@ import os
 from flask import Flask
 from flask_babel import Babel
 from config import config
-from app.extensions import db, migrate, babel
+from app.extensions import db, migrate, babel, cache
+
+class TranslationTable(dict):
+    """Translations of one language, returning the text itself when it has none"""
+    
+    def __missing__(self, text):
+        return text
 
 def create_app(config_name=None):
     """Application factory"""
@@ -15,6 +21,13 @@ def create_app(config_name=None):
     # Initialize extensions
     db.init_app(app)
     migrate.init_app(app, db)
+    cache.init_app(app)
+    
+    # Request, SQL, OpenAI, Stripe and cache metrics on /metrics
+    from app import metrics, query_tracker
+    metrics.init_app(app)
+    # Repeated statements per request (N+1 queries), in development and tests
+    query_tracker.init_app(app)
     
     # Babel language selector function
     def get_locale():
@@ -152,32 +165,40 @@ def create_app(config_name=None):
         }
     }
     
-    # Custom translation function
-    def translate(text):
-        from flask import session
-        current_lang = session.get('language', 'uk')
-        if text in TRANSLATIONS and current_lang in TRANSLATIONS[text]:
-            return TRANSLATIONS[text][current_lang]
-        return text
+    # Precompiled per-language lookup tables: one dict lookup per _() call
+    translation_tables = {}
+    for text, by_language in TRANSLATIONS.items():
+        for lang, translated in by_language.items():
+            translation_tables.setdefault(lang, TranslationTable())[text] = translated
+    untranslated = TranslationTable()
     
     # Template context processor
     @app.context_processor
     def inject_template_vars():
         from flask import session
-        from app.models import SocialLink
-        
-        # Get social links for all pages
-        social_links = SocialLink.query.filter_by(is_active=True).order_by(SocialLink.sort_order).all()
+        from app.page_cache import cache_fragment, get_footer_links
         
+        language = session.get('language', 'uk')
         return {
-            'language': session.get('language', 'uk'),
-            '_': translate,  # Custom translation function
-            'social_links': social_links  # Social links for footer
+            'language': language,
+            '_': translation_tables.get(language, untranslated).__getitem__,  # Custom translation function
+            'social_links': get_footer_links(),  # Social links for footer, cached per worker
+            'cache_fragment': cache_fragment
         }
     
     # Import models
     from app import models
     
+    # Catalog edits invalidate cached catalog data in every worker
+    cache.invalidate_on_change(models.Product, 'catalog')
+    cache.invalidate_on_change(models.Category, 'catalog')
+    # Public page cache (app/page_cache.py) dependencies
+    cache.invalidate_on_change(models.BlogPost, 'blog')
+    cache.invalidate_on_change(models.HomePageBlock, 'homepage')
+    cache.invalidate_on_change(models.SocialLink, 'social')
+    # Stripe price IDs reused by checkout (app/stripe_catalog.py)
+    cache.invalidate_on_change(models.StripePrice, 'stripe')
+    
     # Register blueprints
     from app.routes import main_bp, admin_bp, api_bp
     from app.admin_routes import admin_routes
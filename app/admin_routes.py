@@ -1,10 +1,12 @@
 from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash, session, current_app
 from flask_babel import gettext as _
 from app.extensions import db
-from app.models import Category, Product, BlogPost, HomePageBlock, SocialLink, User
+from app.models import Category, Product, BlogPost, HomePageBlock, SocialLink, User, BackgroundJob
 from app.forms import CategoryForm, ProductForm, BlogPostForm, AIBlogPostForm, HomePageBlockForm, SocialLinkForm
-from app.utils import save_uploaded_file, delete_file, AIContentGenerator, generate_slug, create_stripe_price
+from app.utils import save_uploaded_file, delete_file, AIContentGenerator, generate_slug, unique_slug
+from app.stripe_catalog import get_price_id, price_key
 from app.content_generator import ContentGenerator
+from app.jobs import enqueue, job_handler
 import os
 
 admin_routes = Blueprint('admin_routes', __name__)
@@ -34,12 +36,7 @@ def add_category():
             slug = generate_slug(form.name_uk.data)
             
             # Ensure slug is unique
-            existing_category = Category.query.filter_by(slug=slug).first()
-            if existing_category:
-                counter = 1
-                while Category.query.filter_by(slug=f"{slug}-{counter}").first():
-                    counter += 1
-                slug = f"{slug}-{counter}"
+            slug = unique_slug(Category, slug)
             
             category = Category(
                 name_uk=form.name_uk.data,
@@ -101,13 +98,7 @@ def edit_category(category_id):
             new_slug = generate_slug(form.name_uk.data)
             if new_slug != category.slug:
                 # Ensure slug is unique
-                existing_category = Category.query.filter_by(slug=new_slug).filter(Category.id != category.id).first()
-                if existing_category:
-                    counter = 1
-                    while Category.query.filter_by(slug=f"{new_slug}-{counter}").filter(Category.id != category.id).first():
-                        counter += 1
-                    new_slug = f"{new_slug}-{counter}"
-                category.slug = new_slug
+                category.slug = unique_slug(Category, new_slug, exclude_id=category.id)
             
             category.is_active = form.is_active.data
             category.sort_order = form.sort_order.data
@@ -141,23 +132,11 @@ def add_product():
             if form.image.data and hasattr(form.image.data, 'filename'):
                 image_filename = save_uploaded_file(form.image.data, 'products')
             
-            # Create Stripe price
-            stripe_price_id = create_stripe_price(
-                form.name_uk.data,
-                form.price.data,
-                form.currency.data
-            )
-            
             # Generate slug from Ukrainian name
             slug = generate_slug(form.name_uk.data)
             
             # Ensure slug is unique
-            existing_product = Product.query.filter_by(slug=slug).first()
-            if existing_product:
-                counter = 1
-                while Product.query.filter_by(slug=f"{slug}-{counter}").first():
-                    counter += 1
-                slug = f"{slug}-{counter}"
+            slug = unique_slug(Product, slug)
             
             product = Product(
                 name_uk=form.name_uk.data,
@@ -174,10 +153,10 @@ def add_product():
                 category_id=form.category_id.data,
                 image=image_filename,
                 is_active=form.is_active.data,
-                sort_order=form.sort_order.data,
-                stripe_price_id=stripe_price_id
+                sort_order=form.sort_order.data
             )
             
+            # The Stripe price is created on the first checkout (or by `flask sync-stripe-prices`)
             db.session.add(product)
             db.session.commit()
             
@@ -220,6 +199,7 @@ def edit_product(product_id):
             product.description_ru = form.description_ru.data
             product.description_de = form.description_de.data
             product.description_en = form.description_en.data
+            charged = price_key(product.id, product.price, product.currency)
             product.price = form.price.data
             product.currency = form.currency.data
             product.category_id = form.category_id.data
@@ -230,23 +210,13 @@ def edit_product(product_id):
             new_slug = generate_slug(form.name_uk.data)
             if new_slug != product.slug:
                 # Ensure slug is unique
-                existing_product = Product.query.filter_by(slug=new_slug).filter(Product.id != product.id).first()
-                if existing_product:
-                    counter = 1
-                    while Product.query.filter_by(slug=f"{new_slug}-{counter}").filter(Product.id != product.id).first():
-                        counter += 1
-                    new_slug = f"{new_slug}-{counter}"
-                product.slug = new_slug
-            
-            # Update Stripe price if price changed
-            if product.stripe_price_id and product.price != form.price.data:
-                new_stripe_price_id = create_stripe_price(
-                    form.name_uk.data,
-                    form.price.data,
-                    form.currency.data
-                )
-                if new_stripe_price_id:
-                    product.stripe_price_id = new_stripe_price_id
+                product.slug = unique_slug(Product, new_slug, exclude_id=product.id)
+            
+            # Point at the Stripe price already created for this amount, if any; checkout creates missing ones.
+            # A price ID set before prices were tracked stays until the amount or currency changes.
+            price_id = get_price_id(product.id, product.price, product.currency, create=False)
+            if price_id is not None or price_key(product.id, product.price, product.currency) != charged:
+                product.stripe_price_id = price_id
             
             db.session.commit()
             
@@ -279,47 +249,19 @@ def add_blog_post():
                 keywords = form.keywords.data or ''
                 auto_publish = form.auto_publish.data
                 
-                generator = ContentGenerator()
-                all_langs = generator.generate_multilingual_post(primary_language, topic, keywords)
-                
-                slug = generate_slug(all_langs['en']['title'] if all_langs.get('en') else topic)
-                existing_post = BlogPost.query.filter_by(slug=slug).first()
-                if existing_post:
-                    counter = 1
-                    while BlogPost.query.filter_by(slug=f"{slug}-{counter}").first():
-                        counter += 1
-                    slug = f"{slug}-{counter}"
-                
-                blog_post = BlogPost(
-                    # Основные поля берем из primary_language
-                    title=all_langs[primary_language]['title'],
-                    content=all_langs[primary_language]['content'],
-                    excerpt=all_langs[primary_language]['excerpt'],
-                    # Мультиязычные поля
-                    title_uk=all_langs['uk']['title'],
-                    title_ru=all_langs['ru']['title'],
-                    title_de=all_langs['de']['title'],
-                    title_en=all_langs['en']['title'],
-                    content_uk=all_langs['uk']['content'],
-                    content_ru=all_langs['ru']['content'],
-                    content_de=all_langs['de']['content'],
-                    content_en=all_langs['en']['content'],
-                    excerpt_uk=all_langs['uk']['excerpt'],
-                    excerpt_ru=all_langs['ru']['excerpt'],
-                    excerpt_de=all_langs['de']['excerpt'],
-                    excerpt_en=all_langs['en']['excerpt'],
-                    slug=slug,
-                    is_published=auto_publish,
-                    author_id=session.get('admin_user_id')
-                )
-                db.session.add(blog_post)
-                db.session.commit()
-                current_app.logger.info(f"AI blog post created and translated with ID: {blog_post.id}")
-                flash(_('AI blog post created and translated!'), 'success')
-                return redirect(url_for('admin.blog'))
+                job = enqueue('blog.translate_post', {
+                    'primary_language': primary_language,
+                    'topic': topic,
+                    'keywords': keywords,
+                    'auto_publish': auto_publish,
+                    'author_id': session.get('admin_user_id')
+                })
+                current_app.logger.info(f"AI blog post generation queued as job {job.id}")
+                flash(_('AI blog post generation started, the post will appear when it is ready.'), 'info')
+                return redirect(url_for('admin.blog', job=job.id))
             except Exception as e:
                 db.session.rollback()
-                current_app.logger.error(f"Error creating AI blog post: {str(e)}")
+                current_app.logger.error(f"Error queueing AI blog post: {str(e)}")
                 flash(_('Error creating AI blog post'), 'error')
         return render_template('admin/ai_blog_form.html', form=form, action='add')
     else:
@@ -339,12 +281,7 @@ def add_blog_post():
                 slug = generate_slug(form.title_uk.data)
             
             # Ensure slug is unique
-            existing_post = BlogPost.query.filter_by(slug=slug).first()
-            if existing_post:
-                counter = 1
-                while BlogPost.query.filter_by(slug=f"{slug}-{counter}").first():
-                    counter += 1
-                slug = f"{slug}-{counter}"
+            slug = unique_slug(BlogPost, slug)
             
             current_app.logger.info(f"Creating blog post with title: {form.title_uk.data}")
             current_app.logger.info(f"Published status: {form.is_published.data}")
@@ -394,8 +331,6 @@ def generate_ai_post():
         return auth_check
     
     try:
-        current_app.logger.info("Starting AI post generation...")
-        
         # Get form data
         topics = {
             'uk': request.form.get('topic_uk', ''),
@@ -406,59 +341,122 @@ def generate_ai_post():
         keywords = request.form.get('keywords', '')
         auto_publish = request.form.get('auto_publish') == 'on'
         
-        current_app.logger.info(f"Topics: {topics}")
-        current_app.logger.info(f"Auto publish: {auto_publish}")
-        
-        # Generate AI content
-        ai_generator = AIContentGenerator()
-        generated_content = ai_generator.generate_multilingual_post(topics, keywords)
-        
-        current_app.logger.info(f"Generated content keys: {generated_content.keys()}")
-        
-        # Create blog post
-        slug = generate_slug(generated_content.get('uk', {}).get('title', topics['uk']))
-        
-        # Ensure slug is unique
-        existing_post = BlogPost.query.filter_by(slug=slug).first()
-        if existing_post:
-            counter = 1
-            while BlogPost.query.filter_by(slug=f"{slug}-{counter}").first():
-                counter += 1
-            slug = f"{slug}-{counter}"
-        
-        blog_post = BlogPost(
-            # Основные поля
-            title=generated_content.get('uk', {}).get('title', topics['uk']),
-            content=generated_content.get('uk', {}).get('content', ''),
-            excerpt=generated_content.get('uk', {}).get('excerpt', ''),
-            # Мультиязычные поля
-            title_uk=generated_content.get('uk', {}).get('title', topics['uk']),
-            title_ru=generated_content.get('ru', {}).get('title', topics['ru']),
-            title_de=generated_content.get('de', {}).get('title', topics['de']),
-            title_en=generated_content.get('en', {}).get('title', topics['en']),
-            content_uk=generated_content.get('uk', {}).get('content', ''),
-            content_ru=generated_content.get('ru', {}).get('content', ''),
-            content_de=generated_content.get('de', {}).get('content', ''),
-            content_en=generated_content.get('en', {}).get('content', ''),
-            excerpt_uk=generated_content.get('uk', {}).get('excerpt', ''),
-            excerpt_ru=generated_content.get('ru', {}).get('excerpt', ''),
-            excerpt_de=generated_content.get('de', {}).get('excerpt', ''),
-            excerpt_en=generated_content.get('en', {}).get('excerpt', ''),
-            slug=slug,
-            is_published=auto_publish,
-            author_id=session.get('admin_user_id')
-        )
-        
-        db.session.add(blog_post)
-        db.session.commit()
-        
-        current_app.logger.info(f"AI blog post created successfully with ID: {blog_post.id}")
-        return jsonify({'success': True, 'post_id': blog_post.id})
+        # Generation takes minutes, so it runs in the job worker instead of this request
+        job = enqueue('blog.generate_ai_post', {
+            'topics': topics,
+            'keywords': keywords,
+            'auto_publish': auto_publish,
+            'author_id': session.get('admin_user_id')
+        })
+        current_app.logger.info(f"AI post generation queued as job {job.id}, topics: {topics}")
+        return jsonify({'success': True, 'job_id': job.id,
+                        'status_url': url_for('admin_routes.job_status', job_id=job.id)}), 202
         
     except Exception as e:
-        current_app.logger.error(f"Error generating AI post: {str(e)}")
+        db.session.rollback()
+        current_app.logger.error(f"Error queueing AI post: {str(e)}")
         return jsonify({'success': False, 'error': str(e)})
 
+@admin_routes.route('/jobs/<int:job_id>')
+def job_status(job_id):
+    """Progress of a background job, polled by the admin UI"""
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    job = db.session.get(BackgroundJob, job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+def language_progress(job, languages):
+    """Completion callback reporting each finished language, which also heartbeats the job's lock"""
+    done = []
+
+    def on_done(language):
+        done.append(language)
+        job.report(10 + 80 * len(done) // max(languages, 1), f"Finished {', '.join(done)}")
+    return on_done
+
+@job_handler('blog.translate_post')
+def translate_post_job(job, payload):
+    """Generate a post in the primary language, translate it and save it"""
+    primary_language = payload['primary_language']
+    topic = payload['topic']
+    
+    job.report(10, 'Generating and translating content')
+    generator = ContentGenerator()
+    all_langs = generator.generate_multilingual_post(primary_language, topic, payload.get('keywords', ''),
+                                                     on_done=language_progress(job, 4))
+    
+    job.report(90, 'Saving post')
+    blog_post = BlogPost(
+        # Основные поля берем из primary_language
+        title=all_langs[primary_language]['title'],
+        content=all_langs[primary_language]['content'],
+        excerpt=all_langs[primary_language]['excerpt'],
+        # Мультиязычные поля
+        title_uk=all_langs['uk']['title'],
+        title_ru=all_langs['ru']['title'],
+        title_de=all_langs['de']['title'],
+        title_en=all_langs['en']['title'],
+        content_uk=all_langs['uk']['content'],
+        content_ru=all_langs['ru']['content'],
+        content_de=all_langs['de']['content'],
+        content_en=all_langs['en']['content'],
+        excerpt_uk=all_langs['uk']['excerpt'],
+        excerpt_ru=all_langs['ru']['excerpt'],
+        excerpt_de=all_langs['de']['excerpt'],
+        excerpt_en=all_langs['en']['excerpt'],
+        slug=unique_slug(BlogPost, generate_slug(all_langs['en']['title'] if all_langs.get('en') else topic)),
+        is_published=payload.get('auto_publish', False),
+        author_id=payload.get('author_id')
+    )
+    db.session.add(blog_post)
+    db.session.commit()
+    current_app.logger.info(f"AI blog post created and translated with ID: {blog_post.id}")
+    return {'post_id': blog_post.id}
+
+@job_handler('blog.generate_ai_post')
+def generate_ai_post_job(job, payload):
+    """Generate a post in every language that has a topic and save it"""
+    topics = payload['topics']
+    
+    job.report(10, 'Generating content')
+    ai_generator = AIContentGenerator()
+    languages = sum(1 for topic in topics.values() if topic.strip())
+    generated_content = ai_generator.generate_multilingual_post(topics, payload.get('keywords', ''),
+                                                                on_done=language_progress(job, languages))
+    current_app.logger.info(f"Generated content keys: {generated_content.keys()}")
+    
+    job.report(90, 'Saving post')
+    blog_post = BlogPost(
+        # Основные поля
+        title=generated_content.get('uk', {}).get('title', topics['uk']),
+        content=generated_content.get('uk', {}).get('content', ''),
+        excerpt=generated_content.get('uk', {}).get('excerpt', ''),
+        # Мультиязычные поля
+        title_uk=generated_content.get('uk', {}).get('title', topics['uk']),
+        title_ru=generated_content.get('ru', {}).get('title', topics['ru']),
+        title_de=generated_content.get('de', {}).get('title', topics['de']),
+        title_en=generated_content.get('en', {}).get('title', topics['en']),
+        content_uk=generated_content.get('uk', {}).get('content', ''),
+        content_ru=generated_content.get('ru', {}).get('content', ''),
+        content_de=generated_content.get('de', {}).get('content', ''),
+        content_en=generated_content.get('en', {}).get('content', ''),
+        excerpt_uk=generated_content.get('uk', {}).get('excerpt', ''),
+        excerpt_ru=generated_content.get('ru', {}).get('excerpt', ''),
+        excerpt_de=generated_content.get('de', {}).get('excerpt', ''),
+        excerpt_en=generated_content.get('en', {}).get('excerpt', ''),
+        slug=unique_slug(BlogPost, generate_slug(generated_content.get('uk', {}).get('title', topics['uk']))),
+        is_published=payload.get('auto_publish', False),
+        author_id=payload.get('author_id')
+    )
+    db.session.add(blog_post)
+    db.session.commit()
+    current_app.logger.info(f"AI blog post created successfully with ID: {blog_post.id}")
+    return {'post_id': blog_post.id,
+            'timings': {language: timing.as_dict() for language, timing in ai_generator.timings.items()}}
+
 @admin_routes.route('/homepage/add', methods=['GET', 'POST'])
 def add_homepage_block():
     auth_check = require_admin()
@@ -683,12 +681,7 @@ def edit_blog_post(post_id):
             if form.title_uk.data and form.title_uk.data != post.title_uk:
                 slug = generate_slug(form.title_uk.data)
                 # Check for duplicate slugs
-                existing_post = BlogPost.query.filter_by(slug=slug).filter(BlogPost.id != post_id).first()
-                if existing_post:
-                    counter = 1
-                    while BlogPost.query.filter_by(slug=f"{slug}-{counter}").filter(BlogPost.id != post_id).first():
-                        counter += 1
-                    slug = f"{slug}-{counter}"
+                slug = unique_slug(BlogPost, slug, exclude_id=post_id)
             
             # Update post fields
             post.title_uk = form.title_uk.data
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""OpenAI Assistants API client with an adaptive run-completion waiter"""
+import json
+import time
+import threading
+from typing import Optional, Dict, Any, Callable, Iterator
+
+import requests
+
+DEFAULT_API_BASE = 'https://api.openai.com/v1'
+
+# Run statuses that mean the assistant is still working
+PENDING_STATUSES = ('queued', 'in_progress', 'cancelling')
+
+
+class RunWaitTimeout(Exception):
+    """Raised when a run does not finish before the waiter deadline"""
+
+
+class RunCancelled(Exception):
+    """Raised when waiting for a run was cancelled by the caller"""
+
+
+class RunWaitResult:
+    """Outcome of waiting for a run, with polling statistics"""
+
+    def __init__(self, run: Dict[str, Any], polls: int, waited: float, wasted: float, streamed: bool = False):
+        self.run = run
+        self.polls = polls          # Number of runs.retrieve calls made
+        self.waited = waited        # Seconds from run creation until completion was observed
+        self.wasted = wasted        # Upper bound of seconds slept after the run had finished
+        self.streamed = streamed    # Completion was pushed by a streaming run, not polled
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'status': self.run.get('status'),
+            'polls': self.polls,
+            'waited': round(self.waited, 4),
+            'wasted': round(self.wasted, 4),
+            'streamed': self.streamed
+        }
+
+
+class RunWaiter:
+    """Wait for an Assistants run with exponential-then-capped backoff and a deadline"""
+
+    def __init__(self, initial_delay: float = 0.05, multiplier: float = 1.5,
+                 max_delay: float = 0.5, deadline: float = 60.0):
+        self.initial_delay = initial_delay
+        self.multiplier = multiplier
+        self.max_delay = max_delay
+        self.deadline = deadline
+
+    def delays(self) -> Iterator[float]:
+        """Yield the sleep schedule between polls"""
+        delay = self.initial_delay
+        while True:
+            yield delay
+            delay = min(delay * self.multiplier, self.max_delay)
+
+    def wait(self, run: Dict[str, Any], retrieve: Callable[[], Dict[str, Any]],
+             cancel: Optional[Callable[[], Any]] = None,
+             cancel_event: Optional[threading.Event] = None) -> RunWaitResult:
+        """Poll until the run leaves a pending status, the deadline passes or the wait is cancelled"""
+        cancel_event = cancel_event or threading.Event()
+        started = time.monotonic()
+        polls = 0
+        last_sleep = 0.0
+
+        for delay in self.delays():
+            if run.get('status') not in PENDING_STATUSES:
+                break
+
+            remaining = self.deadline - (time.monotonic() - started)
+            if remaining <= 0:
+                self.cancel_quietly(cancel)
+                raise RunWaitTimeout(f"Run {run.get('id')} still {run.get('status')} after {self.deadline}s")
+
+            last_sleep = min(delay, remaining)
+            if cancel_event.wait(last_sleep):
+                self.cancel_quietly(cancel)
+                raise RunCancelled(f"Waiting for run {run.get('id')} was cancelled")
+
+            run = retrieve()
+            polls += 1
+
+        return RunWaitResult(run, polls, time.monotonic() - started, last_sleep if polls else 0.0)
+
+    @staticmethod
+    def cancel_quietly(cancel: Optional[Callable[[], Any]]) -> None:
+        if cancel:
+            try:
+                cancel()
+            except Exception:
+                pass  # Best effort, the run expires server-side anyway
+
+
+class AssistantsClient:
+    """Minimal HTTP client for the Assistants API (openai 0.28 has no SDK support)"""
+
+    def __init__(self, api_key: str, api_base: Optional[str] = None,
+                 http_session: Optional[requests.Session] = None, timeout: float = 60.0):
+        self.api_key = api_key
+        self.api_base = (api_base or DEFAULT_API_BASE).rstrip('/')
+        self.http_session = http_session or requests.Session()
+        self.timeout = timeout
+
+    def _headers(self) -> Dict[str, str]:
+        return {
+            'Authorization': f'Bearer {self.api_key}',
+            'Content-Type': 'application/json',
+            'OpenAI-Beta': 'assistants=v2'
+        }
+
+    def _request(self, method: str, path: str, payload: Optional[Dict[str, Any]] = None,
+                 stream: bool = False) -> requests.Response:
+        response = self.http_session.request(
+            method, f'{self.api_base}{path}',
+            headers=self._headers(),
+            data=json.dumps(payload) if payload is not None else None,
+            timeout=self.timeout,
+            stream=stream
+        )
+        response.raise_for_status()
+        return response
+
+    def create_thread(self) -> Dict[str, Any]:
+        return self._request('POST', '/threads', {}).json()
+
+    def delete_thread(self, thread_id: str) -> Dict[str, Any]:
+        return self._request('DELETE', f'/threads/{thread_id}').json()
+
+    def create_message(self, thread_id: str, content: str, role: str = 'user') -> Dict[str, Any]:
+        return self._request('POST', f'/threads/{thread_id}/messages', {'role': role, 'content': content}).json()
+
+    def list_messages(self, thread_id: str, limit: int = 20) -> Dict[str, Any]:
+        return self._request('GET', f'/threads/{thread_id}/messages?limit={limit}&order=desc').json()
+
+    def create_run(self, thread_id: str, assistant_id: str, instructions: Optional[str] = None) -> Dict[str, Any]:
+        payload = {'assistant_id': assistant_id}
+        if instructions:
+            payload['additional_instructions'] = instructions
+        return self._request('POST', f'/threads/{thread_id}/runs', payload).json()
+
+    def retrieve_run(self, thread_id: str, run_id: str) -> Dict[str, Any]:
+        return self._request('GET', f'/threads/{thread_id}/runs/{run_id}').json()
+
+    def cancel_run(self, thread_id: str, run_id: str) -> Dict[str, Any]:
+        return self._request('POST', f'/threads/{thread_id}/runs/{run_id}/cancel', {}).json()
+
+    def stream_run(self, thread_id: str, assistant_id: str,
+                   instructions: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """Create a streaming run and yield its server-sent events as {'event', 'data'} dicts"""
+        payload = {'assistant_id': assistant_id, 'stream': True}
+        if instructions:
+            payload['additional_instructions'] = instructions
+        response = self._request('POST', f'/threads/{thread_id}/runs', payload, stream=True)
+
+        event_name = None
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                if not line:
+                    continue
+                if line.startswith('event:'):
+                    event_name = line[6:].strip()
+                elif line.startswith('data:'):
+                    data = line[5:].strip()
+                    if data == '[DONE]':
+                        return
+                    yield {'event': event_name, 'data': json.loads(data)}
+        finally:
+            response.close()
+
+    @staticmethod
+    def latest_assistant_text(messages: Dict[str, Any]) -> Optional[str]:
+        """Extract the newest assistant reply from a messages list response"""
+        for message in messages.get('data', []):
+            if message.get('role') == 'assistant':
+                return ''.join(part['text']['value'] for part in message.get('content', [])
+                               if part.get('type') == 'text')
+        return None
+
+    def run_and_wait(self, thread_id: str, assistant_id: str, waiter: RunWaiter,
+                     instructions: Optional[str] = None, stream: bool = True,
+                     cancel_event: Optional[threading.Event] = None):
+        """Run the assistant on a thread and return (reply text, RunWaitResult)"""
+        if stream:
+            try:
+                return self._run_streaming(thread_id, assistant_id, waiter, instructions, cancel_event)
+            except requests.HTTPError:
+                pass  # Streaming runs not available for this endpoint - poll instead
+
+        run = self.create_run(thread_id, assistant_id, instructions)
+        result = waiter.wait(
+            run,
+            retrieve=lambda: self.retrieve_run(thread_id, run['id']),
+            cancel=lambda: self.cancel_run(thread_id, run['id']),
+            cancel_event=cancel_event
+        )
+        if result.run.get('status') != 'completed':
+            raise RuntimeError(f"Assistant run ended with status {result.run.get('status')}")
+        return self.latest_assistant_text(self.list_messages(thread_id, limit=1)), result
+
+    def _run_streaming(self, thread_id, assistant_id, waiter, instructions, cancel_event):
+        started = time.monotonic()
+        parts = []
+        run = {}
+
+        def cancel():
+            if run.get('id'):
+                self.cancel_run(thread_id, run['id'])
+
+        for event in self.stream_run(thread_id, assistant_id, instructions):
+            name, data = event['event'], event['data']
+            if name and name.startswith('thread.run.'):
+                run = data
+            if name == 'thread.message.delta':
+                for part in data.get('delta', {}).get('content', []):
+                    if part.get('type') == 'text':
+                        parts.append(part['text'].get('value', ''))
+            if cancel_event is not None and cancel_event.is_set():
+                waiter.cancel_quietly(cancel)
+                raise RunCancelled(f"Streaming run {run.get('id')} was cancelled")
+            if time.monotonic() - started > waiter.deadline:
+                waiter.cancel_quietly(cancel)
+                raise RunWaitTimeout(f"Streaming run {run.get('id')} exceeded {waiter.deadline}s")
+
+        if run.get('status') != 'completed':
+            raise RuntimeError(f"Assistant run ended with status {run.get('status')}")
+        return ''.join(parts), RunWaitResult(run, 0, time.monotonic() - started, 0.0, streamed=True)
+
+
+def get_assistants_client(app) -> AssistantsClient:
+    """Get the application's Assistants client, sharing the chatbot engine's HTTP pool"""
+    client = app.extensions.get('assistants_client')
+    if client is None:
+        from app.chatbot_engine import get_chatbot_engine
+        client = AssistantsClient(
+            api_key=app.config.get('OPENAI_API_KEY'),
+            api_base=app.config.get('OPENAI_API_BASE'),
+            http_session=get_chatbot_engine(app).http_session,
+            timeout=app.config.get('OPENAI_REQUEST_TIMEOUT', 60)
+        )
+        app.extensions['assistants_client'] = client
+    return client
+
+
+def create_run_waiter(app) -> RunWaiter:
+    """Create a run waiter from the application's polling settings"""
+    return RunWaiter(
+        initial_delay=app.config.get('OPENAI_RUN_POLL_INITIAL', 0.05),
+        multiplier=app.config.get('OPENAI_RUN_POLL_MULTIPLIER', 1.5),
+        max_delay=app.config.get('OPENAI_RUN_POLL_MAX', 0.5),
+        deadline=app.config.get('OPENAI_RUN_DEADLINE', 60)
+    )
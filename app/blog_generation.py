@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""In-process blog post generation over the shared pooled OpenAI session"""
+import time
+from typing import Optional, Dict, Any, Tuple
+
+import openai
+
+# Prompts formerly sent by the openai_caller_file.py subprocess, now asking for HTML output
+BLOG_PROMPTS = {
+    'uk': {
+        'system': 'Ти досвідчений копірайтер українською мовою.',
+        'user': 'Напиши статтю про "{topic}". Ключові слова: {keywords}. '
+                'Перший рядок - заголовок, далі абзаци з HTML-тегами <h2>, <p>, <ul> і <li>.'
+    },
+    'ru': {
+        'system': 'Ты опытный копирайтер на русском языке.',
+        'user': 'Напиши статью про "{topic}". Ключевые слова: {keywords}. '
+                'Первая строка - заголовок, далее абзацы с HTML-тегами <h2>, <p>, <ul> и <li>.'
+    },
+    'de': {
+        'system': 'Du bist ein erfahrener Copywriter auf Deutsch.',
+        'user': 'Schreibe einen Artikel über "{topic}". Schlüsselwörter: {keywords}. '
+                'Die erste Zeile ist der Titel, danach Absätze mit den HTML-Tags <h2>, <p>, <ul> und <li>.'
+    },
+    'en': {
+        'system': 'You are an experienced copywriter in English.',
+        'user': 'Write an article about "{topic}". Keywords: {keywords}. '
+                'The first line is the title, followed by paragraphs using the HTML tags <h2>, <p>, <ul> and <li>.'
+    }
+}
+
+
+class GenerationTiming:
+    """Where the time of one blog post generation went"""
+
+    __slots__ = ('language', 'request_seconds', 'parse_seconds', 'total_seconds',
+                 'prompt_tokens', 'completion_tokens', 'error')
+
+    def __init__(self, language: str):
+        self.language = language
+        self.request_seconds = 0.0  # OpenAI round trip, including queueing for a pooled connection
+        self.parse_seconds = 0.0
+        self.total_seconds = 0.0
+        self.prompt_tokens = None
+        self.completion_tokens = None
+        self.error = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'language': self.language,
+            'request_seconds': round(self.request_seconds, 4),
+            'parse_seconds': round(self.parse_seconds, 4),
+            'total_seconds': round(self.total_seconds, 4),
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'error': self.error
+        }
+
+
+def parse_article(text: str, topic: str) -> Dict[str, str]:
+    """Split a generated article into title, excerpt and content"""
+    lines = [line for line in text.split('\n') if line.strip()]
+    title = lines[0] if lines else topic
+    for token in ('<h1>', '</h1>', '#', '*'):
+        title = title.replace(token, '')
+    title = title.strip() or topic
+
+    paragraphs = [p.strip() for p in text.split('\n\n') if p.strip()]
+    first = paragraphs[1] if len(paragraphs) > 1 else (paragraphs[0] if paragraphs else topic)
+    for tag in ('<p>', '</p>', '<h2>', '</h2>'):
+        first = first.replace(tag, '')
+    excerpt = first[:200] + '...' if len(first) > 200 else first
+    return {'title': title, 'excerpt': excerpt, 'content': text}
+
+
+class BlogPostBackend:
+    """Generate one blog post per chat completion, timing each call"""
+
+    def __init__(self, api_key: str, api_base: Optional[str] = None, model: str = 'gpt-3.5-turbo',
+                 max_tokens: int = 1500, temperature: float = 0.7, request_timeout: float = 120.0):
+        self.api_key = api_key
+        self.api_base = api_base
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.request_timeout = request_timeout
+
+    def generate(self, topic: str, language: str = 'uk',
+                 keywords: str = '') -> Tuple[Optional[Dict[str, str]], GenerationTiming]:
+        """Generate a post, returning it (None on failure) with its timing"""
+        timing = GenerationTiming(language)
+        prompt = BLOG_PROMPTS.get(language, BLOG_PROMPTS['en'])
+        params = {}
+        if self.api_base:
+            params['api_base'] = self.api_base
+
+        started = time.monotonic()
+        try:
+            response = openai.ChatCompletion.create(
+                model=self.model,
+                messages=[
+                    {'role': 'system', 'content': prompt['system']},
+                    {'role': 'user', 'content': prompt['user'].format(topic=topic, keywords=keywords)}
+                ],
+                max_tokens=self.max_tokens,
+                temperature=self.temperature,
+                api_key=self.api_key,
+                request_timeout=self.request_timeout,
+                **params
+            )
+            timing.request_seconds = time.monotonic() - started
+
+            parse_started = time.monotonic()
+            usage = response.get('usage') or {}
+            timing.prompt_tokens = usage.get('prompt_tokens')
+            timing.completion_tokens = usage.get('completion_tokens')
+            post = parse_article(response.choices[0].message.content.strip(), topic)
+            timing.parse_seconds = time.monotonic() - parse_started
+            return post, timing
+        except Exception as e:
+            timing.error = str(e)
+            return None, timing
+        finally:
+            timing.total_seconds = time.monotonic() - started
+
+
+def get_blog_backend(app) -> BlogPostBackend:
+    """Get the application's blog generation backend, sharing the chatbot engine's HTTP pool"""
+    backend = app.extensions.get('blog_generation_backend')
+    if backend is None:
+        from app.chatbot_engine import get_chatbot_engine
+        get_chatbot_engine(app)  # Installs the keep-alive session openai 0.28 uses for every call
+        backend = BlogPostBackend(
+            api_key=app.config.get('OPENAI_API_KEY'),
+            api_base=app.config.get('OPENAI_API_BASE'),
+            model=app.config.get('BLOG_GENERATION_MODEL', 'gpt-3.5-turbo'),
+            request_timeout=app.config.get('CONTENT_GENERATION_TIMEOUT', 120)
+        )
+        app.extensions['blog_generation_backend'] = backend
+    return backend
@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+"""Shared cache with pluggable stores and namespace versions bumped on commit"""
+import os
+import time
+import uuid
+import pickle
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from itertools import chain
+from typing import Any, Callable, Optional, Dict, Set
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.metrics import count_cache
+
+try:
+    import redis
+except ImportError:  # Optional, only needed for CACHE_TYPE=redis
+    redis = None
+
+
+class NullStore:
+    """Store that keeps nothing, for disabling the cache"""
+
+    def get(self, key: str) -> Any:
+        return None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        pass
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        return True
+
+    def delete(self, key: str) -> None:
+        pass
+
+
+class MemoryStore:
+    """Per-process LRU store with expiry"""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._data = OrderedDict()  # key -> (expires_at or None, value)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[0] is not None and entry[0] < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._data[key] = (time.time() + ttl if ttl else None, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        """Set the key only if it holds no live value, returning whether it was set"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and (entry[0] is None or entry[0] >= time.time()):
+                return False
+        self.set(key, value, ttl)
+        return True
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class FileStore:
+    """Store in a local directory, shared by all workers on the host"""
+
+    PRUNE_EVERY = 256  # Sets between sweeps for expired files
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._sets = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.cache')
+
+    def _load(self, path: str):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    def get(self, key: str) -> Any:
+        path = self._path(key)
+        try:
+            expires_at, value = self._load(path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if expires_at is not None and expires_at < time.time():
+            self._remove(path)
+            return None
+        return value
+
+    def _write_tmp(self, value: Any, ttl: Optional[float]) -> str:
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((time.time() + ttl if ttl else None, value), f, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            self._remove(tmp_path)
+            raise
+        return tmp_path
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        # Write to a temp file and rename so readers never see a partial entry
+        tmp_path = self._write_tmp(value, ttl)
+        try:
+            os.replace(tmp_path, self._path(key))
+        except Exception:
+            self._remove(tmp_path)
+            raise
+
+        self._sets += 1
+        if self._sets % self.PRUNE_EVERY == 0:
+            self.prune()
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        """Set the key only if it holds no live value, atomically across the host's workers"""
+        tmp_path = self._write_tmp(value, ttl)
+        try:
+            for _ in range(2):
+                try:
+                    # Unlike a rename, a hard link fails when the entry exists
+                    os.link(tmp_path, self._path(key))
+                    return True
+                except FileExistsError:
+                    if self.get(key) is not None:
+                        return False
+                    # Expired: get() removed it, try once more
+            return False
+        finally:
+            self._remove(tmp_path)
+
+    def delete(self, key: str) -> None:
+        self._remove(self._path(key))
+
+    def prune(self) -> None:
+        """Remove expired entries, e.g. values of superseded namespace versions"""
+        now = time.time()
+        for name in os.listdir(self.directory):
+            if not name.endswith('.cache'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                expires_at, _ = self._load(path)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                continue
+            if expires_at is not None and expires_at < now:
+                self._remove(path)
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class RedisStore:
+    """Store in Redis, shared by all workers and hosts"""
+
+    def __init__(self, client, prefix: str = 'shop:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key: str) -> Any:
+        data = self.client.get(self.prefix + key)
+        return pickle.loads(data) if data is not None else None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if ttl:
+            self.client.set(self.prefix + key, data, px=int(ttl * 1000))
+        else:
+            self.client.set(self.prefix + key, data)
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        """SET NX: set the key only if it does not exist, across every worker and host"""
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        return bool(self.client.set(self.prefix + key, data, nx=True, px=int(ttl * 1000) if ttl else None))
+
+    def delete(self, key: str) -> None:
+        self.client.delete(self.prefix + key)
+
+
+def create_store(app):
+    """Create the store selected by CACHE_TYPE"""
+    cache_type = app.config.get('CACHE_TYPE', 'filesystem')
+    if cache_type == 'null':
+        return NullStore()
+    if cache_type == 'memory':
+        return MemoryStore(app.config.get('CACHE_MAX_ENTRIES', 1024))
+    if cache_type == 'redis':
+        if redis is not None:
+            return RedisStore(redis.Redis.from_url(app.config.get('CACHE_REDIS_URL', 'redis://localhost:6379/0')))
+        app.logger.warning("CACHE_TYPE=redis but the redis package is not installed, using the filesystem cache")
+    return FileStore(app.config.get('CACHE_DIR') or os.path.join(app.instance_path, 'cache'))
+
+
+# Model class -> cache namespaces to invalidate when rows of it change
+_watched_models: Dict[type, Set[str]] = {}
+
+
+class Cache:
+    """Flask extension caching values under namespaces that are invalidated by version bumps"""
+
+    def init_app(self, app) -> None:
+        app.extensions['cache'] = create_store(app)
+
+    @property
+    def store(self):
+        return current_app.extensions['cache']
+
+    def version(self, namespace: str) -> str:
+        """Current version token of a namespace"""
+        version = self.store.get(f'version:{namespace}')
+        if version is None:
+            version = uuid.uuid4().hex
+            self.store.set(f'version:{namespace}', version)
+        return version
+
+    def bump(self, *namespaces: str) -> None:
+        """Invalidate everything cached under the namespaces, in every worker"""
+        for namespace in namespaces:
+            # A fresh random token needs no cross-process counter locking
+            self.store.set(f'version:{namespace}', uuid.uuid4().hex)
+
+    def _key(self, namespace: str, key: str) -> str:
+        return f'{namespace}:{self.version(namespace)}:{key}'
+
+    def get(self, namespace: str, key: str) -> Any:
+        try:
+            return self.store.get(self._key(namespace, key))
+        except Exception as e:
+            current_app.logger.warning(f"Cache read failed for {namespace}:{key}: {str(e)}")
+            return None
+
+    def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        try:
+            self.store.set(self._key(namespace, key), value, ttl or current_app.config.get('CACHE_DEFAULT_TTL'))
+        except Exception as e:
+            current_app.logger.warning(f"Cache write failed for {namespace}:{key}: {str(e)}")
+
+    def get_or_set(self, namespace: str, key: str, builder: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        """Return the cached value, building and storing it on a miss"""
+        value = self.get(namespace, key)
+        if value is None:
+            count_cache(namespace, 'miss')
+            value = builder()
+            self.set(namespace, key, value, ttl)
+        else:
+            count_cache(namespace, 'hit')
+        return value
+
+    def get_or_build_local(self, namespace: str, key: str, builder: Callable[[], Any]) -> Any:
+        """Per-process copy of a value, rebuilt when another worker bumps the namespace
+
+        One thread rebuilds it at a time; the others keep getting the previous copy meanwhile.
+        """
+        local = current_app.extensions.setdefault('cache_local', {})
+        locks = current_app.extensions.setdefault('cache_local_locks', {})
+        version = self.version(namespace)
+        entry = local.get((namespace, key))
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        lock = locks.setdefault((namespace, key), threading.Lock())
+        if not lock.acquire(blocking=entry is None):
+            return entry[1]
+        try:
+            entry = local.get((namespace, key))
+            if entry is None or entry[0] != version:
+                # Only the version token crosses the process boundary, the value is never unpickled
+                entry = (version, builder())
+                local[(namespace, key)] = entry
+            return entry[1]
+        finally:
+            lock.release()
+
+    def invalidate_on_change(self, model: type, *namespaces: str) -> None:
+        """Bump the namespaces after any commit that writes rows of the model"""
+        _watched_models.setdefault(model, set()).update(namespaces)
+
+
+def _mark_namespaces(session, classes) -> None:
+    for cls in classes:
+        namespaces = _watched_models.get(cls)
+        if namespaces:
+            session.info.setdefault('cache_namespaces', set()).update(namespaces)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_flushed(session, flush_context):
+    _mark_namespaces(session, {type(obj) for obj in chain(session.new, session.dirty, session.deleted)})
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_bulk_writes(orm_execute_state):
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        _mark_namespaces(orm_execute_state.session, {mapper.class_ for mapper in orm_execute_state.all_mappers})
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_committed(session):
+    namespaces = session.info.pop('cache_namespaces', None)
+    if namespaces and has_app_context() and 'cache' in current_app.extensions:
+        try:
+            Cache().bump(*namespaces)
+        except Exception as e:
+            current_app.logger.warning(f"Cache invalidation failed for {sorted(namespaces)}: {str(e)}")
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_rolled_back(session):
+    session.info.pop('cache_namespaces', None)
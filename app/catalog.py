@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""Read-only in-memory snapshot of the catalog shared by the storefront, the API, checkout and the chatbot
+
+The snapshot is built from the products and categories tables with two
+queries and stamped with the catalog cache version. When a commit moves that
+version, the next reader builds a new snapshot and swaps it in whole, so a
+request always reads one consistent catalog and catalog reads are dictionary
+lookups. With gunicorn's preload_app the master builds it before forking
+(see warm_catalog) and the workers share its memory pages.
+"""
+import gc
+from bisect import bisect_right
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from flask import current_app
+from sqlalchemy import null, select
+
+from app.extensions import cache, db
+from app.localization import FALLBACK_LANGUAGE
+from app.models import Category, Product
+from app.pagination import KeysetPage, decode_cursor, encode_cursor
+
+
+class _Record:
+    """Immutable record: attributes are set once when the snapshot is built"""
+
+    __slots__ = ()
+
+    def __init__(self, **values):
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{type(self).__name__} is read-only')
+
+    def __delattr__(self, name):
+        raise AttributeError(f'{type(self).__name__} is read-only')
+
+    def __repr__(self) -> str:
+        return f'<{type(self).__name__} {self.id}>'
+
+    def get_name(self, language: str = 'uk') -> str:
+        """Localized name, falling back like the model"""
+        return self.names[self.languages.get(language, 0)]
+
+    def get_description(self, language: str = 'uk') -> str:
+        """Localized description, falling back like the model"""
+        return self.descriptions[self.languages.get(language, 0)]
+
+
+class CategoryRecord(_Record):
+    """Snapshot of a category row"""
+
+    __slots__ = ('id', 'slug', 'image', 'is_active', 'sort_order', 'names', 'descriptions', 'languages')
+
+
+class ProductRecord(_Record):
+    """Snapshot of a product row; `category` is the CategoryRecord it belongs to"""
+
+    __slots__ = ('id', 'slug', 'price', 'currency', 'image', 'is_active', 'sort_order', 'category_id', 'category',
+                 'names', 'descriptions', 'languages')
+
+    @property
+    def sort_key(self) -> Tuple[int, int]:
+        return self.sort_order, self.id
+
+
+class CatalogSnapshot:
+    """Every product and category, indexed by id, slug and category, with the active ones in display order"""
+
+    __slots__ = ('version', 'products', 'products_by_slug', 'categories', 'active_products', 'active_categories',
+                 'by_category')
+
+    def __init__(self, version: Optional[str], products: Sequence[ProductRecord],
+                 categories: Sequence[CategoryRecord]):
+        self.version = version
+        self.categories: Dict[int, CategoryRecord] = {c.id: c for c in categories}
+        self.products: Dict[int, ProductRecord] = {p.id: p for p in products}
+        self.products_by_slug: Dict[str, ProductRecord] = {p.slug: p for p in products}
+        self.active_categories: Tuple[CategoryRecord, ...] = tuple(sorted(
+            (c for c in categories if c.is_active), key=lambda c: (c.sort_order, c.id)))
+        self.active_products: Tuple[ProductRecord, ...] = tuple(sorted(
+            (p for p in products if p.is_active), key=lambda p: p.sort_key))
+        by_category: Dict[int, List[ProductRecord]] = {}
+        for product in self.active_products:
+            by_category.setdefault(product.category_id, []).append(product)
+        self.by_category: Dict[int, Tuple[ProductRecord, ...]] = {
+            category_id: tuple(items) for category_id, items in by_category.items()}
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+    def products_in(self, category_id: int) -> Tuple[ProductRecord, ...]:
+        """Active products of a category in display order"""
+        return self.by_category.get(category_id, ())
+
+    def related(self, product: ProductRecord, limit: int = 4) -> List[ProductRecord]:
+        """Other active products of the same category"""
+        return [p for p in self.products_in(product.category_id) if p.id != product.id][:limit]
+
+
+def _texts(values: Sequence[Optional[str]], strings: Dict[str, str]) -> Tuple[str, ...]:
+    # One text per language, the fallback language first; empty ones fall back like the model,
+    # and equal strings are stored once
+    fallback = values[0] or ''
+    return tuple([strings.setdefault(value, value) for value in (value or fallback for value in values)])
+
+
+def _rows(model, fields: Tuple[str, ...], languages: Sequence[str]):
+    """Rows of the fields followed by every localized field in every language, as plain tuples"""
+    columns = model.__table__.c
+    localized = [columns.get(f'{field}_{language}', null())
+                 for field in model.__localized__ for language in languages]
+    return db.session.execute(select(*(columns[name] for name in fields), *localized)).tuples()
+
+
+def build_catalog(version: Optional[str] = None) -> CatalogSnapshot:
+    """Read the catalog tables into a new snapshot"""
+    languages = (FALLBACK_LANGUAGE,) + tuple(
+        language for language in current_app.config['LANGUAGES'] if language != FALLBACK_LANGUAGE)
+    positions = {language: i for i, language in enumerate(languages)}  # Shared by every record
+    count = len(languages)
+    strings: Dict[str, str] = {}
+
+    categories = []
+    for row in _rows(Category, ('id', 'slug', 'image', 'is_active', 'sort_order'), languages):
+        category_id, slug, image, is_active, sort_order = row[:5]
+        categories.append(CategoryRecord(
+            id=category_id, slug=slug, image=image, is_active=bool(is_active), sort_order=sort_order or 0,
+            names=_texts(row[5:5 + count], strings), descriptions=_texts(row[5 + count:], strings),
+            languages=positions))
+    by_id = {c.id: c for c in categories}
+
+    # Core rows rather than ORM objects: no identity map or instance state for every product
+    products = []
+    for row in _rows(Product, ('id', 'slug', 'price', 'currency', 'image', 'is_active', 'sort_order',
+                               'category_id'), languages):
+        product_id, slug, price, currency, image, is_active, sort_order, category_id = row[:8]
+        products.append(ProductRecord(
+            id=product_id, slug=slug, price=price, currency=strings.setdefault(currency, currency), image=image,
+            is_active=bool(is_active), sort_order=sort_order or 0, category_id=category_id,
+            category=by_id.get(category_id), names=_texts(row[8:8 + count], strings),
+            descriptions=_texts(row[8 + count:], strings), languages=positions))
+    return CatalogSnapshot(version, products, categories)
+
+
+def get_catalog() -> CatalogSnapshot:
+    """This worker's catalog snapshot, rebuilt after catalog commits"""
+    return cache.get_or_build_local('catalog', 'snapshot', lambda: build_catalog(cache.version('catalog')))
+
+
+def warm_catalog(app) -> None:
+    """Build the snapshot in the gunicorn master so preloaded workers inherit it instead of building their own"""
+    try:
+        with app.app_context():
+            get_catalog()
+            # Workers must open their own connections, and the collector must not touch the shared pages
+            db.session.remove()
+            db.engine.dispose()
+        gc.freeze()
+    except Exception as e:
+        app.logger.warning(f"Catalog snapshot not preloaded, workers will build it: {str(e)}")
+
+
+def paginate(products: Sequence[ProductRecord], per_page: int, after: Optional[str] = None) -> KeysetPage:
+    """Keyset page of products in display order, with the same cursors as app.pagination"""
+    start = 0
+    if after:
+        start = bisect_right(products, decode_cursor(after, (int, int)), key=lambda p: p.sort_key)
+    items = list(products[start:start + per_page])
+    next_cursor = encode_cursor(items[-1].sort_key) if start + per_page < len(products) else None
+    prev_cursor = encode_cursor(items[0].sort_key) if after and items else None
+    return KeysetPage(items, next_cursor, prev_cursor)
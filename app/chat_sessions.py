@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""Map chat sessions to persistent OpenAI Assistants threads"""
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
+from typing import Optional, Callable, Dict, Any, List
+
+import requests
+from flask import current_app
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+
+from app.extensions import db
+from app.models import ChatThread
+
+
+class ThreadSessionManager:
+    """Look up or create the Assistants thread of a session with an LRU + TTL cache and batched touches
+
+    Touches are written at most touch_interval seconds after the activity: by
+    the next touch once the interval has passed, or by a timer when the worker
+    gets no more chat traffic (with an app to run it in), and by close() when
+    the worker exits.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600.0, touch_interval: float = 60.0, app=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.touch_interval = touch_interval
+        self._app = app
+        self._cache = OrderedDict()  # session_id -> (thread_id, expires_at)
+        self._pending_touches = {}   # session_id -> last activity not yet written
+        self._last_flush = time.monotonic()
+        self._timer = None           # Writes the pending touches if no later touch does
+        self._lock = threading.Lock()
+
+    def _cached(self, session_id: str) -> Optional[str]:
+        with self._lock:
+            entry = self._cache.get(session_id)
+            if entry is None:
+                return None
+            if entry[1] < time.monotonic():
+                del self._cache[session_id]
+                return None
+            self._cache.move_to_end(session_id)
+            return entry[0]
+
+    def _remember(self, session_id: str, thread_id: str) -> None:
+        with self._lock:
+            self._cache[session_id] = (thread_id, time.monotonic() + self.ttl)
+            self._cache.move_to_end(session_id)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def get_thread_id(self, session_id: str, create_thread: Callable[[], Dict[str, Any]],
+                      language: str = 'uk') -> str:
+        """Return the thread of a session, creating and storing a new one on first use"""
+        thread_id = self._cached(session_id)
+        if thread_id is None:
+            chat_thread = ChatThread.query.filter_by(session_id=session_id, is_active=True).first()
+            if chat_thread is not None:
+                thread_id = chat_thread.thread_id
+            else:
+                thread_id = self._create(session_id, create_thread, language)
+            self._remember(session_id, thread_id)
+
+        self.touch(session_id)
+        return thread_id
+
+    def _create(self, session_id: str, create_thread: Callable[[], Dict[str, Any]], language: str) -> str:
+        thread_id = create_thread()['id']
+        # Replace an inactive row of this session, the session_id column is unique
+        ChatThread.query.filter_by(session_id=session_id, is_active=False).delete()
+        db.session.add(ChatThread(session_id=session_id, thread_id=thread_id, language=language))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Another worker stored a thread for this session first - use theirs
+            db.session.rollback()
+            chat_thread = ChatThread.query.filter_by(session_id=session_id).first()
+            if chat_thread is None:
+                raise
+            current_app.logger.info(f"Thread for session {session_id} created concurrently, "
+                                    f"discarding {thread_id}")
+            return chat_thread.thread_id
+        return thread_id
+
+    def forget(self, session_id: str) -> None:
+        """Drop a session from the cache, e.g. after its remote thread disappeared"""
+        with self._lock:
+            self._cache.pop(session_id, None)
+            self._pending_touches.pop(session_id, None)
+
+    def invalidate(self, session_id: str) -> None:
+        """Forget a session and deactivate its stored thread so the next message starts a new one"""
+        self.forget(session_id)
+        ChatThread.query.filter_by(session_id=session_id).update({'is_active': False})
+        db.session.commit()
+
+    def touch(self, session_id: str) -> None:
+        """Record session activity, writing updated_at in batches"""
+        with self._lock:
+            self._pending_touches[session_id] = datetime.now(timezone.utc)
+            due = time.monotonic() - self._last_flush >= self.touch_interval
+            if not due and self._timer is None and self._app is not None:
+                self._timer = threading.Timer(self.touch_interval, self._flush_later)
+                self._timer.daemon = True
+                self._timer.start()
+        if due:
+            self.flush_touches()
+
+    def _flush_later(self) -> None:
+        with self._lock:
+            self._timer = None
+        with self._app.app_context():
+            self.flush_touches()
+
+    def close(self) -> int:
+        """Stop the timer and write the pending touches, when the worker exits"""
+        with self._lock:
+            timer, self._timer = self._timer, None
+        if timer is not None:
+            timer.cancel()
+        if self._app is None:
+            return self.flush_touches()
+        with self._app.app_context():
+            return self.flush_touches()
+
+    def flush_touches(self) -> int:
+        """Write pending updated_at touches in a single UPDATE"""
+        with self._lock:
+            pending, self._pending_touches = self._pending_touches, {}
+            self._last_flush = time.monotonic()
+        if not pending:
+            return 0
+
+        # Touches only feed expiry, so one timestamp per batch is precise enough
+        touched_at = max(pending.values())
+        try:
+            db.session.execute(
+                update(ChatThread)
+                .where(ChatThread.session_id.in_(list(pending)))
+                .values(updated_at=touched_at)
+            )
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.warning(f"Could not update chat thread activity: {str(e)}")
+            return 0
+        return len(pending)
+
+
+def get_thread_sessions(app) -> ThreadSessionManager:
+    """Get the application's thread-session manager"""
+    manager = app.extensions.get('chat_thread_sessions')
+    if manager is None:
+        manager = ThreadSessionManager(
+            max_entries=app.config.get('CHAT_THREAD_CACHE_SIZE', 1024),
+            ttl=app.config.get('CHAT_THREAD_CACHE_TTL', 3600),
+            touch_interval=app.config.get('CHAT_THREAD_TOUCH_INTERVAL', 60),
+            app=app
+        )
+        app.extensions['chat_thread_sessions'] = manager
+    return manager
+
+
+def close_thread_sessions(app) -> int:
+    """Write the chat activity a worker still holds, from gunicorn's worker_exit hook"""
+    manager = app.extensions.get('chat_thread_sessions')
+    return manager.close() if manager is not None else 0
+
+
+def delete_remote_threads(client, thread_ids: List[str], max_workers: int = 8) -> List[str]:
+    """Delete Assistants threads concurrently, returning the ids that are gone remotely"""
+    logger = current_app.logger
+
+    def delete(thread_id):
+        try:
+            client.delete_thread(thread_id)
+            return thread_id
+        except requests.HTTPError as e:
+            if e.response is not None and e.response.status_code == 404:
+                return thread_id  # Already expired on OpenAI's side
+            logger.warning(f"Could not delete OpenAI thread {thread_id}: {str(e)}")
+        except Exception as e:
+            logger.warning(f"Could not delete OpenAI thread {thread_id}: {str(e)}")
+        return None
+
+    if not thread_ids:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(thread_ids))) as executor:
+        return [thread_id for thread_id in executor.map(delete, thread_ids) if thread_id]
+
+
+def expire_chat_threads(days_old: int = 7, client=None) -> int:
+    """Delete threads idle for more than days_old days, remotely and locally
+
+    Other workers write their touches up to CHAT_THREAD_TOUCH_INTERVAL seconds
+    late, so threads are kept for that much longer than days_old.
+    """
+    app = current_app._get_current_object()
+    manager = get_thread_sessions(app)
+    manager.flush_touches()  # Recent activity of this worker must be stored before picking idle threads
+
+    cutoff_date = datetime.now(timezone.utc) - timedelta(days=days_old, seconds=manager.touch_interval)
+    idle_threads = ChatThread.query.filter(ChatThread.updated_at < cutoff_date).all()
+    if not idle_threads:
+        return 0
+
+    if client is None and app.config.get('OPENAI_API_KEY'):
+        from app.assistant_runs import get_assistants_client
+        client = get_assistants_client(app)
+
+    if client is not None:
+        deleted = set(delete_remote_threads(client, [t.thread_id for t in idle_threads],
+                                            app.config.get('CHAT_THREAD_CLEANUP_WORKERS', 8)))
+    else:
+        deleted = {t.thread_id for t in idle_threads}  # Nothing to delete remotely without an API key
+
+    expired = 0
+    for chat_thread in idle_threads:
+        if chat_thread.thread_id in deleted:
+            manager.forget(chat_thread.session_id)
+            db.session.delete(chat_thread)
+            expired += 1
+    db.session.commit()
+    return expired
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""In-process chatbot engine with a pooled OpenAI HTTP session"""
+import os
+import sys
+import json
+import time
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Optional, Dict, Any, List, Iterator
+
+import openai
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.metrics import observe_openai
+
+FALLBACK_MESSAGE = "I'm sorry, I can't connect to my AI services right now. Please try again later."
+BUSY_MESSAGE = "I'm sorry, I'm handling too many conversations right now. Please try again in a moment."
+
+
+def create_http_session(pool_size: int = 4, max_retries: int = 2) -> requests.Session:
+    """Create a requests session with a keep-alive connection pool"""
+    http_session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=max_retries)
+    http_session.mount('https://', adapter)
+    http_session.mount('http://', adapter)
+    return http_session
+
+
+def build_system_prompt(request_data: Dict[str, Any], assistant_id: Optional[str]) -> str:
+    """Build the assistant system prompt from a chatbot request"""
+    language = request_data.get('language', 'uk')
+    product_info = request_data.get('product_info', '')
+    category_info = request_data.get('category_info', '')
+
+    # Build context information if available
+    context_info = ""
+    if product_info or category_info:
+        context_info = f"""
+ИНФОРМАЦИЯ О МАГАЗИНЕ:
+
+КАТЕГОРИИ:
+{category_info}
+
+ПОПУЛЯРНЫЕ ТОВАРЫ:
+{product_info}
+"""
+
+    return f"""Ты - AI-консультант интернет-магазина (Assistant ID: {assistant_id}).
+
+{context_info}
+
+Дополнительные инструкции:
+- Отвечай на языке пользователя ({language})
+- Будь дружелюбным и полезным
+- Рекомендуй товары из предоставленного списка
+- Помогай с выбором и отвечай на вопросы о товарах
+- Если пользователь спрашивает о конкретном товаре, предоставь детальную информацию
+- Всегда старайся направить разговор к покупке подходящих товаров
+"""
+
+
+def build_messages(request_data: Dict[str, Any], assistant_id: Optional[str]) -> List[Dict[str, str]]:
+    """Build chat completion messages from a chatbot request"""
+    return [
+        {"role": "system", "content": build_system_prompt(request_data, assistant_id)},
+        {"role": "user", "content": request_data.get('message', '')}
+    ]
+
+
+def process_request(request_data: Dict[str, Any], api_key: Optional[str] = None,
+                    assistant_id: Optional[str] = None, api_base: Optional[str] = None,
+                    request_timeout: Optional[float] = None) -> Dict[str, Any]:
+    """Answer one chatbot request, returning the openai_izi_assistant.py JSON contract"""
+    if not api_key:
+        return {"error": "OpenAI API key not found", "response": FALLBACK_MESSAGE}
+
+    assistant_id = assistant_id or request_data.get('assistant_id')
+
+    try:
+        params = {
+            'model': request_data.get('model', 'gpt-3.5-turbo'),
+            'messages': build_messages(request_data, assistant_id),
+            'max_tokens': request_data.get('max_tokens', 500),
+            'temperature': request_data.get('temperature', 0.7),
+            'api_key': api_key,
+            'request_timeout': request_timeout
+        }
+        if api_base:
+            params['api_base'] = api_base
+
+        started = time.perf_counter()
+        try:
+            response = openai.ChatCompletion.create(**params)
+        except Exception:
+            observe_openai('chatbot', 'chat', time.perf_counter() - started, outcome='error')
+            raise
+        observe_openai('chatbot', 'chat', time.perf_counter() - started, response.get('usage'))
+
+        return {
+            "response": response.choices[0].message.content.strip(),
+            "status": "success",
+            "using_assistant": bool(assistant_id)
+        }
+    except Exception as e:
+        return {"error": f"OpenAI API error: {str(e)}", "response": FALLBACK_MESSAGE}
+
+
+def stream_request(request_data: Dict[str, Any], api_key: Optional[str] = None,
+                   assistant_id: Optional[str] = None, api_base: Optional[str] = None,
+                   request_timeout: Optional[float] = None) -> Iterator[str]:
+    """Yield the chatbot answer as text deltas using a streaming chat completion"""
+    if not api_key:
+        raise ValueError("OpenAI API key not found")
+
+    assistant_id = assistant_id or request_data.get('assistant_id')
+    params = {
+        'model': request_data.get('model', 'gpt-3.5-turbo'),
+        'messages': build_messages(request_data, assistant_id),
+        'max_tokens': request_data.get('max_tokens', 500),
+        'temperature': request_data.get('temperature', 0.7),
+        'api_key': api_key,
+        'request_timeout': request_timeout,
+        'stream': True
+    }
+    if api_base:
+        params['api_base'] = api_base
+
+    # Streamed completions carry no usage block, so only the time to the last delta is recorded
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        for chunk in openai.ChatCompletion.create(**params):
+            if not chunk.choices:
+                continue
+            text = chunk.choices[0].get('delta', {}).get('content')
+            if text:
+                yield text
+        outcome = 'ok'
+    except GeneratorExit:
+        outcome = 'cancelled'  # The client went away mid-answer
+        raise
+    finally:
+        observe_openai('chatbot', 'stream', time.perf_counter() - started, outcome=outcome)
+
+
+def run_assistant_script(request_data: Dict[str, Any], script_path: str,
+                         env: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """Answer a chatbot request by spawning openai_izi_assistant.py (legacy path)"""
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False, encoding='utf-8') as f:
+        json.dump(request_data, f, ensure_ascii=False, indent=2)
+        temp_file = f.name
+
+    try:
+        process = subprocess.Popen(
+            [sys.executable, script_path, temp_file],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=env,
+            universal_newlines=True,
+            encoding='utf-8',
+            errors='replace'  # Replace invalid characters instead of failing
+        )
+        stdout, stderr = process.communicate()
+
+        if process.returncode != 0:
+            return {"error": f"Assistant script exited with code {process.returncode}: {stderr}",
+                    "response": FALLBACK_MESSAGE}
+        try:
+            return json.loads(stdout)
+        except json.JSONDecodeError:
+            return {"error": f"Invalid JSON response: {stdout}", "response": FALLBACK_MESSAGE}
+    except Exception as e:
+        return {"error": f"Error running assistant script: {str(e)}", "response": FALLBACK_MESSAGE}
+    finally:
+        try:
+            os.unlink(temp_file)
+        except OSError:
+            pass
+
+
+class ChatbotEngine:
+    """Long-lived chatbot engine with a bounded worker pool and keep-alive HTTP session"""
+
+    def __init__(self, api_key: Optional[str], assistant_id: Optional[str] = None,
+                 api_base: Optional[str] = None, pool_size: int = 4,
+                 request_timeout: float = 60.0, max_pending: Optional[int] = None,
+                 max_streams: int = 200):
+        self.api_key = api_key
+        self.assistant_id = assistant_id
+        self.api_base = api_base
+        self.request_timeout = request_timeout
+        self.http_session = create_http_session(max(pool_size, max_streams))
+        self.executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='chatbot')
+        # Bound queued + running requests so a burst cannot pile up unbounded work
+        self._slots = threading.BoundedSemaphore(max_pending or pool_size * 2)
+        # Streams run in the request's own greenlet/thread, so they get a separate bound
+        self._stream_slots = threading.BoundedSemaphore(max_streams)
+
+        # openai 0.28 reuses this session in every thread instead of opening its own
+        openai.requestssession = self.http_session
+
+    def handle(self, request_data: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Answer a chatbot request on the worker pool"""
+        if not self._slots.acquire(blocking=False):
+            return {"error": "Chatbot engine is busy", "response": BUSY_MESSAGE}
+
+        try:
+            future = self.executor.submit(
+                process_request, request_data,
+                api_key=self.api_key,
+                assistant_id=self.assistant_id,
+                api_base=self.api_base,
+                request_timeout=self.request_timeout
+            )
+        except RuntimeError as e:
+            self._slots.release()
+            return {"error": f"Chatbot engine unavailable: {str(e)}", "response": FALLBACK_MESSAGE}
+
+        future.add_done_callback(lambda _: self._slots.release())
+
+        try:
+            return future.result(timeout=timeout or self.request_timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            return {"error": "Chatbot request timed out", "response": FALLBACK_MESSAGE}
+
+    def stream(self, request_data: Dict[str, Any]) -> Iterator[str]:
+        """Stream a chatbot answer in the calling worker (thread or greenlet)"""
+        if not self._stream_slots.acquire(blocking=False):
+            raise RuntimeError("Chatbot engine is busy")
+
+        try:
+            yield from stream_request(
+                request_data,
+                api_key=self.api_key,
+                assistant_id=self.assistant_id,
+                api_base=self.api_base,
+                request_timeout=self.request_timeout
+            )
+        finally:
+            self._stream_slots.release()
+
+    def shutdown(self) -> None:
+        """Stop worker threads and close pooled connections"""
+        self.executor.shutdown(wait=False)
+        self.http_session.close()
+
+
+_engine_lock = threading.Lock()
+
+
+def get_chatbot_engine(app) -> ChatbotEngine:
+    """Get the application's shared chatbot engine, creating it on first use"""
+    engine = app.extensions.get('chatbot_engine')
+    if engine is None:
+        with _engine_lock:
+            engine = app.extensions.get('chatbot_engine')
+            if engine is None:
+                engine = ChatbotEngine(
+                    api_key=app.config.get('OPENAI_API_KEY'),
+                    assistant_id=app.config.get('OPENAI_ASSISTANT_ID'),
+                    api_base=app.config.get('OPENAI_API_BASE'),
+                    pool_size=app.config.get('CHATBOT_POOL_SIZE', 4),
+                    request_timeout=app.config.get('OPENAI_REQUEST_TIMEOUT', 60),
+                    max_streams=app.config.get('CHATBOT_MAX_STREAMS', 200)
+                )
+                app.extensions['chatbot_engine'] = engine
+    return engine
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""Resolve a shopping cart into a validated price snapshot from the catalog snapshot"""
+from typing import Any, Dict, List
+
+from app.catalog import ProductRecord, get_catalog
+
+
+class CartError(ValueError):
+    """Raised when a cart cannot be checked out, listing every problem found"""
+
+    def __init__(self, problems: List[Dict[str, Any]]):
+        super().__init__('; '.join(problem['error'] for problem in problems))
+        self.problems = problems
+
+
+class CartLine:
+    """Snapshot of one product as it is charged"""
+
+    __slots__ = ('product_id', 'name', 'description', 'price', 'currency', 'quantity')
+
+    def __init__(self, product: ProductRecord, quantity: int, language: str):
+        self.product_id = product.id
+        self.name = product.get_name(language)
+        self.description = product.get_description(language)[:100]
+        self.price = product.price
+        self.currency = product.currency
+        self.quantity = quantity
+
+    def as_item(self) -> Dict[str, Any]:
+        """Item in the format create_checkout_session expects"""
+        return {
+            'product_id': self.product_id,
+            'name': self.name,
+            'description': self.description,
+            'price': self.price,
+            'currency': self.currency,
+            'quantity': self.quantity
+        }
+
+
+def _quantities(items: List[Dict[str, Any]], max_quantity: int) -> Dict[int, int]:
+    # Parse and merge repeated products before looking any up
+    quantities, problems = {}, []
+    for index, item in enumerate(items):
+        try:
+            product_id = int(item['product_id'])
+            quantity = int(item.get('quantity', 1))
+        except (KeyError, TypeError, ValueError, AttributeError):
+            problems.append({'code': 'malformed', 'error': f'Item {index} is malformed', 'index': index})
+            continue
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+
+    problems.extend({'code': 'quantity', 'product_id': product_id,
+                     'error': f'Quantity of product {product_id} must be between 1 and {max_quantity}'}
+                    for product_id, quantity in quantities.items() if not 1 <= quantity <= max_quantity)
+    if problems:
+        raise CartError(problems)
+    return quantities
+
+
+def resolve_cart(items: List[Dict[str, Any]], language: str, max_quantity: int = 99,
+                 max_lines: int = 100) -> List[CartLine]:
+    """Validate cart items and snapshot their products, raising CartError with all problems"""
+    if not items:
+        raise CartError([{'code': 'empty', 'error': 'Cart is empty'}])
+    if len(items) > max_lines:
+        raise CartError([{'code': 'too_many', 'error': f'Cart has more than {max_lines} items'}])
+
+    quantities = _quantities(items, max_quantity)
+    products = get_catalog().products
+
+    unavailable = [product_id for product_id in quantities
+                   if product_id not in products or not products[product_id].is_active]
+    problems = [{'code': 'unavailable', 'product_id': product_id, 'error': f'Product {product_id} is not available'}
+                for product_id in unavailable]
+    # One Stripe session charges a single currency
+    currencies = {products[product_id].currency for product_id in quantities if product_id not in unavailable}
+    if len(currencies) > 1:
+        problems.append({'code': 'currency', 'error': f"Cart mixes currencies: {', '.join(sorted(currencies))}"})
+    if problems:
+        raise CartError(problems)
+
+    return [CartLine(products[product_id], quantity, language) for product_id, quantity in quantities.items()]
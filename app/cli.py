@@ -3,7 +3,7 @@ import click
 from flask.cli import with_appcontext
 from app.extensions import db
 from app.models import User, Category, Product, BlogPost, HomePageBlock, SocialLink
-from app.utils import init_default_data
+from app.utils import init_default_data, cleanup_old_chat_threads
 
 @click.command()
 @with_appcontext
@@ -85,6 +85,51 @@ def stats():
     for name, count in stats_data.items():
         click.echo(f'{name:<15}: {count:>5}')
 
+@click.command('cleanup-chat-threads')
+@click.option('--days', default=7, show_default=True, help='Delete threads idle for more than this many days')
+@with_appcontext
+def cleanup_chat_threads(days):
+    """Delete idle chatbot threads locally and on OpenAI."""
+    expired = cleanup_old_chat_threads(days_old=days)
+    click.echo(f'Expired {expired} chat threads.')
+
+@click.command('run-jobs')
+@click.option('--burst', is_flag=True, help='Exit once the queue is empty')
+@click.option('--poll-interval', default=2.0, show_default=True, help='Seconds between polls of an empty queue')
+@with_appcontext
+def run_jobs(burst, poll_interval):
+    """Process background jobs (AI blog generation) outside the web workers."""
+    from app.jobs import work
+    click.echo('Job worker started' + (' (burst mode)' if burst else ''))
+    processed = work(poll_interval=poll_interval, burst=burst)
+    click.echo(f'Processed {processed} jobs.')
+
+@click.command('clear-page-cache')
+@with_appcontext
+def clear_page_cache():
+    """Drop cached public pages and fragments, e.g. after deploying template changes."""
+    from app.extensions import cache
+    cache.bump('pages', 'fragments')
+    click.echo('Page cache cleared.')
+
+@click.command('sync-stripe-prices')
+@click.option('--no-create', is_flag=True, help='Only import and link existing Stripe prices')
+@with_appcontext
+def sync_stripe_prices(no_create):
+    """Reconcile product prices with Stripe, creating the missing ones."""
+    from app.stripe_catalog import reconcile
+    counts = reconcile(create_missing=not no_create)
+    for name, count in counts.items():
+        click.echo(f'{name:<10}: {count:>5}')
+
+@click.command('search-reindex')
+@with_appcontext
+def search_reindex():
+    """Rebuild the full-text search index, e.g. for a database created before search existed."""
+    from app.search import rebuild_index
+    indexed = rebuild_index()
+    click.echo(f'Indexed {indexed} products and posts.')
+
 def init_cli_commands(app):
     """Register CLI commands with the Flask app."""
     app.cli.add_command(init_db)
@@ -92,3 +137,8 @@ def init_cli_commands(app):
     app.cli.add_command(create_admin)
     app.cli.add_command(list_users)
     app.cli.add_command(stats)
+    app.cli.add_command(cleanup_chat_threads)
+    app.cli.add_command(run_jobs)
+    app.cli.add_command(clear_page_cache)
+    app.cli.add_command(sync_stripe_prices)
+    app.cli.add_command(search_reindex)
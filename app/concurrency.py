@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""Run independent slow calls (e.g. OpenAI requests) concurrently inside the app context"""
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, as_completed
+from typing import Any, Callable, Dict, Optional
+
+from flask import current_app
+
+
+def run_concurrently(tasks: Dict[Any, Callable[[], Any]], max_workers: int = 4,
+                     timeout: Optional[float] = None,
+                     on_done: Optional[Callable[[Any], None]] = None) -> Dict[Any, Any]:
+    """Run callables on a bounded thread pool, mapping each key to its result or exception
+
+    on_done(key) is called in the calling thread as each task finishes, e.g. to report progress.
+    """
+    if not tasks:
+        return {}
+    app = current_app._get_current_object()
+    workers = min(max_workers, len(tasks))
+
+    def run_in_app(task):
+        with app.app_context():
+            return task()
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='concurrent')
+    try:
+        futures = {executor.submit(run_in_app, task): key for key, task in tasks.items()}
+        # Queued tasks start late, so allow one timeout per wave of max_workers tasks
+        waves = -(-len(tasks) // workers)
+
+        results = {}
+        try:
+            for future in as_completed(futures, timeout=timeout * waves if timeout else None):
+                key = futures[future]
+                try:
+                    results[key] = future.result()
+                except Exception as e:
+                    results[key] = e  # Callers substitute a fallback for failed keys
+                if on_done is not None:
+                    on_done(key)
+        except FutureTimeoutError:
+            for future, key in futures.items():
+                if key not in results:
+                    future.cancel()
+                    results[key] = TimeoutError(f"Task {key!r} did not finish within {timeout}s")
+        return {key: results[key] for key in tasks}
+    finally:
+        # Do not wait for timed out calls, they finish (and are discarded) in the background
+        executor.shutdown(wait=False, cancel_futures=True)
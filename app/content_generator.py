@@ -1,32 +1,55 @@
 import os
 import json
-from typing import Dict, List, Optional, Any, Union
+from typing import Callable, Dict, List, Optional, Any, Union
 from datetime import datetime, timezone
+import time
 import openai
 from flask import current_app
+from app.concurrency import run_concurrently
+from app.metrics import observe_openai
 
 class ContentGenerator:
     """Class for generating and translating blog content using OpenAI API"""
     
     def __init__(self):
-        """Initialize ContentGenerator with OpenAI client"""
+        """Initialize ContentGenerator with OpenAI settings"""
         api_key = current_app.config.get('OPENAI_API_KEY')
+        self.request_timeout = current_app.config.get('CONTENT_GENERATION_TIMEOUT', 120)
+        self.max_workers = current_app.config.get('CONTENT_GENERATION_WORKERS', 4)
         
         if not api_key:
             self.client = None
             current_app.logger.warning("OpenAI API key not configured")
             return
             
+        # openai 0.28 has no client object, calls pass the key and endpoint explicitly
+        self.client = True  # Just a flag to indicate it's configured
+        self.api_key = api_key
+        self.api_base = current_app.config.get('OPENAI_API_BASE')
+        current_app.logger.info("OpenAI content generator initialized successfully (v0.28)")
+    
+    def _chat(self, messages: List[Dict[str, str]], model: str = "gpt-3.5-turbo",
+              temperature: float = 0.7, max_tokens: int = 1000) -> str:
+        """Run one chat completion and return the reply text"""
+        params = {}
+        if self.api_base:
+            params['api_base'] = self.api_base
+        started = time.perf_counter()
         try:
-            # For OpenAI module
-            openai.api_key = api_key
-            self.client = openai.OpenAI(api_key=api_key)
-            self.api_key = api_key
-            current_app.logger.info("OpenAI client initialized successfully")
-        except Exception as e:
-            current_app.logger.error(f"Error initializing OpenAI client: {str(e)}")
-            self.client = None
-            self.api_key = None
+            response = openai.ChatCompletion.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                api_key=self.api_key,
+                request_timeout=self.request_timeout,
+                **params
+            )
+        except Exception:
+            observe_openai('content_generator', 'chat', time.perf_counter() - started, outcome='error')
+            raise
+        observe_openai('content_generator', 'chat', time.perf_counter() - started, response.get('usage'))
+        return response.choices[0].message.content.strip()
     
     def generate_content(self, topic: str, language: str = 'en', keywords: str = '') -> Dict[str, str]:
         """Generate blog post content using OpenAI API directly"""
@@ -71,8 +94,7 @@ class ContentGenerator:
             
             prompt = prompts.get(language, prompts['en'])
             
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
+            content = self._chat(
                 messages=[
                     {"role": "system", "content": prompt['system']},
                     {"role": "user", "content": prompt['user']}
@@ -81,8 +103,6 @@ class ContentGenerator:
                 max_tokens=2500
             )
             
-            content = response.choices[0].message.content.strip()
-            
             # Extract title, content, and excerpt
             lines = content.split('\n')
             title = lines[0].replace('#', '').replace('*', '').strip() if lines else topic
@@ -130,44 +150,35 @@ class ContentGenerator:
             from_lang_name = language_names.get(from_lang, 'English')
             to_lang_name = language_names.get(to_lang, 'English')
             
-            # Translate title
-            title_response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": f"You are a professional translator from {from_lang_name} to {to_lang_name}."},
-                    {"role": "user", "content": f"Translate the following title from {from_lang_name} to {to_lang_name}. Keep it concise and catchy:\n\n{title}"}
-                ],
-                temperature=0.3,
-                max_tokens=100
-            )
+            system_message = {"role": "system", "content": f"You are a professional translator from {from_lang_name} to {to_lang_name}."}
             
-            translated_title = title_response.choices[0].message.content.strip()
+            # Title, excerpt and content are independent requests, so translate them concurrently
+            parts = run_concurrently({
+                'title': lambda: self._chat(
+                    messages=[system_message, {"role": "user", "content": f"Translate the following title from {from_lang_name} to {to_lang_name}. Keep it concise and catchy:\n\n{title}"}],
+                    temperature=0.3,
+                    max_tokens=100
+                ),
+                'excerpt': lambda: self._chat(
+                    messages=[system_message, {"role": "user", "content": f"Translate the following excerpt from {from_lang_name} to {to_lang_name}. Keep the same tone and style:\n\n{excerpt}"}],
+                    temperature=0.3,
+                    max_tokens=300
+                ),
+                'content': lambda: self._chat(
+                    model="gpt-3.5-turbo-16k",
+                    messages=[system_message, {"role": "user", "content": f"Translate the following HTML content from {from_lang_name} to {to_lang_name}. Keep all HTML tags intact and maintain the same structure. Keep the same tone and style:\n\n{original_content}"}],
+                    temperature=0.3,
+                    max_tokens=4000
+                )
+            }, max_workers=3, timeout=self.request_timeout)
             
-            # Translate excerpt
-            excerpt_response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": f"You are a professional translator from {from_lang_name} to {to_lang_name}."},
-                    {"role": "user", "content": f"Translate the following excerpt from {from_lang_name} to {to_lang_name}. Keep the same tone and style:\n\n{excerpt}"}
-                ],
-                temperature=0.3,
-                max_tokens=300
-            )
-            
-            translated_excerpt = excerpt_response.choices[0].message.content.strip()
-            
-            # Translate content
-            content_response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo-16k",
-                messages=[
-                    {"role": "system", "content": f"You are a professional translator from {from_lang_name} to {to_lang_name}."},
-                    {"role": "user", "content": f"Translate the following HTML content from {from_lang_name} to {to_lang_name}. Keep all HTML tags intact and maintain the same structure. Keep the same tone and style:\n\n{original_content}"}
-                ],
-                temperature=0.3,
-                max_tokens=4000
-            )
+            for part, result in parts.items():
+                if isinstance(result, Exception):
+                    raise RuntimeError(f"{part} translation failed: {result}")
             
-            translated_content = content_response.choices[0].message.content.strip()
+            translated_title = parts['title']
+            translated_excerpt = parts['excerpt']
+            translated_content = parts['content']
             
             return {
                 "title": translated_title,
@@ -179,8 +190,9 @@ class ContentGenerator:
             current_app.logger.error(f"Error translating content with OpenAI: {str(e)}")
             return self._get_simple_translation(content, from_lang, to_lang)
     
-    def generate_multilingual_post(self, primary_language: str, topic: str, keywords: str = '') -> Dict[str, Dict[str, str]]:
-        """Generate blog post in primary language and translate to others"""
+    def generate_multilingual_post(self, primary_language: str, topic: str, keywords: str = '',
+                                   on_done: Optional[Callable[[str], None]] = None) -> Dict[str, Dict[str, str]]:
+        """Generate blog post in primary language and translate to others, calling on_done(language) for each"""
         current_app.logger.info(f"Generating multilingual post from {primary_language} with topic: {topic}")
         
         # Available languages
@@ -188,14 +200,26 @@ class ContentGenerator:
         
         # First generate content in the primary language
         primary_content = self.generate_content(topic, primary_language, keywords)
+        if on_done is not None:
+            on_done(primary_language)
         
-        # Then translate to other languages
+        # Then translate to the other languages concurrently
         result = {primary_language: primary_content}
+        targets = [lang for lang in languages if lang != primary_language]
+        
+        translations = run_concurrently(
+            {lang: (lambda lang=lang: self.translate_content(primary_content, primary_language, lang)) for lang in targets},
+            max_workers=self.max_workers,
+            timeout=self.request_timeout,
+            on_done=on_done
+        )
         
-        for lang in languages:
-            if lang != primary_language:
-                translated = self.translate_content(primary_content, primary_language, lang)
-                result[lang] = translated
+        for lang in targets:
+            translated = translations[lang]
+            if isinstance(translated, Exception):
+                current_app.logger.error(f"Translation to {lang} failed: {str(translated)}")
+                translated = self._get_simple_translation(primary_content, primary_language, lang)
+            result[lang] = translated
         
         return result
     
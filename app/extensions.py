@@ -2,8 +2,10 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_babel import Babel
+from app.cache import Cache
 
 # Initialize extensions
 db = SQLAlchemy()
 migrate = Migrate()
 babel = Babel()
+cache = Cache()
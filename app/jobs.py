@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""Database-backed job queue for slow work (AI generation) kept out of web workers"""
+import os
+import json
+import time
+import socket
+import traceback
+from datetime import datetime, timezone, timedelta
+from typing import Any, Callable, Dict, Optional
+
+from flask import current_app
+from sqlalchemy import select, update, and_, or_
+
+from app.extensions import db
+from app.models import BackgroundJob
+
+# Job kind -> handler(context, payload) returning a JSON-serializable result
+_handlers: Dict[str, Callable[['JobContext', Dict[str, Any]], Any]] = {}
+
+
+def job_handler(kind: str):
+    """Register a function as the handler of a job kind"""
+    def decorator(func):
+        _handlers[kind] = func
+        return func
+    return decorator
+
+
+class JobContext:
+    """Handle given to job handlers for reporting progress"""
+
+    def __init__(self, job: BackgroundJob):
+        self.job = job
+
+    @property
+    def id(self) -> int:
+        return self.job.id
+
+    def report(self, progress: int, message: Optional[str] = None) -> None:
+        """Store progress so the admin UI can show it while the job runs"""
+        self.job.progress = max(0, min(100, progress))
+        self.job.message = message
+        self.job.locked_at = _now()  # Heartbeat, so the job is not reclaimed as stale
+        db.session.commit()
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def enqueue(kind: str, payload: Optional[Dict[str, Any]] = None, max_attempts: Optional[int] = None,
+            commit: bool = True) -> BackgroundJob:
+    """Queue a job and return it; a `flask run-jobs` worker picks it up
+
+    With commit=False the job is only flushed, so it is queued by the caller's transaction.
+    """
+    if kind not in _handlers:
+        raise ValueError(f"No handler registered for job kind '{kind}'")
+    job = BackgroundJob(
+        kind=kind,
+        payload=json.dumps(payload or {}, ensure_ascii=False),
+        max_attempts=max_attempts or current_app.config.get('JOB_MAX_ATTEMPTS', 3),
+        message='Queued'
+    )
+    db.session.add(job)
+    if commit:
+        db.session.commit()
+    else:
+        db.session.flush()
+    return job
+
+
+def _claimable(now: datetime, stale_before: datetime):
+    # Queued jobs that are due, plus running jobs whose worker stopped heartbeating (crashed)
+    return or_(
+        and_(BackgroundJob.status == 'queued', BackgroundJob.run_after <= now),
+        and_(BackgroundJob.status == 'running', BackgroundJob.locked_at < stale_before)
+    )
+
+
+def claim_next_job(worker_id: str) -> Optional[BackgroundJob]:
+    """Atomically claim the oldest due job for this worker"""
+    now = _now()
+    stale_before = now - timedelta(seconds=current_app.config.get('JOB_LOCK_TIMEOUT', 900))
+    candidates = db.session.execute(
+        select(BackgroundJob.id).where(_claimable(now, stale_before)).order_by(BackgroundJob.id).limit(5)
+    ).scalars().all()
+    db.session.rollback()  # End the read transaction before the claims
+
+    for job_id in candidates:
+        # Conditional UPDATE so two workers never claim the same job, on SQLite and PostgreSQL alike
+        claimed = db.session.execute(
+            update(BackgroundJob)
+            .where(BackgroundJob.id == job_id, _claimable(now, stale_before))
+            .values(status='running', locked_by=worker_id, locked_at=now,
+                    attempts=BackgroundJob.attempts + 1, message='Running')
+        ).rowcount
+        db.session.commit()
+        if claimed:
+            return db.session.get(BackgroundJob, job_id)
+    return None
+
+
+def run_job(job: BackgroundJob) -> None:
+    """Run a claimed job, scheduling a retry with backoff when it fails"""
+    handler = _handlers.get(job.kind)
+    try:
+        if handler is None:
+            raise LookupError(f"No handler registered for job kind '{job.kind}'")
+        result = handler(JobContext(job), json.loads(job.payload or '{}'))
+        job.status = 'succeeded'
+        job.progress = 100
+        job.message = 'Done'
+        job.result = json.dumps(result, ensure_ascii=False) if result is not None else None
+        job.error = None
+        job.locked_by = None
+        db.session.commit()
+        current_app.logger.info(f"Job {job.id} ({job.kind}) succeeded")
+    except Exception as e:
+        db.session.rollback()
+        job = db.session.get(BackgroundJob, job.id)
+        job.error = f"{str(e)}\n{traceback.format_exc()}"
+        job.locked_by = None
+        if job.attempts < job.max_attempts and handler is not None:
+            delay = current_app.config.get('JOB_RETRY_DELAY', 30) * 2 ** (job.attempts - 1)
+            job.status = 'queued'
+            job.run_after = _now() + timedelta(seconds=delay)
+            job.message = f'Retrying in {delay:.0f}s (attempt {job.attempts} of {job.max_attempts} failed)'
+            current_app.logger.warning(f"Job {job.id} ({job.kind}) failed, retrying in {delay:.0f}s: {str(e)}")
+        else:
+            job.status = 'failed'
+            job.message = 'Failed'
+            current_app.logger.error(f"Job {job.id} ({job.kind}) failed permanently: {str(e)}")
+        db.session.commit()
+
+
+def work(worker_id: Optional[str] = None, poll_interval: float = 2.0, burst: bool = False,
+         max_jobs: Optional[int] = None) -> int:
+    """Process jobs until stopped; with burst=True return once the queue is empty"""
+    worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}'
+    processed = 0
+    while max_jobs is None or processed < max_jobs:
+        job = claim_next_job(worker_id)
+        if job is None:
+            if burst:
+                break
+            db.session.remove()
+            time.sleep(poll_interval)
+            continue
+        run_job(job)
+        processed += 1
+    return processed
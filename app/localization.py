@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""Load only the columns of the language a page renders from the multilingual models"""
+from typing import Iterable, List, Optional
+
+from flask import current_app
+from sqlalchemy.orm import defer
+
+# Language every get_* accessor falls back to
+FALLBACK_LANGUAGE = 'uk'
+
+
+def localized(model, language: str, fields: Optional[Iterable[str]] = None) -> List:
+    """Loader options deferring the other languages' columns, and localized fields the page does not use
+
+    `model.__localized__` names the fields stored as `<field>_<language>` columns. The current
+    language and the fallback of kept fields are loaded; deferred columns still load lazily
+    if something reads them.
+    """
+    fields = model.__localized__ if fields is None else tuple(fields)
+    keep = {f'{field}_{lang}' for field in fields for lang in (language, FALLBACK_LANGUAGE)}
+    options = []
+    for field in model.__localized__:
+        for lang in current_app.config['LANGUAGES']:
+            name = f'{field}_{lang}'
+            if name not in keep and hasattr(model, name):
+                options.append(defer(getattr(model, name)))
+        # Unsuffixed copies of the primary language (BlogPost.title/content/excerpt) are unused by the accessors
+        if hasattr(model, field):
+            options.append(defer(getattr(model, field)))
+    return options
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""Prometheus metrics: request latency, SQL per request, OpenAI and Stripe calls, cache lookups
+
+Every worker records into prometheus_client metrics. Under gunicorn,
+gunicorn.conf.py sets PROMETHEUS_MULTIPROC_DIR before the app is imported,
+so each worker writes its values to memory-mapped files in that directory
+and /metrics sums the files of all workers (including ones that have been
+recycled) instead of reporting whichever worker answered the scrape.
+
+Cache hit ratio per cache, counting stale copies served as hits:
+
+    sum by (cache) (rate(cache_lookups_total{outcome!~"miss|computed"}[5m]))
+      / sum by (cache) (rate(cache_lookups_total[5m]))
+
+Without prometheus_client installed nothing is recorded and /metrics is not
+registered; the same goes for production without a METRICS_TOKEN.
+"""
+import os
+import time
+from typing import Any, Mapping, Optional
+
+from flask import Response, current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+try:
+    import prometheus_client
+    from prometheus_client import CollectorRegistry, Counter, Histogram, multiprocess
+except ImportError:
+    prometheus_client = None
+
+if prometheus_client is not None:
+    REQUEST_SECONDS = Histogram(
+        'http_request_duration_seconds', 'Time to produce a response, by endpoint',
+        ('endpoint', 'method', 'status'))
+    DB_QUERIES = Histogram(
+        'db_queries_per_request', 'SQL statements executed while handling a request', ('endpoint',),
+        buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100, 250))
+    DB_SECONDS = Histogram(
+        'db_query_seconds_per_request', 'Time spent in SQL statements while handling a request', ('endpoint',),
+        buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+    OPENAI_SECONDS = Histogram(
+        'openai_request_duration_seconds', 'OpenAI call latency', ('caller', 'operation', 'outcome'),
+        buckets=(0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120))
+    OPENAI_TOKENS = Counter(
+        'openai_tokens', 'Tokens billed for OpenAI calls', ('caller', 'kind'))
+    STRIPE_SECONDS = Histogram(
+        'stripe_request_duration_seconds', 'Stripe call latency, retries included', ('operation', 'outcome'),
+        buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30))
+    CACHE_LOOKUPS = Counter(
+        'cache_lookups', 'Cache lookups by how they were answered', ('cache', 'outcome'))
+
+
+def observe_openai(caller: str, operation: str, seconds: float, usage: Optional[Mapping[str, Any]] = None,
+                   outcome: str = 'ok') -> None:
+    """Record one OpenAI call and the tokens in its `usage` block"""
+    if prometheus_client is None:
+        return
+    OPENAI_SECONDS.labels(caller, operation, outcome).observe(seconds)
+    for kind in ('prompt', 'completion'):
+        tokens = (usage or {}).get(f'{kind}_tokens')
+        if tokens:
+            OPENAI_TOKENS.labels(caller, kind).inc(tokens)
+
+
+def observe_stripe(operation: str, outcome: str, seconds: float) -> None:
+    """Record one Stripe call as the caller saw it"""
+    if prometheus_client is not None:
+        STRIPE_SECONDS.labels(operation, outcome).observe(seconds)
+
+
+def count_cache(cache: str, outcome: str) -> None:
+    """Record a cache lookup; outcomes other than `miss` and `computed` were served from the cache"""
+    if prometheus_client is not None:
+        CACHE_LOOKUPS.labels(cache, outcome).inc()
+
+
+# SQL time per request, from engine events
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('metrics_started')
+    if not started:
+        return  # The statement started before the listener was added
+    started = started.pop()
+    if has_request_context():
+        queries = g.get('metrics_queries')
+        if queries is not None:
+            queries[0] += 1
+            queries[1] += time.perf_counter() - started
+
+
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute
+    if exception_context.connection is not None:
+        started = exception_context.connection.info.get('metrics_started')
+        if started:
+            started.pop()
+
+
+# Requests
+
+def _start_request():
+    g.metrics_started = time.perf_counter()
+    g.metrics_queries = [0, 0.0]
+
+
+def _observe_request(response):
+    started = g.get('metrics_started')
+    if started is not None:
+        endpoint = request.endpoint or 'unmatched'  # Unknown URLs share one series
+        REQUEST_SECONDS.labels(endpoint, request.method, response.status_code).observe(
+            time.perf_counter() - started)
+        count, seconds = g.metrics_queries
+        DB_QUERIES.labels(endpoint).observe(count)
+        DB_SECONDS.labels(endpoint).observe(seconds)
+    return response
+
+
+def metrics_view():
+    """Prometheus text exposition of every worker's metrics"""
+    token = current_app.config.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return Response(prometheus_client.generate_latest(registry), mimetype=prometheus_client.CONTENT_TYPE_LATEST)
+
+
+def init_app(app) -> None:
+    """Time every request and its SQL, and serve the metrics on /metrics"""
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+    if prometheus_client is None:
+        app.logger.warning("prometheus_client not installed - /metrics is disabled")
+        return
+    if app.config.get('METRICS_TOKEN_REQUIRED') and not app.config.get('METRICS_TOKEN'):
+        # Latencies, endpoints and call volumes are not for the public internet
+        app.logger.warning("METRICS_TOKEN not set - /metrics is disabled")
+        return
+
+    # Engines are created per app, so listen on the class once for all of them
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+
+    app.before_request(_start_request)
+    app.after_request(_observe_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
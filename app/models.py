@@ -1,10 +1,11 @@
 from typing import Optional
 from datetime import datetime, timezone
-from sqlalchemy.orm import Mapped, mapped_column
-from sqlalchemy import Integer, String, Text, Float, Boolean, DateTime, ForeignKey, LargeBinary
+from sqlalchemy.orm import Mapped, mapped_column, query_expression
+from sqlalchemy import Integer, String, Text, Float, Boolean, DateTime, ForeignKey, LargeBinary, Index, UniqueConstraint, func
 from werkzeug.security import generate_password_hash, check_password_hash
 from app.extensions import db
 import os
+import json
 
 # Get schema from environment
 SCHEMA_NAME = os.environ.get('DB_SCHEMA', 'public')
@@ -33,6 +34,7 @@ class Category(db.Model):
     """Product category model"""
     __tablename__ = 'categories'
     __table_args__ = {'schema': SCHEMA_NAME} if SCHEMA_NAME != 'public' else {}
+    __localized__ = ('name', 'description')  # <field>_<language> columns, see app/localization.py
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     name_uk: Mapped[str] = mapped_column(String(100), nullable=False)
@@ -65,7 +67,13 @@ class Category(db.Model):
 class Product(db.Model):
     """Product model"""
     __tablename__ = 'products'
-    __table_args__ = {'schema': SCHEMA_NAME} if SCHEMA_NAME != 'public' else {}
+    __table_args__ = (
+        # Storefront listings: active products in display order, overall and per category
+        Index('ix_products_listing', 'is_active', 'sort_order'),
+        Index('ix_products_category_listing', 'category_id', 'is_active', 'sort_order'),
+        {'schema': SCHEMA_NAME} if SCHEMA_NAME != 'public' else {}
+    )
+    __localized__ = ('name', 'description')  # <field>_<language> columns, see app/localization.py
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     name_uk: Mapped[str] = mapped_column(String(200), nullable=False)
@@ -99,7 +107,12 @@ class Product(db.Model):
 class BlogPost(db.Model):
     """Blog post model"""
     __tablename__ = 'blog_posts'
-    __table_args__ = {'schema': SCHEMA_NAME} if SCHEMA_NAME != 'public' else {}
+    __table_args__ = (
+        # Keyset pagination of the blog listing reads this index in order
+        Index('ix_blog_posts_listing', 'is_published', 'created_at', 'id'),
+        {'schema': SCHEMA_NAME} if SCHEMA_NAME != 'public' else {}
+    )
+    __localized__ = ('title', 'content', 'excerpt')  # <field>_<language> columns, see app/localization.py
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     title: Mapped[str] = mapped_column(String(200), nullable=False)  # Основное поле заголовка
@@ -127,6 +140,18 @@ class BlogPost(db.Model):
     # Relationships
     author = db.relationship('User', backref='blog_posts')
     
+    # Listing preview computed by the database, see listing_excerpt()
+    preview: Mapped[Optional[str]] = query_expression()
+    
+    @classmethod
+    def listing_excerpt(cls, language: str = 'uk', length: int = 400):
+        """SQL expression for the start of the localized excerpt, or of the content when there is none"""
+        def localized(prefix):
+            column = getattr(cls, f'{prefix}_{language}', None)
+            fallback = getattr(cls, f'{prefix}_uk')
+            return func.coalesce(func.nullif(column, ''), fallback) if column is not None else fallback
+        return func.substr(func.coalesce(func.nullif(localized('excerpt'), ''), localized('content')), 1, length)
+    
     def get_title(self, language: str = 'uk') -> str:
         """Get localized title"""
         title = getattr(self, f'title_{language}', None)
@@ -145,7 +170,11 @@ class BlogPost(db.Model):
 class HomePageBlock(db.Model):
     """Home page customizable blocks"""
     __tablename__ = 'homepage_blocks'
-    __table_args__ = {'schema': SCHEMA_NAME} if SCHEMA_NAME != 'public' else {}
+    __table_args__ = (
+        Index('ix_homepage_blocks_listing', 'is_active', 'sort_order'),
+        {'schema': SCHEMA_NAME} if SCHEMA_NAME != 'public' else {}
+    )
+    __localized__ = ('title',)  # <field>_<language> columns, see app/localization.py
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     title_uk: Mapped[str] = mapped_column(String(200), nullable=False)
@@ -210,11 +239,41 @@ class OrderItem(db.Model):
     # Relationships
     product = db.relationship('Product', backref='order_items')
 
+class StripePrice(db.Model):
+    """Stripe price of a product at one amount and currency, reused by every checkout"""
+    __tablename__ = 'stripe_prices'
+    __table_args__ = (
+        UniqueConstraint('product_id', 'unit_amount', 'currency', name='uq_stripe_prices_product_amount'),
+        {'schema': SCHEMA_NAME} if SCHEMA_NAME != 'public' else {}
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    product_id: Mapped[int] = mapped_column(Integer, ForeignKey(f'{SCHEMA_NAME}.products.id' if SCHEMA_NAME != 'public' else 'products.id', ondelete='CASCADE'), nullable=False)
+    unit_amount: Mapped[int] = mapped_column(Integer, nullable=False)  # Cents
+    currency: Mapped[str] = mapped_column(String(3), nullable=False)  # Lowercase, as Stripe returns it
+    stripe_price_id: Mapped[str] = mapped_column(String(255), unique=True, nullable=False)
+    stripe_product_id: Mapped[str] = mapped_column(String(255), nullable=False)
+    active: Mapped[bool] = mapped_column(Boolean, default=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+class StripeEvent(db.Model):
+    """Stripe webhook event already applied, so redeliveries are acknowledged without effect"""
+    __tablename__ = 'stripe_events'
+    __table_args__ = {'schema': SCHEMA_NAME} if SCHEMA_NAME != 'public' else {}
+
+    id: Mapped[str] = mapped_column(String(255), primary_key=True)  # Stripe event ID (evt_...)
+    type: Mapped[str] = mapped_column(String(100), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=lambda: datetime.now(timezone.utc))
+
 
 class ChatThread(db.Model):
     """Chat thread model for storing OpenAI assistant threads"""
     __tablename__ = 'chat_threads'
-    __table_args__ = {'schema': SCHEMA_NAME} if SCHEMA_NAME != 'public' else {}
+    __table_args__ = (
+        # Idle thread cleanup and the admin list of recent threads
+        Index('ix_chat_threads_updated_at', 'updated_at'),
+        {'schema': SCHEMA_NAME} if SCHEMA_NAME != 'public' else {}
+    )
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     session_id: Mapped[str] = mapped_column(String(255), unique=True, nullable=False)  # User session ID
@@ -223,3 +282,38 @@ class ChatThread(db.Model):
     created_at: Mapped[datetime] = mapped_column(DateTime, default=lambda: datetime.now(timezone.utc))
     updated_at: Mapped[datetime] = mapped_column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
     is_active: Mapped[bool] = mapped_column(Boolean, default=True)
+
+
+class BackgroundJob(db.Model):
+    """Queued job processed by the `flask run-jobs` worker"""
+    __tablename__ = 'background_jobs'
+    __table_args__ = {'schema': SCHEMA_NAME} if SCHEMA_NAME != 'public' else {}
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    kind: Mapped[str] = mapped_column(String(100), nullable=False)  # Registered handler name
+    payload: Mapped[str] = mapped_column(Text, nullable=False, default='{}')  # JSON arguments
+    status: Mapped[str] = mapped_column(String(20), default='queued', index=True)  # queued, running, succeeded, failed
+    progress: Mapped[int] = mapped_column(Integer, default=0)  # 0-100
+    message: Mapped[Optional[str]] = mapped_column(String(255))  # Human readable progress step
+    result: Mapped[Optional[str]] = mapped_column(Text)  # JSON result of a succeeded job
+    error: Mapped[Optional[str]] = mapped_column(Text)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    max_attempts: Mapped[int] = mapped_column(Integer, default=3)
+    run_after: Mapped[datetime] = mapped_column(DateTime, default=lambda: datetime.now(timezone.utc))
+    locked_by: Mapped[Optional[str]] = mapped_column(String(100))
+    locked_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    
+    def to_dict(self) -> dict:
+        """Status representation polled by the admin UI"""
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'progress': self.progress,
+            'message': self.message,
+            'attempts': self.attempts,
+            'result': json.loads(self.result) if self.result else None,
+            'error': self.error
+        }
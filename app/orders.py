@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""Record paid Stripe checkout sessions as orders from verified, deduplicated webhook events"""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import stripe
+from flask import current_app
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+
+from app.extensions import db
+from app.jobs import enqueue, job_handler
+from app.models import Order, OrderItem, Product, StripeEvent
+from app.stripe_client import get_stripe_client
+
+# Stripe limits metadata values to 500 characters, longer carts use several cart_<n> keys
+METADATA_VALUE_LIMIT = 500
+
+# Event type -> handler(checkout session object)
+_event_handlers: Dict[str, Callable[[Dict[str, Any]], None]] = {}
+
+
+class WebhookError(ValueError):
+    """Raised for a webhook request that is not a correctly signed Stripe event"""
+
+
+def cart_metadata(lines) -> Dict[str, str]:
+    """Checkout session metadata describing the charged cart lines as product:quantity:cents"""
+    encoded = ','.join(f'{line.product_id}:{line.quantity}:{int(round(line.price * 100))}' for line in lines)
+    return {f'cart_{i // METADATA_VALUE_LIMIT}': encoded[i:i + METADATA_VALUE_LIMIT]
+            for i in range(0, len(encoded), METADATA_VALUE_LIMIT)}
+
+
+def parse_cart_metadata(metadata: Dict[str, str]) -> Optional[List[Tuple[int, int, float]]]:
+    """(product_id, quantity, price) lines stored by cart_metadata, None when the session has none"""
+    chunks, index = [], 0
+    while f'cart_{index}' in metadata:
+        chunks.append(metadata[f'cart_{index}'])
+        index += 1
+    if not chunks:
+        return None
+    lines = []
+    for entry in ''.join(chunks).split(','):
+        product_id, quantity, cents = entry.split(':')
+        lines.append((int(product_id), int(quantity), int(cents) / 100))
+    return lines
+
+
+def verify_event(payload: bytes, signature: str) -> stripe.Event:
+    """Parse a webhook payload after checking its Stripe-Signature header"""
+    secret = current_app.config.get('STRIPE_WEBHOOK_SECRET')
+    if not secret:
+        raise WebhookError('Stripe webhook secret is not configured')
+    try:
+        return stripe.Webhook.construct_event(payload, signature, secret,
+                                              tolerance=current_app.config.get('STRIPE_WEBHOOK_TOLERANCE', 300))
+    except (ValueError, stripe.error.SignatureVerificationError) as e:
+        raise WebhookError(str(e)) from e
+
+
+def handle_event(event) -> bool:
+    """Apply an event in one transaction; False when it was already applied"""
+    # Redeliveries and replay storms cost one primary key lookup
+    if db.session.get(StripeEvent, event['id']) is not None:
+        return False
+    try:
+        db.session.add(StripeEvent(id=event['id'], type=event['type']))
+        db.session.flush()
+        handler = _event_handlers.get(event['type'])
+        if handler is not None:
+            handler(event['data']['object'])
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        if db.session.get(StripeEvent, event['id']) is not None:
+            # A concurrent delivery of the same event committed first
+            return False
+        # Any other constraint failure: let the webhook answer 5xx so Stripe redelivers
+        raise
+    return True
+
+
+def event_handler(*types: str):
+    """Register a function as the handler of Stripe event types"""
+    def decorator(func):
+        for event_type in types:
+            _event_handlers[event_type] = func
+        return func
+    return decorator
+
+
+def _save_order(checkout_session: Dict[str, Any], status: str) -> Order:
+    # Events of one session arrive in any order: create the order once, then only move its status
+    order = Order.query.filter_by(stripe_session_id=checkout_session['id']).first()
+    if order is not None:
+        if status != 'pending':
+            order.status = status
+        return order
+
+    details = checkout_session.get('customer_details') or {}
+    order = Order(
+        stripe_session_id=checkout_session['id'],
+        customer_email=details.get('email') or checkout_session.get('customer_email') or '',
+        total_amount=(checkout_session.get('amount_total') or 0) / 100,
+        currency=(checkout_session.get('currency') or 'eur').upper(),
+        status=status
+    )
+    db.session.add(order)
+    db.session.flush()
+
+    lines = parse_cart_metadata(checkout_session.get('metadata') or {})
+    if lines is None:
+        # Sessions created without cart metadata need their line items fetched from Stripe
+        enqueue('orders.fetch_line_items', {'order_id': order.id}, commit=False)
+    else:
+        add_order_items(order, lines)
+    return order
+
+
+def add_order_items(order: Order, lines: List[Tuple[int, int, float]]) -> None:
+    """Insert the order's items with one statement, skipping products deleted since checkout"""
+    existing = set(db.session.execute(
+        select(Product.id).where(Product.id.in_({product_id for product_id, _, _ in lines}))).scalars())
+    missing = [product_id for product_id, _, _ in lines if product_id not in existing]
+    if missing:
+        current_app.logger.warning(f"Order {order.id}: products {missing} no longer exist, items not recorded")
+    rows = [{'order_id': order.id, 'product_id': product_id, 'quantity': quantity, 'price': price}
+            for product_id, quantity, price in lines if product_id in existing]
+    if rows:
+        db.session.execute(insert(OrderItem), rows)
+
+
+@event_handler('checkout.session.completed')
+def session_completed(checkout_session: Dict[str, Any]) -> None:
+    """Record the order; delayed payment methods complete it with a later event"""
+    _save_order(checkout_session, 'completed' if checkout_session.get('payment_status') == 'paid' else 'pending')
+
+
+@event_handler('checkout.session.async_payment_succeeded')
+def async_payment_succeeded(checkout_session: Dict[str, Any]) -> None:
+    _save_order(checkout_session, 'completed')
+
+
+@event_handler('checkout.session.async_payment_failed')
+def async_payment_failed(checkout_session: Dict[str, Any]) -> None:
+    _save_order(checkout_session, 'failed')
+
+
+@job_handler('orders.fetch_line_items')
+def fetch_line_items_job(job, payload):
+    """Record the items of an order whose session carried no cart metadata"""
+    order = db.session.get(Order, payload['order_id'])
+    client = get_stripe_client()
+    if client is None:
+        raise RuntimeError('Stripe is not configured')
+    lines = []
+    for item in client.call('checkout.session.list_line_items', stripe.checkout.Session.list_line_items,
+                            order.stripe_session_id, limit=100,
+                            expand=['data.price.product']).auto_paging_iter():
+        product_id = (item['price']['product'].get('metadata') or {}).get('product_id')
+        if product_id:
+            lines.append((int(product_id), item['quantity'], item['price']['unit_amount'] / 100))
+    add_order_items(order, lines)
+    db.session.commit()
+    return {'order_id': order.id, 'items': len(lines)}
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""Cache rendered public pages and template fragments until the content they show changes"""
+import hashlib
+from functools import wraps
+from typing import Iterable, Optional, Tuple
+
+from flask import current_app, request, session, make_response
+from flask_babel import get_locale
+from markupsafe import Markup
+
+from app.extensions import cache
+from app.single_flight import NotCached, get_single_flight
+
+# Every page renders the footer social links from the base layout
+LAYOUT_NAMESPACES = ('social',)
+
+# X-Page-Cache header per single-flight outcome
+CACHE_HEADERS = {'fresh': 'hit', 'stale': 'stale', 'waited': 'coalesced', 'computed': 'miss'}
+
+
+def page_language() -> str:
+    """Language part of a cache key: the session choice and the locale Babel negotiated"""
+    return f"{session.get('language', '')}-{get_locale()}"
+
+
+def _versions(namespaces: Iterable[str]) -> str:
+    return '.'.join(cache.version(namespace) for namespace in namespaces)
+
+
+def _page_key(namespaces: Tuple[str, ...], query_args: Tuple[str, ...]) -> Tuple[str, str]:
+    args = sorted((request.view_args or {}).items())
+    query = [(name, request.args.get(name, '')) for name in query_args]
+    key = f"{request.endpoint}:{args}:{query}:{page_language()}"
+    # The ETag changes whenever one of the page's namespaces (or 'pages' itself, e.g. on deploy) is bumped
+    etag = hashlib.sha1(f"{key}:{_versions(('pages',) + namespaces)}".encode('utf-8')).hexdigest()
+    return key, etag
+
+
+def _cacheable_request() -> bool:
+    # Pending flash messages are rendered into the page for this visitor only
+    return (request.method in ('GET', 'HEAD') and current_app.config.get('PAGE_CACHE', True)
+            and not session.get('_flashes'))
+
+
+def cached_page(*namespaces: str, query_args: Tuple[str, ...] = (), ttl: Optional[float] = None):
+    """Serve the view from the cache, with ETag revalidation, until its namespaces are bumped
+
+    After a bump one request re-renders the page while concurrent ones get the previous copy
+    (X-Page-Cache: stale), see app/single_flight.py.
+    """
+    namespaces = tuple(namespaces) + LAYOUT_NAMESPACES
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not _cacheable_request():
+                return view(*args, **kwargs)
+
+            def render():
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    raise NotCached(response)
+                return response.get_data(), response.mimetype
+
+            key, etag = _page_key(namespaces, query_args)
+            if etag in request.if_none_match:
+                response = make_response('', 304)
+            else:
+                try:
+                    # A stale copy keeps the ETag it was rendered with
+                    (body, mimetype), etag, outcome = get_single_flight().get(
+                        'pages', key, etag, render, ttl or current_app.config.get('PAGE_CACHE_TTL'))
+                except NotCached as e:
+                    return e.value
+                response = make_response(body)
+                response.mimetype = mimetype
+                response.headers['X-Page-Cache'] = CACHE_HEADERS[outcome]
+
+            response.set_etag(etag)
+            # Browsers revalidate every view, admin edits must show up immediately
+            response.cache_control.no_cache = True
+            response.vary.add('Cookie')
+            response.vary.add('Accept-Language')
+            return response
+        return wrapper
+    return decorator
+
+
+class FooterLink:
+    """Detached copy of an active social link for the footer"""
+
+    __slots__ = ('name', 'platform', 'url', 'icon_class')
+
+    def __init__(self, link):
+        self.name = link.name
+        self.platform = link.platform
+        self.url = link.url
+        self.icon_class = link.icon_class
+
+
+def get_footer_links() -> Tuple[FooterLink, ...]:
+    """Active social links, queried once per process and version of the 'social' namespace"""
+    from app.models import SocialLink
+
+    def build():
+        links = SocialLink.query.filter_by(is_active=True).order_by(SocialLink.sort_order).all()
+        return tuple(FooterLink(link) for link in links)
+
+    return cache.get_or_build_local('social', 'footer-links', build)
+
+
+def cache_fragment(name: str, *namespaces: str, ttl: Optional[float] = None, caller=None) -> Markup:
+    """Jinja call block caching its rendered body per language: {% call cache_fragment('name', 'ns') %}"""
+    key = f"{name}:{page_language()}:{_versions(namespaces)}"
+    html = cache.get('fragments', key)
+    if html is None:
+        html = str(caller())
+        cache.set('fragments', key, html, ttl or current_app.config.get('PAGE_CACHE_TTL'))
+    return Markup(html)
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""Keyset (seek) pagination whose cost does not grow with the page number"""
+import json
+import base64
+import binascii
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+from sqlalchemy import and_, or_
+
+
+class InvalidCursor(ValueError):
+    """Raised for a cursor that was not produced by encode_cursor"""
+
+
+def encode_cursor(values: Tuple[Any, ...]) -> str:
+    """Opaque URL-safe token for the sort key of a row"""
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, types: Tuple[type, ...]) -> Tuple[Any, ...]:
+    """Sort key of a cursor, converted back to the column types"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(types):
+            raise InvalidCursor(cursor)
+        return tuple(datetime.fromisoformat(v) if t is datetime else t(v) for t, v in zip(types, values))
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError) as e:
+        raise InvalidCursor(cursor) from e
+
+
+class KeysetPage:
+    """One page of rows with cursors for its neighbours"""
+
+    def __init__(self, items: List[Any], next_cursor: Optional[str], prev_cursor: Optional[str]):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self) -> bool:
+        return self.prev_cursor is not None
+
+
+def _seek(columns, values, descending: bool):
+    # Row-value comparison (a, b) < (x, y) spelled out, it is not portable to every backend
+    clauses = []
+    for i, column in enumerate(columns):
+        equal = [columns[j] == values[j] for j in range(i)]
+        clauses.append(and_(*equal, column < values[i] if descending else column > values[i]))
+    # The redundant bound on the leading column lets the planner use an index range scan
+    bound = columns[0] <= values[0] if descending else columns[0] >= values[0]
+    return and_(bound, or_(*clauses))
+
+
+def keyset_paginate(query, columns, types: Tuple[type, ...], per_page: int,
+                    after: Optional[str] = None, before: Optional[str] = None,
+                    descending: bool = True) -> KeysetPage:
+    """Page through a query ordered by columns (last one unique) from a cursor
+
+    Only the requested rows are read, using an index on the columns, whatever the page depth.
+    """
+    def key(row):
+        return tuple(getattr(row, column.key) for column in columns)
+
+    def ordered(reverse):
+        desc = descending != reverse
+        return [c.desc() if desc else c.asc() for c in columns]
+
+    if before:
+        # Walk backwards in the opposite order, then restore the display order
+        values = decode_cursor(before, types)
+        rows = (query.filter(_seek(columns, values, descending=not descending))
+                .order_by(*ordered(reverse=True)).limit(per_page + 1).all())
+        has_more = len(rows) > per_page
+        rows = list(reversed(rows[:per_page]))
+        prev_cursor = encode_cursor(key(rows[0])) if has_more and rows else None
+        next_cursor = encode_cursor(key(rows[-1])) if rows else None
+        return KeysetPage(rows, next_cursor, prev_cursor)
+
+    if after:
+        query = query.filter(_seek(columns, decode_cursor(after, types), descending=descending))
+    rows = query.order_by(*ordered(reverse=False)).limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    next_cursor = encode_cursor(key(rows[-1])) if has_more else None
+    prev_cursor = encode_cursor(key(rows[0])) if after and rows else None
+    return KeysetPage(rows, next_cursor, prev_cursor)
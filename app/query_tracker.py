@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""Development and test SQL tracker: flags statements repeated within one request (N+1 queries)
+
+Every statement a request runs is recorded with the innermost frames of app
+code that issued it, templates included, so a lazy load inside a
+`{% for %}` loop points at the template line. After the request, statements
+run QUERY_TRACKER_REPEATS times or more are logged as a warning. Capturing
+the stack costs far more than the metrics, which is why the tracker is on in
+the development and testing configurations only.
+"""
+import os
+import sys
+from collections import Counter
+from typing import List, Optional, Tuple
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+ORIGIN_FRAMES = 4  # App frames kept per statement, innermost first
+
+
+class TrackedQuery:
+    """One executed statement and where it came from"""
+
+    __slots__ = ('statement', 'origin')
+
+    def __init__(self, statement: str, origin: Tuple[str, ...]):
+        self.statement = statement
+        self.origin = origin  # 'file:line in function', innermost first
+
+
+class QueryLog:
+    """Statements executed while handling one request"""
+
+    def __init__(self):
+        self.queries: List[TrackedQuery] = []
+
+    def __len__(self) -> int:
+        return len(self.queries)
+
+    def repeated(self, threshold: int = 2) -> List[Tuple[str, List[TrackedQuery]]]:
+        """(statement, its executions) for statements run at least `threshold` times, most repeated first"""
+        counts = Counter(query.statement for query in self.queries)
+        return [(statement, [query for query in self.queries if query.statement == statement])
+                for statement, count in counts.most_common() if count >= threshold]
+
+    def describe(self, threshold: int = 2) -> str:
+        """Readable report of the repeated statements and the code that ran them"""
+        lines = []
+        for statement, queries in self.repeated(threshold):
+            lines.append(f'{len(queries)}x {" ".join(statement.split())}')
+            for origin in dict.fromkeys(query.origin for query in queries):
+                lines.extend(f'    {frame}' for frame in origin or ('<outside app code>',))
+        return '\n'.join(lines)
+
+
+def _origin(root: str) -> Tuple[str, ...]:
+    frames = []
+    frame = sys._getframe(2)
+    while frame is not None and len(frames) < ORIGIN_FRAMES:
+        filename = frame.f_code.co_filename
+        if filename.startswith(root) and filename != __file__:
+            lineno = frame.f_lineno
+            template = frame.f_globals.get('__jinja_template__')
+            if template is not None:
+                # Compiled template code: report the line of the template source
+                lineno = template.get_corresponding_lineno(lineno)
+            frames.append(f'{os.path.relpath(filename, root)}:{lineno} in {frame.f_code.co_name}')
+        frame = frame.f_back
+    return tuple(frames)
+
+
+def _record(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        log: Optional[QueryLog] = g.get('query_log')
+        if log is not None:
+            log.queries.append(TrackedQuery(statement, _origin(current_app.root_path)))
+
+
+def _start_request():
+    g.query_log = QueryLog()
+
+
+def _report_request(response):
+    log = g.get('query_log')
+    threshold = current_app.config.get('QUERY_TRACKER_REPEATS', 3)
+    if log is not None and log.repeated(threshold):
+        current_app.logger.warning(f"Repeated SQL in {request.method} {request.path} ({len(log)} statements):\n"
+                                   f"{log.describe(threshold)}")
+    return response
+
+
+def init_app(app) -> None:
+    """Record the statements of every request when QUERY_TRACKER is on"""
+    if not app.config.get('QUERY_TRACKER'):
+        return
+    if not event.contains(Engine, 'before_cursor_execute', _record):
+        event.listen(Engine, 'before_cursor_execute', _record)
+    app.before_request(_start_request)
+    app.after_request(_report_request)
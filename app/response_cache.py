@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""Cache of chatbot answers with exact and near-duplicate question matching"""
+import os
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any, FrozenSet, Tuple
+
+from app.extensions import cache
+from app.metrics import count_cache
+
+_NON_WORD = re.compile(r'[\W_]+', re.UNICODE)
+_NUMBER = re.compile(r'\d+')
+
+
+def normalize_message(message: str) -> str:
+    """Normalize a question for matching: case, punctuation and whitespace are ignored"""
+    return _NON_WORD.sub(' ', message.casefold()).strip()
+
+
+def ngrams(text: str, size: int = 3) -> FrozenSet[str]:
+    """Character n-grams of a normalized message, padded so short words still count"""
+    padded = f' {text} '
+    if len(padded) <= size:
+        return frozenset([padded])
+    return frozenset(padded[i:i + size] for i in range(len(padded) - size + 1))
+
+
+def numbers(text: str) -> Tuple[str, ...]:
+    """Numbers in a message, which must match exactly ("product 1" is not "product 2")"""
+    return tuple(_NUMBER.findall(text))
+
+
+def similarity(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    """Jaccard similarity of two n-gram sets"""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class CachedResponse:
+    """A cached answer with its n-gram fingerprint"""
+
+    __slots__ = ('response', 'grams', 'numbers', 'expires_at', 'latency')
+
+    def __init__(self, response: str, normalized: str, ngram_size: int, expires_at: float, latency: float):
+        self.response = response
+        self.grams = ngrams(normalized, ngram_size)
+        self.numbers = numbers(normalized)
+        self.expires_at = expires_at
+        self.latency = latency  # Seconds the original OpenAI answer took
+
+
+class ResponseCache:
+    """Chatbot answers keyed on language, normalized message and catalog version"""
+
+    def __init__(self, max_entries: int = 512, ttl: float = 6 * 3600, similarity_threshold: float = 0.8,
+                 ngram_size: int = 3):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.ngram_size = ngram_size
+        self._entries = OrderedDict()  # (language, normalized message) -> CachedResponse
+        self._catalog_version = None
+        self._lock = threading.Lock()
+        self._stats = {'exact_hits': 0, 'similar_hits': 0, 'misses': 0, 'stores': 0, 'saved_seconds': 0.0}
+        self._started = time.time()
+
+    @staticmethod
+    def _shared_key(language: str, normalized: str) -> str:
+        return f"chatbot-response:{language}:{hashlib.sha1(normalized.encode('utf-8')).hexdigest()}"
+
+    def _sync_catalog_version(self) -> None:
+        # Answers recommend products, so a catalog edit makes every cached answer stale
+        version = cache.version('catalog')
+        with self._lock:
+            if version != self._catalog_version:
+                self._entries.clear()
+                self._catalog_version = version
+
+    def _remember(self, key, entry: CachedResponse) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _hit(self, kind: str, entry: CachedResponse) -> str:
+        count_cache('chatbot_responses', kind[:-1])
+        with self._lock:
+            self._stats[kind] += 1
+            self._stats['saved_seconds'] += entry.latency
+        return entry.response
+
+    def lookup(self, language: str, message: str) -> Optional[str]:
+        """Return a cached answer for the question or a near-duplicate of it"""
+        normalized = normalize_message(message)
+        if not normalized:
+            return None
+        self._sync_catalog_version()
+        key = (language, normalized)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at < now:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is not None:
+            return self._hit('exact_hits', entry)
+
+        # Another worker may have answered the same question already
+        shared = cache.get('catalog', self._shared_key(language, normalized))
+        if shared is not None:
+            entry = CachedResponse(shared['response'], normalized, self.ngram_size,
+                                   now + self.ttl, shared.get('latency', 0.0))
+            self._remember(key, entry)
+            return self._hit('exact_hits', entry)
+
+        if self.similarity_threshold < 1:
+            grams, message_numbers = ngrams(normalized, self.ngram_size), numbers(normalized)
+            best, best_score = None, self.similarity_threshold
+            with self._lock:
+                for (entry_language, _), candidate in self._entries.items():
+                    if entry_language != language or candidate.expires_at < now:
+                        continue
+                    if candidate.numbers != message_numbers:
+                        continue
+                    score = similarity(grams, candidate.grams)
+                    if score >= best_score:
+                        best, best_score = candidate, score
+            if best is not None:
+                return self._hit('similar_hits', best)
+
+        count_cache('chatbot_responses', 'miss')
+        with self._lock:
+            self._stats['misses'] += 1
+        return None
+
+    def store(self, language: str, message: str, response: str, latency: float = 0.0) -> None:
+        """Cache a successful answer locally and for the other workers"""
+        normalized = normalize_message(message)
+        if not normalized or not response:
+            return
+        self._sync_catalog_version()
+        self._remember((language, normalized),
+                       CachedResponse(response, normalized, self.ngram_size, time.time() + self.ttl, latency))
+        cache.set('catalog', self._shared_key(language, normalized),
+                  {'response': response, 'latency': latency}, self.ttl)
+        with self._lock:
+            self._stats['stores'] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit and miss counters of this worker since it started"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        lookups = stats['exact_hits'] + stats['similar_hits'] + stats['misses']
+        stats['lookups'] = lookups
+        stats['hit_rate'] = (stats['exact_hits'] + stats['similar_hits']) / lookups if lookups else 0.0
+        stats['saved_seconds'] = round(stats['saved_seconds'], 2)
+        stats['worker_pid'] = os.getpid()
+        stats['since'] = self._started
+        return stats
+
+
+def get_response_cache(app) -> Optional[ResponseCache]:
+    """Get the application's chatbot response cache, or None when disabled"""
+    if not app.config.get('CHATBOT_RESPONSE_CACHE', True):
+        return None
+    response_cache = app.extensions.get('chatbot_response_cache')
+    if response_cache is None:
+        response_cache = ResponseCache(
+            max_entries=app.config.get('CHATBOT_RESPONSE_CACHE_SIZE', 512),
+            ttl=app.config.get('CHATBOT_RESPONSE_CACHE_TTL', 6 * 3600),
+            similarity_threshold=app.config.get('CHATBOT_RESPONSE_SIMILARITY', 0.8)
+        )
+        app.extensions['chatbot_response_cache'] = response_cache
+    return response_cache
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""BM25 retrieval over the catalog, so the chatbot is only given the products and categories a message is about
+
+The index lives in memory per worker and is pickled to the instance folder,
+stamped with the catalog cache version it reflects. Commits apply their
+product and category changes to the file; other workers reload it when the
+catalog version moves, and rebuild from the database only when it is stale.
+"""
+import os
+import re
+import math
+import heapq
+import pickle
+import tempfile
+from contextlib import contextmanager
+from itertools import chain
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.catalog import get_catalog
+from app.extensions import cache
+from app.models import Category, Product
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process development server
+    fcntl = None
+
+_TOKEN = re.compile(r'\w+')
+# Words are indexed by prefixes so inflected forms match: the short one catches short stems
+# (сайт/сайтів/сайти), the long one keeps longer words apart (website/websites vs webinar)
+PREFIX_LENGTHS = (4, 6)
+
+Key = Tuple[str, int]  # (kind, row id)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word prefixes of a text"""
+    terms = []
+    for word in _TOKEN.findall(text.lower()):
+        if len(word) > 1:
+            terms.extend({word[:length] for length in PREFIX_LENGTHS})
+    return terms
+
+
+class CatalogIndex:
+    """Per-language BM25 postings plus the context line of every indexed item"""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.version: Optional[str] = None  # Catalog cache version the index reflects
+        self.entries: Dict[Key, Tuple[tuple, Dict[str, str]]] = {}  # key -> (sort key, line per language)
+        self.postings: Dict[str, Dict[str, Dict[Key, int]]] = {}  # language -> term -> key -> term frequency
+        self.lengths: Dict[str, Dict[Key, int]] = {}  # language -> key -> document length
+        self.total_length: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def add(self, key: Key, order: tuple, documents: Dict[str, Tuple[str, str]]) -> None:
+        """Index an item from its (context line, searchable text) per language, replacing an older copy"""
+        self.remove(key)
+        self.entries[key] = (order, {language: line for language, (line, _) in documents.items()})
+        for language, (_, text) in documents.items():
+            terms = tokenize(text)
+            postings = self.postings.setdefault(language, {})
+            for term in terms:
+                entry = postings.setdefault(term, {})
+                entry[key] = entry.get(key, 0) + 1
+            self.lengths.setdefault(language, {})[key] = len(terms)
+            self.total_length[language] = self.total_length.get(language, 0) + len(terms)
+
+    def remove(self, key: Key) -> None:
+        if self.entries.pop(key, None) is None:
+            return
+        for language, lengths in self.lengths.items():
+            length = lengths.pop(key, None)
+            if length is None:
+                continue
+            self.total_length[language] -= length
+            postings = self.postings[language]
+            for term in [term for term, entry in postings.items() if key in entry]:
+                del postings[term][key]
+                if not postings[term]:
+                    del postings[term]
+
+    def search(self, query: str, language: str, kind: str, limit: int) -> List[Key]:
+        """Keys of the best matching items of a kind, best first"""
+        postings, lengths = self.postings.get(language, {}), self.lengths.get(language, {})
+        if not lengths:
+            return []
+        count, average = len(lengths), self.total_length[language] / len(lengths) or 1
+        scores: Dict[Key, float] = {}
+        for term in set(tokenize(query)):
+            matches = postings.get(term)
+            if not matches:
+                continue
+            idf = math.log(1 + (count - len(matches) + 0.5) / (len(matches) + 0.5))
+            for key, frequency in matches.items():
+                if key[0] != kind:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * lengths[key] / average)
+                scores[key] = scores.get(key, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+        # Ties go to the catalog order
+        return heapq.nsmallest(limit, scores, key=lambda key: (-scores[key], self.entries[key][0]))
+
+    def first(self, kind: str, limit: int) -> List[Key]:
+        """Keys of the first items of a kind in catalog order"""
+        return heapq.nsmallest(limit, (key for key in self.entries if key[0] == kind),
+                               key=lambda key: self.entries[key][0])
+
+    def line(self, key: Key, language: str) -> str:
+        return self.entries[key][1].get(language, '')
+
+
+def _product_documents(product: Product, languages: Iterable[str]) -> Dict[str, Tuple[str, str]]:
+    documents = {}
+    for language in languages:
+        name, description = product.get_name(language), product.get_description(language)
+        line = (f"- {name}: {product.price} {product.currency} - "
+                f"{description[:100] if description else 'Качественный цифровой продукт'}...")
+        # The name counts twice: a word in the name says more than one in the description
+        documents[language] = (line, f'{name} {name} {description}')
+    return documents
+
+
+def _category_documents(category: Category, languages: Iterable[str]) -> Dict[str, Tuple[str, str]]:
+    documents = {}
+    for language in languages:
+        name, description = category.get_name(language), category.get_description(language)
+        line = f"- {name}: {description[:100] if description else 'Профессиональные ИТ-услуги'}..."
+        documents[language] = (line, f'{name} {name} {description}')
+    return documents
+
+
+# Model -> (kind, document builder)
+INDEXED = {Product: ('product', _product_documents), Category: ('category', _category_documents)}
+
+
+def _entry(obj) -> Optional[Tuple[tuple, Dict[str, Tuple[str, str]]]]:
+    """Sort key and documents of a row, None when it must not be offered to the chatbot"""
+    if not obj.is_active:
+        return None
+    return (obj.sort_order, obj.id), INDEXED[type(obj)][1](obj, current_app.config['LANGUAGES'])
+
+
+def build_index() -> CatalogIndex:
+    """Index every active product and category of the catalog snapshot"""
+    index = CatalogIndex()
+    catalog, languages = get_catalog(), current_app.config['LANGUAGES']
+    for model, records in ((Product, catalog.active_products), (Category, catalog.active_categories)):
+        kind, documents = INDEXED[model]
+        for record in records:
+            index.add((kind, record.id), (record.sort_order, record.id), documents(record, languages))
+    return index
+
+
+def _index_path() -> Optional[str]:
+    path = current_app.config.get('CHATBOT_RETRIEVAL_INDEX')
+    return os.path.join(current_app.instance_path, path) if path else None
+
+
+@contextmanager
+def _locked(path: str):
+    # Serializes rebuilds and updates between the workers of a host
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.lock', 'a') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _read(path: str) -> Optional[CatalogIndex]:
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError):
+        return None
+
+
+def _write(index: CatalogIndex, path: str) -> None:
+    # Write to a temp file and rename so readers never see a partial index
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(index, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _load_or_build() -> CatalogIndex:
+    version = cache.version('catalog')
+    path = _index_path()
+    if path is None:
+        index = build_index()
+    else:
+        with _locked(path):
+            index = _read(path)
+            if index is not None and index.version == version:
+                return index
+            index = build_index()
+            index.version = version
+            _write(index, path)
+    index.version = version
+    return index
+
+
+def get_catalog_index() -> CatalogIndex:
+    """This worker's catalog index, reloaded after catalog commits"""
+    return cache.get_or_build_local('catalog', 'retrieval-index', _load_or_build)
+
+
+def catalog_context(language: str, message: Optional[str] = None, products: int = 5,
+                    categories: int = 5) -> Dict[str, str]:
+    """Context lines of the products and categories most relevant to a message
+
+    Without a message, or when nothing matches it, the first items in catalog order are used.
+    """
+    index = get_catalog_index()
+    lines = {}
+    for kind, limit in (('product', products), ('category', categories)):
+        keys = index.search(message, language, kind, limit) if message else []
+        lines[kind] = [index.line(key, language) for key in keys or index.first(kind, limit)]
+    return {'product_info': '\n'.join(lines['product']), 'category_info': '\n'.join(lines['category'])}
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changes(session, flush_context):
+    if not has_app_context():
+        return
+    changed = [obj for obj in chain(session.new, session.dirty) if type(obj) in INDEXED]
+    deleted = [obj for obj in session.deleted if type(obj) in INDEXED]
+    if not (changed or deleted):
+        return
+    # Deltas only apply on top of the index as it was when this transaction started writing
+    session.info.setdefault('retrieval_base', cache.version('catalog'))
+    changes = session.info.setdefault('retrieval_changes', {})
+    for obj in deleted:
+        changes[(INDEXED[type(obj)][0], obj.id)] = None
+    for obj in changed:
+        changes[(INDEXED[type(obj)][0], obj.id)] = _entry(obj)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_bulk_writes(orm_execute_state):
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        if any(mapper.class_ in INDEXED for mapper in orm_execute_state.all_mappers):
+            # Rows changed by a bulk statement are unknown, the index has to be rebuilt
+            orm_execute_state.session.info['retrieval_stale'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_changes(session):
+    # Runs after app.cache has bumped the catalog version for this commit
+    changes = session.info.pop('retrieval_changes', None)
+    base = session.info.pop('retrieval_base', None)
+    stale = session.info.pop('retrieval_stale', False)
+    if not (changes or stale) or not has_app_context():
+        return
+    path = _index_path()
+    if path is None:
+        return
+    try:
+        with _locked(path):
+            index = _read(path)
+            if stale or index is None or index.version != base:
+                # Missed other commits: let the next reader rebuild it
+                if os.path.exists(path):
+                    os.remove(path)
+                return
+            for key, entry in changes.items():
+                if entry is None:
+                    index.remove(key)
+                else:
+                    index.add(key, *entry)
+            index.version = cache.version('catalog')
+            _write(index, path)
+    except OSError as e:
+        current_app.logger.warning(f"Updating the chatbot retrieval index failed: {str(e)}")
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    for key in ('retrieval_changes', 'retrieval_base', 'retrieval_stale'):
+        session.info.pop(key, None)
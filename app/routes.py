@@ -1,10 +1,24 @@
 import os
-from flask import Blueprint, render_template, request, jsonify, session, redirect, url_for, flash, current_app
+import json
+import hashlib
+import stripe
+from datetime import datetime
+from flask import Blueprint, render_template, request, jsonify, session, redirect, url_for, flash, current_app, Response, stream_with_context, make_response, abort
 from flask_babel import gettext as _, ngettext
-from app.extensions import db
+from sqlalchemy.orm import joinedload, with_expression
+from app.extensions import db, cache
 from app.models import Category, Product, BlogPost, HomePageBlock, SocialLink, Order, OrderItem, User, ChatThread
 from app.forms import ContactForm, LoginForm
 from app.utils import get_current_language, create_checkout_session, ChatbotAssistant
+from app.page_cache import cached_page, CACHE_HEADERS
+from app.pagination import keyset_paginate, InvalidCursor
+from app.localization import localized
+from app.checkout import resolve_cart, CartError
+from app.orders import cart_metadata, verify_event, handle_event, WebhookError
+from app.stripe_client import StripeUnavailable, get_stripe_client
+from app.search import search, KINDS
+from app.catalog import get_catalog, paginate
+from app.single_flight import NotCached, get_single_flight
 from werkzeug.security import check_password_hash
 
 # Create blueprints
@@ -14,18 +28,23 @@ api_bp = Blueprint('api', __name__)
 
 # Main routes
 @main_bp.route('/')
+@cached_page('homepage', 'blog', 'catalog')
 def index():
     """Home page with customizable blocks"""
     language = get_current_language()
     
     # Get active home page blocks
-    blocks = HomePageBlock.query.filter_by(is_active=True).order_by(HomePageBlock.sort_order).all()
+    blocks = HomePageBlock.query.filter_by(is_active=True).options(
+        *localized(HomePageBlock, language)).order_by(HomePageBlock.sort_order).all()
     
     # Get latest blog posts for preview
-    latest_posts = BlogPost.query.filter_by(is_published=True).order_by(BlogPost.created_at.desc()).limit(3).all()
+    latest_posts = BlogPost.query.filter_by(is_published=True).options(
+        *localized(BlogPost, language, ('title', 'excerpt')),
+        with_expression(BlogPost.preview, BlogPost.listing_excerpt(language, 150))
+    ).order_by(BlogPost.created_at.desc()).limit(3).all()
     
     # Get featured products
-    featured_products = Product.query.filter_by(is_active=True).order_by(Product.sort_order).limit(6).all()
+    featured_products = get_catalog().active_products[:6]
     
     return render_template('index.html',
                          blocks=blocks,
@@ -41,44 +60,62 @@ def set_language(language):
     return redirect(request.referrer or url_for('main.index'))
 
 @main_bp.route('/shop')
+@cached_page('catalog')
 def shop():
     """Shop page with categories"""
     language = get_current_language()
-    categories = Category.query.filter_by(is_active=True).order_by(Category.sort_order).all()
+    categories = get_catalog().active_categories
     return render_template('shop/categories.html', categories=categories, language=language)
 
 @main_bp.route('/shop/category/<int:category_id>')
+@cached_page('catalog')
 def category_products(category_id):
     """Products in category"""
     language = get_current_language()
-    category = Category.query.get_or_404(category_id)
-    products = Product.query.filter_by(category_id=category_id, is_active=True).order_by(Product.sort_order).all()
+    catalog = get_catalog()
+    category = catalog.categories.get(category_id) or abort(404)
+    products = catalog.products_in(category_id)
     return render_template('shop/products.html', category=category, products=products, language=language)
 
 @main_bp.route('/shop/product/<int:product_id>')
+@cached_page('catalog')
 def product_detail(product_id):
     """Product detail page"""
     language = get_current_language()
-    product = Product.query.get_or_404(product_id)
-    related_products = Product.query.filter_by(category_id=product.category_id, is_active=True).filter(Product.id != product_id).limit(4).all()
+    catalog = get_catalog()
+    product = catalog.products.get(product_id) or abort(404)
+    related_products = catalog.related(product, limit=4)
     return render_template('shop/product_detail.html', product=product, related_products=related_products, language=language)
 
 @main_bp.route('/blog')
+@cached_page('blog', 'catalog', query_args=('after', 'before'))
 def blog():
     """Blog page"""
     language = get_current_language()
-    page = request.args.get('page', 1, type=int)
-    posts = BlogPost.query.filter_by(is_published=True).order_by(BlogPost.created_at.desc()).all()
-    categories = Category.query.all()
-    return render_template('blog/index.html', posts=posts, language=language, categories=categories)
+    # Only titles and a short preview are read, the full articles in four languages stay in the database
+    listing = BlogPost.query.filter_by(is_published=True).options(
+        *localized(BlogPost, language, ('title',)),
+        with_expression(BlogPost.preview, BlogPost.listing_excerpt(language))
+    )
+    try:
+        page = keyset_paginate(listing, (BlogPost.created_at, BlogPost.id), (datetime, int),
+                               per_page=current_app.config.get('BLOG_POSTS_PER_PAGE', 10),
+                               after=request.args.get('after'), before=request.args.get('before'))
+    except InvalidCursor:
+        return redirect(url_for('main.blog'))
+    categories = list(get_catalog().categories.values())
+    return render_template('blog/index.html', posts=page.items, page=page, language=language, categories=categories)
 
 @main_bp.route('/blog/<slug>')
+@cached_page('blog', 'catalog')
 def blog_post(slug):
     """Individual blog post"""
     language = get_current_language()
-    post = BlogPost.query.filter_by(slug=slug, is_published=True).first_or_404()
-    categories = Category.query.all()
-    recent_posts = BlogPost.query.filter_by(is_published=True).filter(BlogPost.id != post.id).order_by(BlogPost.created_at.desc()).limit(5).all()
+    post = BlogPost.query.filter_by(slug=slug, is_published=True).options(
+        *localized(BlogPost, language, ('title', 'content')), joinedload(BlogPost.author)).first_or_404()
+    categories = list(get_catalog().categories.values())
+    recent_posts = BlogPost.query.filter_by(is_published=True).filter(BlogPost.id != post.id).options(
+        *localized(BlogPost, language, ('title',))).order_by(BlogPost.created_at.desc()).limit(5).all()
     return render_template('blog/post.html', post=post, language=language, categories=categories, recent_posts=recent_posts)
 
 @main_bp.route('/blog/category/<category_slug>')
@@ -86,6 +123,23 @@ def blog_category(category_slug):
     """Blog posts by category - redirecting to all blog posts since posts don't have categories"""
     return redirect(url_for('main.blog'))
 
+def _search_hit_url(hit):
+    if hit.kind == 'post':
+        return url_for('main.blog_post', slug=hit.slug)
+    return url_for('main.product_detail', product_id=hit.id)
+
+@main_bp.route('/search')
+@cached_page('catalog', 'blog', query_args=('q', 'kind', 'page'))
+def search_page():
+    """Search products and blog posts in the current language"""
+    language = get_current_language()
+    query = request.args.get('q', '').strip()
+    kind = request.args.get('kind') if request.args.get('kind') in KINDS else None
+    page = search(query, language, kind=kind, page=max(request.args.get('page', 1, type=int), 1),
+                  per_page=current_app.config.get('SEARCH_PER_PAGE', 20))
+    return render_template('search.html', query=query, kind=kind, page=page, language=language,
+                           hit_url=_search_hit_url)
+
 @main_bp.route('/contact', methods=['GET', 'POST'])
 def contact():
     """Contact page"""
@@ -105,47 +159,45 @@ def checkout():
     try:
         cart_items = request.json.get('items', [])
         
-        if not cart_items:
-            return jsonify({'error': 'Cart is empty'}), 400
-        
-        # Prepare items for Stripe
-        stripe_items = []
-        for item in cart_items:
-            product = Product.query.get(item['product_id'])
-            if product and product.is_active:
-                stripe_items.append({
-                    'name': product.get_name(get_current_language()),
-                    'description': product.get_description(get_current_language())[:100],
-                    'price': product.price,
-                    'currency': product.currency,
-                    'quantity': item.get('quantity', 1)
-                })
-        
-        if not stripe_items:
-            return jsonify({'error': 'No valid items in cart'}), 400
+        # Resolve the whole cart with one query into a price snapshot
+        try:
+            lines = resolve_cart(cart_items, get_current_language(),
+                                 max_quantity=current_app.config.get('CART_MAX_QUANTITY', 99),
+                                 max_lines=current_app.config.get('CART_MAX_LINES', 100))
+        except CartError as e:
+            return jsonify({'error': str(e), 'problems': e.problems}), 400
+        stripe_items = [line.as_item() for line in lines]
         
         # Create checkout session
-        session_id = create_checkout_session(
-            items=stripe_items,
-            success_url=url_for('main.checkout_success', _external=True) + '?session_id={CHECKOUT_SESSION_ID}',
-            cancel_url=url_for('main.shop', _external=True)
-        )
+        try:
+            session_id = create_checkout_session(
+                items=stripe_items,
+                success_url=url_for('main.checkout_success', _external=True) + '?session_id={CHECKOUT_SESSION_ID}',
+                cancel_url=url_for('main.shop', _external=True),
+                metadata=cart_metadata(lines)  # Lets the webhook record the order items without calling Stripe
+            )
+        except StripeUnavailable as e:
+            # Degraded mode: say so and let the customer retry, never fake a purchase
+            retry_after = max(1, int(e.retry_after))
+            response = jsonify({'error': 'Payments are temporarily unavailable, please try again shortly',
+                                'code': 'payments_unavailable', 'retry_after': retry_after})
+            response.headers['Retry-After'] = str(retry_after)
+            return response, 503
+        except stripe.error.StripeError as e:
+            current_app.logger.error(f"Stripe rejected checkout session: {str(e)}")
+            return jsonify({'error': 'Failed to create checkout session', 'code': 'payment_error'}), 502
+        
+        # Handle demo mode
+        if session_id.startswith('demo_'):
+            # For demo mode, redirect immediately to success page
+            return jsonify({
+                'session_id': session_id,
+                'demo_mode': True,
+                'redirect_url': url_for('main.checkout_success', _external=True) + f'?session_id={session_id}'
+            })
+        # Real Stripe session
+        return jsonify({'session_id': session_id})
         
-        if session_id:
-            # Handle demo mode
-            if session_id.startswith('demo_'):
-                # For demo mode, redirect immediately to success page
-                return jsonify({
-                    'session_id': session_id,
-                    'demo_mode': True,
-                    'redirect_url': url_for('main.checkout_success', _external=True) + f'?session_id={session_id}'
-                })
-            else:
-                # Real Stripe session
-                return jsonify({'session_id': session_id})
-        else:
-            return jsonify({'error': 'Failed to create checkout session'}), 500
-            
     except Exception as e:
         current_app.logger.error(f"Checkout error: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
@@ -154,7 +206,23 @@ def checkout():
 def checkout_success():
     """Checkout success page"""
     session_id = request.args.get('session_id')
-    return render_template('checkout/success.html', session_id=session_id)
+    # The order exists once the Stripe webhook has been received
+    order = Order.query.filter_by(stripe_session_id=session_id).first() if session_id else None
+    return render_template('checkout/success.html', session_id=session_id, order=order)
+
+@main_bp.route('/stripe/webhook', methods=['POST'])
+def stripe_webhook():
+    """Receive Stripe events; orders are recorded once per event however often it is delivered"""
+    try:
+        event = verify_event(request.get_data(), request.headers.get('Stripe-Signature', ''))
+    except WebhookError as e:
+        current_app.logger.warning(f"Rejected Stripe webhook: {str(e)}")
+        return jsonify({'error': 'Invalid webhook'}), 400
+    
+    applied = handle_event(event)
+    if not applied:
+        current_app.logger.info(f"Stripe event {event['id']} already processed")
+    return jsonify({'received': True, 'duplicate': not applied})
 
 # Admin routes
 @admin_bp.route('/')
@@ -217,7 +285,7 @@ def products():
     if not session.get('admin_logged_in'):
         return redirect(url_for('admin.login'))
     
-    products = Product.query.order_by(Product.sort_order).all()
+    products = Product.query.options(joinedload(Product.category)).order_by(Product.sort_order).all()
     return render_template('admin/products.html', products=products)
 
 @admin_bp.route('/blog')
@@ -226,7 +294,7 @@ def blog():
     if not session.get('admin_logged_in'):
         return redirect(url_for('admin.login'))
     
-    posts = BlogPost.query.order_by(BlogPost.created_at.desc()).all()
+    posts = BlogPost.query.options(joinedload(BlogPost.author)).order_by(BlogPost.created_at.desc()).all()
     return render_template('admin/blog.html', posts=posts)
 
 @admin_bp.route('/homepage')
@@ -258,14 +326,37 @@ def chatbot_admin():
     active_threads = ChatThread.query.filter_by(is_active=True).count()
     recent_threads = ChatThread.query.order_by(ChatThread.updated_at.desc()).limit(10).all()
     
+    from app.response_cache import get_response_cache
+    response_cache = get_response_cache(current_app._get_current_object())
+    
     stats = {
         'total_threads': total_threads,
         'active_threads': active_threads,
-        'recent_threads': recent_threads
+        'recent_threads': recent_threads,
+        'response_cache': response_cache.stats() if response_cache else None
     }
     
     return render_template('admin/chatbot.html', stats=stats)
 
+@admin_bp.route('/stripe/status')
+def stripe_status():
+    """Stripe client circuit state and call latency/error metrics of this worker"""
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    client = get_stripe_client()
+    if client is None:
+        return jsonify({'configured': False})
+    return jsonify(dict(client.stats(), configured=True))
+
+@admin_bp.route('/cache/status')
+def cache_status():
+    """Single-flight outcomes of this worker: hit and coalescing ratios per cached namespace"""
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    return jsonify(get_single_flight().stats.stats())
+
 @admin_bp.route('/chatbot/cleanup', methods=['POST'])
 def chatbot_cleanup():
     """Clean up old chat threads"""
@@ -311,34 +402,170 @@ def chatbot():
         current_app.logger.error(f"Chatbot API error: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
+@api_bp.route('/chatbot/stream', methods=['POST'])
+def chatbot_stream():
+    """Chatbot API endpoint streaming the answer as server-sent events"""
+    data = request.get_json(silent=True) or {}
+    message = data.get('message', '')
+    language = data.get('language', 'uk')
+    
+    if not message:
+        return jsonify({'error': 'Message is required'}), 400
+    
+    session_id = request.cookies.get('session_id') or request.headers.get('X-Session-ID')
+    if not session_id:
+        import uuid
+        session_id = str(uuid.uuid4())
+    
+    chatbot = ChatbotAssistant()
+    
+    def sse(event, payload):
+        return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+    
+    def generate():
+        try:
+            for text in chatbot.stream_response(message, session_id, language):
+                yield sse('token', {'text': text})
+            yield sse('done', {'session_id': session_id})
+        except Exception as e:
+            current_app.logger.error(f"Chatbot stream error: {str(e)}")
+            yield sse('error', {'error': 'Internal server error'})
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Disable proxy buffering so tokens arrive immediately
+    })
+
+# Fields /api/products can return; the default keeps the original response shape
+PRODUCT_FIELDS = {
+    'id': lambda p, language: p.id,
+    'name': lambda p, language: p.get_name(language),
+    'description': lambda p, language: p.get_description(language),
+    'price': lambda p, language: p.price,
+    'currency': lambda p, language: p.currency,
+    'image': lambda p, language: p.image,
+    'category_id': lambda p, language: p.category_id,
+    'slug': lambda p, language: p.slug
+}
+DEFAULT_PRODUCT_FIELDS = ('id', 'name', 'description', 'price', 'currency', 'image', 'category_id')
+
+def _id_list(value):
+    """Parse a comma separated list of ids, None if it is malformed"""
+    try:
+        return [int(part) for part in value.split(',') if part.strip()]
+    except ValueError:
+        return None
+
 @api_bp.route('/products')
 def products():
-    """API endpoint for products"""
+    """API endpoint for products: ?id=, ?ids=1,2, ?fields=, ?category_id=, ?limit= and ?cursor="""
     language = request.args.get('language', 'uk')
     category_id = request.args.get('category_id', type=int)
+    product_id = request.args.get('id', type=int)
+    ids = _id_list(request.args.get('ids') or request.args.get('product_id') or '')
+    fields = tuple(f for f in request.args.get('fields', '').split(',') if f) or DEFAULT_PRODUCT_FIELDS
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    
+    if ids is None:
+        return jsonify({'error': 'ids must be comma separated integers'}), 400
+    unknown = [f for f in fields if f not in PRODUCT_FIELDS]
+    if unknown:
+        return jsonify({'error': f"Unknown fields: {', '.join(unknown)}"}), 400
+    max_limit = current_app.config.get('API_PRODUCTS_MAX_LIMIT', 100)
+    if len(ids) > max_limit or (limit is not None and not 0 < limit <= max_limit):
+        return jsonify({'error': f'At most {max_limit} products per request'}), 400
     
-    query = Product.query.filter_by(is_active=True)
-    if category_id:
-        query = query.filter_by(category_id=category_id)
+    # Product data only changes with the catalog version, so revalidation needs no query
+    etag = hashlib.sha1(f"{cache.version('catalog')}:{request.query_string.decode()}".encode('utf-8')).hexdigest()
+    def render():
+        catalog = get_catalog()
+        listed = catalog.products_in(category_id) if category_id else catalog.active_products
+        
+        def available(p):
+            return p is not None and p.is_active and (not category_id or p.category_id == category_id)
+        
+        headers = {}
+        if product_id is not None:
+            products = [p for p in (catalog.products.get(product_id),) if available(p)]
+            if not products:
+                raise NotCached((jsonify({'error': 'Product not found'}), 404))
+        elif 'ids' in request.args or 'product_id' in request.args:
+            # Returned in the requested order
+            products = [p for p in map(catalog.products.get, dict.fromkeys(ids)) if available(p)]
+        elif limit or cursor:
+            try:
+                page = paginate(listed, per_page=limit or max_limit, after=cursor)
+            except InvalidCursor:
+                raise NotCached((jsonify({'error': 'Invalid cursor'}), 400))
+            products = page.items
+            if page.next_cursor:
+                headers['X-Next-Cursor'] = page.next_cursor
+                headers['Link'] = f'<{url_for("api.products", **{**request.args.to_dict(), "cursor": page.next_cursor})}>; rel="next"'
+        else:
+            products = listed
+        
+        items = [{field: PRODUCT_FIELDS[field](p, language) for field in fields} for p in products]
+        return jsonify(items[0] if product_id is not None else items).get_data(), headers
     
-    products = query.order_by(Product.sort_order).all()
+    if etag in request.if_none_match:
+        response = make_response('', 304)
+    else:
+        # One request per query rebuilds the payload after a catalog change, the others get the previous one
+        try:
+            (body, headers), etag, outcome = get_single_flight().get(
+                'api-products', request.query_string.decode(), etag, render)
+        except NotCached as e:
+            return e.value
+        response = current_app.response_class(body, mimetype='application/json', headers=headers)
+        response.headers['X-Cache'] = CACHE_HEADERS[outcome]
     
-    return jsonify([{
-        'id': p.id,
-        'name': p.get_name(language),
-        'description': p.get_description(language),
-        'price': p.price,
-        'currency': p.currency,
-        'image': p.image,
-        'category_id': p.category_id
-    } for p in products])
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config.get('API_PRODUCTS_MAX_AGE', 60)
+    return response
+
+@api_bp.route('/search')
+def search_api():
+    """Ranked search results: ?q=, ?language=, ?kind=product|post, ?page= and ?per_page="""
+    language = request.args.get('language', 'uk')
+    kind = request.args.get('kind')
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', current_app.config.get('SEARCH_PER_PAGE', 20), type=int)
+    max_per_page = current_app.config.get('SEARCH_MAX_PER_PAGE', 50)
+    
+    if language not in current_app.config['LANGUAGES']:
+        return jsonify({'error': f'Unknown language {language}'}), 400
+    if kind is not None and kind not in KINDS:
+        return jsonify({'error': f"kind must be one of {', '.join(KINDS)}"}), 400
+    if page < 1 or not 0 < per_page <= max_per_page:
+        return jsonify({'error': f'page must be positive and per_page at most {max_per_page}'}), 400
+    
+    results = search(request.args.get('q', ''), language, kind=kind, page=page, per_page=per_page)
+    response = jsonify({
+        'results': [{
+            'kind': hit.kind,
+            'id': hit.id,
+            'title': hit.title,
+            'snippet': str(hit.snippet_html),
+            'url': _search_hit_url(hit),
+            'score': round(hit.score, 4)
+        } for hit in results.hits],
+        'page': results.page,
+        'per_page': results.per_page,
+        'has_next': results.has_next
+    })
+    # Results only change with the catalog and blog
+    response.set_etag(hashlib.sha1(
+        f"{cache.version('catalog')}:{cache.version('blog')}:{request.query_string.decode()}".encode('utf-8')).hexdigest())
+    return response.make_conditional(request)
 
 @api_bp.route('/categories')
 def categories():
     """API endpoint for categories"""
     language = request.args.get('language', 'uk')
     
-    categories = Category.query.filter_by(is_active=True).order_by(Category.sort_order).all()
+    categories = get_catalog().active_categories
     
     return jsonify([{
         'id': c.id,
@@ -349,6 +576,7 @@ def categories():
 
 
 @main_bp.route('/privacy')
+@cached_page()
 def privacy():
     """Privacy Policy page"""
     language = get_current_language()
@@ -356,6 +584,7 @@ def privacy():
 
 
 @main_bp.route('/terms')
+@cached_page()
 def terms():
     """Terms and Conditions page"""
     language = get_current_language()
@@ -363,6 +592,7 @@ def terms():
 
 
 @main_bp.route('/impressum')
+@cached_page()
 def impressum():
     """Impressum page"""
     language = get_current_language()
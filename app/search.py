@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""Multilingual full-text search over active products and published blog posts
+
+Every item is indexed once per language. SQLite uses one FTS5 table per language;
+PostgreSQL uses one table with a weighted tsvector and a GIN index per language.
+ORM writes update the index in the same transaction (see _index_flushed).
+"""
+import re
+from itertools import chain
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from flask import current_app, has_app_context
+from markupsafe import Markup, escape
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import Session
+
+from app.extensions import db
+from app.models import BlogPost, Product, SCHEMA_NAME
+
+DEFAULT_LANGUAGES = ('uk', 'ru', 'de', 'en')
+# Snippet highlight markers, turned into <mark> after the text is escaped
+MARK_START, MARK_END = '\x02', '\x03'
+_TAG = re.compile(r'<[^>]+>')
+_WORD = re.compile(r'\w+')
+
+# (language, title, body, slug) documents of an item, empty when it must not be found
+Document = Tuple[str, str, str, str]
+
+
+def _product_documents(product: Product, languages: Iterable[str]) -> List[Document]:
+    if not product.is_active:
+        return []
+    return [(lang, product.get_name(lang), product.get_description(lang), product.slug) for lang in languages]
+
+
+def _post_documents(post: BlogPost, languages: Iterable[str]) -> List[Document]:
+    if not post.is_published:
+        return []
+    return [(lang, post.get_title(lang), _TAG.sub(' ', f'{post.get_excerpt(lang)} {post.get_content(lang)}'),
+             post.slug) for lang in languages]
+
+
+# Model -> (kind, numeric kind code, document builder)
+SEARCHABLE: Dict[type, Tuple[str, int, Callable]] = {
+    Product: ('product', 0, _product_documents),
+    BlogPost: ('post', 1, _post_documents),
+}
+KINDS = {kind: code for kind, code, _ in SEARCHABLE.values()}
+
+
+class SearchHit:
+    """One ranked search result"""
+
+    __slots__ = ('kind', 'id', 'slug', 'title', 'snippet', 'score')
+
+    def __init__(self, kind: str, id: int, slug: str, title: str, snippet: str, score: float):
+        self.kind = kind
+        self.id = id
+        self.slug = slug
+        self.title = title
+        self.snippet = snippet
+        self.score = score
+
+    @property
+    def snippet_html(self) -> Markup:
+        """Escaped snippet with the matched words wrapped in <mark>"""
+        return escape(self.snippet).replace(MARK_START, Markup('<mark>')).replace(MARK_END, Markup('</mark>'))
+
+
+class SearchPage:
+    """One page of search hits"""
+
+    def __init__(self, hits: List[SearchHit], page: int, per_page: int, has_next: bool):
+        self.hits = hits
+        self.page = page
+        self.per_page = per_page
+        self.has_next = has_next
+
+    @property
+    def has_prev(self) -> bool:
+        return self.page > 1
+
+
+def query_terms(query: str, max_terms: int = 8) -> List[str]:
+    """Words of a user query, lowercased; search syntax characters are dropped"""
+    return [word.lower() for word in _WORD.findall(query)][:max_terms]
+
+
+def _languages() -> Tuple[str, ...]:
+    return tuple(current_app.config['LANGUAGES']) if has_app_context() else DEFAULT_LANGUAGES
+
+
+def _table(name: str) -> str:
+    return f'{SCHEMA_NAME}.{name}' if SCHEMA_NAME != 'public' else name
+
+
+class SQLiteSearchBackend:
+    """FTS5 table per language; rowid = item id * 2 + kind code, so updates are rowid lookups"""
+
+    def table(self, language: str) -> str:
+        return f'search_{language}'
+
+    def create(self, connection) -> None:
+        for language in _languages():
+            connection.execute(text(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table(language)} USING fts5("
+                "kind UNINDEXED, slug UNINDEXED, title, body, "
+                "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"))
+
+    def drop(self, connection) -> None:
+        for language in _languages():
+            connection.execute(text(f'DROP TABLE IF EXISTS {self.table(language)}'))
+
+    def exists(self, connection) -> bool:
+        return inspect(connection).has_table(self.table(_languages()[0]))
+
+    def delete(self, connection, kind: str, ref_id: int) -> None:
+        for language in _languages():
+            connection.execute(text(f'DELETE FROM {self.table(language)} WHERE rowid = :rowid'),
+                               {'rowid': ref_id * 2 + KINDS[kind]})
+
+    def insert(self, connection, kind: str, rows: List[Tuple[int, List[Document]]]) -> None:
+        by_language: Dict[str, List[dict]] = {}
+        for ref_id, documents in rows:
+            for language, title, body, slug in documents:
+                by_language.setdefault(language, []).append(
+                    {'rowid': ref_id * 2 + KINDS[kind], 'kind': kind, 'slug': slug, 'title': title, 'body': body})
+        for language, params in by_language.items():
+            connection.execute(text(f'INSERT INTO {self.table(language)} (rowid, kind, slug, title, body) '
+                                    'VALUES (:rowid, :kind, :slug, :title, :body)'), params)
+
+    def search(self, connection, terms: List[str], language: str, kind: Optional[str],
+               limit: int, offset: int) -> List[SearchHit]:
+        table = self.table(language)
+        # Every word must match, each as a prefix so results follow the user's typing
+        match = ' '.join(f'"{term}"*' for term in terms)
+        rows = connection.execute(text(
+            f"SELECT rowid, kind, slug, title, snippet({table}, 3, :start, :end, '…', 24), "
+            f"bm25({table}, 0, 0, 10.0, 1.0) AS score FROM {table} "
+            f"WHERE {table} MATCH :match {'AND kind = :kind ' if kind else ''}"
+            "ORDER BY score LIMIT :limit OFFSET :offset"),
+            {'match': match, 'kind': kind, 'start': MARK_START, 'end': MARK_END, 'limit': limit, 'offset': offset})
+        return [SearchHit(kind, rowid // 2, slug, title, snippet, -score)
+                for rowid, kind, slug, title, snippet, score in rows]
+
+
+class PostgresSearchBackend:
+    """One table with a weighted tsvector column and a partial GIN index per language"""
+
+    # Ukrainian has no stemmer in core PostgreSQL
+    CONFIGS = {'uk': 'simple', 'ru': 'russian', 'de': 'german', 'en': 'english'}
+
+    def __init__(self):
+        self.name = _table('search_documents')
+
+    def config(self, language: str) -> str:
+        return self.CONFIGS.get(language, 'simple')
+
+    def create(self, connection) -> None:
+        connection.execute(text(
+            f'CREATE TABLE IF NOT EXISTS {self.name} ('
+            'kind VARCHAR(10) NOT NULL, ref_id INTEGER NOT NULL, language VARCHAR(5) NOT NULL, '
+            'slug VARCHAR(255) NOT NULL, title TEXT NOT NULL, body TEXT NOT NULL, document TSVECTOR NOT NULL, '
+            'PRIMARY KEY (kind, ref_id, language))'))
+        for language in _languages():
+            connection.execute(text(
+                f'CREATE INDEX IF NOT EXISTS ix_search_documents_{language} ON {self.name} '
+                f"USING gin (document) WHERE language = '{language}'"))
+
+    def drop(self, connection) -> None:
+        connection.execute(text(f'DROP TABLE IF EXISTS {self.name}'))
+
+    def exists(self, connection) -> bool:
+        return inspect(connection).has_table('search_documents', schema=None if SCHEMA_NAME == 'public' else SCHEMA_NAME)
+
+    def delete(self, connection, kind: str, ref_id: int) -> None:
+        connection.execute(text(f'DELETE FROM {self.name} WHERE kind = :kind AND ref_id = :ref_id'),
+                           {'kind': kind, 'ref_id': ref_id})
+
+    def insert(self, connection, kind: str, rows: List[Tuple[int, List[Document]]]) -> None:
+        params = [{'kind': kind, 'ref_id': ref_id, 'language': language, 'config': self.config(language),
+                   'slug': slug, 'title': title, 'body': body}
+                  for ref_id, documents in rows for language, title, body, slug in documents]
+        if params:
+            connection.execute(text(
+                f'INSERT INTO {self.name} (kind, ref_id, language, slug, title, body, document) '
+                'VALUES (:kind, :ref_id, :language, :slug, :title, :body, '
+                "setweight(to_tsvector(CAST(:config AS regconfig), :title), 'A') || "
+                "setweight(to_tsvector(CAST(:config AS regconfig), :body), 'B'))"), params)
+
+    def search(self, connection, terms: List[str], language: str, kind: Optional[str],
+               limit: int, offset: int) -> List[SearchHit]:
+        # Headlines are only computed for the page being returned
+        rows = connection.execute(text(
+            'WITH query AS (SELECT to_tsquery(CAST(:config AS regconfig), :tsquery) AS q), hits AS ('
+            f'SELECT kind, ref_id, slug, title, body, ts_rank_cd(document, query.q) AS score FROM {self.name}, query '
+            f"WHERE language = :language AND document @@ query.q {'AND kind = :kind ' if kind else ''}"
+            'ORDER BY score DESC LIMIT :limit OFFSET :offset) '
+            'SELECT kind, ref_id, slug, title, ts_headline(CAST(:config AS regconfig), body, query.q, :options), score '
+            'FROM hits, query ORDER BY score DESC'),
+            {'config': self.config(language), 'tsquery': ' & '.join(f'{term}:*' for term in terms),
+             'language': language, 'kind': kind, 'limit': limit, 'offset': offset,
+             'options': f'StartSel={MARK_START}, StopSel={MARK_END}, MaxWords=30, MinWords=12'})
+        return [SearchHit(*row) for row in rows]
+
+
+BACKENDS = {'sqlite': SQLiteSearchBackend, 'postgresql': PostgresSearchBackend}
+
+
+def get_backend(connection):
+    """Search backend for the connection's database"""
+    backend = BACKENDS.get(connection.dialect.name)
+    if backend is None:
+        raise NotImplementedError(f'Full-text search is not available on {connection.dialect.name}')
+    return backend()
+
+
+def search(query: str, language: str, kind: Optional[str] = None, page: int = 1,
+           per_page: int = 20) -> SearchPage:
+    """Ranked hits for a query in one language, best first"""
+    terms = query_terms(query)
+    connection = db.session.connection()
+    if not terms or not _index_ready(connection):
+        return SearchPage([], page, per_page, False)
+    hits = get_backend(connection).search(connection, terms, language, kind, per_page + 1, (page - 1) * per_page)
+    return SearchPage(hits[:per_page], page, per_page, len(hits) > per_page)
+
+
+def _index_ready(connection) -> bool:
+    # Databases created before search existed have no index until migration 0004 or `flask search-reindex`
+    ready = current_app.extensions.get('search_index_ready')
+    if ready is None:
+        ready = connection.dialect.name in BACKENDS and get_backend(connection).exists(connection)
+        current_app.extensions['search_index_ready'] = ready
+    return ready
+
+
+def create_index(connection) -> None:
+    """Create the search tables of the connection's database"""
+    get_backend(connection).create(connection)
+    if has_app_context():
+        current_app.extensions['search_index_ready'] = True
+
+
+def rebuild_index(batch_size: int = 500) -> int:
+    """Recreate the index from every searchable row, returning the number of items indexed"""
+    connection = db.session.connection()
+    backend = get_backend(connection)
+    backend.drop(connection)
+    backend.create(connection)
+    languages, indexed = _languages(), 0
+    for model, (kind, _, documents) in SEARCHABLE.items():
+        rows = []
+        for obj in db.session.query(model).yield_per(batch_size):
+            rows.append((obj.id, documents(obj, languages)))
+            if len(rows) >= batch_size:
+                backend.insert(connection, kind, rows)
+                indexed += len(rows)
+                rows = []
+        backend.insert(connection, kind, rows)
+        indexed += len(rows)
+    db.session.commit()
+    current_app.extensions['search_index_ready'] = True
+    return indexed
+
+
+@event.listens_for(Session, 'after_flush')
+def _index_flushed(session, flush_context):
+    changed = [obj for obj in chain(session.new, session.dirty) if type(obj) in SEARCHABLE]
+    deleted = [obj for obj in session.deleted if type(obj) in SEARCHABLE]
+    if not (changed or deleted) or not has_app_context() or not current_app.config.get('SEARCH_INDEX', True):
+        return
+    connection = session.connection()
+    if not _index_ready(connection):
+        return
+    backend, languages = get_backend(connection), _languages()
+    for obj in chain(changed, deleted):
+        backend.delete(connection, SEARCHABLE[type(obj)][0], obj.id)
+    for obj in changed:
+        kind, _, documents = SEARCHABLE[type(obj)]
+        backend.insert(connection, kind, [(obj.id, documents(obj, languages))])
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _create_with_tables(target, connection, **kw):
+    # Other databases work without search rather than fail db.create_all()
+    if connection.dialect.name in BACKENDS:
+        create_index(connection)
+
+
+@event.listens_for(db.metadata, 'after_drop')
+def _drop_with_tables(target, connection, **kw):
+    if connection.dialect.name in BACKENDS:
+        get_backend(connection).drop(connection)
+    if has_app_context():
+        current_app.extensions.pop('search_index_ready', None)
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""Rebuild expensive cached values once per key, serving the stale value to everyone else meanwhile
+
+A value is stored with the version it was built for (a page ETag made of
+namespace versions, say) under a key that does not change with the version.
+When the version moves or the value expires, exactly one request per key
+rebuilds it: the one that claims the key in its process and then takes the
+key's lock across workers (in the cache store, which is Redis with
+CACHE_TYPE=redis, or a PostgreSQL advisory lock). Every other request is
+served the previous value until the new one is stored, or waits for the
+first value when there is none yet. An invalidation under load then costs one
+render instead of one per concurrent request.
+"""
+import os
+import time
+import hashlib
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import text
+
+from app.extensions import cache, db
+from app.metrics import count_cache
+
+# How a lookup was answered: the current value, the previous value while another request rebuilt it,
+# a value built by another request it waited for, or a value it built itself
+OUTCOMES = ('fresh', 'stale', 'waited', 'computed')
+
+POLL_INTERVAL = 0.05  # Seconds between store reads while waiting for another worker's first value
+
+Entry = Tuple[str, float, Any]  # (version, fresh until, value)
+
+
+class NotCached(Exception):
+    """Raised by a builder whose result must be returned to its caller but not stored, e.g. an error page"""
+
+    def __init__(self, value: Any):
+        super().__init__('Result is not cacheable')
+        self.value = value
+
+
+class FlightStats:
+    """Per-process count of lookup outcomes by namespace"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Dict[str, Dict[str, int]] = {}
+        self._started = time.time()
+
+    def record(self, namespace: str, outcome: str) -> None:
+        count_cache(namespace, outcome)
+        with self._lock:
+            self._counts.setdefault(namespace, dict.fromkeys(OUTCOMES, 0))[outcome] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Counts, hit ratio and coalescing ratio (rebuilds avoided / lookups that needed one) per namespace"""
+        with self._lock:
+            namespaces = {namespace: dict(counts) for namespace, counts in self._counts.items()}
+        for counts in namespaces.values():
+            needed = counts['stale'] + counts['waited'] + counts['computed']
+            lookups = counts['fresh'] + needed
+            counts['lookups'] = lookups
+            counts['hit_ratio'] = counts['fresh'] / lookups if lookups else 0.0
+            counts['coalescing_ratio'] = (counts['stale'] + counts['waited']) / needed if needed else 0.0
+        return {'namespaces': namespaces, 'worker_pid': os.getpid(), 'since': self._started}
+
+
+class SingleFlight:
+    """Coalesces rebuilds of cached values within the process and, through a lock, across workers"""
+
+    def __init__(self, lock: str = 'cache', lock_ttl: float = 30, wait: float = 5, stale_ttl: float = 3600):
+        self.lock = lock
+        self.lock_ttl = lock_ttl  # A lock left by a crashed worker frees itself after this long
+        self.wait = wait
+        self.stale_ttl = stale_ttl  # How long an expired value may still be served while it is rebuilt
+        self.stats = FlightStats()
+        self._guard = threading.Lock()
+        self._inflight: Dict[str, threading.Event] = {}  # Keys this process is rebuilding
+        self._connections: Dict[str, Any] = {}  # Key -> connection holding its advisory lock
+
+    # Stored entries
+
+    @staticmethod
+    def _load(name: str) -> Optional[Entry]:
+        try:
+            return cache.store.get(f'flight:{name}')
+        except Exception as e:
+            current_app.logger.warning(f"Cache read failed for {name}: {str(e)}")
+            return None
+
+    def _save(self, name: str, version: str, value: Any, ttl: float) -> None:
+        try:
+            cache.store.set(f'flight:{name}', (version, time.time() + ttl, value), ttl + self.stale_ttl)
+        except Exception as e:
+            current_app.logger.warning(f"Cache write failed for {name}: {str(e)}")
+
+    # Locks across workers
+
+    def _acquire(self, name: str) -> bool:
+        try:
+            if self.lock == 'postgres':
+                connection = db.engine.connect()
+                if connection.execute(text('SELECT pg_try_advisory_lock(:key)'), {'key': _lock_id(name)}).scalar():
+                    self._connections[name] = connection
+                    return True
+                connection.close()
+                return False
+            return cache.store.add(f'flight-lock:{name}', os.getpid(), self.lock_ttl)
+        except Exception as e:
+            # Without a working lock every worker rebuilds for itself, as it did before coalescing
+            current_app.logger.warning(f"Single-flight lock failed for {name}: {str(e)}")
+            return True
+
+    def _release(self, name: str) -> None:
+        try:
+            connection = self._connections.pop(name, None)
+            if connection is not None:
+                try:
+                    connection.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': _lock_id(name)})
+                finally:
+                    connection.close()
+            elif self.lock != 'postgres':
+                cache.store.delete(f'flight-lock:{name}')
+        except Exception as e:
+            current_app.logger.warning(f"Single-flight unlock failed for {name}: {str(e)}")
+
+    # Lookups
+
+    def _claim(self, name: str) -> bool:
+        """Whether this request is the one that rebuilds the key"""
+        with self._guard:
+            if name in self._inflight:
+                return False
+            self._inflight[name] = threading.Event()
+        if self._acquire(name):
+            return True
+        self._finish(name, locked=False)
+        return False
+
+    def _finish(self, name: str, locked: bool = True) -> None:
+        if locked:
+            self._release(name)
+        with self._guard:
+            event = self._inflight.pop(name, None)
+        if event is not None:
+            event.set()
+
+    def _wait_for(self, name: str, version: str) -> Optional[Entry]:
+        # Wait for this process' rebuild, or poll the store for another worker's
+        deadline = time.monotonic() + self.wait
+        while True:
+            with self._guard:
+                event = self._inflight.get(name)
+            if event is not None:
+                event.wait(max(0.0, deadline - time.monotonic()))
+            entry = self._load(name)
+            if entry is not None and entry[0] == version:
+                return entry
+            if time.monotonic() >= deadline:
+                return None
+            if event is None:
+                time.sleep(POLL_INTERVAL)
+
+    def get(self, namespace: str, key: str, version: str, builder: Callable[[], Any],
+            ttl: Optional[float] = None) -> Tuple[Any, str, str]:
+        """(value, version it was built for, outcome) for a key, rebuilding it at most once at a time
+
+        The returned version is older than the requested one when a stale value is served. A
+        builder raising NotCached hands its value back to this caller only.
+        """
+        name = f'{namespace}:{key}'
+        ttl = ttl or current_app.config.get('CACHE_DEFAULT_TTL', 3600)
+        entry = self._load(name)
+        if entry is not None and entry[0] == version and entry[1] > time.time():
+            self.stats.record(namespace, 'fresh')
+            return entry[2], entry[0], 'fresh'
+
+        if not self._claim(name):
+            if entry is not None:
+                self.stats.record(namespace, 'stale')
+                return entry[2], entry[0], 'stale'
+            entry = self._wait_for(name, version)
+            if entry is not None:
+                self.stats.record(namespace, 'waited')
+                return entry[2], entry[0], 'waited'
+            # The rebuild is too slow or failed: build it here rather than fail the request
+            self.stats.record(namespace, 'computed')
+            value = builder()
+            self._save(name, version, value, ttl)
+            return value, version, 'computed'
+
+        try:
+            self.stats.record(namespace, 'computed')
+            value = builder()
+            self._save(name, version, value, ttl)
+            return value, version, 'computed'
+        finally:
+            self._finish(name)
+
+
+def _lock_id(name: str) -> int:
+    # Advisory locks are keyed by a signed 64-bit integer
+    return int.from_bytes(hashlib.blake2b(name.encode('utf-8'), digest_size=8).digest(), 'big', signed=True)
+
+
+def get_single_flight() -> SingleFlight:
+    """The app's single-flight coordinator, created on first use"""
+    flight = current_app.extensions.get('single_flight')
+    if flight is None:
+        config = current_app.config
+        flight = current_app.extensions.setdefault('single_flight', SingleFlight(
+            lock=config.get('SINGLE_FLIGHT_LOCK', 'cache'),
+            lock_ttl=config.get('SINGLE_FLIGHT_LOCK_TTL', 30),
+            wait=config.get('SINGLE_FLIGHT_WAIT', 5),
+            stale_ttl=config.get('SINGLE_FLIGHT_STALE_TTL', 3600)))
+    return flight
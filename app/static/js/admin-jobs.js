@@ -0,0 +1,29 @@
+// Admin background job polling
+
+// Poll a job status URL until the job finishes; resolves with the final status
+async function pollJob(statusUrl, onProgress, interval = 2000) {
+    while (true) {
+        const response = await fetch(statusUrl, { credentials: 'same-origin' });
+        if (!response.ok) {
+            throw new Error(`HTTP ${response.status}`);
+        }
+        const job = await response.json();
+        if (onProgress) {
+            onProgress(job);
+        }
+        if (job.status === 'succeeded' || job.status === 'failed') {
+            return job;
+        }
+        await new Promise(resolve => setTimeout(resolve, interval));
+    }
+}
+
+// Show a dismissible alert at the top of the admin main area
+function showAdminAlert(type, html) {
+    const alert = document.createElement('div');
+    alert.className = `alert alert-${type} alert-dismissible fade show`;
+    alert.innerHTML = `${html}<button type="button" class="btn-close" data-bs-dismiss="alert"></button>`;
+    const main = document.querySelector('.admin-main');
+    main.insertBefore(alert, main.firstChild);
+    return alert;
+}
@@ -140,30 +140,36 @@ class ShoppingCart {
 // Initialize shopping cart
 const cart = new ShoppingCart();
 
+// Product details fetched from the API, by id
+const productDetails = {};
+
 // Add to cart function (called from HTML)
 function addToCart(productId) {
-    // Get product details from the page or make an API call
-    // For now, we'll extract from the current page elements
-    const productElement = document.querySelector(`[data-product-id="${productId}"]`);
+    // Product cards embed their details, so most clicks need no request at all
+    const productElement = document.querySelector(`[data-product-id="${productId}"][data-product-price]`);
     if (productElement) {
-        const name = productElement.querySelector('.card-title').textContent;
-        const priceText = productElement.querySelector('.text-primary').textContent;
-        const [price, currency] = priceText.split(' ');
-        const image = productElement.querySelector('img')?.src.split('/').pop();
-        
-        cart.addItem(productId, name, parseFloat(price), currency, image);
-    } else {
-        // Fallback: make API call to get product details
-        fetch(`/api/products?product_id=${productId}`)
-            .then(response => response.json())
-            .then(products => {
-                if (products.length > 0) {
-                    const product = products[0];
-                    cart.addItem(productId, product.name, product.price, product.currency, product.image);
-                }
-            })
-            .catch(error => console.error('Error fetching product:', error));
+        const data = productElement.dataset;
+        cart.addItem(productId, data.productName, parseFloat(data.productPrice), data.productCurrency, data.productImage || null);
+        return;
     }
+
+    // Fallback: fetch just this product's cart fields (cached by the browser, revalidated by ETag)
+    const cached = productDetails[productId];
+    const request = cached ? Promise.resolve(cached) : fetch(
+        `/api/products?id=${encodeURIComponent(productId)}&fields=name,price,currency,image&language=${document.documentElement.lang || 'uk'}`
+    ).then(response => {
+        if (!response.ok) {
+            throw new Error(`Product ${productId} not available`);
+        }
+        return response.json();
+    });
+
+    request
+        .then(product => {
+            productDetails[productId] = product;
+            cart.addItem(productId, product.name, product.price, product.currency, product.image);
+        })
+        .catch(error => console.error('Error fetching product:', error));
 }
 
 // Checkout function
@@ -206,7 +212,12 @@ async function checkout() {
                     window.location.href = `/checkout/success?session_id=${data.session_id}`;
                 }
             }
+        } else if (data.code === 'payments_unavailable') {
+            alert('Оплата тимчасово недоступна. Спробуйте ще раз за ' + data.retry_after + ' с.');
         } else {
+            // Drop products that are no longer sold so the next attempt can succeed
+            (data.problems || []).filter(problem => problem.code === 'unavailable')
+                .forEach(problem => cart.removeItem(problem.product_id));
             alert('Помилка при створенні сесії оплати: ' + (data.error || 'Невідома помилка'));
         }
     } catch (error) {
@@ -243,32 +254,10 @@ class Chatbot {
         this.showTyping();
 
         try {
-            const response = await fetch('/api/chatbot', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                    'X-Session-ID': this.sessionId
-                },
-                body: JSON.stringify({
-                    message: message,
-                    language: this.currentLanguage
-                })
-            });
-
-            const data = await response.json();
-            
-            // Remove typing indicator
-            this.hideTyping();
-
-            if (data.response) {
-                this.addMessage(data.response, 'bot');
-                // Update session ID if returned from server
-                if (data.session_id) {
-                    this.sessionId = data.session_id;
-                    localStorage.setItem('chatbot_session_id', this.sessionId);
-                }
+            if (window.ReadableStream && window.TextDecoder) {
+                await this.streamMessage(message);
             } else {
-                this.addMessage('Вибачте, сталася помилка. Спробуйте пізніше.', 'bot');
+                await this.requestMessage(message);
             }
         } catch (error) {
             this.hideTyping();
@@ -277,6 +266,125 @@ class Chatbot {
         }
     }
 
+    async requestMessage(message) {
+        const response = await fetch('/api/chatbot', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-Session-ID': this.sessionId
+            },
+            body: JSON.stringify({
+                message: message,
+                language: this.currentLanguage
+            })
+        });
+
+        const data = await response.json();
+        
+        // Remove typing indicator
+        this.hideTyping();
+
+        if (data.response) {
+            this.addMessage(data.response, 'bot');
+            // Update session ID if returned from server
+            if (data.session_id) {
+                this.updateSessionId(data.session_id);
+            }
+        } else {
+            this.addMessage('Вибачте, сталася помилка. Спробуйте пізніше.', 'bot');
+        }
+    }
+
+    async streamMessage(message) {
+        // Server-sent events over POST, so read the stream with fetch
+        const response = await fetch('/api/chatbot/stream', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'Accept': 'text/event-stream',
+                'X-Session-ID': this.sessionId
+            },
+            body: JSON.stringify({
+                message: message,
+                language: this.currentLanguage
+            })
+        });
+
+        if (!response.ok || !response.body) {
+            return this.requestMessage(message);
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder('utf-8');
+        let buffer = '';
+        let messageDiv = null;
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            // Events are separated by a blank line
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const event = this.parseEvent(buffer.slice(0, boundary));
+                buffer = buffer.slice(boundary + 2);
+
+                if (event.type === 'token') {
+                    if (!messageDiv) {
+                        this.hideTyping();
+                        messageDiv = this.addMessage('', 'bot');
+                    }
+                    messageDiv.textContent += event.data.text;
+                    this.scrollToBottom();
+                } else if (event.type === 'done') {
+                    if (event.data.session_id) {
+                        this.updateSessionId(event.data.session_id);
+                    }
+                } else if (event.type === 'error' && !messageDiv) {
+                    this.hideTyping();
+                    this.addMessage('Вибачте, сталася помилка. Спробуйте пізніше.', 'bot');
+                    return;
+                }
+            }
+        }
+
+        if (!messageDiv) {
+            this.hideTyping();
+            this.addMessage('Вибачте, сталася помилка. Спробуйте пізніше.', 'bot');
+        }
+    }
+
+    parseEvent(block) {
+        const event = { type: 'message', data: {} };
+        const dataLines = [];
+        block.split('\n').forEach(line => {
+            if (line.startsWith('event:')) {
+                event.type = line.slice(6).trim();
+            } else if (line.startsWith('data:')) {
+                dataLines.push(line.slice(5).trim());
+            }
+        });
+        if (dataLines.length) {
+            try {
+                event.data = JSON.parse(dataLines.join('\n'));
+            } catch (e) {
+                event.data = {};
+            }
+        }
+        return event;
+    }
+
+    updateSessionId(sessionId) {
+        this.sessionId = sessionId;
+        localStorage.setItem('chatbot_session_id', this.sessionId);
+    }
+
+    scrollToBottom() {
+        const messagesContainer = document.getElementById('chatbot-messages');
+        messagesContainer.scrollTop = messagesContainer.scrollHeight;
+    }
+
     addMessage(message, sender) {
         const messagesContainer = document.getElementById('chatbot-messages');
         const messageDiv = document.createElement('div');
@@ -285,6 +393,7 @@ class Chatbot {
         
         messagesContainer.appendChild(messageDiv);
         messagesContainer.scrollTop = messagesContainer.scrollHeight;
+        return messageDiv;
     }
 
     showTyping() {
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""Stripe prices created once per (product, amount, currency) and reused by every checkout"""
+from typing import Dict, Optional, Tuple
+
+import stripe
+from flask import current_app
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from app.extensions import db, cache
+from app.models import Product, StripePrice
+from app.stripe_client import StripeClient, get_stripe_client
+
+PriceKey = Tuple[int, int, str]  # (product id, unit amount in cents, lowercase currency)
+
+
+def price_key(product_id: int, price: float, currency: str) -> PriceKey:
+    """Key identifying the Stripe price charged for a product"""
+    return product_id, int(round(price * 100)), currency.lower()
+
+
+def _load_prices() -> Dict[PriceKey, str]:
+    rows = db.session.execute(select(StripePrice.product_id, StripePrice.unit_amount, StripePrice.currency,
+                                     StripePrice.stripe_price_id).where(StripePrice.active.is_(True)))
+    return {(product_id, amount, currency): price_id for product_id, amount, currency, price_id in rows}
+
+
+def known_prices() -> Dict[PriceKey, str]:
+    """Active Stripe price IDs by key, kept per worker until a price is added or archived"""
+    return cache.get_or_build_local('stripe', 'prices', _load_prices)
+
+
+def get_price_id(product_id: int, price: float, currency: str, create: bool = True) -> Optional[str]:
+    """Stripe price ID for the product at this price, creating it in Stripe on first use"""
+    key = price_key(product_id, price, currency)
+    price_id = known_prices().get(key)
+    if price_id is None and create:
+        client = get_stripe_client()
+        if client is not None:
+            price_id = _create_price(client, key)
+    return price_id
+
+
+def _stripe_product_id(client: StripeClient, product: Product) -> str:
+    # Every price of a product hangs off one Stripe product
+    existing = db.session.execute(select(StripePrice.stripe_product_id)
+                                  .where(StripePrice.product_id == product.id).limit(1)).scalar()
+    if existing:
+        return existing
+    # Workers creating the first price of a product at once share one Stripe product
+    return client.create(stripe.Product, idempotency_key=f'product-{product.id}',
+                         name=product.get_name(current_app.config['BABEL_DEFAULT_LOCALE']),
+                         metadata={'product_id': str(product.id)}).id
+
+
+def _price_row(key: PriceKey) -> Optional[StripePrice]:
+    # The key's row, active or archived; the unique constraint allows one per key
+    product_id, amount, currency = key
+    return StripePrice.query.filter_by(product_id=product_id, unit_amount=amount, currency=currency).first()
+
+
+def _create_price(client: StripeClient, key: PriceKey) -> str:
+    product_id, amount, currency = key
+    row = _price_row(key)
+    if row is not None and row.active:
+        return row.stripe_price_id  # Stored by another worker since this one loaded its prices
+    product = db.session.get(Product, product_id)
+    stripe_product_id = _stripe_product_id(client, product)
+    # Workers racing to create the same price get one Stripe object back. A replacement for an
+    # archived price needs a key of its own, or Stripe replays the archived price for 24 hours
+    idempotency_key = f'price-{stripe_product_id}-{amount}-{currency}'
+    if row is not None:
+        idempotency_key += f'-replacing-{row.stripe_price_id}'
+    price = client.create(stripe.Price, idempotency_key=idempotency_key,
+                          unit_amount=amount, currency=currency, product=stripe_product_id,
+                          metadata={'product_id': str(product_id)})
+    return _remember(key, price.id, stripe_product_id, row)
+
+
+def _remember(key: PriceKey, price_id: str, stripe_product_id: str,
+              archived: Optional[StripePrice] = None) -> str:
+    product_id, amount, currency = key
+    try:
+        if archived is None:
+            db.session.add(StripePrice(product_id=product_id, unit_amount=amount, currency=currency,
+                                       stripe_price_id=price_id, stripe_product_id=stripe_product_id))
+        else:
+            # The key keeps one row: it now records the price that replaces the archived one
+            archived.stripe_price_id, archived.stripe_product_id, archived.active = price_id, stripe_product_id, True
+        db.session.commit()
+    except IntegrityError:
+        # Another worker stored a price for this key first, use theirs
+        db.session.rollback()
+        stored = db.session.execute(select(StripePrice.stripe_price_id).where(
+            StripePrice.product_id == product_id, StripePrice.unit_amount == amount,
+            StripePrice.currency == currency, StripePrice.active.is_(True))).scalar()
+        if stored is None:
+            raise
+        return stored
+    current_app.logger.info(f"Created Stripe price {price_id} for product {product_id} ({amount} {currency})")
+    return price_id
+
+
+def reconcile(create_missing: bool = True) -> Dict[str, int]:
+    """Bring local price records, Stripe and Product.stripe_price_id in line, returning counts"""
+    client = get_stripe_client()
+    if client is None:
+        raise RuntimeError('Stripe is not configured')
+    counts = {'imported': 0, 'archived': 0, 'created': 0, 'linked': 0}
+    rows = {row.stripe_price_id: row for row in StripePrice.query.all()}
+
+    # Prices in Stripe: tagged by this app, or referenced by products saved before prices were tracked
+    referenced = {p.stripe_price_id: p.id for p in Product.query.filter(Product.stripe_price_id.isnot(None))}
+    remote = {price.id: price for price in client.call('price.list', stripe.Price.list, limit=100).auto_paging_iter()}
+    for price_id in set(referenced) - set(remote):
+        try:
+            remote[price_id] = client.call('price.retrieve', stripe.Price.retrieve, price_id)
+        except stripe.error.InvalidRequestError:
+            current_app.logger.warning(f"Stripe price {price_id} referenced by a product does not exist")
+
+    for price_id, price in remote.items():
+        row = rows.get(price_id)
+        if row is not None and row.active and not price.get('active', True):
+            row.active = False
+            counts['archived'] += 1
+
+    # Keys with an active price; an archived row is taken over by an active remote price of its key
+    archived = {(row.product_id, row.unit_amount, row.currency): row for row in rows.values() if not row.active}
+    taken = {(row.product_id, row.unit_amount, row.currency) for row in rows.values() if row.active}
+    for price_id, price in remote.items():
+        product_id = (price.get('metadata') or {}).get('product_id') or referenced.get(price_id)
+        if product_id is None or price_id in rows:
+            continue
+        key = (int(product_id), price['unit_amount'], price['currency'])
+        product = price['product'] if isinstance(price['product'], str) else price['product']['id']
+        if key not in taken and price.get('active', True) and db.session.get(Product, key[0]) is not None:
+            row = archived.pop(key, None)
+            if row is None:
+                db.session.add(StripePrice(product_id=key[0], unit_amount=key[1], currency=key[2],
+                                           stripe_price_id=price_id, stripe_product_id=product))
+            else:
+                row.stripe_price_id, row.stripe_product_id, row.active = price_id, product, True
+            taken.add(key)
+            counts['imported'] += 1
+    db.session.commit()
+
+    known = _load_prices()
+    for product in Product.query.filter_by(is_active=True):
+        key = price_key(product.id, product.price, product.currency)
+        if key not in known and create_missing:
+            known[key] = _create_price(client, key)
+            counts['created'] += 1
+        if known.get(key) != product.stripe_price_id and key in known:
+            product.stripe_price_id = known[key]
+            counts['linked'] += 1
+    db.session.commit()
+    return counts
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""Shared Stripe client: pooled connections, idempotent retries with jitter and a circuit breaker"""
+import os
+import time
+import uuid
+import random
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+import stripe
+from flask import current_app
+
+from app.chatbot_engine import create_http_session
+
+# Failures worth retrying: the request may not have reached Stripe, or Stripe asked to retry
+TRANSIENT_ERRORS = (stripe.error.APIConnectionError, stripe.error.RateLimitError, stripe.error.APIError)
+
+
+class StripeUnavailable(RuntimeError):
+    """Raised when Stripe cannot be reached: retries exhausted or the circuit is open"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Stops calling a failing service for a while instead of making every request wait on it
+
+    Opens after `failure_threshold` consecutive failures, lets one trial call through
+    after `reset_timeout` seconds (half-open) and closes again when it succeeds.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            return 'half_open' if time.monotonic() - self._opened_at >= self.reset_timeout else 'open'
+
+    def retry_after(self) -> float:
+        """Seconds until a trial call is allowed"""
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def allow(self) -> bool:
+        """Whether a call may go out now"""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._trial_running:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+
+class StripeMetrics:
+    """Per-operation call counts and latencies of this worker"""
+
+    OUTCOMES = ('ok', 'declined', 'error', 'rejected')  # declined: Stripe answered with a 4xx
+
+    def __init__(self, window: int = 500):
+        self._operations: Dict[str, Dict[str, Any]] = {}
+        self._window = window
+        self._lock = threading.Lock()
+        self.started = time.time()
+
+    def record(self, operation: str, outcome: str, seconds: float = 0.0) -> None:
+        with self._lock:
+            entry = self._operations.get(operation)
+            if entry is None:
+                entry = dict.fromkeys(self.OUTCOMES, 0)
+                entry.update(retries=0, latencies=deque(maxlen=self._window))
+                self._operations[operation] = entry
+            entry[outcome] += 1
+            if outcome != 'rejected':
+                entry['latencies'].append(seconds)
+
+    def record_retry(self, operation: str) -> None:
+        with self._lock:
+            self._operations[operation]['retries'] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Counts plus mean, p95 and max latency in milliseconds over the recent calls"""
+        with self._lock:
+            operations = {name: dict(entry, latencies=sorted(entry['latencies']))
+                          for name, entry in self._operations.items()}
+        for entry in operations.values():
+            latencies = entry.pop('latencies')
+            if latencies:
+                entry['mean_ms'] = round(1000 * sum(latencies) / len(latencies), 1)
+                entry['p95_ms'] = round(1000 * latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 1)
+                entry['max_ms'] = round(1000 * latencies[-1], 1)
+        return operations
+
+
+class StripeClient:
+    """Stripe API calls of this worker over one connection pool, guarded by retries and a breaker"""
+
+    def __init__(self, api_key: str, api_base: Optional[str] = None, pool_size: int = 10, timeout: float = 10.0,
+                 max_retries: int = 2, backoff: float = 0.25, backoff_max: float = 2.0,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.api_key = api_key
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self.metrics = StripeMetrics()
+        # Retries are ours, with idempotency keys; the adapter only keeps connections alive
+        self.http_client = stripe.http_client.RequestsClient(
+            timeout=timeout, session=create_http_session(pool_size, max_retries=0))
+        # The SDK reads these globals on every request; set once here instead of per call
+        stripe.default_http_client = self.http_client
+        stripe.api_base = api_base or 'https://api.stripe.com'
+        stripe.max_network_retries = 0
+
+    def _delay(self, attempt: int) -> float:
+        # Full jitter keeps workers that failed together from retrying together
+        return random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+
+    def call(self, operation: str, func: Callable[..., Any], *args, **params) -> Any:
+        """Call an SDK method, retrying transient failures; raises StripeUnavailable when Stripe is down"""
+        if not self.breaker.allow():
+            self.metrics.record(operation, 'rejected')
+            raise StripeUnavailable(f'Stripe circuit is open, {operation} not attempted', self.breaker.retry_after())
+
+        attempt = 0
+        while True:
+            started = time.monotonic()
+            try:
+                result = func(*args, api_key=self.api_key, **params)
+            except TRANSIENT_ERRORS as e:
+                self.metrics.record(operation, 'error', time.monotonic() - started)
+                self.breaker.record_failure()
+                if attempt >= self.max_retries or not self.breaker.allow():
+                    current_app.logger.error(f"Stripe {operation} failed after {attempt + 1} attempts: {str(e)}")
+                    raise StripeUnavailable(f'Stripe {operation} failed: {str(e)}',
+                                            self.breaker.retry_after()) from e
+                self.metrics.record_retry(operation)
+                time.sleep(self._delay(attempt))
+                attempt += 1
+                continue
+            except stripe.error.StripeError:
+                # Stripe answered (invalid request, card declined): not an outage
+                self.metrics.record(operation, 'declined', time.monotonic() - started)
+                self.breaker.record_success()
+                raise
+            self.metrics.record(operation, 'ok', time.monotonic() - started)
+            self.breaker.record_success()
+            return result
+
+    def create(self, resource, idempotency_key: Optional[str] = None, **params) -> Any:
+        """Create a Stripe object; every retry reuses one idempotency key so it is created once"""
+        return self.call(f'{resource.OBJECT_NAME}.create', resource.create,
+                         idempotency_key=idempotency_key or uuid.uuid4().hex, **params)
+
+    def stats(self) -> Dict[str, Any]:
+        """Breaker state and call metrics, for the admin status endpoint"""
+        return {
+            'circuit': self.breaker.state,
+            'retry_after': round(self.breaker.retry_after(), 1),
+            'operations': self.metrics.snapshot(),
+            'worker_pid': os.getpid(),
+            'since': self.metrics.started
+        }
+
+
+_client_lock = threading.Lock()
+
+
+def stripe_configured(app) -> bool:
+    """Whether a real Stripe key is set; without one checkout runs in demo mode"""
+    key = app.config.get('STRIPE_SECRET_KEY')
+    return bool(key) and not key.startswith('sk_test_your_stripe')
+
+
+def get_stripe_client(app=None) -> Optional[StripeClient]:
+    """Get the application's shared Stripe client, or None in demo mode"""
+    app = app or current_app._get_current_object()
+    if not stripe_configured(app):
+        return None
+    client = app.extensions.get('stripe_client')
+    if client is None:
+        with _client_lock:
+            client = app.extensions.get('stripe_client')
+            if client is None:
+                client = StripeClient(
+                    api_key=app.config['STRIPE_SECRET_KEY'],
+                    api_base=app.config.get('STRIPE_API_BASE'),
+                    pool_size=app.config.get('STRIPE_POOL_SIZE', 10),
+                    timeout=app.config.get('STRIPE_TIMEOUT', 10),
+                    max_retries=app.config.get('STRIPE_MAX_RETRIES', 2),
+                    backoff=app.config.get('STRIPE_RETRY_BACKOFF', 0.25),
+                    breaker=CircuitBreaker(app.config.get('STRIPE_BREAKER_THRESHOLD', 5),
+                                           app.config.get('STRIPE_BREAKER_RESET', 30))
+                )
+                app.extensions['stripe_client'] = client
+    return client
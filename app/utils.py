@@ -31,13 +31,25 @@ if hasattr(openai, '__version__'):
 else:
     print("DEBUG: OpenAI version attribute not found")
 
-from typing import Optional, Dict, Any, List
+from typing import Callable, Optional, Dict, Any, List
 from datetime import datetime
 from werkzeug.utils import secure_filename
 from flask import current_app, session
+from sqlalchemy import or_
 from app.extensions import db
 from app.models import Product, Category, BlogPost, User
+from app.chatbot_engine import get_chatbot_engine, run_assistant_script
+from app.retrieval import catalog_context
+from app.assistant_runs import get_assistants_client, create_run_waiter
+from app.chat_sessions import get_thread_sessions, expire_chat_threads
+from app.response_cache import get_response_cache
+from app.concurrency import run_concurrently
+from app.blog_generation import get_blog_backend
+from app.stripe_catalog import get_price_id
+from app.stripe_client import get_stripe_client, StripeUnavailable
+from app.metrics import observe_openai, observe_stripe
 import re
+import time
 import requests
 
 # Ensure proper Unicode handling
@@ -84,76 +96,67 @@ def get_current_language() -> str:
     """Get current language from session or default"""
     return session.get('language', current_app.config['BABEL_DEFAULT_LOCALE'])
 
-def create_stripe_price(product_name: str, price: float, currency: str = 'eur') -> Optional[str]:
-    """Create Stripe price and return price ID"""
-    try:
-        stripe_secret_key = current_app.config.get('STRIPE_SECRET_KEY')
-        
-        # Check if Stripe is configured
-        if not stripe_secret_key or stripe_secret_key.startswith('sk_test_your_stripe'):
-            current_app.logger.warning("Stripe not configured - skipping price creation")
-            return None
-            
-        stripe.api_key = stripe_secret_key
-        
-        # Create product first
-        stripe_product = stripe.Product.create(name=product_name)
-        
-        # Create price
-        stripe_price = stripe.Price.create(
-            unit_amount=int(price * 100),  # Convert to cents
-            currency=currency.lower(),
-            product=stripe_product.id,
-        )
-        
-        return stripe_price.id
-    except Exception as e:
-        current_app.logger.error(f"Error creating Stripe price: {str(e)}")
-        return None
-
-def create_checkout_session(items: List[Dict[str, Any]], success_url: str, cancel_url: str) -> Optional[str]:
-    """Create Stripe checkout session"""
+def _checkout_line_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    # Reuse the product's Stripe price; inline price data only when it cannot be resolved
+    if 'product_id' in item:
+        try:
+            price_id = get_price_id(item['product_id'], item['price'], item.get('currency', 'eur'))
+            return {'price': price_id, 'quantity': item.get('quantity', 1)}
+        except Exception as e:
+            current_app.logger.warning(f"No Stripe price for product {item['product_id']}, sending price data: {str(e)}")
+    return {
+        'price_data': {
+            'currency': item.get('currency', 'eur').lower(),
+            'product_data': {
+                'name': item['name'],
+                'description': item.get('description', ''),
+                'metadata': {'product_id': str(item['product_id'])} if 'product_id' in item else {},
+            },
+            'unit_amount': int(round(item['price'] * 100)),  # Convert to cents, 19.99 * 100 is 1998.99...
+        },
+        'quantity': item.get('quantity', 1),
+    }
+
+def create_checkout_session(items: List[Dict[str, Any]], success_url: str, cancel_url: str,
+                            metadata: Optional[Dict[str, str]] = None) -> str:
+    """Create Stripe checkout session, metadata is returned with its webhook events
+
+    Returns a demo session ID only when Stripe is not configured. Raises StripeUnavailable
+    when Stripe cannot be reached and stripe.error.StripeError when it rejects the session.
+    """
+    client = get_stripe_client()
+    if client is None:
+        current_app.logger.warning("Stripe not configured - using demo mode")
+        # Return a demo session ID for testing
+        return "demo_session_12345"
+    
+    line_items = [_checkout_line_item(item) for item in items]
+    
+    started = time.perf_counter()
+    outcome = 'error'
     try:
-        stripe_secret_key = current_app.config.get('STRIPE_SECRET_KEY')
-        
-        # Check if Stripe is configured
-        if not stripe_secret_key or stripe_secret_key.startswith('sk_test_your_stripe'):
-            current_app.logger.warning("Stripe not configured - using demo mode")
-            # Return a demo session ID for testing
-            return "demo_session_12345"
-        
-        stripe.api_key = stripe_secret_key
-        
-        line_items = []
-        for item in items:
-            line_items.append({
-                'price_data': {
-                    'currency': item.get('currency', 'eur').lower(),
-                    'product_data': {
-                        'name': item['name'],
-                        'description': item.get('description', ''),
-                    },
-                    'unit_amount': int(item['price'] * 100),  # Convert to cents
-                },
-                'quantity': item.get('quantity', 1),
-            })
-        
-        session = stripe.checkout.Session.create(
+        session = client.create(
+            stripe.checkout.Session,
             payment_method_types=['card'],
             line_items=line_items,
             mode='payment',
             success_url=success_url,
             cancel_url=cancel_url,
             metadata={
-                'source': 'saas_shop'
+                'source': 'saas_shop',
+                **(metadata or {})
             }
         )
-        
-        return session.id
-    except Exception as e:
-        current_app.logger.error(f"Error creating checkout session: {str(e)}")
-        # Return demo session ID as fallback
-        return "demo_session_fallback"
+        outcome = 'ok'
+    except StripeUnavailable:
+        outcome = 'unavailable'
+        raise
+    except stripe.error.StripeError:
+        outcome = 'declined'
+        raise
+    finally:
+        observe_stripe('checkout.session.create', outcome, time.perf_counter() - started)
+    return session.id
 
 def generate_slug(title: str) -> str:
     """Generate URL-friendly slug from title"""
@@ -165,45 +168,34 @@ def generate_slug(title: str) -> str:
     slug = slug.strip('-')
     return slug
 
+def unique_slug(model, slug: str, exclude_id: Optional[int] = None) -> str:
+    """Return the slug, or the slug with the first free "-<counter>" suffix, reading the taken ones in one query"""
+    query = db.session.query(model.slug).filter(or_(model.slug == slug, model.slug.like(f'{slug}-%')))
+    if exclude_id is not None:
+        query = query.filter(model.id != exclude_id)
+    taken = {row.slug for row in query}
+    if slug not in taken:
+        return slug
+    counter = 1
+    while f"{slug}-{counter}" in taken:
+        counter += 1
+    return f"{slug}-{counter}"
+
 class AIContentGenerator:
     """AI content generator for blog posts"""
     
     def __init__(self):
         api_key = current_app.config.get('OPENAI_API_KEY')
+        self.timings = {}  # language -> GenerationTiming of the last generate_blog_post call
         if not api_key:
             self.client = None
             self.assistant_id = None
             current_app.logger.warning("OpenAI API key not configured")
         else:
-            try:
-                # Log OpenAI version for debugging
-                current_app.logger.info(f"OpenAI version: {openai.__version__}")
-                
-                # Ensure proper environment setup for Unicode handling
-                import os
-                if 'PYTHONIOENCODING' not in os.environ:
-                    os.environ['PYTHONIOENCODING'] = 'utf-8'
-                
-                # Set locale for proper encoding
-                import locale
-                try:
-                    locale.setlocale(locale.LC_ALL, 'C.UTF-8')
-                except:
-                    try:
-                        locale.setlocale(locale.LC_ALL, 'en_US.UTF-8')
-                    except:
-                        pass  # Keep default if neither works
-                
-                # For OpenAI 0.28, we set the API key globally
-                openai.api_key = api_key
-                
-                self.client = True  # Just a flag to indicate it's configured
-                self.assistant_id = current_app.config.get('OPENAI_ASSISTANT_ID')
-                current_app.logger.info("OpenAI client initialized successfully (v0.28)")
-            except Exception as e:
-                current_app.logger.error(f"Error initializing OpenAI client: {str(e)}")
-                self.client = None
-                self.assistant_id = None
+            # Generation runs in-process on the shared keep-alive session (openai 0.28)
+            self.client = get_blog_backend(current_app._get_current_object())
+            self.assistant_id = current_app.config.get('OPENAI_ASSISTANT_ID')
+            current_app.logger.info("OpenAI client initialized successfully (v0.28)")
     
     def generate_blog_post(self, topic: str, language: str = 'uk', keywords: str = '') -> Dict[str, str]:
         """Generate SEO-optimized blog post using OpenAI"""
@@ -213,112 +205,14 @@ class AIContentGenerator:
             current_app.logger.info("No OpenAI client - using fallback")
             return self._get_fallback_template(topic, language, keywords)
         
-        try:
-            # Use temporary file approach to avoid encoding issues in subprocess
-            import subprocess
-            import json
-            import sys
-            import os
-            import tempfile
-            
-            current_app.logger.info("Calling OpenAI via temporary file...")
-            
-            # Create temporary file with arguments in system temp directory to avoid path issues
-            # Use C:\Temp instead of user directory to avoid Cyrillic characters
-            temp_dir = "C:\\Temp"
-            current_app.logger.info(f"Using temp directory: {temp_dir}")
-            
-            # Create temp file manually with unique name
-            import uuid
-            temp_filename = f"openai_args_{uuid.uuid4().hex}.json"
-            temp_file = os.path.join(temp_dir, temp_filename)
-            
-            current_app.logger.info(f"Creating temp file: {temp_file}")
-            
-            try:
-                # Write arguments to temp file
-                args_data = {
-                    'api_key': current_app.config.get('OPENAI_API_KEY'),
-                    'topic': topic,
-                    'language': language,
-                    'keywords': keywords
-                }
-                
-                with open(temp_file, 'w', encoding='utf-8') as f:
-                    json.dump(args_data, f, ensure_ascii=False, indent=2)
-                
-                current_app.logger.info("Temp file created successfully")
-                
-                # Path to our caller script - use ASCII-safe location
-                script_path = "C:\\Temp\\openai_caller_file.py"
-                current_app.logger.info(f"Script path: {script_path}")
-                
-                # Call external script with temp file
-                cmd = ["python", script_path, temp_file]  # Use system python instead of full path
-                current_app.logger.info(f"Running command: {' '.join(cmd)}")
-                
-                # Run with UTF-8 encoding and clean environment
-                env = os.environ.copy()  # Copy current environment
-                env.update({
-                    'PYTHONIOENCODING': 'utf-8',
-                    'PYTHONLEGACYWINDOWSFSENCODING': '0'
-                })
-                
-                result = subprocess.run(
-                    cmd, 
-                    capture_output=True, 
-                    text=True, 
-                    encoding='utf-8',
-                    env=env,
-                    cwd=os.path.dirname(os.path.dirname(__file__))  # Set working directory
-                )
-                
-                current_app.logger.info(f"Subprocess return code: {result.returncode}")
-                current_app.logger.info(f"Subprocess stdout length: {len(result.stdout) if result.stdout else 0}")
-                current_app.logger.info(f"Subprocess stderr: {result.stderr}")
-                
-                if result.returncode == 0:
-                    try:
-                        current_app.logger.info(f"Raw stdout first 200 chars: {result.stdout[:200]}")
-                        data = json.loads(result.stdout.strip())
-                        if data.get('success', False):
-                            current_app.logger.info("✅ File-based OpenAI script successful!")
-                            return {
-                                'title': data['title'],
-                                'excerpt': data['excerpt'], 
-                                'content': data['content']
-                            }
-                        else:
-                            current_app.logger.error(f"File-based OpenAI failed: {data.get('error', 'Unknown error')}")
-                            current_app.logger.error(f"Full response: {data}")
-                    except json.JSONDecodeError as e:
-                        current_app.logger.error(f"Failed to parse JSON response: {e}")
-                        current_app.logger.error(f"Raw output: {result.stdout[:500]}")
-                    except Exception as parse_error:
-                        current_app.logger.error(f"Error parsing response: {parse_error}")
-                        current_app.logger.error(f"Raw output: {result.stdout[:500]}")
-                else:
-                    current_app.logger.error(f"File-based script failed with code {result.returncode}")
-                    current_app.logger.error(f"Error output: {result.stderr}")
-                    current_app.logger.error(f"Standard output: {result.stdout}")
-                    
-            finally:
-                # Clean up temp file
-                try:
-                    if os.path.exists(temp_file):
-                        os.unlink(temp_file)
-                        current_app.logger.info("Temp file cleaned up")
-                except Exception as cleanup_error:
-                    current_app.logger.warning(f"Failed to cleanup temp file: {cleanup_error}")
-                
-        except Exception as e:
-            current_app.logger.error(f"Error calling file-based OpenAI script: {str(e)}")
-            import traceback
-            current_app.logger.error(f"Traceback: {traceback.format_exc()}")
+        post, timing = self.client.generate(topic, language, keywords)
+        self.timings[language] = timing
+        if post is None:
+            current_app.logger.error(f"OpenAI blog generation failed, using fallback template: {timing.as_dict()}")
+            return self._get_fallback_template(topic, language, keywords)
         
-        # Fallback if everything fails
-        current_app.logger.info("Using fallback template due to OpenAI failure")
-        return self._get_fallback_template(topic, language, keywords)
+        current_app.logger.info(f"Blog post generated: {timing.as_dict()}")
+        return post
     
     def _get_fallback_template(self, topic: str, language: str, keywords: str) -> Dict[str, str]:
         """Get fallback template for when OpenAI fails"""
@@ -436,14 +330,36 @@ class AIContentGenerator:
             'content': template['content']
         }
     
-    def generate_multilingual_post(self, topics: Dict[str, str], keywords: str = '') -> Dict[str, Dict[str, str]]:
-        """Generate blog post in all supported languages"""
+    def generate_multilingual_post(self, topics: Dict[str, str], keywords: str = '',
+                                   on_done: Optional[Callable[[str], None]] = None) -> Dict[str, Dict[str, str]]:
+        """Generate blog post in all supported languages, calling on_done(language) as each finishes"""
+        topics = {lang: topic for lang, topic in topics.items() if topic.strip()}
+        
+        # Each language is an independent generation, so run them concurrently
+        posts = run_concurrently(
+            {lang: (lambda lang=lang, topic=topic: self.generate_blog_post(topic, lang, keywords))
+             for lang, topic in topics.items()},
+            max_workers=current_app.config.get('CONTENT_GENERATION_WORKERS', 4),
+            timeout=current_app.config.get('CONTENT_GENERATION_TIMEOUT', 120),
+            on_done=on_done
+        )
+        
         result = {}
         for lang, topic in topics.items():
-            if topic.strip():
-                result[lang] = self.generate_blog_post(topic, lang, keywords)
+            post = posts[lang]
+            if isinstance(post, Exception):
+                current_app.logger.error(f"Generating {lang} blog post failed: {str(post)}")
+                post = self._get_fallback_template(topic, lang, keywords)
+            result[lang] = post
         return result
 
+def get_catalog_context(language: str, message: Optional[str] = None) -> Dict[str, str]:
+    """Get the products and categories relevant to a chatbot message from the retrieval index"""
+    return catalog_context(language, message,
+                           products=current_app.config.get('CHATBOT_CONTEXT_PRODUCTS', 5),
+                           categories=current_app.config.get('CHATBOT_CONTEXT_CATEGORIES', 5))
+
+
 class ChatbotAssistant:
     """AI Chatbot for customer support using OpenAI Assistants API"""
     
@@ -459,6 +375,8 @@ class ChatbotAssistant:
         else:
             current_app.logger.error(f"Chatbot script not found at: {script_path}")
         
+        self.last_run_stats = None  # Polling statistics of the latest Assistants run
+        
         if not api_key:
             self.client = None
             self.assistant_id = None
@@ -489,124 +407,102 @@ class ChatbotAssistant:
             return self._get_fallback_response(language)
         
         try:
-            # Get product context for chat
-            from app.models import Product, Category
-            products = Product.query.filter_by(is_active=True).limit(10).all()
-            categories = Category.query.filter_by(is_active=True).limit(5).all()
+            response_cache = get_response_cache(current_app._get_current_object())
+            if response_cache:
+                cached = response_cache.lookup(language, message)
+                if cached is not None:
+                    return cached
             
-            product_info = "\n".join([
-                f"- {p.get_name(language)}: {p.price} {p.currency} - {p.get_description(language)[:100] if p.get_description(language) else 'Качественный цифровой продукт'}..."
-                for p in products
-            ])
+            started = time.perf_counter()
+            assistant_request = self._build_assistant_request(message, language)
             
-            category_info = "\n".join([
-                f"- {c.get_name(language)}: {c.get_description(language)[:100] if c.get_description(language) else 'Профессиональные ИТ-услуги'}..."
-                for c in categories
-            ])
-            
-            # Prepare OpenAI Assistant request
-            assistant_request = {
-                "message": message,
-                "language": language,
-                "product_info": product_info,
-                "category_info": category_info,
-                "assistant_id": self.assistant_id
-            }
-            
-            # Log debug info about Assistant ID
-            current_app.logger.info(f"Using OpenAI Assistant ID: {self.assistant_id}")
+            if current_app.config.get('CHATBOT_ENGINE') == 'subprocess':
+                response_data = self._call_assistant_script(assistant_request)
+            else:
+                engine = get_chatbot_engine(current_app._get_current_object())
+                response_data = engine.handle(assistant_request)
             
-            # Save request to temp file
-            import json
-            import tempfile
-            import subprocess
+            if 'error' in response_data:
+                current_app.logger.error(f"OpenAI Assistant API error: {response_data['error']}")
+                # Fall back to direct approach if Assistant API fails
+                current_app.logger.info("Falling back to direct OpenAI API call")
+                return self._direct_openai_call(message, language, session_id)
             
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False, encoding='utf-8') as f:
-                json.dump(assistant_request, f, ensure_ascii=False, indent=2)
-                temp_file = f.name
-            
-            try:
-                # Get absolute path to script
-                script_dir = os.path.abspath(os.path.join(current_app.root_path, '..'))
-                
-                # Try to use our custom script for v0.28.0 that properly integrates assistant_id
-                script_path = os.path.join(script_dir, 'openai_izi_assistant.py')
-                
-                # Setup environment with OpenAI API key and force UTF-8 encoding
-                env = os.environ.copy()
-                env['OPENAI_API_KEY'] = current_app.config.get('OPENAI_API_KEY', '')
-                env['OPENAI_ASSISTANT_ID'] = self.assistant_id
-                env['PYTHONIOENCODING'] = 'utf-8'  # Force UTF-8 for all IO operations
-                
-                # Log useful debug info
-                current_app.logger.info(f"Running Assistant chatbot script from: {script_dir}")
-                current_app.logger.info(f"Full script path: {script_path}")
-                
-                # Use full paths for everything to avoid any path resolution issues
-                python_executable = sys.executable
-                
-                try:
-                    # Set up a process with pipes and explicit encoding
-                    process = subprocess.Popen(
-                        [python_executable, script_path, temp_file],
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.PIPE,
-                        env=env,
-                        universal_newlines=True,
-                        encoding='utf-8',
-                        errors='replace'  # Replace invalid characters instead of failing
-                    )
-                    
-                    # Get output with proper encoding
-                    stdout, stderr = process.communicate()
-                    
-                    # Create a result object similar to subprocess.run
-                    result = type('Result', (), {
-                        'returncode': process.returncode,
-                        'stdout': stdout,
-                        'stderr': stderr
-                    })
-                    
-                except Exception as e:
-                    current_app.logger.error(f"Error running Assistant chatbot process: {str(e)}")
-                    result = type('Result', (), {
-                        'returncode': 1,
-                        'stdout': '',
-                        'stderr': f"Error: {str(e)}"
-                    })
-                
-                if result.returncode == 0:
-                    try:
-                        response_data = json.loads(result.stdout)
-                        if 'error' in response_data:
-                            current_app.logger.error(f"OpenAI Assistant API error: {response_data['error']}")
-                            # Fall back to direct approach if Assistant API fails
-                            current_app.logger.info("Falling back to direct OpenAI API call")
-                            return self._direct_openai_call(message, language)
-                        return response_data.get('response', self._get_fallback_response(language))
-                    except json.JSONDecodeError:
-                        current_app.logger.error(f"Invalid JSON response: {result.stdout}")
-                        # Try direct approach instead
-                        current_app.logger.info("Falling back to direct OpenAI API call")
-                        return self._direct_openai_call(message, language)
-                else:
-                    current_app.logger.error(f"OpenAI Assistant script error: {result.stderr}")
-                    current_app.logger.error(f"Script stdout: {result.stdout}")
-                    # Try direct approach instead
-                    current_app.logger.info("Falling back to direct OpenAI API call")
-                    return self._direct_openai_call(message, language)
-                    
-            finally:
-                # Clean up temp file
-                try:
-                    os.unlink(temp_file)
-                except:
-                    pass
+            response = response_data.get('response')
+            if not response:
+                return self._get_fallback_response(language)
+            if response_cache:
+                response_cache.store(language, message, response, time.perf_counter() - started)
+            return response
             
         except Exception as e:
             current_app.logger.error(f"Error getting OpenAI Assistant response: {str(e)}")
             return self._get_fallback_response(language)
     
+    def stream_response(self, message: str, session_id: str, language: str = 'uk'):
+        """Yield the chatbot response as text deltas for server-sent events"""
+        if not self.client:
+            yield self._get_static_fallback(language)
+            return
+        
+        response_cache = get_response_cache(current_app._get_current_object())
+        if response_cache:
+            cached = response_cache.lookup(language, message)
+            if cached is not None:
+                yield cached
+                return
+        
+        started = time.perf_counter()
+        assistant_request = self._build_assistant_request(message, language)
+        # Return the DB connection to the pool before holding the stream open
+        db.session.close()
+        
+        engine = get_chatbot_engine(current_app._get_current_object())
+        parts = []
+        try:
+            for text in engine.stream(assistant_request):
+                parts.append(text)
+                yield text
+        except Exception as e:
+            current_app.logger.error(f"Error streaming OpenAI response: {str(e)}")
+            if not parts:
+                yield self._get_static_fallback(language)
+            return
+        
+        if response_cache and parts:
+            response_cache.store(language, message, ''.join(parts), time.perf_counter() - started)
+    
+    def _build_assistant_request(self, message: str, language: str) -> Dict[str, Any]:
+        """Build the engine request with the product and category context relevant to the message"""
+        catalog_context = get_catalog_context(language, message)
+        
+        # Log debug info about Assistant ID
+        current_app.logger.info(f"Using OpenAI Assistant ID: {self.assistant_id}")
+        
+        return {
+            "message": message,
+            "language": language,
+            "product_info": catalog_context['product_info'],
+            "category_info": catalog_context['category_info'],
+            "assistant_id": self.assistant_id
+        }
+    
+    def _call_assistant_script(self, assistant_request: Dict[str, Any]) -> Dict[str, Any]:
+        """Run the request through openai_izi_assistant.py in a subprocess (legacy engine)"""
+        script_dir = os.path.abspath(os.path.join(current_app.root_path, '..'))
+        script_path = os.path.join(script_dir, 'openai_izi_assistant.py')
+        
+        # Setup environment with OpenAI API key and force UTF-8 encoding
+        env = os.environ.copy()
+        env['OPENAI_API_KEY'] = current_app.config.get('OPENAI_API_KEY', '')
+        env['OPENAI_ASSISTANT_ID'] = self.assistant_id or ''
+        env['PYTHONIOENCODING'] = 'utf-8'  # Force UTF-8 for all IO operations
+        if current_app.config.get('OPENAI_API_BASE'):
+            env['OPENAI_API_BASE'] = current_app.config['OPENAI_API_BASE']
+        
+        current_app.logger.info(f"Running Assistant chatbot script: {script_path}")
+        return run_assistant_script(assistant_request, script_path, env)
+    
     def _get_demo_response(self, message: str, language: str, products, categories) -> str:
         """Generate demo responses based on message content and available products"""
         message_lower = message.lower()
@@ -782,98 +678,13 @@ Reply in English, be friendly and helpful. Try to direct the conversation toward
         
         return context_messages.get(language, context_messages['uk'])
     
-    def _direct_openai_call(self, message: str, language: str) -> str:
+    def _direct_openai_call(self, message: str, language: str, session_id: Optional[str] = None) -> str:
         """Make a direct OpenAI API call as a fallback, using Assistant API if possible"""
         try:
             # Check if we have an assistant_id to use
             if self.assistant_id:
                 try:
-                    # Try to use imported OpenAI module structure to detect version
-                    openai_version = "unknown"
-                    try:
-                        import openai
-                        try:
-                            from openai import version
-                            openai_version = version.__version__
-                        except:
-                            openai_version = "0.x"  # Older version doesn't have version module
-                    except:
-                        pass
-                    
-                    current_app.logger.info(f"Using direct assistant call with OpenAI version {openai_version}")
-                    
-                    # Try to use Assistant API directly
-                    if openai_version.startswith("1"):
-                        # For v1.x API
-                        from openai import OpenAI
-                        client = OpenAI(api_key=openai.api_key)
-                        
-                        # Create thread and message
-                        thread = client.beta.threads.create()
-                        client.beta.threads.messages.create(
-                            thread_id=thread.id,
-                            role="user",
-                            content=message
-                        )
-                        
-                        # Run the assistant
-                        run = client.beta.threads.runs.create(
-                            thread_id=thread.id,
-                            assistant_id=self.assistant_id,
-                            instructions=f"Пользователь общается на языке: {language}. Отвечай на том же языке."
-                        )
-                        
-                        # Wait for completion
-                        import time
-                        while run.status in ["queued", "in_progress"]:
-                            time.sleep(0.5)
-                            run = client.beta.threads.runs.retrieve(
-                                thread_id=thread.id,
-                                run_id=run.id
-                            )
-                        
-                        # Get messages
-                        messages = client.beta.threads.messages.list(thread_id=thread.id)
-                        for message in messages.data:
-                            if message.role == "assistant":
-                                return message.content[0].text.value
-                    else:
-                        # For v0.x API - special handling for 0.28.0
-                        import time
-                        
-                        # Create thread and message
-                        thread = openai.Thread.create()
-                        openai.ThreadMessage.create(
-                            thread_id=thread.id,
-                            role="user",
-                            content=message
-                        )
-                        
-                        # Run the assistant
-                        run = openai.ThreadRun.create(
-                            thread_id=thread.id,
-                            assistant_id=self.assistant_id,
-                            instructions=f"Пользователь общается на языке: {language}. Отвечай на том же языке."
-                        )
-                        
-                        # Wait for completion
-                        while run.status in ["queued", "in_progress"]:
-                            time.sleep(0.5)
-                            run = openai.ThreadRun.retrieve(
-                                thread_id=thread.id,
-                                run_id=run.id
-                            )
-                        
-                        # Get messages
-                        messages = openai.ThreadMessage.list(thread_id=thread.id)
-                        for message in messages.data:
-                            if message.role == "assistant":
-                                # Handle different message content structures
-                                if hasattr(message.content[0], 'text'):
-                                    return message.content[0].text.value
-                                else:
-                                    return message.content[0].value
-                
+                    return self._assistant_run(message, language, session_id)
                 except Exception as e:
                     current_app.logger.error(f"Assistant API call failed, falling back to ChatCompletion: {str(e)}")
                     # Fall through to ChatCompletion if Assistant API fails
@@ -882,15 +693,26 @@ Reply in English, be friendly and helpful. Try to direct the conversation toward
             simple_prompt = f"You are a professional sales assistant for IZI.SOFT. Respond in {language} language. Be helpful and concise."
             
             # Make direct OpenAI call
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": simple_prompt},
-                    {"role": "user", "content": message}
-                ],
-                max_tokens=800,
-                temperature=0.7
-            )
+            params = {}
+            if current_app.config.get('OPENAI_API_BASE'):
+                params['api_base'] = current_app.config['OPENAI_API_BASE']
+            started = time.perf_counter()
+            try:
+                response = openai.ChatCompletion.create(
+                    model="gpt-3.5-turbo",
+                    messages=[
+                        {"role": "system", "content": simple_prompt},
+                        {"role": "user", "content": message}
+                    ],
+                    max_tokens=800,
+                    temperature=0.7,
+                    request_timeout=current_app.config.get('OPENAI_REQUEST_TIMEOUT'),
+                    **params
+                )
+            except Exception:
+                observe_openai('chatbot', 'fallback_chat', time.perf_counter() - started, outcome='error')
+                raise
+            observe_openai('chatbot', 'fallback_chat', time.perf_counter() - started, response.get('usage'))
             
             return response.choices[0].message.content.strip()
             
@@ -898,6 +720,47 @@ Reply in English, be friendly and helpful. Try to direct the conversation toward
             current_app.logger.error(f"Direct OpenAI API call failed: {str(e)}")
             return self._get_static_fallback(language)
     
+    def _assistant_run(self, message: str, language: str, session_id: Optional[str] = None) -> str:
+        """Answer through the Assistants API on the session's thread, waiting for the run with adaptive backoff"""
+        app = current_app._get_current_object()
+        client = get_assistants_client(app)
+        
+        if session_id:
+            thread_sessions = get_thread_sessions(app)
+            thread_id = thread_sessions.get_thread_id(session_id, client.create_thread, language)
+            try:
+                client.create_message(thread_id, message)
+            except requests.HTTPError as e:
+                if e.response is None or e.response.status_code != 404:
+                    raise
+                # The stored thread expired remotely - start the conversation over
+                thread_sessions.invalidate(session_id)
+                thread_id = thread_sessions.get_thread_id(session_id, client.create_thread, language)
+                client.create_message(thread_id, message)
+        else:
+            thread_id = client.create_thread()['id']
+            client.create_message(thread_id, message)
+        
+        started = time.perf_counter()
+        try:
+            text, result = client.run_and_wait(
+                thread_id,
+                self.assistant_id,
+                create_run_waiter(app),
+                instructions=f"Пользователь общается на языке: {language}. Отвечай на том же языке.",
+                stream=app.config.get('OPENAI_ASSISTANT_STREAM_RUNS', True)
+            )
+        except Exception:
+            observe_openai('chatbot', 'assistant_run', time.perf_counter() - started, outcome='error')
+            raise
+        observe_openai('chatbot', 'assistant_run', time.perf_counter() - started, result.run.get('usage'))
+        
+        self.last_run_stats = result.as_dict()
+        current_app.logger.info(f"Assistant run {result.run.get('id')} finished: {self.last_run_stats}")
+        if not text:
+            raise RuntimeError("Assistant run completed without a reply")
+        return text
+    
     def _get_fallback_response(self, language: str) -> str:
         """Get fallback response when AI is unavailable"""
         # Try direct API call first
@@ -1012,31 +875,13 @@ def init_default_data():
 
 
 def cleanup_old_chat_threads(days_old: int = 7):
-    """Clean up chat threads older than specified days"""
+    """Clean up chat threads idle for more than the specified days"""
     try:
-        from app.models import ChatThread
-        from app.extensions import db
-        from datetime import datetime, timezone, timedelta
-        
-        cutoff_date = datetime.now(timezone.utc) - timedelta(days=days_old)
-        
-        old_threads = ChatThread.query.filter(ChatThread.created_at < cutoff_date).all()
-        
-        for thread in old_threads:
-            try:
-                # Try to delete the thread from OpenAI (optional)
-                # client = openai.OpenAI(api_key=current_app.config['OPENAI_API_KEY'])
-                # client.beta.threads.delete(thread.thread_id)
-                pass
-            except Exception as e:
-                current_app.logger.warning(f"Could not delete OpenAI thread {thread.thread_id}: {str(e)}")
-            
-            # Delete from local database
-            db.session.delete(thread)
-        
-        db.session.commit()
-        current_app.logger.info(f"Cleaned up {len(old_threads)} old chat threads")
+        expired = expire_chat_threads(days_old=days_old)
+        current_app.logger.info(f"Cleaned up {expired} old chat threads")
+        return expired
         
     except Exception as e:
         current_app.logger.error(f"Error cleaning up chat threads: {str(e)}")
         db.session.rollback()
+        return 0
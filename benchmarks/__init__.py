@@ -0,0 +1 @@
+"""Benchmarks and local stub servers for performance testing"""
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Measure the blog listing as the number of published posts grows.
+
+Compares the previous listing (every published post with all language
+columns, sliced in the template) with keyset pages from the first page
+and from deep inside the blog, using an in-memory SQLite database:
+
+    python -m benchmarks.bench_blog_listing --posts 10000,100000 --content-size 500
+"""
+import os
+import sys
+import time
+import argparse
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app
+from app.extensions import db
+from app.models import BlogPost, User
+from app.pagination import encode_cursor
+
+
+def fill(count, content_size, start):
+    body = 'x' * content_size
+    rows = []
+    for i in range(start, count):
+        rows.append({
+            'title': f'Post {i}', 'content': body, 'excerpt': None,
+            'title_uk': f'Пост {i}', 'title_ru': f'Пост {i}', 'title_de': f'Beitrag {i}', 'title_en': f'Post {i}',
+            'content_uk': body, 'content_ru': body, 'content_de': body, 'content_en': body,
+            'slug': f'post-{i}', 'is_published': True, 'author_id': 1,
+            'created_at': datetime(2024, 1, 1) + timedelta(minutes=i)
+        })
+        if len(rows) == 5000:
+            db.session.execute(BlogPost.__table__.insert(), rows)
+            rows = []
+    if rows:
+        db.session.execute(BlogPost.__table__.insert(), rows)
+    db.session.commit()
+
+
+def timed(client, url, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        response = client.get(url)
+        assert response.status_code == 200, response.status_code
+    return (time.perf_counter() - started) / repeat * 1000, len(response.get_data())
+
+
+def old_listing_ms(repeat):
+    # The previous blog() query plus the template's per-post content slicing
+    started = time.perf_counter()
+    for _ in range(repeat):
+        posts = BlogPost.query.filter_by(is_published=True).order_by(BlogPost.created_at.desc()).all()
+        [post.get_content('en')[:150] for post in posts]
+        db.session.expunge_all()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--posts', default='10000,100000', help='Comma separated post counts')
+    parser.add_argument('--content-size', type=int, default=500, help='Characters per language of each article')
+    parser.add_argument('--repeat', type=int, default=20, help='Requests per measurement')
+    args = parser.parse_args()
+
+    app = create_app('testing')
+    app.config['PAGE_CACHE'] = False
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(id=1, username='bench', email='bench@example.com', password_hash='-'))
+        db.session.commit()
+        client = app.test_client()
+        client.get('/set_language/en')
+
+        print(f"{'posts':>8} | {'old query':>10} | {'first page':>10} | {'deep page':>10} | {'page bytes':>10}")
+        loaded = 0
+        for count in (int(c) for c in args.posts.split(',')):
+            fill(count, args.content_size, loaded)
+            loaded = count
+            deep = encode_cursor((datetime(2024, 1, 1) + timedelta(minutes=count // 10), count // 10))
+            old_ms = old_listing_ms(max(1, args.repeat // 10))
+            first_ms, size = timed(client, '/blog', args.repeat)
+            deep_ms, _ = timed(client, f'/blog?after={deep}', args.repeat)
+            print(f"{count:8d} | {old_ms:7.1f} ms | {first_ms:7.2f} ms | {deep_ms:7.2f} ms | {size:10d}")
+
+
+if __name__ == '__main__':
+    main()
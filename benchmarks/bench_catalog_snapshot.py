@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Measure the in-memory catalog snapshot (app/catalog.py) against ORM reads.
+
+Generates --products products in four languages with a short description
+each, then reports how long the snapshot takes to build, the memory it holds
+(scaled to 100k products), the same rows loaded as ORM objects for
+comparison, and the cost of the catalog reads the storefront makes: one
+product by id, the active products of a category and a cart of ten products.
+Everything runs on an in-memory SQLite database:
+
+    python -m benchmarks.bench_catalog_snapshot --products 100000 --repeat 200
+"""
+import os
+import sys
+import gc
+import time
+import random
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app
+from app.catalog import build_catalog, get_catalog
+from app.checkout import resolve_cart
+from app.extensions import db
+from app.localization import localized
+from app.models import Category, Product
+
+WORDS = ('website chatbot hosting shop design automation marketing support analytics mobile payment cloud '
+         'backup migration training content branding newsletter search security').split()
+
+
+def generate(products, categories, rng):
+    db.session.execute(Category.__table__.insert(), [
+        {'name_uk': f'Категорія {i}', 'name_ru': f'Категория {i}', 'name_de': f'Kategorie {i}',
+         'name_en': f'Category {i}', 'slug': f'category-{i}', 'is_active': True, 'sort_order': i}
+        for i in range(categories)])
+    for start in range(0, products, 5000):
+        rows = []
+        for i in range(start, min(start + 5000, products)):
+            name = ' '.join(rng.choices(WORDS, k=3))
+            description = ' '.join(rng.choices(WORDS, k=25))
+            rows.append({'name_uk': f'{name} {i}', 'name_ru': f'{name} {i}', 'name_de': f'{name} {i} DE',
+                         'name_en': f'{name} {i} EN', 'description_uk': description,
+                         'description_en': description.capitalize(), 'price': round(rng.uniform(10, 5000), 2),
+                         'currency': 'EUR', 'slug': f'product-{i}', 'is_active': i % 10 != 0,
+                         'sort_order': i % 1000, 'category_id': i % categories + 1})
+        db.session.execute(Product.__table__.insert(), rows)
+    db.session.commit()
+
+
+def retained(build):
+    # Time without tracing, then the memory still allocated by what build returns once its temporaries are gone
+    started = time.perf_counter()
+    build()
+    elapsed = time.perf_counter() - started
+    db.session.expunge_all()
+    gc.collect()
+    tracemalloc.start()
+    value = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return value, size, elapsed
+
+
+def timed(function, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=100000, help='Products in the generated catalog')
+    parser.add_argument('--categories', type=int, default=50, help='Categories in the generated catalog')
+    parser.add_argument('--repeat', type=int, default=200, help='Repetitions of every read')
+    args = parser.parse_args()
+
+    app = create_app('testing')
+    rng = random.Random(3)
+    with app.app_context():
+        db.create_all()
+        generate(args.products, args.categories, rng)
+        scale = 100000 / args.products
+
+        snapshot, snapshot_bytes, build_s = retained(build_catalog)
+        del snapshot
+        orm, orm_bytes, orm_s = retained(lambda: Product.query.all())
+        del orm
+        db.session.expunge_all()
+        print(f'{args.products} products, {args.categories} categories')
+        print(f"{'held in memory':<24} | {'build':>8} | {'MB':>7} | {'MB per 100k products':>20}")
+        for label, size, elapsed in (('catalog snapshot', snapshot_bytes, build_s),
+                                     ('ORM objects', orm_bytes, orm_s)):
+            print(f'{label:<24} | {elapsed:6.2f} s | {size / 2 ** 20:7.1f} | {size * scale / 2 ** 20:20.1f}')
+
+        catalog = get_catalog()
+        product_id, category_id = args.products // 2 + 1, 2
+        cart = [{'product_id': rng.randrange(args.products // 10) * 10 + 2, 'quantity': 1} for _ in range(10)]  # Active
+        reads = (
+            ('product by id', lambda: db.session.get(Product, product_id),
+             lambda: catalog.products[product_id]),
+            ('category listing', lambda: Product.query.filter_by(category_id=category_id, is_active=True).options(
+                *localized(Product, 'en')).order_by(Product.sort_order).all(),
+             lambda: catalog.products_in(category_id)),
+            ('cart of 10', lambda: Product.query.filter(Product.id.in_([i['product_id'] for i in cart])).options(
+                *localized(Product, 'en')).all(),
+             lambda: resolve_cart(cart, 'en')),
+        )
+        print(f"{'read':<24} | {'ORM query':>12} | {'snapshot':>12}")
+        for label, query, lookup in reads:
+            def uncached():
+                query()
+                db.session.expunge_all()
+            print(f'{label:<24} | {timed(uncached, args.repeat):9.1f} us | {timed(lookup, args.repeat):9.2f} us')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Compare chatbot latency: in-process engine vs. subprocess per message.
+
+Runs both engines against a local fake OpenAI server and prints p50/p99:
+
+    python -m benchmarks.bench_chatbot --requests 50 --latency 0.05
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+
+from app.chatbot_engine import ChatbotEngine, run_assistant_script
+from benchmarks.fake_openai import FakeOpenAIServer
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def report(name, samples):
+    print(f"{name:<12} n={len(samples):<4} "
+          f"p50={percentile(samples, 50) * 1000:8.1f} ms  "
+          f"p99={percentile(samples, 99) * 1000:8.1f} ms  "
+          f"mean={statistics.mean(samples) * 1000:8.1f} ms")
+
+
+def sample_request(i):
+    return {
+        "message": f"What do you sell? #{i}",
+        "language": "en",
+        "product_info": "- Website: 500 EUR - Landing page with CMS...",
+        "category_info": "- Web development: Websites and shops...",
+        "assistant_id": "asst_benchmark"
+    }
+
+
+def bench_inprocess(server, count):
+    engine = ChatbotEngine(api_key='sk-benchmark', api_base=server.url)
+    samples = []
+    try:
+        for i in range(count):
+            started = time.perf_counter()
+            result = engine.handle(sample_request(i))
+            samples.append(time.perf_counter() - started)
+            assert 'error' not in result, result
+    finally:
+        engine.shutdown()
+    return samples
+
+
+def bench_subprocess(server, count):
+    script_path = os.path.join(ROOT_DIR, 'openai_izi_assistant.py')
+    env = os.environ.copy()
+    env.update({
+        'OPENAI_API_KEY': 'sk-benchmark',
+        'OPENAI_API_BASE': server.url,
+        'PYTHONIOENCODING': 'utf-8'
+    })
+    samples = []
+    for i in range(count):
+        started = time.perf_counter()
+        result = run_assistant_script(sample_request(i), script_path, env)
+        samples.append(time.perf_counter() - started)
+        assert 'error' not in result, result
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=30)
+    parser.add_argument('--latency', type=float, default=0.05, help='Simulated model latency in seconds')
+    args = parser.parse_args()
+
+    with FakeOpenAIServer(latency=args.latency) as server:
+        inprocess = bench_inprocess(server, args.requests)
+        subprocess_samples = bench_subprocess(server, args.requests)
+
+    print(f"Fake model latency: {args.latency * 1000:.0f} ms")
+    report('inprocess', inprocess)
+    report('subprocess', subprocess_samples)
+    saved = percentile(subprocess_samples, 50) - percentile(inprocess, 50)
+    print(f"p50 saved per message: {saved * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
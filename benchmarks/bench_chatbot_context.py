@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Measure the catalog context the chatbot sends to OpenAI, offline.
+
+Builds a generated catalog of --products items, then asks one question per
+sampled product and compares the previous context (the first 10 active
+products, whatever was asked) with retrieval (app/retrieval.py, top
+CHATBOT_CONTEXT_PRODUCTS by BM25): prompt size, whether the product asked
+about is in the context, and the per-message retrieval cost. Also times the
+index build, reloading it from disk and a commit updating it in place.
+Everything is deterministic and needs no API key:
+
+    python -m benchmarks.bench_chatbot_context --products 2000 --questions 200
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app
+from app.extensions import db, cache
+from app.models import Category, Product
+from app.retrieval import build_index, get_catalog_index
+from app.utils import get_catalog_context
+
+SERVICES = ('website', 'chatbot', 'hosting', 'newsletter', 'logo', 'crm', 'analytics', 'backup', 'webshop',
+            'translation', 'seo', 'firewall', 'mobile app', 'booking system', 'payment gateway', 'invoice tool')
+AUDIENCES = ('restaurants', 'dentists', 'lawyers', 'bakeries', 'hotels', 'schools', 'garages', 'florists',
+             'fitness studios', 'architects', 'startups', 'clinics', 'photographers', 'retailers')
+FEATURES = ('multilingual', 'responsive', 'secure', 'automated', 'managed', 'custom', 'cloud based', 'white label')
+QUESTIONS = ('Do you have a {service} for {audience}?', 'How much is a {feature} {service}?',
+             'We are {audience} and need a {service}, what can you offer?')
+
+
+def previous_context(language):
+    # The context get_response used before retrieval: the first ten active products
+    lines = []
+    for p in Product.query.filter_by(is_active=True).limit(10).all():
+        description = p.get_description(language)
+        lines.append(f"- {p.get_name(language)}: {p.price} {p.currency} - "
+                     f"{description[:100] if description else 'Качественный цифровой продукт'}...")
+    return '\n'.join(lines)
+
+
+def generate(products, rng):
+    db.session.add(Category(id=1, slug='services', name_uk='Сервіси', name_ru='Сервисы', name_de='Dienste',
+                            name_en='Services'))
+    catalog = []
+    for i in range(products):
+        service, audience, feature = rng.choice(SERVICES), rng.choice(AUDIENCES), rng.choice(FEATURES)
+        name = f'{feature.capitalize()} {service} for {audience} #{i}'
+        catalog.append((service, audience, feature, name))
+        db.session.add(Product(name_uk=name, name_ru=name, name_de=name, name_en=name,
+                               description_en=f'A {feature} {service} built for {audience}, set up in days.',
+                               price=round(rng.uniform(50, 5000), 2), slug=f'product-{i}', sort_order=i,
+                               category_id=1))
+    db.session.commit()
+    return catalog
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=2000, help='Products in the generated catalog')
+    parser.add_argument('--questions', type=int, default=200, help='Questions, each about one product')
+    parser.add_argument('--top-k', type=int, default=5, help='CHATBOT_CONTEXT_PRODUCTS')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    app = create_app('testing')
+    app.config.update(CHATBOT_CONTEXT_PRODUCTS=args.top_k,
+                      CHATBOT_RETRIEVAL_INDEX=os.path.join(directory, 'catalog.idx'))
+    rng = random.Random(7)
+    try:
+        with app.app_context():
+            db.create_all()
+            catalog = generate(args.products, rng)
+
+            started = time.perf_counter()
+            build_index()
+            build_s = time.perf_counter() - started
+            get_catalog_index()  # Builds and writes the index file
+            size_kb = os.path.getsize(app.config['CHATBOT_RETRIEVAL_INDEX']) / 1024
+            app.extensions['cache_local'].clear()
+            started = time.perf_counter()
+            get_catalog_index()
+            load_s = time.perf_counter() - started
+
+            totals = {'previous': [0, 0], 'retrieval': [0, 0]}  # [characters, questions answered from context]
+            retrieval_s = 0.0
+            for index in rng.sample(range(len(catalog)), min(args.questions, len(catalog))):
+                service, audience, feature, name = catalog[index]
+                question = rng.choice(QUESTIONS).format(service=service, audience=audience, feature=feature)
+                # The product asked about, or any product with the same service and audience, answers it
+                wanted = f'{service} for {audience} #'
+                previous = previous_context('en')
+                started = time.perf_counter()
+                context = get_catalog_context('en', question)['product_info']
+                retrieval_s += time.perf_counter() - started
+                for label, text in (('previous', previous), ('retrieval', context)):
+                    totals[label][0] += len(text)
+                    totals[label][1] += wanted in text
+
+            product = db.session.get(Product, 1)
+            product.name_en = 'Renamed product'
+            started = time.perf_counter()
+            db.session.commit()
+            get_catalog_index()
+            update_s = time.perf_counter() - started
+            assert 'Renamed product' in get_catalog_context('en', 'renamed')['product_info']
+            assert cache.version('catalog') == get_catalog_index().version
+
+        questions = min(args.questions, len(catalog))
+        print(f'{args.products} products, {questions} questions, top {args.top_k}')
+        print(f"{'context':<10} | {'chars/msg':>9} | {'~tokens/msg':>11} | {'answerable':>10}")
+        for label, (characters, hits) in totals.items():
+            print(f'{label:<10} | {characters / questions:9.0f} | {characters / questions / 4:11.0f} | '
+                  f'{hits / questions:9.0%}')
+        print(f'retrieval per message: {retrieval_s / questions * 1000:.2f} ms')
+        print(f'index build: {build_s * 1000:.0f} ms, file {size_kb:.0f} KB, reload from file: {load_s * 1000:.0f} ms, '
+              f'commit + in-place update + reload: {update_s * 1000:.0f} ms')
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
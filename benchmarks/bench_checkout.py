@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+Count the SQL queries and time POST /checkout for growing carts.
+
+Compares the previous per-item Product.query.get loop with resolve_cart
+(one IN query) in Stripe demo mode, using an in-memory SQLite database:
+
+    python -m benchmarks.bench_checkout --sizes 1,10,50 --repeat 50
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import event
+
+from app import create_app
+from app.extensions import db
+from app.models import Category, Product
+
+
+def previous_checkout(cart_items, language):
+    # The loop checkout() ran before resolve_cart
+    stripe_items = []
+    for item in cart_items:
+        product = Product.query.get(item['product_id'])
+        if product and product.is_active:
+            stripe_items.append({
+                'name': product.get_name(language),
+                'description': product.get_description(language)[:100],
+                'price': product.price,
+                'currency': product.currency,
+                'quantity': item.get('quantity', 1)
+            })
+    return stripe_items
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1,10,50', help='Comma separated cart sizes')
+    parser.add_argument('--repeat', type=int, default=50, help='Checkouts per measurement')
+    args = parser.parse_args()
+
+    app = create_app('testing')
+    statements = []
+    with app.app_context():
+        db.create_all()
+        event.listen(db.engine, 'before_cursor_execute', lambda *a: statements.append(a[2]))
+        db.session.add(Category(id=1, slug='services', name_uk='Сервіси', name_ru='Сервисы', name_de='Dienste'))
+        db.session.execute(Product.__table__.insert(), [{
+            'name_uk': f'Товар {i}', 'name_ru': f'Товар {i}', 'name_de': f'Produkt {i}', 'name_en': f'Product {i}',
+            'description_uk': 'x' * 500, 'price': 9.99, 'currency': 'EUR', 'slug': f'product-{i}',
+            'is_active': True, 'category_id': 1
+        } for i in range(200)])
+        db.session.commit()
+        client = app.test_client()
+
+        print(f"{'items':>5} | {'old queries':>11} | {'new queries':>11} | {'old':>9} | {'new':>9}")
+        for size in (int(s) for s in args.sizes.split(',')):
+            cart = [{'product_id': i + 1, 'quantity': 2} for i in range(size)]
+
+            statements.clear()
+            db.session.expunge_all()
+            previous_checkout(cart, 'uk')
+            old_queries = len(statements)
+            started = time.perf_counter()
+            for _ in range(args.repeat):
+                db.session.expunge_all()
+                previous_checkout(cart, 'uk')
+            old_ms = (time.perf_counter() - started) / args.repeat * 1000
+
+            statements.clear()
+            assert client.post('/checkout', json={'items': cart}).status_code == 200
+            new_queries = len(statements)
+            started = time.perf_counter()
+            for _ in range(args.repeat):
+                client.post('/checkout', json={'items': cart})
+            new_ms = (time.perf_counter() - started) / args.repeat * 1000
+
+            print(f"{size:5d} | {old_queries:11d} | {new_queries:11d} | {old_ms:6.2f} ms | {new_ms:6.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
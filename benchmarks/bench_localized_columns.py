@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Measure the column data the public pages load with and without per-language projection.
+
+Fills an in-memory SQLite database with multilingual products and blog posts,
+then requests each page once with app.localization.localized disabled (every
+language loaded, the previous behaviour) and once enabled. The byte counts are
+the sizes of the column values loaded into the ORM, which is what a PostgreSQL
+server sends for those rows:
+
+    python -m benchmarks.bench_localized_columns --products 200 --posts 200 --text-size 2000
+"""
+import os
+import sys
+import argparse
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import event
+
+from app import create_app
+from app.extensions import db
+from app.models import BlogPost, Category, HomePageBlock, Product, User
+
+LOADED_MODELS = (BlogPost, Category, HomePageBlock, Product)
+
+
+def value_size(value):
+    if value is None:
+        return 0
+    if isinstance(value, str):
+        return len(value.encode('utf-8'))
+    return 8
+
+
+def fill(products, posts, text_size):
+    text = 'x' * text_size
+    db.session.add(User(id=1, username='bench', email='bench@example.com', password_hash='-'))
+    db.session.add(Category(id=1, slug='services', name_uk='Сервіси', name_ru='Сервисы', name_de='Dienste',
+                            name_en='Services', description_uk=text, description_ru=text,
+                            description_de=text, description_en=text))
+    db.session.execute(Product.__table__.insert(), [{
+        'name_uk': f'Товар {i}', 'name_ru': f'Товар {i}', 'name_de': f'Produkt {i}', 'name_en': f'Product {i}',
+        'description_uk': text, 'description_ru': text, 'description_de': text, 'description_en': text,
+        'price': 10.0, 'currency': 'EUR', 'slug': f'product-{i}', 'is_active': True, 'sort_order': i,
+        'category_id': 1
+    } for i in range(products)])
+    db.session.execute(BlogPost.__table__.insert(), [{
+        'title': f'Post {i}', 'content': text, 'title_uk': f'Пост {i}', 'title_ru': f'Пост {i}',
+        'title_de': f'Beitrag {i}', 'title_en': f'Post {i}', 'content_uk': text, 'content_ru': text,
+        'content_de': text, 'content_en': text, 'slug': f'post-{i}', 'is_published': True, 'author_id': 1
+    } for i in range(posts)])
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=200)
+    parser.add_argument('--posts', type=int, default=200)
+    parser.add_argument('--text-size', type=int, default=2000, help='Characters per language of each text column')
+    args = parser.parse_args()
+
+    app = create_app('testing')
+    app.config['PAGE_CACHE'] = False
+    loaded = [0]
+
+    def count_bytes(target, context):
+        loaded[0] += sum(value_size(v) for k, v in target.__dict__.items() if not k.startswith('_'))
+
+    for model in LOADED_MODELS:
+        event.listen(model, 'load', count_bytes)
+
+    pages = ['/', '/shop', '/shop/category/1', '/shop/product/1', '/blog', '/blog/post-1']
+    with app.app_context():
+        db.create_all()
+        fill(args.products, args.posts, args.text_size)
+        client = app.test_client()
+        client.get('/set_language/en')
+
+        def measure(url):
+            loaded[0] = 0
+            db.session.expunge_all()
+            assert client.get(url).status_code == 200, url
+            return loaded[0]
+
+        print(f"{'page':<18} | {'all languages':>14} | {'localized':>10} | {'saved':>6}")
+        for url in pages:
+            with mock.patch('app.routes.localized', lambda *a, **k: []):
+                before = measure(url)
+            after = measure(url)
+            saved = 100 * (before - after) / before if before else 0
+            print(f"{url:<18} | {before:14,d} | {after:10,d} | {saved:5.1f}%")
+
+
+if __name__ == '__main__':
+    main()
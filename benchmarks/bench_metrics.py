@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Measure what the Prometheus instrumentation (app/metrics.py) adds to a request.
+
+Serves --requests requests of a cheap cached page and of a page that runs
+SQL through the test client with METRICS_ENABLED off and on, and times the
+single recording calls the instrumentation makes. --multiprocess records
+into files in a temporary PROMETHEUS_MULTIPROC_DIR, as under gunicorn, which
+is the slower storage:
+
+    python -m benchmarks.bench_metrics --requests 2000 --multiprocess
+"""
+import os
+import sys
+import time
+import shutil
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+def per_request(client, url, requests):
+    client.get(url)  # Warm caches first
+    started = time.perf_counter()
+    for _ in range(requests):
+        client.get(url)
+    return (time.perf_counter() - started) / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000, help='Requests per URL and setting')
+    parser.add_argument('--multiprocess', action='store_true', help='Record into multiprocess files')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='metrics_bench_')
+    try:
+        if args.multiprocess:
+            # Must be set before prometheus_client is imported
+            os.environ['PROMETHEUS_MULTIPROC_DIR'] = directory
+        from app import create_app
+        from app.extensions import db
+        from app.metrics import count_cache, observe_openai
+        from benchmarks.bench_catalog_snapshot import generate
+        from config import TestingConfig
+
+        urls = ('/api/categories', '/api/search?q=cloud')
+        timings = {}
+        # Off first: once enabled, the SQL listeners stay on the Engine class
+        for enabled in (False, True):
+            TestingConfig.METRICS_ENABLED = enabled  # Read by create_app
+            app = create_app('testing')
+            with app.app_context():
+                db.create_all()
+                generate(2000, 20, random.Random(3))
+                client = app.test_client()
+                timings[enabled] = [per_request(client, url, args.requests) for url in urls]
+
+        mode = 'multiprocess files' if args.multiprocess else 'in-process'
+        print(f'{args.requests} requests per URL, metrics stored {mode}')
+        print(f"{'url':<24} | {'metrics off':>12} | {'metrics on':>12} | {'added':>10}")
+        for i, url in enumerate(urls):
+            off, on = timings[False][i], timings[True][i]
+            print(f'{url:<24} | {off:9.1f} us | {on:9.1f} us | {on - off:7.1f} us')
+
+        calls = 100000
+        started = time.perf_counter()
+        for _ in range(calls):
+            count_cache('bench', 'fresh')
+        counter_us = (time.perf_counter() - started) / calls * 1e6
+        started = time.perf_counter()
+        for _ in range(calls):
+            observe_openai('bench', 'chat', 0.5, {'prompt_tokens': 10, 'completion_tokens': 20})
+        openai_us = (time.perf_counter() - started) / calls * 1e6
+        print(f'count_cache {counter_us:.2f} us, observe_openai with tokens {openai_us:.2f} us per call')
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Tune the Assistants run waiter against a local mock Assistants API.
+
+For several simulated run durations, compares the old fixed 0.5 s polling
+loop with the adaptive waiter and a streaming run, reporting polls and
+wasted wait (time slept after the run had already finished):
+
+    python -m benchmarks.bench_run_waiter --initial 0.05 --multiplier 1.5 --max-delay 0.5
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.assistant_runs import AssistantsClient, RunWaiter
+from benchmarks.fake_openai import FakeOpenAIServer
+
+
+class FixedIntervalWaiter(RunWaiter):
+    """The previous behaviour: sleep 0.5 s between polls, no deadline"""
+
+    def __init__(self):
+        super().__init__(initial_delay=0.5, multiplier=1.0, max_delay=0.5, deadline=3600)
+
+
+def measure(client, server, waiter, stream):
+    thread = client.create_thread()
+    client.create_message(thread['id'], 'ping')
+    started = time.monotonic()
+    _, result = client.run_and_wait(thread['id'], 'asst_bench', waiter, stream=stream)
+    elapsed = time.monotonic() - started
+    return result.polls, elapsed - server.assistants.run_duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--initial', type=float, default=0.05, help='First poll delay in seconds')
+    parser.add_argument('--multiplier', type=float, default=1.5, help='Backoff growth factor')
+    parser.add_argument('--max-delay', type=float, default=0.5, help='Backoff cap in seconds')
+    parser.add_argument('--durations', default='0.1,0.3,0.8,1.5,3.0', help='Comma separated run durations')
+    args = parser.parse_args()
+
+    adaptive = RunWaiter(initial_delay=args.initial, multiplier=args.multiplier,
+                         max_delay=args.max_delay, deadline=60)
+    fixed = FixedIntervalWaiter()
+
+    print(f"{'run':>6} | {'fixed 0.5s':>18} | {'adaptive':>18} | {'streaming':>10}")
+    print(f"{'(s)':>6} | {'polls':>6} {'overhead':>11} | {'polls':>6} {'overhead':>11} | {'overhead':>10}")
+    with FakeOpenAIServer() as server:
+        client = AssistantsClient(api_key='sk-bench', api_base=server.url)
+        for duration in (float(d) for d in args.durations.split(',')):
+            server.assistants.run_duration = duration
+            fixed_polls, fixed_over = measure(client, server, fixed, stream=False)
+            adaptive_polls, adaptive_over = measure(client, server, adaptive, stream=False)
+            _, stream_over = measure(client, server, adaptive, stream=True)
+            print(f"{duration:6.2f} | {fixed_polls:6d} {fixed_over * 1000:8.0f} ms | "
+                  f"{adaptive_polls:6d} {adaptive_over * 1000:8.0f} ms | {stream_over * 1000:7.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Time GET /api/search against a generated catalog of products and posts.
+
+Indexes --documents items (each in four languages) in an SQLite FTS5 index
+and reports median and p95 latency of ranked, paginated queries, next to a
+LIKE '%word%' scan over the same columns for comparison. Texts draw
+--topic-share of their words from a small topic vocabulary (the query words)
+and the rest from a Zipf-distributed filler vocabulary, like real text;
+raise --topic-share to make every query match most documents:
+
+    python -m benchmarks.bench_search --documents 100000 --repeat 20
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app
+from app.extensions import db
+from app.models import BlogPost, Category, Product, User
+from app.search import rebuild_index
+
+WORDS = ('website development shop design chatbot automation marketing support hosting analytics mobile '
+         'application integration payment catalog service consulting audit security cloud server backup '
+         'migration training content strategy branding email newsletter search optimization speed').split()
+QUERIES = ('website', 'chatbot payment', 'optim', 'cloud backup migration', 'design shop', 'zzzz')
+FILLER = [f'{a}{b}{c}' for a in 'bcdfgklmnprstv' for b in ('a', 'e', 'i', 'o', 'u', 'ai', 'ou')
+          for c in ('lar', 'ben', 'tox', 'rin', 'vum', 'sek', 'dal', 'mip', 'fon', 'gut')]
+FILLER_WEIGHTS = [1 / (rank + 1) for rank in range(len(FILLER))]
+
+
+def sentence(rng, words, topic_share):
+    topic = sum(rng.random() < topic_share for _ in range(words))
+    return ' '.join([rng.choice(WORDS) for _ in range(topic)] +
+                    rng.choices(FILLER, FILLER_WEIGHTS, k=words - topic))
+
+
+def generate(documents, topic_share):
+    rng = random.Random(42)
+
+    def text(words):
+        return sentence(rng, words, topic_share)
+
+    db.session.add(Category(id=1, slug='services', name_uk='Сервіси', name_ru='Сервисы', name_de='Dienste'))
+    db.session.add(User(id=1, username='author', email='author@example.com', password_hash='-'))
+    db.session.flush()
+    products = documents * 4 // 5
+    for start in range(0, products, 5000):
+        db.session.execute(Product.__table__.insert(), [{
+            'name_uk': text(3), 'name_ru': text(3), 'name_de': text(3),
+            'name_en': text(3), 'description_en': text(40), 'description_de': text(40),
+            'price': 9.99, 'currency': 'EUR', 'slug': f'product-{i}', 'is_active': True, 'category_id': 1
+        } for i in range(start, min(start + 5000, products))])
+    for start in range(0, documents - products, 5000):
+        db.session.execute(BlogPost.__table__.insert(), [{
+            'title': '-', 'title_uk': text(6), 'title_ru': text(6), 'title_de': text(6),
+            'title_en': text(6), 'content': '-', 'content_uk': '-', 'content_ru': '-', 'content_de': '-',
+            'content_en': f'<p>{text(150)}</p>', 'slug': f'post-{i}', 'is_published': True,
+            'author_id': 1
+        } for i in range(start, min(start + 5000, documents - products))])
+    db.session.commit()
+
+
+def like_scan(query):
+    # Substring matching without an index: what a search box without full-text search would run
+    pattern = f'%{query.split()[0]}%'
+    return Product.query.filter(Product.is_active.is_(True), db.or_(
+        Product.name_en.ilike(pattern), Product.description_en.ilike(pattern))).limit(21).all()
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return samples[len(samples) // 2] * 1000, samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--documents', type=int, default=100000, help='Products and posts to index')
+    parser.add_argument('--repeat', type=int, default=20, help='Requests per query')
+    parser.add_argument('--topic-share', type=float, default=0.1, help='Share of words from the query vocabulary')
+    args = parser.parse_args()
+
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        generate(args.documents, args.topic_share)
+        started = time.perf_counter()
+        indexed = rebuild_index()
+        print(f'Indexed {indexed} documents in 4 languages in {time.perf_counter() - started:.1f} s')
+        client = app.test_client()
+
+        print(f"{'query':<24} | {'LIKE p50':>9} | {'search p50':>10} | {'search p95':>10} | {'page 5 p95':>10}")
+        for query in QUERIES:
+            like = []
+            for _ in range(args.repeat):
+                db.session.expunge_all()
+                started = time.perf_counter()
+                like_scan(query)
+                like.append(time.perf_counter() - started)
+            first, deep = [], []
+            for samples, page in ((first, 1), (deep, 5)):
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    response = client.get('/api/search', query_string={'q': query, 'language': 'en', 'page': page})
+                    samples.append(time.perf_counter() - started)
+                    assert response.status_code == 200
+            print(f'{query:<24} | {percentiles(like)[0]:6.2f} ms | {percentiles(first)[0]:7.2f} ms | '
+                  f'{percentiles(first)[1]:7.2f} ms | {percentiles(deep)[1]:7.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
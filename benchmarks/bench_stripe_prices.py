@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Count the Stripe API calls and time the product saves and checkouts of a shop session.
+
+Runs against benchmarks.fake_stripe with simulated API latency. The previous
+behaviour created a Stripe product and price on every admin save and sent inline
+price_data (a new price object in Stripe) for every checkout line; now saves
+make no call and checkouts reuse one price per product and amount, created by
+the first checkout that needs it (cold) and found locally afterwards (warm):
+
+    python -m benchmarks.bench_stripe_prices --products 20 --checkouts 50 --latency 0.1
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import stripe
+
+from app import create_app
+from app.extensions import db
+from app.models import Category, Product
+from app.stripe_client import get_stripe_client
+from benchmarks.fake_stripe import FakeStripeServer
+
+
+def run(app, server, args, previous):
+    """(API calls, seconds per save, seconds per checkout) of one session"""
+    client = app.test_client()
+    server.request_log.clear()
+    started = time.perf_counter()
+    for product in Product.query.all():
+        if previous:
+            # What create_stripe_price did on every admin product save
+            stripe_client = get_stripe_client(app)
+            stripe_client.create(stripe.Price, unit_amount=int(round(product.price * 100)), currency='eur',
+                                 product=stripe_client.create(stripe.Product, name=product.name_uk).id)
+    save_seconds = (time.perf_counter() - started) / args.products
+
+    rng = random.Random(1)
+    started = time.perf_counter()
+    for _ in range(args.checkouts):
+        cart = [{'product_id': rng.randint(1, args.products)} for _ in range(3)]
+        assert client.post('/checkout', json={'items': cart}).status_code == 200
+    checkout_seconds = (time.perf_counter() - started) / args.checkouts
+    return len(server.request_log), save_seconds, checkout_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=20)
+    parser.add_argument('--checkouts', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.1, help='Seconds of simulated Stripe latency')
+    args = parser.parse_args()
+
+    with FakeStripeServer(latency=args.latency) as server:
+        app = create_app('testing')
+        app.config.update(STRIPE_SECRET_KEY='sk_test_bench', STRIPE_API_BASE=server.url)
+        with app.app_context():
+            db.create_all()
+            db.session.add(Category(id=1, slug='services', name_uk='Сервіси', name_ru='Сервисы', name_de='Dienste'))
+            db.session.add_all(Product(name_uk=f'Товар {i}', name_ru=f'Товар {i}', name_de=f'Produkt {i}',
+                                       price=10 + i, slug=f'product-{i}', category_id=1)
+                               for i in range(args.products))
+            db.session.commit()
+
+            # Products without a product_id in the item dict get inline price_data, as before
+            with mock.patch('app.checkout.CartLine.as_item',
+                            lambda line: {k: getattr(line, k) for k in ('name', 'description', 'price',
+                                                                        'currency', 'quantity')}):
+                before = run(app, server, args, previous=True)
+            cold = run(app, server, args, previous=False)
+            warm = run(app, server, args, previous=False)
+
+    print(f"{'':<9} | {'API calls':>9} | {'per save':>9} | {'per checkout':>12}")
+    for label, (calls, save, checkout) in (('previous', before), ('cold', cold), ('warm', warm)):
+        print(f"{label:<9} | {calls:9d} | {save * 1000:6.1f} ms | {checkout * 1000:9.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
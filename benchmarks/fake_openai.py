@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""
+Local fake OpenAI server for benchmarks and tests.
+
+Serves just enough of the OpenAI REST API (chat completions, including
+streaming, and the Assistants threads/messages/runs endpoints) to exercise
+the chatbot and content generation code paths without network access:
+
+    python -m benchmarks.fake_openai --port 8765 --latency 0.05
+
+then point the app at it with OPENAI_API_BASE=http://127.0.0.1:8765/v1
+"""
+import argparse
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """Request handler emulating the OpenAI endpoints used by the app"""
+
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like the real API
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        return json.loads(body.decode('utf-8')) if body else {}
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.server.record_request(self)
+        data = self._read_json()
+        path = self.path.split('?')[0]
+        if path.endswith('/chat/completions'):
+            return self._chat_completion(data)
+        if path.endswith('/threads'):
+            return self._send_json(self.server.assistants.create_thread())
+        match = re.search(r'/threads/([^/]+)/messages$', path)
+        if match:
+            message = self.server.assistants.add_message(match.group(1), data)
+            if message is None:
+                return self._send_json({'error': {'message': 'No thread found'}}, status=404)
+            return self._send_json(message)
+        match = re.search(r'/threads/([^/]+)/runs$', path)
+        if match:
+            if self.server.assistants.fail_streaming and data.get('stream'):
+                return self._send_json({'error': {'message': 'stream not supported'}}, status=400)
+            run = self.server.assistants.create_run(match.group(1), data, self.server.reply_template)
+            if data.get('stream'):
+                return self._stream_events(self._run_events(match.group(1), run))
+            return self._send_json(run)
+        match = re.search(r'/threads/([^/]+)/runs/([^/]+)/cancel$', path)
+        if match:
+            return self._send_json(self.server.assistants.cancel_run(match.group(2)))
+        self._send_json({'error': {'message': f'Unknown path {self.path}'}}, status=404)
+
+    def do_GET(self):
+        self.server.record_request(self)
+        path = self.path.split('?')[0]
+        match = re.search(r'/threads/([^/]+)/runs/([^/]+)$', path)
+        if match:
+            return self._send_json(self.server.assistants.retrieve_run(match.group(2)))
+        match = re.search(r'/threads/([^/]+)/messages$', path)
+        if match:
+            return self._send_json(self.server.assistants.list_messages(match.group(1)))
+        self._send_json({'error': {'message': f'Unknown path {self.path}'}}, status=404)
+
+    def do_DELETE(self):
+        self.server.record_request(self)
+        match = re.search(r'/threads/([^/]+)$', self.path.split('?')[0])
+        if match:
+            return self._send_json(self.server.assistants.delete_thread(match.group(1)))
+        self._send_json({'error': {'message': f'Unknown path {self.path}'}}, status=404)
+
+    def _run_events(self, thread_id, run):
+        yield f'event: thread.run.created\ndata: {json.dumps(run)}\n\n'
+        time.sleep(self.server.assistants.run_duration)
+        finished = self.server.assistants.retrieve_run(run['id'])
+        reply = self.server.assistants.threads[thread_id][0]['content'][0]['text']['value']
+        delta = {'id': 'msg_delta', 'delta': {'content': [{'index': 0, 'type': 'text', 'text': {'value': reply}}]}}
+        yield f'event: thread.message.delta\ndata: {json.dumps(delta, ensure_ascii=False)}\n\n'
+        yield f'event: thread.run.completed\ndata: {json.dumps(finished)}\n\n'
+        yield 'event: done\ndata: [DONE]\n\n'
+
+    def _send_chunk(self, text):
+        body = text.encode('utf-8')
+        self.wfile.write(f'{len(body):x}\r\n'.encode('ascii') + body + b'\r\n')
+        self.wfile.flush()
+
+    def _stream_events(self, events):
+        """Send server-sent events with chunked transfer encoding"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for event in events:
+            self._send_chunk(event)
+        self.wfile.write(b'0\r\n\r\n')
+        self.wfile.flush()
+
+    def _chat_completion(self, data):
+        time.sleep(self.server.latency)
+        messages = data.get('messages') or [{}]
+        user_message = messages[-1].get('content', '')
+        reply = self.server.reply_template.format(message=user_message)
+        if data.get('stream'):
+            return self._stream_events(self._completion_chunks(data, reply))
+        self._send_json({
+            'id': 'chatcmpl-fake',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': data.get('model', 'gpt-3.5-turbo'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': reply},
+                'finish_reason': 'stop'
+            }],
+            'usage': {'prompt_tokens': 10, 'completion_tokens': len(reply.split()), 'total_tokens': 10 + len(reply.split())}
+        })
+
+    def _completion_chunks(self, data, reply):
+        words = reply.split(' ')
+        for index, word in enumerate(words):
+            if index:
+                time.sleep(self.server.token_latency)
+            chunk = {
+                'id': 'chatcmpl-fake',
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': data.get('model', 'gpt-3.5-turbo'),
+                'choices': [{
+                    'index': 0,
+                    'delta': {'content': word if index == 0 else ' ' + word},
+                    'finish_reason': None
+                }]
+            }
+            yield f'data: {json.dumps(chunk, ensure_ascii=False)}\n\n'
+        yield 'data: [DONE]\n\n'
+
+
+class FakeAssistants:
+    """In-memory Assistants API state: threads, messages and timed runs"""
+
+    def __init__(self, run_duration: float = 0.0):
+        self.run_duration = run_duration
+        self.fail_streaming = False
+        self.threads = {}
+        self.runs = {}
+        self.deleted_threads = []
+        self._lock = threading.Lock()
+
+    def create_thread(self):
+        thread_id = f'thread_{uuid.uuid4().hex[:12]}'
+        with self._lock:
+            self.threads[thread_id] = []
+        return {'id': thread_id, 'object': 'thread', 'created_at': int(time.time())}
+
+    def delete_thread(self, thread_id):
+        with self._lock:
+            self.threads.pop(thread_id, None)
+            self.deleted_threads.append(thread_id)
+        return {'id': thread_id, 'object': 'thread.deleted', 'deleted': True}
+
+    def _message(self, role, text):
+        return {'id': f'msg_{uuid.uuid4().hex[:12]}', 'object': 'thread.message', 'role': role,
+                'content': [{'type': 'text', 'text': {'value': text, 'annotations': []}}]}
+
+    def add_message(self, thread_id, data):
+        message = self._message(data.get('role', 'user'), data.get('content', ''))
+        with self._lock:
+            if thread_id not in self.threads:
+                return None
+            self.threads[thread_id].insert(0, message)
+        return message
+
+    def list_messages(self, thread_id):
+        with self._lock:
+            return {'object': 'list', 'data': list(self.threads.get(thread_id, []))}
+
+    def create_run(self, thread_id, data, reply_template):
+        run_id = f'run_{uuid.uuid4().hex[:12]}'
+        with self._lock:
+            history = self.threads.setdefault(thread_id, [])
+            last_user = next((m['content'][0]['text']['value'] for m in history if m['role'] == 'user'), '')
+            self.runs[run_id] = {
+                'id': run_id, 'object': 'thread.run', 'thread_id': thread_id,
+                'assistant_id': data.get('assistant_id'), 'status': 'queued',
+                'started': time.monotonic(), 'reply': reply_template.format(message=last_user)
+            }
+        return self.retrieve_run(run_id)
+
+    def retrieve_run(self, run_id):
+        with self._lock:
+            run = self.runs[run_id]
+            elapsed = time.monotonic() - run['started']
+            if run['status'] in ('queued', 'in_progress'):
+                if elapsed >= self.run_duration:
+                    run['status'] = 'completed'
+                    run['completed_monotonic'] = run['started'] + self.run_duration
+                    self.threads[run['thread_id']].insert(0, self._message('assistant', run['reply']))
+                elif elapsed > 0:
+                    run['status'] = 'in_progress'
+            return {k: v for k, v in run.items() if k in ('id', 'object', 'thread_id', 'assistant_id', 'status')}
+
+    def cancel_run(self, run_id):
+        with self._lock:
+            self.runs[run_id]['status'] = 'cancelled'
+        return self.retrieve_run(run_id)
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    """Threaded fake OpenAI server usable as a context manager"""
+
+    daemon_threads = True
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0,
+                 reply_template: str = 'Echo: {message}', token_latency: float = 0.0,
+                 run_duration: float = 0.0):
+        super().__init__((host, port), FakeOpenAIHandler)
+        self.latency = latency
+        self.token_latency = token_latency
+        self.assistants = FakeAssistants(run_duration)
+        self.reply_template = reply_template
+        self.request_log = []
+        self.connections = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """Base URL to use as OPENAI_API_BASE"""
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/v1'
+
+    def record_request(self, handler):
+        with self._lock:
+            self.request_log.append((handler.command, handler.path))
+            self.connections.add(handler.client_address)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a local fake OpenAI API server')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.05, help='Seconds of simulated model latency')
+    parser.add_argument('--token-latency', type=float, default=0.01, help='Seconds between streamed tokens')
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(port=args.port, latency=args.latency, token_latency=args.token_latency)
+    print(f'Fake OpenAI server listening on {server.url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Local fake Stripe server for benchmarks and tests.
+
+Serves just enough of the Stripe REST API (products, prices and checkout
+sessions) to exercise the checkout and price sync code paths without
+network access:
+
+    python -m benchmarks.fake_stripe --port 12111 --latency 0.1
+
+then point the app at it with STRIPE_API_BASE=http://127.0.0.1:12111
+"""
+import argparse
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+
+def unflatten(pairs):
+    """Nested dict from Stripe's form encoding (line_items[0][price]=...)"""
+    result = {}
+    for key, value in pairs:
+        parts = re.findall(r'[^\[\]]+', key)
+        node = result
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        node[parts[-1]] = value
+    return result
+
+
+class FakeStripeHandler(BaseHTTPRequestHandler):
+    """Request handler emulating the Stripe endpoints used by the app"""
+
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like the real API
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_form(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode('utf-8') if length else ''
+        return unflatten(parse_qsl(body, keep_blank_values=True))
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _outage(self):
+        if self.server.outage_status:
+            self._send_json({'error': {'message': 'Simulated outage', 'type': 'api_error'}},
+                            status=self.server.outage_status)
+            return True
+        return False
+
+    def do_POST(self):
+        self.server.record_request(self)
+        data = self._read_form()
+        if self._outage():
+            return
+        path = urlsplit(self.path).path
+        objects = self.server.objects
+        if path == '/v1/products':
+            return self._send_json(objects.create('prod', 'product', data))
+        if path == '/v1/prices':
+            data['unit_amount'] = int(data['unit_amount'])
+            data.setdefault('active', True)
+            return self._send_json(objects.create('price', 'price', data))
+        if path == '/v1/checkout/sessions':
+            session = objects.create('cs_test', 'checkout.session', data)
+            session['url'] = f"https://checkout.stripe.test/{session['id']}"
+            return self._send_json(session)
+        self._send_json({'error': {'message': f'Unknown path {self.path}'}}, status=404)
+
+    def do_GET(self):
+        self.server.record_request(self)
+        if self._outage():
+            return
+        path = urlsplit(self.path).path
+        objects = self.server.objects
+        if path == '/v1/prices':
+            return self._send_json({'object': 'list', 'url': '/v1/prices', 'has_more': False,
+                                    'data': objects.list('price')})
+        match = re.match(r'/v1/(prices|products)/([^/]+)$', path)
+        if match and match.group(2) in objects.by_id:
+            return self._send_json(objects.by_id[match.group(2)])
+        self._send_json({'error': {'message': f'No such object: {path}', 'type': 'invalid_request_error'}},
+                        status=404)
+
+
+class FakeStripeObjects:
+    """Objects created through the fake API"""
+
+    def __init__(self):
+        self.by_id = {}
+        self._lock = threading.Lock()
+
+    def create(self, prefix, object_name, data):
+        obj = dict(data, id=f'{prefix}_{uuid.uuid4().hex[:14]}', object=object_name, created=int(time.time()))
+        with self._lock:
+            self.by_id[obj['id']] = obj
+        return obj
+
+    def list(self, object_name):
+        return [obj for obj in self.by_id.values() if obj['object'] == object_name]
+
+
+class FakeStripeServer(ThreadingHTTPServer):
+    """Threaded fake Stripe server usable as a context manager"""
+
+    daemon_threads = True
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0):
+        super().__init__((host, port), FakeStripeHandler)
+        self.latency = latency
+        self.outage_status = None  # HTTP status every request fails with while set, e.g. 503
+        self.objects = FakeStripeObjects()
+        self.request_log = []
+        self.connections = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """Base URL to use as STRIPE_API_BASE"""
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def record_request(self, handler):
+        with self._lock:
+            self.request_log.append((handler.command, urlsplit(handler.path).path))
+            self.connections.add(handler.client_address)
+        if self.latency:
+            time.sleep(self.latency)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a local fake Stripe API server')
+    parser.add_argument('--port', type=int, default=12111)
+    parser.add_argument('--latency', type=float, default=0.1, help='Seconds of simulated API latency')
+    args = parser.parse_args()
+
+    server = FakeStripeServer(port=args.port, latency=args.latency)
+    print(f'Fake Stripe server listening on {server.url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Load test for the streaming chatbot endpoint (/api/chatbot/stream).
+
+Opens N concurrent chats and reports time-to-first-token, total stream time
+and how many streams were held open at the same time. By default it starts
+a local fake OpenAI server plus one gunicorn worker of the app:
+
+    python -m benchmarks.load_chatbot_stream --concurrency 200 --worker-class gevent
+
+Use --url to point it at an already running server instead.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+from urllib.parse import urlparse
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+
+from benchmarks.fake_openai import FakeOpenAIServer
+from benchmarks.bench_chatbot import percentile
+
+
+class StreamStats:
+    """Thread-safe collector for per-stream timings"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ttft = []
+        self.total = []
+        self.errors = 0
+        self.open_streams = 0
+        self.max_open_streams = 0
+
+    def opened(self):
+        with self.lock:
+            self.open_streams += 1
+            self.max_open_streams = max(self.max_open_streams, self.open_streams)
+
+    def closed(self):
+        with self.lock:
+            self.open_streams -= 1
+
+
+def run_stream(base_url, index, stats, timeout):
+    parsed = urlparse(base_url)
+    conn = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=timeout)
+    body = json.dumps({'message': f'Hello #{index}', 'language': 'en'})
+    started = time.perf_counter()
+    first_token = None
+    try:
+        conn.request('POST', '/api/chatbot/stream', body=body, headers={
+            'Content-Type': 'application/json',
+            'X-Session-ID': f'load-{index}'
+        })
+        response = conn.getresponse()
+        if response.status != 200:
+            raise RuntimeError(f'HTTP {response.status}')
+        stats.opened()
+        try:
+            while True:
+                line = response.readline()
+                if not line:
+                    break
+                if line.startswith(b'event: token') and first_token is None:
+                    first_token = time.perf_counter() - started
+                if line.startswith(b'event: error'):
+                    raise RuntimeError('error event')
+        finally:
+            stats.closed()
+        if first_token is None:
+            raise RuntimeError('no tokens received')
+        with stats.lock:
+            stats.ttft.append(first_token)
+            stats.total.append(time.perf_counter() - started)
+    except Exception:
+        with stats.lock:
+            stats.errors += 1
+    finally:
+        conn.close()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'App did not start on port {port}')
+
+
+def start_app(fake_url, worker_class, port):
+    db_file = os.path.join(tempfile.mkdtemp(prefix='chatbot_load_'), 'load.db')
+    env = os.environ.copy()
+    env.update({
+        'DATABASE_URL': f'sqlite:///{db_file}',
+        'OPENAI_API_KEY': 'sk-load-test',
+        'OPENAI_API_BASE': fake_url,
+        'PORT': str(port),
+        'WEB_CONCURRENCY': '1',
+        'GUNICORN_WORKER_CLASS': worker_class,
+        'CHATBOT_MAX_STREAMS': '10000'
+    })
+    # Create the schema before the worker starts
+    subprocess.run([sys.executable, '-c', 'from app import create_app; from app.extensions import db; '
+                    'app = create_app(); app.app_context().push(); db.create_all()'],
+                   cwd=ROOT_DIR, env=env, check=True, capture_output=True)
+    return subprocess.Popen(['gunicorn', '--config', 'gunicorn.conf.py', 'wsgi:app'],
+                            cwd=ROOT_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='Base URL of a running app (skips starting one)')
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--worker-class', default='gevent', help='gunicorn worker class for the started app')
+    parser.add_argument('--latency', type=float, default=0.3, help='Fake model time to first token')
+    parser.add_argument('--token-latency', type=float, default=0.05, help='Fake model time between tokens')
+    parser.add_argument('--timeout', type=float, default=120)
+    args = parser.parse_args()
+
+    reply = ' '.join(f'token{i}' for i in range(20))
+    with FakeOpenAIServer(latency=args.latency, token_latency=args.token_latency, reply_template=reply) as fake:
+        app_process = None
+        base_url = args.url
+        if not base_url:
+            port = free_port()
+            app_process = start_app(fake.url, args.worker_class, port)
+            wait_for_port(port)
+            base_url = f'http://127.0.0.1:{port}'
+
+        try:
+            stats = StreamStats()
+            threads = [threading.Thread(target=run_stream, args=(base_url, i, stats, args.timeout))
+                       for i in range(args.concurrency)]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+        finally:
+            if app_process:
+                app_process.terminate()
+                app_process.wait()
+
+    print(f"Concurrency: {args.concurrency}  ok={len(stats.ttft)}  errors={stats.errors}  wall={elapsed:.2f}s")
+    print(f"Max streams open at once: {stats.max_open_streams}")
+    if stats.ttft:
+        print(f"TTFT  p50={percentile(stats.ttft, 50) * 1000:8.1f} ms  p99={percentile(stats.ttft, 99) * 1000:8.1f} ms")
+        print(f"Total p50={percentile(stats.total, 50) * 1000:8.1f} ms  p99={percentile(stats.total, 99) * 1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+Load test for cached pages and payloads while the catalog keeps changing.
+
+Starts gunicorn with --workers workers on a generated catalog (file cache
+shared by the workers), then --concurrency clients request the home page,
+the blog and /api/products for --duration seconds while the catalog version
+is bumped every --bump-interval seconds, as an admin edit would. Reports
+latency and how the requests were answered (X-Page-Cache / X-Cache): after
+each bump one request per URL should render (miss) while the others get the
+previous copy (stale) or wait for the new one (coalesced). Without
+single-flight every request in flight at the bump would render:
+
+    python -m benchmarks.load_page_cache --workers 4 --concurrency 64 --duration 20
+
+Use --url to point it at an already running server instead (no bumps then).
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+from collections import Counter, defaultdict
+from urllib.parse import urlparse
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+
+URLS = ('/', '/blog', '/api/products?language=en&limit=50', '/api/products?language=de&fields=id,name')
+
+
+def seed(products, posts):
+    """Create the schema and a catalog with blog posts, in the database of the environment"""
+    from app import create_app
+    from app.extensions import db
+    from app.models import BlogPost, Category, Product, User
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        db.session.add(Category(id=1, slug='services', name_uk='Сервіси', name_ru='Сервисы', name_de='Dienste'))
+        db.session.add(User(id=1, username='author', email='author@example.com', password_hash='-'))
+        db.session.flush()
+        db.session.execute(Product.__table__.insert(), [
+            {'name_uk': f'Товар {i}', 'name_ru': f'Товар {i}', 'name_de': f'Produkt {i}', 'name_en': f'Product {i}',
+             'description_en': f'Description of product {i}', 'price': 10.0 + i, 'currency': 'EUR',
+             'slug': f'product-{i}', 'is_active': True, 'sort_order': i, 'category_id': 1} for i in range(products)])
+        db.session.execute(BlogPost.__table__.insert(), [
+            {'title': '-', 'title_uk': f'Пост {i}', 'title_ru': '-', 'title_de': '-', 'content': '-',
+             'content_uk': f'<p>Текст {i}</p>' * 20, 'content_ru': '-', 'content_de': '-', 'slug': f'post-{i}',
+             'is_published': True, 'author_id': 1} for i in range(posts)])
+        db.session.commit()
+
+
+class LoadStats:
+    """Thread-safe collector of latencies and cache outcomes per URL"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = []
+        self.outcomes = defaultdict(Counter)
+        self.errors = 0
+
+    def add(self, url, elapsed, outcome):
+        with self.lock:
+            self.latency.append(elapsed)
+            self.outcomes[url][outcome] += 1
+
+
+def client(base_url, stats, stop, rng):
+    parsed = urlparse(base_url)
+    conn = None
+    while not stop.is_set():
+        url = rng.choice(URLS)
+        started = time.perf_counter()
+        try:
+            if conn is None:
+                conn = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=30)
+            conn.request('GET', url)
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                raise RuntimeError(f'HTTP {response.status}')
+            outcome = response.getheader('X-Page-Cache') or response.getheader('X-Cache') or 'none'
+            stats.add(url, time.perf_counter() - started, outcome)
+        except Exception:
+            with stats.lock:
+                stats.errors += 1
+            if conn is not None:
+                conn.close()
+            conn = None
+    if conn is not None:
+        conn.close()
+
+
+def bump_catalog(stop, interval, bumps):
+    # Same effect on the caches as an admin editing a product
+    from app import create_app
+    from app.extensions import cache
+
+    app = create_app()
+    with app.app_context():
+        while not stop.wait(interval):
+            cache.bump('catalog')
+            bumps.append(time.time())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='Base URL of a running app (skips starting one)')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn workers of the started app')
+    parser.add_argument('--worker-class', default='gevent', help='gunicorn worker class for the started app')
+    parser.add_argument('--concurrency', type=int, default=64, help='Concurrent clients')
+    parser.add_argument('--duration', type=float, default=20, help='Seconds of load')
+    parser.add_argument('--bump-interval', type=float, default=2, help='Seconds between catalog changes')
+    parser.add_argument('--products', type=int, default=20000, help='Products in the generated catalog')
+    parser.add_argument('--posts', type=int, default=200, help='Blog posts in the generated catalog')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='page_cache_load_')
+    app_process, bumps = None, []
+    base_url = args.url
+    stop = threading.Event()
+    try:
+        if not base_url:
+            # Before anything imports config.py, which reads the environment once
+            os.environ.update({
+                'DATABASE_URL': f"sqlite:///{os.path.join(directory, 'load.db')}",
+                'CACHE_TYPE': 'filesystem',
+                'CACHE_DIR': os.path.join(directory, 'cache'),
+                'CHATBOT_RETRIEVAL_INDEX': '',
+                'WEB_CONCURRENCY': str(args.workers),
+                'GUNICORN_WORKER_CLASS': args.worker_class
+            })
+        from benchmarks.load_chatbot_stream import free_port, wait_for_port
+        if not base_url:
+            port = free_port()
+            os.environ['PORT'] = str(port)
+            seed(args.products, args.posts)
+            app_process = subprocess.Popen(['gunicorn', '--config', 'gunicorn.conf.py', 'wsgi:app'], cwd=ROOT_DIR,
+                                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            wait_for_port(port)
+            base_url = f'http://127.0.0.1:{port}'
+
+        stats = LoadStats()
+        threads = [threading.Thread(target=client, args=(base_url, stats, stop, random.Random(i)))
+                   for i in range(args.concurrency)]
+        if not args.url:
+            threads.append(threading.Thread(target=bump_catalog, args=(stop, args.bump_interval, bumps)))
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(args.duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        stop.set()
+        if app_process:
+            app_process.terminate()
+            app_process.wait()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    from benchmarks.bench_chatbot import percentile
+    requests = len(stats.latency)
+    print(f'{args.concurrency} clients, {requests} requests in {elapsed:.1f} s ({requests / elapsed:.0f}/s), '
+          f'{stats.errors} errors, {len(bumps)} catalog changes')
+    if stats.latency:
+        print(f'latency p50={percentile(stats.latency, 50) * 1000:.1f} ms  '
+              f'p99={percentile(stats.latency, 99) * 1000:.1f} ms')
+    print(f"{'url':<40} | {'hit':>6} | {'stale':>6} | {'coal.':>6} | {'miss':>6} | {'renders/change':>14} | "
+          f"{'coalescing':>10}")
+    for url in URLS:
+        counts = stats.outcomes[url]
+        needed = counts['stale'] + counts['coalesced'] + counts['miss']
+        renders = counts['miss'] / len(bumps) if bumps else float('nan')
+        ratio = (counts['stale'] + counts['coalesced']) / needed if needed else 0.0
+        print(f"{url:<40} | {counts['hit']:6} | {counts['stale']:6} | {counts['coalesced']:6} | {counts['miss']:6} | "
+              f'{renders:14.2f} | {ratio:10.0%}')
+
+
+if __name__ == '__main__':
+    main()
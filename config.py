@@ -44,10 +44,104 @@ class Config:
     STRIPE_PUBLISHABLE_KEY = os.environ.get('STRIPE_PUBLISHABLE_KEY')
     STRIPE_SECRET_KEY = os.environ.get('STRIPE_SECRET_KEY')
     STRIPE_WEBHOOK_SECRET = os.environ.get('STRIPE_WEBHOOK_SECRET')
+    STRIPE_WEBHOOK_TOLERANCE = int(os.environ.get('STRIPE_WEBHOOK_TOLERANCE', 300))  # Max signature age in seconds
+    STRIPE_API_BASE = os.environ.get('STRIPE_API_BASE')  # Override for local stubs
+    STRIPE_POOL_SIZE = int(os.environ.get('STRIPE_POOL_SIZE', 10))  # Keep-alive connections per worker
+    STRIPE_TIMEOUT = float(os.environ.get('STRIPE_TIMEOUT', 10))
+    STRIPE_MAX_RETRIES = int(os.environ.get('STRIPE_MAX_RETRIES', 2))  # Retries of transient failures
+    STRIPE_RETRY_BACKOFF = float(os.environ.get('STRIPE_RETRY_BACKOFF', 0.25))  # Jittered, doubled per retry
+    STRIPE_BREAKER_THRESHOLD = int(os.environ.get('STRIPE_BREAKER_THRESHOLD', 5))  # Consecutive failures opening the circuit
+    STRIPE_BREAKER_RESET = float(os.environ.get('STRIPE_BREAKER_RESET', 30))  # Seconds before a trial call
     
     # OpenAI configuration
     OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
     OPENAI_ASSISTANT_ID = os.environ.get('OPENAI_ASSISTANT_ID')
+    OPENAI_API_BASE = os.environ.get('OPENAI_API_BASE')  # Override for proxies and local stubs
+    OPENAI_REQUEST_TIMEOUT = float(os.environ.get('OPENAI_REQUEST_TIMEOUT', 60))
+    
+    # Assistants run polling: backoff by MULTIPLIER from INITIAL up to MAX seconds, giving up after DEADLINE
+    OPENAI_RUN_POLL_INITIAL = float(os.environ.get('OPENAI_RUN_POLL_INITIAL', 0.05))
+    OPENAI_RUN_POLL_MULTIPLIER = float(os.environ.get('OPENAI_RUN_POLL_MULTIPLIER', 1.5))
+    OPENAI_RUN_POLL_MAX = float(os.environ.get('OPENAI_RUN_POLL_MAX', 0.5))
+    OPENAI_RUN_DEADLINE = float(os.environ.get('OPENAI_RUN_DEADLINE', 60))
+    OPENAI_ASSISTANT_STREAM_RUNS = os.environ.get('OPENAI_ASSISTANT_STREAM_RUNS', 'true').lower() == 'true'
+    
+    # Chatbot engine: 'inprocess' (pooled client) or 'subprocess' (legacy script per message)
+    CHATBOT_ENGINE = os.environ.get('CHATBOT_ENGINE', 'inprocess')
+    CHATBOT_POOL_SIZE = int(os.environ.get('CHATBOT_POOL_SIZE', 4))
+    CHATBOT_MAX_STREAMS = int(os.environ.get('CHATBOT_MAX_STREAMS', 200))  # Open SSE chats per worker
+    
+    # Session -> Assistants thread mapping: in-process cache and batched activity writes
+    CHAT_THREAD_CACHE_SIZE = int(os.environ.get('CHAT_THREAD_CACHE_SIZE', 1024))
+    CHAT_THREAD_CACHE_TTL = float(os.environ.get('CHAT_THREAD_CACHE_TTL', 3600))
+    CHAT_THREAD_TOUCH_INTERVAL = float(os.environ.get('CHAT_THREAD_TOUCH_INTERVAL', 60))  # Seconds activity may wait before it is written
+    CHAT_THREAD_CLEANUP_WORKERS = int(os.environ.get('CHAT_THREAD_CLEANUP_WORKERS', 8))
+    
+    # Chatbot answer cache: repeated and near-duplicate questions (n-gram similarity) skip OpenAI
+    CHATBOT_RESPONSE_CACHE = os.environ.get('CHATBOT_RESPONSE_CACHE', 'true').lower() == 'true'
+    CHATBOT_RESPONSE_CACHE_SIZE = int(os.environ.get('CHATBOT_RESPONSE_CACHE_SIZE', 512))
+    CHATBOT_RESPONSE_CACHE_TTL = float(os.environ.get('CHATBOT_RESPONSE_CACHE_TTL', 6 * 3600))
+    CHATBOT_RESPONSE_SIMILARITY = float(os.environ.get('CHATBOT_RESPONSE_SIMILARITY', 0.8))  # 1 = exact only
+    
+    # Chatbot catalog context (app/retrieval.py): top matches per message from a BM25 index kept in the instance folder
+    CHATBOT_CONTEXT_PRODUCTS = int(os.environ.get('CHATBOT_CONTEXT_PRODUCTS', 5))
+    CHATBOT_CONTEXT_CATEGORIES = int(os.environ.get('CHATBOT_CONTEXT_CATEGORIES', 5))
+    CHATBOT_RETRIEVAL_INDEX = os.environ.get('CHATBOT_RETRIEVAL_INDEX', 'retrieval/catalog.idx')  # Empty: memory only
+    
+    # AI blog generation: languages are generated/translated concurrently, each call bounded by the timeout
+    CONTENT_GENERATION_WORKERS = int(os.environ.get('CONTENT_GENERATION_WORKERS', 4))
+    CONTENT_GENERATION_TIMEOUT = float(os.environ.get('CONTENT_GENERATION_TIMEOUT', 120))
+    BLOG_GENERATION_MODEL = os.environ.get('BLOG_GENERATION_MODEL', 'gpt-3.5-turbo')
+    
+    # Background jobs (`flask run-jobs` worker): retries back off from JOB_RETRY_DELAY seconds
+    JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+    JOB_RETRY_DELAY = float(os.environ.get('JOB_RETRY_DELAY', 30))
+    JOB_LOCK_TIMEOUT = float(os.environ.get('JOB_LOCK_TIMEOUT', 900))  # Reclaim jobs of crashed workers after this
+    
+    # Shared cache: 'filesystem' (instance/cache, shared by workers on one host), 'redis', 'memory' or 'null'
+    CACHE_TYPE = os.environ.get('CACHE_TYPE', 'filesystem')
+    CACHE_DIR = os.environ.get('CACHE_DIR')  # Defaults to <instance>/cache
+    CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL') or os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+    CACHE_DEFAULT_TTL = float(os.environ.get('CACHE_DEFAULT_TTL', 3600))
+    # Public pages are cached until an admin edit bumps their namespaces; browsers revalidate by ETag
+    PAGE_CACHE = os.environ.get('PAGE_CACHE', 'true').lower() == 'true'
+    PAGE_CACHE_TTL = float(os.environ.get('PAGE_CACHE_TTL', 24 * 3600))
+    
+    # Single-flight rebuilds (app/single_flight.py): one request per key rebuilds an expired page or payload,
+    # the others get the stale copy. Lock across workers: 'cache' (the cache store, Redis SET NX with
+    # CACHE_TYPE=redis) or 'postgres' (advisory locks)
+    SINGLE_FLIGHT_LOCK = os.environ.get('SINGLE_FLIGHT_LOCK', 'cache')
+    SINGLE_FLIGHT_LOCK_TTL = float(os.environ.get('SINGLE_FLIGHT_LOCK_TTL', 30))
+    SINGLE_FLIGHT_WAIT = float(os.environ.get('SINGLE_FLIGHT_WAIT', 5))  # Wait for a first value before building it too
+    SINGLE_FLIGHT_STALE_TTL = float(os.environ.get('SINGLE_FLIGHT_STALE_TTL', 3600))
+    
+    # Blog listing page size (keyset pagination, see app/pagination.py)
+    BLOG_POSTS_PER_PAGE = int(os.environ.get('BLOG_POSTS_PER_PAGE', 10))
+    
+    # /api/products: largest page or id batch, and browser cache lifetime (revalidated by ETag after that)
+    API_PRODUCTS_MAX_LIMIT = int(os.environ.get('API_PRODUCTS_MAX_LIMIT', 100))
+    API_PRODUCTS_MAX_AGE = int(os.environ.get('API_PRODUCTS_MAX_AGE', 60))
+    
+    # Full-text search (app/search.py): keep the index updated on writes, page sizes of /search and /api/search
+    SEARCH_INDEX = os.environ.get('SEARCH_INDEX', 'true').lower() == 'true'
+    SEARCH_PER_PAGE = int(os.environ.get('SEARCH_PER_PAGE', 20))
+    SEARCH_MAX_PER_PAGE = int(os.environ.get('SEARCH_MAX_PER_PAGE', 50))
+    
+    # Catalog snapshot (app/catalog.py): build it in the gunicorn master so preloaded workers share it
+    CATALOG_PRELOAD = os.environ.get('CATALOG_PRELOAD', 'true').lower() == 'true'
+    
+    # Prometheus metrics (app/metrics.py) on /metrics; set METRICS_TOKEN to require "Authorization: Bearer <token>"
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    METRICS_TOKEN_REQUIRED = False  # When set, /metrics is not served without METRICS_TOKEN
+    
+    # SQL tracker (app/query_tracker.py): log statements a request runs this many times or more (N+1 queries)
+    QUERY_TRACKER = os.environ.get('QUERY_TRACKER', 'false').lower() == 'true'
+    QUERY_TRACKER_REPEATS = int(os.environ.get('QUERY_TRACKER_REPEATS', 3))
+    
+    # Checkout cart limits
+    CART_MAX_QUANTITY = int(os.environ.get('CART_MAX_QUANTITY', 99))
+    CART_MAX_LINES = int(os.environ.get('CART_MAX_LINES', 100))
     
     # Languages configuration
     LANGUAGES = {
@@ -70,13 +164,30 @@ class Config:
 class DevelopmentConfig(Config):
     """Development configuration"""
     DEBUG = True
+    QUERY_TRACKER = os.environ.get('QUERY_TRACKER', 'true').lower() == 'true'
 
 class ProductionConfig(Config):
     """Production configuration"""
     DEBUG = False
+    METRICS_TOKEN_REQUIRED = True
+
+class TestingConfig(Config):
+    """Testing configuration"""
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    SQLALCHEMY_ENGINE_OPTIONS = {}
+    WTF_CSRF_ENABLED = False
+    SECRET_KEY = 'test-secret-key'
+    # Never reach real external services from tests
+    OPENAI_API_KEY = None
+    STRIPE_SECRET_KEY = None
+    CACHE_TYPE = 'memory'
+    CHATBOT_RETRIEVAL_INDEX = ''
+    QUERY_TRACKER = True
 
 config = {
     'development': DevelopmentConfig,
     'production': ProductionConfig,
+    'testing': TestingConfig,
     'default': DevelopmentConfig
 }
@@ -1,5 +1,7 @@
 import multiprocessing
 import os
+import shutil
+import tempfile
 
 # Gunicorn configuration file
 # https://docs.gunicorn.org/en/stable/configure.html
@@ -8,11 +10,16 @@ import os
 port = os.environ.get("PORT", "5000")
 bind = f"0.0.0.0:{port}"
 
+# Prometheus metrics: every worker writes its values to files here and /metrics sums them (app/metrics.py).
+# Set before the preloaded app imports prometheus_client; on_starting empties it
+metrics_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "saas-shop-metrics"))
+
 # Worker processes - use minimal workers to save memory
 workers = int(os.environ.get("WEB_CONCURRENCY", 1))
-worker_class = "sync"
-worker_connections = 500
-timeout = 150  # Longer timeout to allow for OpenAI API calls
+# gevent lets one worker hold hundreds of open chatbot streams (/api/chatbot/stream)
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gevent")
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 500))
+timeout = 150  # Longer timeout to allow for OpenAI API calls on sync workers
 graceful_timeout = 30
 keepalive = 2
 
@@ -38,13 +45,37 @@ spew = False
 # Server hooks
 def on_starting(server):
     print("Starting gunicorn with memory-optimized settings")
+    # Only the starting master clears old metric files, so a restart does not add up old runs
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
 
 def post_fork(server, worker):
     print(f"Worker spawned (pid: {worker.pid})")
+    if worker_class == "gevent":
+        # Make psycopg2 yield to other greenlets while waiting on PostgreSQL
+        try:
+            from psycogreen.gevent import patch_psycopg
+            patch_psycopg()
+        except ImportError:
+            server.log.warning("psycogreen not installed - database calls will block the gevent worker")
 
 def pre_fork(server, worker):
     pass
 
+def child_exit(server, worker):
+    # Counters and histograms of the exited worker stay in the totals; its live gauges are dropped
+    try:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+    except ImportError:
+        pass
+
+def worker_exit(server, worker):
+    # Chat activity is written in batches, store what this worker still holds
+    if getattr(worker, "wsgi", None) is not None:
+        from app.chat_sessions import close_thread_sessions
+        close_thread_sessions(worker.wsgi)
+
 def pre_exec(server):
     server.log.info("Forked child, re-executing.")
 
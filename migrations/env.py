@@ -100,21 +100,31 @@ def run_migrations_online():
     with connectable.connect() as connection:
         # Получаем схему из конфигурации приложения
         schema = current_app.config.get('DB_SCHEMA', 'public')
+        # Схемы есть только в PostgreSQL (SQLite используется локально и в тестах)
+        postgres = connection.dialect.name == 'postgresql'
         
-        # Добавляем версионную схему для таблицы alembic_version
-        conf_args['version_table_schema'] = schema
+        if postgres:
+            # Добавляем версионную схему для таблицы alembic_version
+            conf_args['version_table_schema'] = schema
         
-        # Добавляем схему к аргументам конфигурации
+        def include_object(obj, name, type_, reflected, compare_to):
+            # Search index tables (app/search.py, migration 0004) have no model: leave them alone
+            if type_ == 'table' and reflected and compare_to is None and name.startswith('search_'):
+                return False
+            return (obj.schema or 'public') == schema if hasattr(obj, 'schema') else True
+        
+        # Добавляем схему к аргументам конфигурации; таблицы без схемы лежат в public
         context.configure(
             connection=connection,
             target_metadata=get_metadata(),
-            include_schemas=True,
-            include_object=lambda obj, name, type_, reflected, compare_to: obj.schema == schema if hasattr(obj, 'schema') else True,
+            include_schemas=postgres,
+            include_object=include_object,
             **conf_args
         )
 
-        # Создаем схему, если она не существует
-        connection.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{schema}"'))
+        if postgres:
+            # Создаем схему, если она не существует
+            connection.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{schema}"'))
         
         with context.begin_transaction():
             context.run_migrations()
@@ -0,0 +1,47 @@
+"""Indexes for the storefront listing queries
+
+Active products in display order (home page, /api/products, per category and
+related products), published blog posts by date for the keyset-paginated
+blog listing, home page blocks in order and chat threads by last activity.
+
+On PostgreSQL the indexes are built with CREATE INDEX CONCURRENTLY, outside
+the migration transaction, so the storefront keeps reading and writing these
+tables while they build. A build that failed halfway leaves an INVALID index
+behind: drop it and run the upgrade again.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 08:40:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+# (index name, table, columns)
+INDEXES = [
+    ('ix_products_listing', 'products', ['is_active', 'sort_order']),
+    ('ix_products_category_listing', 'products', ['category_id', 'is_active', 'sort_order']),
+    ('ix_blog_posts_listing', 'blog_posts', ['is_published', 'created_at', 'id']),
+    ('ix_homepage_blocks_listing', 'homepage_blocks', ['is_active', 'sort_order']),
+    ('ix_chat_threads_updated_at', 'chat_threads', ['updated_at']),
+]
+
+
+def upgrade():
+    # CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, unique=False, if_not_exists=True,
+                            postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=True)
@@ -0,0 +1,51 @@
+"""Full-text search index tables
+
+The tables app/search.py reads and keeps updated on writes: one FTS5 table
+per language on SQLite, one table with a weighted tsvector and a partial GIN
+index per language on PostgreSQL. They are created empty: fill them once
+with `flask search-reindex`, after which every write keeps them current.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 09:45:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+LANGUAGES = ('uk', 'ru', 'de', 'en')
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        for language in LANGUAGES:
+            op.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS search_{language} USING fts5("
+                "kind UNINDEXED, slug UNINDEXED, title, body, "
+                "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')")
+    elif dialect == 'postgresql':
+        op.execute(
+            'CREATE TABLE IF NOT EXISTS search_documents ('
+            'kind VARCHAR(10) NOT NULL, ref_id INTEGER NOT NULL, language VARCHAR(5) NOT NULL, '
+            'slug VARCHAR(255) NOT NULL, title TEXT NOT NULL, body TEXT NOT NULL, document TSVECTOR NOT NULL, '
+            'PRIMARY KEY (kind, ref_id, language))')
+        for language in LANGUAGES:
+            op.execute(
+                f'CREATE INDEX IF NOT EXISTS ix_search_documents_{language} ON search_documents '
+                f"USING gin (document) WHERE language = '{language}'")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        for language in LANGUAGES:
+            op.execute(f'DROP TABLE IF EXISTS search_{language}')
+    elif dialect == 'postgresql':
+        op.execute('DROP TABLE IF EXISTS search_documents')
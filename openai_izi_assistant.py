@@ -12,6 +12,11 @@ import json
 import openai
 import os
 
+# Allow running from any directory
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.chatbot_engine import process_request
+
 def main():
     if len(sys.argv) != 2:
         print(json.dumps({"error": "Missing JSON file argument"}))
@@ -45,62 +50,13 @@ def main():
             safe_id = assistant_id[:8] + "..." if len(assistant_id) > 8 else "not_available"
             print(json.dumps({"debug": f"Using Assistant ID: {safe_id} (truncated for security)"}), file=sys.stderr)
             
-        # Get user message and other parameters
-        user_message = request_data.get('message', '')
-        language = request_data.get('language', 'uk')
-        product_info = request_data.get('product_info', '')
-        category_info = request_data.get('category_info', '')
-        
-        # Build context information if available
-        context_info = ""
-        if product_info or category_info:
-            context_info = f"""
-ИНФОРМАЦИЯ О МАГАЗИНЕ:
-
-КАТЕГОРИИ:
-{category_info}
-
-ПОПУЛЯРНЫЕ ТОВАРЫ:
-{product_info}
-"""
-            
-        # Create enhanced system prompt that incorporates assistant behavior
-        system_prompt = f"""Ты - AI-консультант интернет-магазина (Assistant ID: {assistant_id}).
-
-{context_info}
-
-Дополнительные инструкции:
-- Отвечай на языке пользователя ({language})
-- Будь дружелюбным и полезным
-- Рекомендуй товары из предоставленного списка
-- Помогай с выбором и отвечай на вопросы о товарах
-- Если пользователь спрашивает о конкретном товаре, предоставь детальную информацию
-- Всегда старайся направить разговор к покупке подходящих товаров
-"""
-        
-        # Prepare messages for chat completion
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_message}
-        ]
-        
-        # Make OpenAI API call
-        response = openai.ChatCompletion.create(
-            model=request_data.get("model", "gpt-3.5-turbo"),
-            messages=messages,
-            max_tokens=request_data.get("max_tokens", 500),
-            temperature=request_data.get("temperature", 0.7)
+        # Same request/response contract as the in-process engine used by the app
+        result = process_request(
+            request_data,
+            api_key=openai.api_key,
+            assistant_id=assistant_id
         )
         
-        # Extract and return response
-        ai_response = response.choices[0].message.content.strip()
-        
-        result = {
-            "response": ai_response,
-            "status": "success",
-            "using_assistant": bool(assistant_id)
-        }
-        
         print(json.dumps(result, ensure_ascii=False))
         
     except FileNotFoundError:
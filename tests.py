@@ -4,6 +4,8 @@ Basic test suite for SaaS Shop Flask application
 import unittest
 import os
 import tempfile
+from contextlib import contextmanager
+from sqlalchemy import event
 from app import create_app, db
 from app.models import User, Category, Product, BlogPost
 from config import Config
@@ -237,6 +239,2022 @@ class UtilsTestCase(SaaSShopTestCase):
                 self.assertTrue(len(result) > 0)
                 self.assertEqual(result, result.lower())
 
+class ServiceTestCase(unittest.TestCase):
+    """Base test case running on the isolated testing configuration"""
+    
+    def setUp(self):
+        """Set up an in-memory app"""
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+        db.create_all()
+    
+    def tearDown(self):
+        """Clean up after tests"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+    
+    @contextmanager
+    def count_queries(self):
+        """Collect the SQL statements executed inside the block"""
+        statements = []
+        
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+    
+    def assert_query_budget(self, url, budget, **kwargs):
+        """Request a URL, failing when it runs more than `budget` statements or one statement repeatedly (N+1)"""
+        from flask import g
+        with self.client:
+            response = self.client.get(url, **kwargs)
+            log = g.query_log  # Recorded by app/query_tracker.py, on in the testing configuration
+        self.assertLess(response.status_code, 400, url)
+        self.assertEqual(log.repeated(), [], f'{url} repeats statements:\n{log.describe()}')
+        self.assertLessEqual(len(log), budget, f'{url} ran {len(log)} statements, budget {budget}:\n'
+                             + '\n'.join(query.statement for query in log.queries))
+        return response
+    
+    def create_catalog(self, products=3):
+        """Create one category with a few active products"""
+        category = Category(name_uk='Сервіси', name_ru='Сервисы', name_de='Dienste', name_en='Services',
+                            description_en='All services', slug='services')
+        db.session.add(category)
+        db.session.flush()
+        for i in range(products):
+            db.session.add(Product(name_uk=f'Товар {i}', name_ru=f'Товар {i}', name_de=f'Produkt {i}',
+                                   name_en=f'Product {i}', description_en=f'Description {i}',
+                                   price=10.0 + i, slug=f'product-{i}', category_id=category.id))
+        db.session.commit()
+        return category
+
+class ChatbotEngineTestCase(ServiceTestCase):
+    """Test the in-process chatbot engine against a local fake OpenAI server"""
+    
+    def setUp(self):
+        super().setUp()
+        from benchmarks.fake_openai import FakeOpenAIServer
+        self.server = FakeOpenAIServer(reply_template='Hello from fake').start()
+        self.app.config['OPENAI_API_KEY'] = 'sk-test'
+        self.app.config['OPENAI_API_BASE'] = self.server.url
+    
+    def tearDown(self):
+        engine = self.app.extensions.pop('chatbot_engine', None)
+        if engine:
+            engine.shutdown()
+        self.server.stop()
+        super().tearDown()
+    
+    def test_engine_keeps_cli_contract(self):
+        """Test engine returns the same JSON contract as openai_izi_assistant.py"""
+        from app.chatbot_engine import ChatbotEngine
+        engine = ChatbotEngine(api_key='sk-test', assistant_id='asst_1', api_base=self.server.url)
+        try:
+            result = engine.handle({'message': 'Hi', 'language': 'en'})
+        finally:
+            engine.shutdown()
+        self.assertEqual(result, {'response': 'Hello from fake', 'status': 'success', 'using_assistant': True})
+    
+    def test_engine_reuses_connections(self):
+        """Test repeated messages reuse one keep-alive connection"""
+        from app.chatbot_engine import ChatbotEngine
+        engine = ChatbotEngine(api_key='sk-test', api_base=self.server.url, pool_size=1)
+        try:
+            for _ in range(3):
+                engine.handle({'message': 'Hi'})
+        finally:
+            engine.shutdown()
+        self.assertEqual(len(self.server.request_log), 3)
+        self.assertEqual(len(self.server.connections), 1)
+    
+    def test_get_response_runs_in_process(self):
+        """Test ChatbotAssistant answers without spawning a subprocess"""
+        from unittest import mock
+        from app.utils import ChatbotAssistant
+        with mock.patch('subprocess.Popen') as popen:
+            response = ChatbotAssistant().get_response('Hi', 'session-1', 'en')
+        popen.assert_not_called()
+        self.assertEqual(response, 'Hello from fake')
+
+    def test_stream_endpoint_sends_tokens(self):
+        """Test /api/chatbot/stream emits token events and a done event"""
+        self.server.reply_template = 'one two three'
+        response = self.client.post('/api/chatbot/stream', json={'message': 'Hi', 'language': 'en'},
+                                    headers={'X-Session-ID': 'session-1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        body = response.get_data(as_text=True)
+        self.assertEqual(body.count('event: token'), 3)
+        self.assertIn('"text": " three"', body)
+        self.assertTrue(body.rstrip().endswith('data: {"session_id": "session-1"}'))
+    
+    def test_stream_endpoint_requires_message(self):
+        """Test /api/chatbot/stream rejects an empty message"""
+        response = self.client.post('/api/chatbot/stream', json={})
+        self.assertEqual(response.status_code, 400)
+
+class RunWaiterTestCase(ServiceTestCase):
+    """Test the adaptive Assistants run waiter against a local fake OpenAI server"""
+    
+    def setUp(self):
+        super().setUp()
+        from benchmarks.fake_openai import FakeOpenAIServer
+        from app.assistant_runs import AssistantsClient
+        self.server = FakeOpenAIServer(reply_template='Assistant says hi').start()
+        self.assistants = AssistantsClient(api_key='sk-test', api_base=self.server.url)
+        self.thread = self.assistants.create_thread()
+        self.assistants.create_message(self.thread['id'], 'Hi')
+    
+    def tearDown(self):
+        engine = self.app.extensions.pop('chatbot_engine', None)
+        if engine:
+            engine.shutdown()
+        self.server.stop()
+        super().tearDown()
+    
+    def test_delays_back_off_to_cap(self):
+        """Test the poll schedule grows and is capped"""
+        from itertools import islice
+        from app.assistant_runs import RunWaiter
+        waiter = RunWaiter(initial_delay=0.1, multiplier=2, max_delay=0.5)
+        self.assertEqual(list(islice(waiter.delays(), 5)), [0.1, 0.2, 0.4, 0.5, 0.5])
+    
+    def test_polling_run_returns_reply(self):
+        """Test a polled run returns the reply with little wasted wait"""
+        from app.assistant_runs import RunWaiter
+        self.server.assistants.run_duration = 0.2
+        waiter = RunWaiter(initial_delay=0.02, max_delay=0.1)
+        text, result = self.assistants.run_and_wait(self.thread['id'], 'asst_1', waiter, stream=False)
+        self.assertEqual(text, 'Assistant says hi')
+        self.assertEqual(result.run['status'], 'completed')
+        self.assertGreater(result.polls, 1)
+        self.assertLessEqual(result.wasted, 0.1)
+    
+    def test_deadline_cancels_run(self):
+        """Test a run exceeding the deadline raises and is cancelled"""
+        from app.assistant_runs import RunWaiter, RunWaitTimeout
+        self.server.assistants.run_duration = 5
+        waiter = RunWaiter(initial_delay=0.02, max_delay=0.05, deadline=0.2)
+        with self.assertRaises(RunWaitTimeout):
+            self.assistants.run_and_wait(self.thread['id'], 'asst_1', waiter, stream=False)
+        run = next(iter(self.server.assistants.runs.values()))
+        self.assertEqual(run['status'], 'cancelled')
+    
+    def test_cancel_event_stops_waiting(self):
+        """Test setting the cancel event aborts the wait"""
+        import threading
+        from app.assistant_runs import RunWaiter, RunCancelled
+        self.server.assistants.run_duration = 5
+        cancel_event = threading.Event()
+        threading.Timer(0.1, cancel_event.set).start()
+        with self.assertRaises(RunCancelled):
+            self.assistants.run_and_wait(self.thread['id'], 'asst_1', RunWaiter(), stream=False,
+                                         cancel_event=cancel_event)
+    
+    def test_streaming_run_falls_back_to_polling(self):
+        """Test runs are polled when streaming runs are rejected"""
+        from app.assistant_runs import RunWaiter
+        self.server.assistants.fail_streaming = True
+        text, result = self.assistants.run_and_wait(self.thread['id'], 'asst_1', RunWaiter())
+        self.assertEqual(text, 'Assistant says hi')
+        self.assertFalse(result.streamed)
+    
+    def test_direct_call_uses_assistant_run(self):
+        """Test the direct fallback answers through a streamed Assistants run"""
+        from app.utils import ChatbotAssistant
+        self.app.config.update(OPENAI_API_KEY='sk-test', OPENAI_API_BASE=self.server.url,
+                               OPENAI_ASSISTANT_ID='asst_1')
+        assistant = ChatbotAssistant()
+        self.assertEqual(assistant._direct_openai_call('Hi', 'en'), 'Assistant says hi')
+        self.assertTrue(assistant.last_run_stats['streamed'])
+        self.assertEqual(assistant.last_run_stats['status'], 'completed')
+
+class ChatThreadSessionTestCase(ServiceTestCase):
+    """Test per-session Assistants threads stored in ChatThread"""
+    
+    def setUp(self):
+        super().setUp()
+        from benchmarks.fake_openai import FakeOpenAIServer
+        self.server = FakeOpenAIServer(reply_template='Echo: {message}').start()
+        self.app.config.update(OPENAI_API_KEY='sk-test', OPENAI_API_BASE=self.server.url,
+                               OPENAI_ASSISTANT_ID='asst_1')
+    
+    def tearDown(self):
+        engine = self.app.extensions.pop('chatbot_engine', None)
+        if engine:
+            engine.shutdown()
+        self.server.stop()
+        super().tearDown()
+    
+    def thread_creations(self):
+        return sum(1 for method, path in self.server.request_log if method == 'POST' and path.endswith('/threads'))
+    
+    def test_session_reuses_thread(self):
+        """Test only the first message of a session creates a thread"""
+        from app.utils import ChatbotAssistant
+        from app.models import ChatThread
+        assistant = ChatbotAssistant()
+        self.assertEqual(assistant._direct_openai_call('first', 'en', 'session-1'), 'Echo: first')
+        self.assertEqual(assistant._direct_openai_call('second', 'en', 'session-1'), 'Echo: second')
+        self.assertEqual(self.thread_creations(), 1)
+        chat_thread = ChatThread.query.filter_by(session_id='session-1').one()
+        self.assertIn(chat_thread.thread_id, self.server.assistants.threads)
+    
+    def test_stored_thread_used_after_cache_loss(self):
+        """Test a fresh worker finds the session thread in the database"""
+        from app.utils import ChatbotAssistant
+        ChatbotAssistant()._direct_openai_call('first', 'en', 'session-1')
+        self.app.extensions.pop('chat_thread_sessions')
+        ChatbotAssistant()._direct_openai_call('second', 'en', 'session-1')
+        self.assertEqual(self.thread_creations(), 1)
+    
+    def test_remotely_deleted_thread_is_replaced(self):
+        """Test a session whose thread vanished remotely gets a new thread"""
+        from app.utils import ChatbotAssistant
+        assistant = ChatbotAssistant()
+        assistant._direct_openai_call('first', 'en', 'session-1')
+        self.server.assistants.threads.clear()
+        self.assertEqual(assistant._direct_openai_call('again', 'en', 'session-1'), 'Echo: again')
+        self.assertEqual(self.thread_creations(), 2)
+    
+    def test_touches_are_batched(self):
+        """Test activity is written in one UPDATE once the touch interval passes"""
+        from app.chat_sessions import ThreadSessionManager
+        from app.models import ChatThread
+        manager = ThreadSessionManager(touch_interval=3600)
+        threads = iter(['thread_a', 'thread_b'])
+        for session_id in ('a', 'b'):
+            manager.get_thread_id(session_id, lambda: {'id': next(threads)})
+        stored = {t.session_id: t.updated_at for t in ChatThread.query.all()}
+        
+        manager.touch('a')
+        manager.touch('b')
+        self.assertEqual(len(manager._pending_touches), 2)
+        self.assertEqual(manager.flush_touches(), 2)
+        db.session.expire_all()
+        for chat_thread in ChatThread.query.all():
+            self.assertGreaterEqual(chat_thread.updated_at, stored[chat_thread.session_id])
+        self.assertEqual(manager.flush_touches(), 0)
+
+    def test_last_touches_are_written_without_more_traffic(self):
+        """Test a worker that gets no more chats writes its touches by timer and when it exits"""
+        import time
+        from datetime import datetime
+        from app.chat_sessions import ThreadSessionManager, close_thread_sessions, get_thread_sessions
+        from app.models import ChatThread
+        old = datetime(2020, 1, 1)
+        db.session.add_all([ChatThread(session_id=s, thread_id=f'thread_{s}', language='en', updated_at=old)
+                            for s in ('a', 'b')])
+        db.session.commit()
+
+        def stored(session_id):
+            db.session.rollback()  # Read what the timer committed
+            return ChatThread.query.filter_by(session_id=session_id).one().updated_at
+
+        manager = ThreadSessionManager(touch_interval=0.05, app=self.app)
+        manager.touch('a')
+        deadline = time.monotonic() + 5
+        while stored('a') == old and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertGreater(stored('a'), old)
+
+        get_thread_sessions(self.app).touch('b')
+        self.assertEqual(close_thread_sessions(self.app), 1)
+        self.assertGreater(stored('b'), old)
+
+    def test_cleanup_expires_idle_threads(self):
+        """Test cleanup deletes idle threads remotely and locally, keeping active ones"""
+        from datetime import datetime, timedelta
+        from app.utils import ChatbotAssistant, cleanup_old_chat_threads
+        from app.models import ChatThread
+        assistant = ChatbotAssistant()
+        assistant._direct_openai_call('old', 'en', 'idle-session')
+        assistant._direct_openai_call('new', 'en', 'active-session')
+        idle = ChatThread.query.filter_by(session_id='idle-session').one()
+        idle.updated_at = datetime.utcnow() - timedelta(days=30)
+        db.session.commit()
+        self.app.extensions['chat_thread_sessions']._pending_touches.pop('idle-session')
+        
+        self.assertEqual(cleanup_old_chat_threads(days_old=7), 1)
+        self.assertEqual(self.server.assistants.deleted_threads, [idle.thread_id])
+        self.assertEqual([t.session_id for t in ChatThread.query.all()], ['active-session'])
+
+class CatalogContextCacheTestCase(ServiceTestCase):
+    """Test the cached chatbot catalog context"""
+    
+    def test_cached_context_needs_no_queries(self):
+        """Test a warm catalog context is served without touching the database"""
+        from app.utils import get_catalog_context
+        self.create_catalog()
+        first = get_catalog_context('en')
+        self.assertIn('- Product 0: 10.0 EUR - Description 0...', first['product_info'])
+        with self.count_queries() as statements:
+            self.assertEqual(get_catalog_context('en'), first)
+        self.assertEqual(statements, [])
+    
+    def test_catalog_edit_invalidates_context(self):
+        """Test committing a product change rebuilds the context"""
+        from app.utils import get_catalog_context
+        self.create_catalog()
+        get_catalog_context('en')
+        product = Product.query.filter_by(slug='product-0').one()
+        product.name_en = 'Renamed product'
+        db.session.commit()
+        self.assertIn('Renamed product', get_catalog_context('en')['product_info'])
+    
+    def test_bulk_update_invalidates_context(self):
+        """Test bulk UPDATE statements on the catalog also invalidate"""
+        from app.utils import get_catalog_context
+        self.create_catalog()
+        get_catalog_context('en')
+        Product.query.update({'is_active': False})
+        db.session.commit()
+        self.assertEqual(get_catalog_context('en')['product_info'], '')
+    
+    def test_rollback_keeps_context(self):
+        """Test a rolled back edit does not invalidate"""
+        from app.extensions import cache
+        self.create_catalog()
+        version = cache.version('catalog')
+        Product.query.filter_by(slug='product-0').one().name_en = 'Draft'
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(cache.version('catalog'), version)
+    
+    def test_file_store_is_shared_between_workers(self):
+        """Test two file stores on one directory see each other's values and bumps"""
+        import tempfile
+        from app.cache import FileStore
+        from app.extensions import cache
+        directory = tempfile.mkdtemp()
+        worker_a, worker_b = FileStore(directory), FileStore(directory)
+        self.app.extensions['cache'] = worker_a
+        cache.set('catalog', 'key', 'value')
+        self.app.extensions['cache'] = worker_b
+        self.assertEqual(cache.get('catalog', 'key'), 'value')
+        cache.bump('catalog')
+        self.app.extensions['cache'] = worker_a
+        self.assertIsNone(cache.get('catalog', 'key'))
+
+class RetrievalContextTestCase(ServiceTestCase):
+    """Test the chatbot gets the catalog items relevant to the message from the retrieval index"""
+    
+    def setUp(self):
+        super().setUp()
+        category = self.create_catalog(products=0)
+        for i, (name_en, name_uk, description_en) in enumerate([
+                ('Website development', 'Розробка сайтів', 'Responsive websites and online shops'),
+                ('Chatbot integration', 'Чат-бот', 'An AI chatbot answering your customers'),
+                ('Hosting', 'Хостинг', 'Managed hosting with daily backups'),
+                ('SEO audit', 'SEO аудит', 'Search engine optimization of a website')]):
+            db.session.add(Product(name_uk=name_uk, name_ru=name_uk, name_de=name_en, name_en=name_en,
+                                   description_en=description_en, price=100.0 + i, slug=f'p-{i}',
+                                   sort_order=i, category_id=category.id))
+        db.session.commit()
+    
+    def product_names(self, message, language='en'):
+        """Product names in the context given for a message"""
+        from app.utils import get_catalog_context
+        import re
+        return re.findall(r'^- ([^:]+):', get_catalog_context(language, message)['product_info'], re.M)
+    
+    def test_relevant_products_first(self):
+        """Test the best matches come first and only the top k are sent"""
+        self.app.config['CHATBOT_CONTEXT_PRODUCTS'] = 2
+        self.assertEqual(self.product_names('Can your chatbot answer customers?')[0], 'Chatbot integration')
+        self.assertEqual(self.product_names('I need a website for my shop'), ['Website development', 'SEO audit'])
+        self.assertEqual(self.product_names('сайти', language='uk'), ['Розробка сайтів'])
+    
+    def test_unrelated_message_gets_catalog_order(self):
+        """Test a message matching nothing falls back to the first products"""
+        self.app.config['CHATBOT_CONTEXT_PRODUCTS'] = 3
+        self.assertEqual(self.product_names('Hello!'), ['Website development', 'Chatbot integration', 'Hosting'])
+        self.assertEqual(self.product_names(None), self.product_names('Hello!'))
+    
+    def test_index_file_follows_commits(self):
+        """Test commits update the index file in place, so workers reload it without rebuilding"""
+        import shutil
+        from app.retrieval import CatalogIndex, _read, _index_path
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.app.config['CHATBOT_RETRIEVAL_INDEX'] = os.path.join(directory, 'catalog.idx')
+        self.product_names('hosting')
+        
+        product = Product.query.filter_by(slug='p-2').one()
+        product.name_en = 'Cloud hosting'
+        db.session.commit()
+        with self.count_queries() as statements:
+            self.assertEqual(self.product_names('cloud')[0], 'Cloud hosting')
+        self.assertEqual(statements, [])
+        
+        product.is_active = False
+        db.session.commit()
+        self.assertNotIn('Cloud hosting', self.product_names('cloud'))
+        self.assertIsInstance(_read(_index_path()), CatalogIndex)
+        
+        Product.query.filter_by(slug='p-2').update({'is_active': True})
+        db.session.commit()
+        self.assertIsNone(_read(_index_path()))
+        self.assertEqual(self.product_names('cloud')[0], 'Cloud hosting')
+    
+    def test_assistant_request_uses_message(self):
+        """Test the engine request carries the context of the user's message"""
+        from app.utils import ChatbotAssistant
+        self.app.config['CHATBOT_CONTEXT_PRODUCTS'] = 1
+        request = ChatbotAssistant()._build_assistant_request('How much is hosting?', 'en')
+        self.assertEqual(request['product_info'], '- Hosting: 102.0 EUR - Managed hosting with daily backups...')
+
+class ResponseCacheTestCase(ServiceTestCase):
+    """Test the chatbot answer cache"""
+    
+    def setUp(self):
+        super().setUp()
+        from benchmarks.fake_openai import FakeOpenAIServer
+        self.server = FakeOpenAIServer(reply_template='Answer').start()
+        self.app.config.update(OPENAI_API_KEY='sk-test', OPENAI_API_BASE=self.server.url)
+    
+    def tearDown(self):
+        engine = self.app.extensions.pop('chatbot_engine', None)
+        if engine:
+            engine.shutdown()
+        self.server.stop()
+        super().tearDown()
+    
+    def test_matches_exact_and_near_duplicates(self):
+        """Test normalized and slightly different questions hit, other questions miss"""
+        from app.response_cache import ResponseCache
+        response_cache = ResponseCache()
+        response_cache.store('en', 'What product do you sell?', 'Software', latency=1.5)
+        self.assertEqual(response_cache.lookup('en', '  what product do YOU sell'), 'Software')
+        self.assertEqual(response_cache.lookup('en', 'What products do you sell?'), 'Software')
+        self.assertIsNone(response_cache.lookup('en', 'How much is delivery?'))
+        self.assertIsNone(response_cache.lookup('de', 'What product do you sell?'))
+        stats = response_cache.stats()
+        self.assertEqual((stats['exact_hits'], stats['similar_hits'], stats['misses']), (1, 1, 2))
+        self.assertEqual(stats['saved_seconds'], 3.0)
+    
+    def test_numbers_must_match(self):
+        """Test questions differing only in a number are not near-duplicates"""
+        from app.response_cache import ResponseCache
+        response_cache = ResponseCache()
+        response_cache.store('en', 'How much is plan 1?', '10 EUR')
+        self.assertIsNone(response_cache.lookup('en', 'How much is plan 2?'))
+    
+    def test_catalog_edit_invalidates_answers(self):
+        """Test answers are dropped when the catalog changes"""
+        from app.response_cache import ResponseCache
+        response_cache = ResponseCache()
+        response_cache.store('en', 'What do you sell?', 'Software')
+        self.create_catalog()
+        self.assertIsNone(response_cache.lookup('en', 'What do you sell?'))
+    
+    def test_repeated_question_skips_openai(self):
+        """Test ChatbotAssistant answers a repeated question from the cache"""
+        from app.utils import ChatbotAssistant
+        assistant = ChatbotAssistant()
+        self.assertEqual(assistant.get_response('Do you ship to Germany?', 's1', 'en'), 'Answer')
+        self.assertEqual(assistant.get_response('do you ship to germany', 's2', 'en'), 'Answer')
+        self.assertEqual(len(self.server.request_log), 1)
+    
+    def test_admin_page_shows_hit_rate(self):
+        """Test /admin/chatbot reports the cache hit rate"""
+        from app.utils import ChatbotAssistant
+        assistant = ChatbotAssistant()
+        assistant.get_response('Hello', 's1', 'en')
+        assistant.get_response('Hello', 's1', 'en')
+        with self.client.session_transaction() as sess:
+            sess['admin_logged_in'] = True
+        response = self.client.get('/admin/chatbot')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('50.0%', response.get_data(as_text=True))
+
+class ParallelContentGenerationTestCase(ServiceTestCase):
+    """Test blog posts are generated and translated concurrently"""
+    
+    def setUp(self):
+        super().setUp()
+        from benchmarks.fake_openai import FakeOpenAIServer
+        self.server = FakeOpenAIServer(latency=0.3, reply_template='Translated').start()
+        self.app.config.update(OPENAI_API_KEY='sk-test', OPENAI_API_BASE=self.server.url)
+    
+    def tearDown(self):
+        self.server.stop()
+        super().tearDown()
+    
+    def test_translations_run_concurrently(self):
+        """Test 1 generation + 9 translation calls take about two call latencies"""
+        import time
+        from app.content_generator import ContentGenerator
+        started = time.monotonic()
+        post = ContentGenerator().generate_multilingual_post('en', 'Cloud backups')
+        elapsed = time.monotonic() - started
+        self.assertEqual(sorted(post), ['de', 'en', 'ru', 'uk'])
+        self.assertEqual(post['de'], {'title': 'Translated', 'excerpt': 'Translated', 'content': 'Translated'})
+        self.assertEqual(len(self.server.request_log), 10)
+        self.assertLess(elapsed, 1.5)  # Sequential calls take 3 s
+    
+    def test_failed_translation_falls_back(self):
+        """Test one failing language gets the simple translation, the others are kept"""
+        from unittest import mock
+        from app.content_generator import ContentGenerator
+        generator = ContentGenerator()
+        original = generator.translate_content
+        
+        def translate(content, from_lang, to_lang):
+            if to_lang == 'de':
+                raise RuntimeError('boom')
+            return original(content, from_lang, to_lang)
+        
+        with mock.patch.object(generator, 'translate_content', side_effect=translate):
+            post = generator.generate_multilingual_post('en', 'Cloud backups')
+        self.assertTrue(post['de']['title'].startswith('[DE] '))
+        self.assertEqual(post['uk']['title'], 'Translated')
+    
+    def test_ai_generator_runs_languages_concurrently(self):
+        """Test AIContentGenerator generates languages in parallel with per-language fallback"""
+        import time
+        from unittest import mock
+        from app.utils import AIContentGenerator
+        
+        def slow_generate(topic, language, keywords=''):
+            time.sleep(0.3)
+            if language == 'ru':
+                raise RuntimeError('boom')
+            return {'title': topic, 'excerpt': '', 'content': ''}
+        
+        generator = AIContentGenerator()
+        topics = {'uk': 'Тема', 'ru': 'Тема', 'de': 'Thema', 'en': 'Topic'}
+        started = time.monotonic()
+        with mock.patch.object(generator, 'generate_blog_post', side_effect=slow_generate):
+            posts = generator.generate_multilingual_post(topics)
+        self.assertLess(time.monotonic() - started, 0.9)
+        self.assertEqual(posts['en']['title'], 'Topic')
+        self.assertEqual(posts['ru'], generator._get_fallback_template('Тема', 'ru', ''))
+    
+    def test_timed_out_task_maps_to_error(self):
+        """Test run_concurrently does not wait past the timeout"""
+        import time
+        from app.concurrency import run_concurrently
+        results = run_concurrently({'fast': lambda: 1, 'slow': lambda: time.sleep(1)}, timeout=0.1)
+        self.assertEqual(results['fast'], 1)
+        self.assertIsInstance(results['slow'], TimeoutError)
+
+class BackgroundJobTestCase(ServiceTestCase):
+    """Test the background job queue used for AI blog generation"""
+    
+    def setUp(self):
+        super().setUp()
+        self.app.config['JOB_RETRY_DELAY'] = 0
+        self.app.config['WTF_CSRF_ENABLED'] = False
+    
+    def login_admin(self):
+        """Log the test client in as an admin user"""
+        from app.models import User
+        admin = User(username='admin', email='admin@example.com', is_admin=True)
+        admin.set_password('secret')
+        db.session.add(admin)
+        db.session.commit()
+        with self.client.session_transaction() as sess:
+            sess['admin_logged_in'] = True
+            sess['admin_user_id'] = admin.id
+        return admin
+    
+    def test_generate_ai_post_is_queued_and_run_by_worker(self):
+        """Test the request only queues the job and the worker creates the post"""
+        from app.models import BlogPost
+        from app.jobs import work
+        admin = self.login_admin()
+        response = self.client.post('/admin/generate-ai-post', data={
+            'topic_uk': 'Хмарні бекапи', 'topic_en': 'Cloud backups', 'keywords': 'backup'
+        })
+        self.assertEqual(response.status_code, 202)
+        job_id = response.get_json()['job_id']
+        self.assertEqual(BlogPost.query.count(), 0)
+        self.assertEqual(self.client.get(f'/admin/jobs/{job_id}').get_json()['status'], 'queued')
+        
+        self.assertEqual(work(burst=True), 1)
+        status = self.client.get(f'/admin/jobs/{job_id}').get_json()
+        self.assertEqual(status['status'], 'succeeded')
+        self.assertEqual(status['progress'], 100)
+        post = db.session.get(BlogPost, status['result']['post_id'])
+        self.assertEqual(post.author_id, admin.id)
+        self.assertFalse(post.is_published)
+
+    def test_each_generated_language_heartbeats_the_job(self):
+        """Test progress and the lock heartbeat are stored as every language finishes"""
+        from unittest import mock
+        from app.jobs import JobContext, work
+        self.login_admin()
+        self.client.post('/admin/generate-ai-post', data={
+            'topic_uk': 'Хмарні бекапи', 'topic_de': 'Cloud-Backups', 'topic_en': 'Cloud backups'})
+        reports = []
+        report = JobContext.report
+
+        def record(job, progress, message=None):
+            reports.append((progress, message))
+            report(job, progress, message)
+        with mock.patch.object(JobContext, 'report', record):
+            self.assertEqual(work(burst=True), 1)
+        self.assertEqual([progress for progress, _ in reports], [10, 36, 63, 90, 90])
+        self.assertEqual(sorted(reports[3][1].replace('Finished ', '').split(', ')), ['de', 'en', 'uk'])
+
+    def test_run_concurrently_reports_each_finished_task(self):
+        """Test on_done is called in the calling thread as tasks finish, fastest first"""
+        import threading
+        import time
+        from app.concurrency import run_concurrently
+        finished = []
+        results = run_concurrently({'slow': lambda: time.sleep(0.2) or 'slow', 'fast': lambda: 'fast'},
+                                   on_done=lambda key: finished.append((key, threading.current_thread())))
+        self.assertEqual(list(results), ['slow', 'fast'])
+        self.assertEqual(finished, [('fast', threading.current_thread()), ('slow', threading.current_thread())])
+
+    def test_failing_job_is_retried_then_failed(self):
+        """Test a failing handler is retried up to max_attempts"""
+        from app.models import BackgroundJob
+        from app.jobs import enqueue, job_handler, work
+        calls = []
+        
+        @job_handler('test.fail')
+        def fail(job, payload):
+            calls.append(payload)
+            raise RuntimeError('boom')
+        
+        job = enqueue('test.fail', {'n': 1}, max_attempts=2)
+        work(burst=True)
+        job = db.session.get(BackgroundJob, job.id)
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.attempts, 2)
+        self.assertEqual(len(calls), 2)
+        self.assertIn('boom', job.error)
+    
+    def test_job_is_claimed_once(self):
+        """Test two workers never claim the same job"""
+        from app.jobs import enqueue, claim_next_job, job_handler
+        job_handler('test.noop')(lambda job, payload: None)
+        job = enqueue('test.noop')
+        claimed = claim_next_job('worker-1')
+        self.assertEqual(claimed.id, job.id)
+        self.assertEqual(claimed.locked_by, 'worker-1')
+        self.assertIsNone(claim_next_job('worker-2'))
+    
+    def test_unknown_kind_is_rejected(self):
+        """Test enqueueing a job without a handler fails early"""
+        from app.jobs import enqueue
+        with self.assertRaises(ValueError):
+            enqueue('test.missing')
+    
+    def test_job_status_requires_admin(self):
+        """Test the status endpoint is not public"""
+        self.assertEqual(self.client.get('/admin/jobs/1').status_code, 401)
+
+class BlogGenerationBackendTestCase(ServiceTestCase):
+    """Test AI blog posts are generated in-process over the pooled session"""
+    
+    def setUp(self):
+        super().setUp()
+        from benchmarks.fake_openai import FakeOpenAIServer
+        self.server = FakeOpenAIServer(
+            reply_template='Cloud backups guide\n\n<p>Why backups matter.</p>\n\n<h2>Tools</h2>'
+        ).start()
+        self.app.config.update(OPENAI_API_KEY='sk-test', OPENAI_API_BASE=self.server.url)
+    
+    def tearDown(self):
+        self.server.stop()
+        super().tearDown()
+    
+    def test_generates_post_with_timing(self):
+        """Test the post is parsed from the completion and its timing recorded"""
+        from app.utils import AIContentGenerator
+        generator = AIContentGenerator()
+        post = generator.generate_blog_post('Cloud backups', 'en', 'backup')
+        self.assertEqual(post['title'], 'Cloud backups guide')
+        self.assertEqual(post['excerpt'], 'Why backups matter.')
+        self.assertIn('<h2>Tools</h2>', post['content'])
+        timing = generator.timings['en'].as_dict()
+        self.assertIsNone(timing['error'])
+        self.assertEqual(timing['prompt_tokens'], 10)
+        self.assertGreaterEqual(timing['total_seconds'], timing['request_seconds'])
+    
+    def test_reuses_pooled_connection(self):
+        """Test successive languages share one keep-alive connection"""
+        from app.utils import AIContentGenerator
+        generator = AIContentGenerator()
+        for language in ('uk', 'ru', 'de', 'en'):
+            generator.generate_blog_post('Cloud backups', language)
+        self.assertEqual(len(self.server.request_log), 4)
+        self.assertEqual(len(self.server.connections), 1)
+    
+    def test_unreachable_api_falls_back_to_template(self):
+        """Test a failed call returns the template and records the error"""
+        from app.utils import AIContentGenerator
+        self.app.config['OPENAI_API_BASE'] = 'http://127.0.0.1:1/v1'
+        self.app.extensions.pop('blog_generation_backend', None)
+        generator = AIContentGenerator()
+        post = generator.generate_blog_post('Cloud backups', 'en')
+        self.assertEqual(post, generator._get_fallback_template('Cloud backups', 'en', ''))
+        self.assertIsNotNone(generator.timings['en'].error)
+
+class PageCacheTestCase(ServiceTestCase):
+    """Test public pages are cached until the content they show changes"""
+    
+    def setUp(self):
+        super().setUp()
+        self.category = self.create_catalog()
+    
+    def test_repeat_view_is_served_without_queries(self):
+        """Test the second view comes from the cache without touching the database"""
+        first = self.client.get('/shop')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.headers['X-Page-Cache'], 'miss')
+        with self.count_queries() as statements:
+            second = self.client.get('/shop')
+        self.assertEqual(second.headers['X-Page-Cache'], 'hit')
+        self.assertEqual(second.get_data(), first.get_data())
+        self.assertEqual(statements, [])
+    
+    def test_etag_revalidation(self):
+        """Test a matching If-None-Match gets 304 until the catalog changes"""
+        from app.models import Product
+        url = f'/shop/category/{self.category.id}'
+        etag = self.client.get(url).headers['ETag']
+        not_modified = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.get_data(), b'')
+        
+        product = Product.query.filter_by(slug='product-0').first()
+        product.name_uk = 'Оновлений товар'
+        db.session.commit()
+        changed = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed.headers['ETag'], etag)
+        self.assertIn('Оновлений товар', changed.get_data(as_text=True))
+    
+    def test_languages_are_cached_separately(self):
+        """Test each language gets its own cached page"""
+        self.client.get('/shop')
+        self.client.get('/set_language/en')
+        response = self.client.get('/shop')
+        self.assertEqual(response.headers['X-Page-Cache'], 'miss')
+        self.assertIn('Services', response.get_data(as_text=True))
+    
+    def test_pending_flash_bypasses_cache(self):
+        """Test a page showing a flash message is neither served from nor stored in the cache"""
+        self.client.get('/shop')
+        with self.client.session_transaction() as sess:
+            sess['_flashes'] = [('info', 'Thanks for your message')]
+        response = self.client.get('/shop')
+        self.assertNotIn('X-Page-Cache', response.headers)
+        self.assertIn('Thanks for your message', response.get_data(as_text=True))
+        self.assertEqual(self.client.get('/shop').headers['X-Page-Cache'], 'hit')
+    
+    def test_fragment_cached_until_namespace_bumped(self):
+        """Test a cache_fragment block re-renders only after its namespace changes"""
+        from flask import render_template_string
+        from app.extensions import cache
+        template = "{% call cache_fragment('greeting', 'social') %}{{ value }}{% endcall %}"
+        with self.app.test_request_context('/'):
+            self.assertEqual(render_template_string(template, value='first'), 'first')
+            self.assertEqual(render_template_string(template, value='second'), 'first')
+            cache.bump('social')
+            self.assertEqual(render_template_string(template, value='second'), 'second')
+
+class TemplateContextTestCase(ServiceTestCase):
+    """Test the global template context does not hit the database on every render"""
+    
+    def add_social_link(self, name='Facebook'):
+        """Create an active social link"""
+        from app.models import SocialLink
+        db.session.add(SocialLink(name=name, platform=name.lower(), url=f'https://{name.lower()}.com/shop',
+                                  icon_class=f'fab fa-{name.lower()}'))
+        db.session.commit()
+    
+    def test_social_links_queried_once_per_version(self):
+        """Test repeated renders reuse the footer links until a social link is saved"""
+        self.add_social_link()
+        self.client.get('/contact')
+        with self.count_queries() as statements:
+            response = self.client.get('/contact')
+        self.assertIn('https://facebook.com/shop', response.get_data(as_text=True))
+        self.assertFalse([s for s in statements if 'social_links' in s])
+        
+        self.add_social_link('Instagram')
+        self.assertIn('https://instagram.com/shop', self.client.get('/contact').get_data(as_text=True))
+    
+    def test_bump_from_another_worker_refreshes_links(self):
+        """Test a version bump in the shared store rebuilds this worker's copy"""
+        from app.extensions import cache
+        from app.models import SocialLink
+        from app.page_cache import get_footer_links
+        self.add_social_link()
+        with self.app.test_request_context('/'):
+            self.assertEqual([link.name for link in get_footer_links()], ['Facebook'])
+            # Simulate a write by another worker: the row changes without this process' commit hooks
+            db.session.execute(SocialLink.__table__.update().values(name='Facebook page'))
+            self.assertEqual([link.name for link in get_footer_links()], ['Facebook'])
+            cache.bump('social')
+            self.assertEqual([link.name for link in get_footer_links()], ['Facebook page'])
+    
+    def test_translation_table(self):
+        """Test _() looks texts up in the session language and passes unknown texts through"""
+        from flask import render_template_string
+        with self.app.test_request_context('/'):
+            from flask import session
+            session['language'] = 'de'
+            self.assertEqual(render_template_string("{{ _('Terms & Conditions') }}|{{ _('Unknown') }}"),
+                             'AGB|Unknown')
+
+class BlogPaginationTestCase(ServiceTestCase):
+    """Test the blog listing pages with keyset cursors and reads only listing columns"""
+    
+    def setUp(self):
+        super().setUp()
+        from datetime import datetime, timedelta
+        from app.models import BlogPost, User
+        self.app.config.update(BLOG_POSTS_PER_PAGE=10, PAGE_CACHE=False)
+        author = User(username='author', email='author@example.com', password_hash='-')
+        db.session.add(author)
+        db.session.flush()
+        base = datetime(2024, 1, 1)
+        for i in range(25):
+            # Pairs of posts share a timestamp, so the id must break ties
+            db.session.add(BlogPost(title=f'Post {i}', title_uk=f'Пост {i}', title_ru=f'Пост {i}',
+                                    title_de=f'Beitrag {i}', title_en=f'Post {i:02d}', content=f'Body {i}',
+                                    content_uk=f'Текст {i}', content_ru=f'Текст {i}', content_de=f'Inhalt {i}',
+                                    content_en=f'<p>Body {i}</p>', excerpt_en='Summary' if i == 24 else None,
+                                    slug=f'post-{i}', is_published=True, author_id=author.id,
+                                    created_at=base + timedelta(hours=i // 2)))
+        db.session.commit()
+        self.client.get('/set_language/en')
+    
+    def titles(self, response):
+        """Post titles in listing order"""
+        import re
+        return re.findall(r'class="card-title">Post (\d+)<', response.get_data(as_text=True))
+    
+    def next_url(self, response):
+        """Href of the older posts link, if any"""
+        import re
+        match = re.search(r'href="(/blog\?after=[^"]+)"', response.get_data(as_text=True))
+        return match.group(1) if match else None
+    
+    def test_pages_follow_each_other_without_gaps(self):
+        """Test walking the cursors visits every post once, newest first"""
+        seen = []
+        url = '/blog'
+        while url:
+            response = self.client.get(url)
+            page = self.titles(response)
+            self.assertLessEqual(len(page), 10)
+            seen.extend(page)
+            url = self.next_url(response)
+        self.assertEqual(seen, [f'{i:02d}' for i in range(24, -1, -1)])
+    
+    def test_previous_page_link(self):
+        """Test the newer posts link of page two leads back to page one"""
+        import re
+        first = self.client.get('/blog')
+        second = self.client.get(self.next_url(first))
+        prev_url = re.search(r'href="(/blog\?before=[^"]+)"', second.get_data(as_text=True)).group(1)
+        self.assertEqual(self.titles(self.client.get(prev_url)), self.titles(first))
+    
+    def test_listing_reads_preview_not_articles(self):
+        """Test the query skips other languages' articles and the preview prefers the excerpt"""
+        with self.count_queries() as statements:
+            response = self.client.get('/blog')
+        listing = [s for s in statements if 'FROM blog_posts' in s][0]
+        self.assertNotIn('content_de', listing)
+        self.assertNotIn('title_de', listing)
+        html = response.get_data(as_text=True)
+        self.assertIn('Summary', html)
+        self.assertIn('Body 23', html)
+        self.assertNotIn('&lt;p&gt;', html)
+    
+    def test_invalid_cursor_redirects_to_first_page(self):
+        """Test a tampered cursor does not raise"""
+        response = self.client.get('/blog?after=not-a-cursor')
+        self.assertEqual(response.status_code, 302)
+
+class LocalizedColumnsTestCase(ServiceTestCase):
+    """Test pages load only the current language's columns plus the fallback"""
+    
+    def setUp(self):
+        super().setUp()
+        self.app.config['PAGE_CACHE'] = False
+        self.category = self.create_catalog()
+    
+    def test_query_selects_current_language_and_fallback(self):
+        """Test other languages' columns are left out of the SELECT"""
+        from app.localization import localized
+        from app.models import Product
+        with self.count_queries() as statements:
+            products = Product.query.options(*localized(Product, 'en')).all()
+        select = statements[0].split('FROM')[0]
+        for column in ('name_en', 'name_uk', 'description_en', 'description_uk', 'price'):
+            self.assertIn(f'products.{column}', select)
+        for column in ('name_ru', 'name_de', 'description_ru', 'description_de'):
+            self.assertNotIn(f'products.{column}', select)
+        self.assertEqual(products[0].get_name('en'), 'Product 0')
+    
+    def test_deferred_column_still_loads_on_access(self):
+        """Test reading another language lazily loads it instead of failing"""
+        from app.localization import localized
+        from app.models import Product
+        product = Product.query.options(*localized(Product, 'en', ('name',))).filter_by(slug='product-1').one()
+        self.assertEqual(product.get_name('de'), 'Produkt 1')
+        self.assertEqual(product.get_description('en'), 'Description 1')
+    
+    def test_category_page_renders_language(self):
+        """Test the category page shows the session language from the catalog snapshot"""
+        self.client.get('/set_language/de')
+        self.client.get(f'/shop/category/{self.category.id}')
+        with self.count_queries() as statements:
+            html = self.client.get(f'/shop/category/{self.category.id}').get_data(as_text=True)
+        self.assertIn('Produkt 2', html)
+        self.assertIn('Dienste', html)
+        self.assertEqual([s for s in statements if 'FROM products' in s or 'FROM categories' in s], [])
+
+class ProductAPITestCase(ServiceTestCase):
+    """Test targeted product lookups on /api/products"""
+    
+    def setUp(self):
+        super().setUp()
+        self.create_catalog(products=5)
+        from app.models import Product
+        from app.catalog import get_catalog
+        self.ids = [p.id for p in Product.query.order_by(Product.sort_order, Product.id)]
+        get_catalog()
+    
+    def test_lookup_by_id_with_fields(self):
+        """Test ?id= returns one object with only the requested fields"""
+        with self.count_queries() as statements:
+            response = self.client.get(f'/api/products?id={self.ids[1]}&fields=name,price&language=en')
+        self.assertEqual(response.get_json(), {'name': 'Product 1', 'price': 11.0})
+        self.assertEqual(statements, [])
+        self.assertEqual(self.client.get('/api/products?id=9999').status_code, 404)
+    
+    def test_batch_lookup_keeps_requested_order(self):
+        """Test ?ids= resolves several products from the catalog snapshot"""
+        wanted = [self.ids[3], self.ids[0], 9999, self.ids[3]]
+        with self.count_queries() as statements:
+            response = self.client.get(f"/api/products?ids={','.join(map(str, wanted))}&fields=id")
+        self.assertEqual(response.get_json(), [{'id': self.ids[3]}, {'id': self.ids[0]}])
+        self.assertEqual(statements, [])
+        # The old cart parameter now narrows the result instead of being ignored
+        legacy = self.client.get(f'/api/products?product_id={self.ids[2]}').get_json()
+        self.assertEqual([p['id'] for p in legacy], [self.ids[2]])
+    
+    def test_cursor_pagination(self):
+        """Test limit and cursor walk the catalog in sort order"""
+        seen, url = [], '/api/products?fields=id&limit=2'
+        while url:
+            response = self.client.get(url)
+            seen.extend(p['id'] for p in response.get_json())
+            cursor = response.headers.get('X-Next-Cursor')
+            url = f'/api/products?fields=id&limit=2&cursor={cursor}' if cursor else None
+        self.assertEqual(seen, self.ids)
+    
+    def test_invalid_parameters(self):
+        """Test malformed requests are rejected"""
+        self.assertEqual(self.client.get('/api/products?fields=name,secret').status_code, 400)
+        self.assertEqual(self.client.get('/api/products?ids=1,x').status_code, 400)
+        self.assertEqual(self.client.get('/api/products?limit=1000').status_code, 400)
+        self.assertEqual(self.client.get('/api/products?limit=2&cursor=bogus').status_code, 400)
+    
+    def test_etag_and_cache_headers(self):
+        """Test revalidation answers 304 without a query until the catalog changes"""
+        from app.models import Product
+        url = f'/api/products?id={self.ids[0]}&fields=price'
+        response = self.client.get(url)
+        self.assertIn('max-age=60', response.headers['Cache-Control'])
+        etag = response.headers['ETag']
+        with self.count_queries() as statements:
+            self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 304)
+        self.assertEqual(statements, [])
+        
+        product = db.session.get(Product, self.ids[0])
+        product.price = 99.0
+        db.session.commit()
+        changed = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.get_json(), {'price': 99.0})
+
+class CheckoutTestCase(ServiceTestCase):
+    """Test carts are resolved and validated with one query"""
+    
+    def setUp(self):
+        super().setUp()
+        self.create_catalog(products=5)
+        from app.models import Product
+        self.ids = [p.id for p in Product.query.order_by(Product.id)]
+    
+    def checkout(self, items):
+        return self.client.post('/checkout', json={'items': items})
+    
+    def problem_codes(self, response):
+        self.assertEqual(response.status_code, 400)
+        return sorted(problem['code'] for problem in response.get_json()['problems'])
+    
+    def test_cart_resolves_from_catalog_snapshot(self):
+        """Test a large cart runs no product queries and merges repeated lines"""
+        from app.catalog import get_catalog
+        from app.checkout import resolve_cart
+        items = [{'product_id': self.ids[i % 5], 'quantity': 1} for i in range(50)]
+        get_catalog()
+        with self.count_queries() as statements:
+            lines = resolve_cart(items, 'en')
+        self.assertEqual(statements, [])
+        self.assertEqual([(line.name, line.quantity) for line in lines],
+                         [(f'Product {i}', 10) for i in range(5)])
+        
+        response = self.checkout(items)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.get_json()['demo_mode'])
+    
+    def test_every_problem_is_reported(self):
+        """Test unavailable products and bad quantities are reported together"""
+        from app.models import Product
+        db.session.get(Product, self.ids[1]).is_active = False
+        db.session.commit()
+        response = self.checkout([{'product_id': self.ids[0], 'quantity': 0},
+                                  {'product_id': self.ids[1]}, {'product_id': 9999}])
+        self.assertEqual(self.problem_codes(response), ['quantity'])
+        response = self.checkout([{'product_id': self.ids[1]}, {'product_id': 9999}])
+        self.assertEqual(self.problem_codes(response), ['unavailable', 'unavailable'])
+        self.assertEqual(self.problem_codes(self.checkout([{'product_id': self.ids[0], 'quantity': 1000}])),
+                         ['quantity'])
+        self.assertEqual(self.problem_codes(self.checkout([{'quantity': 1}, 'x'])), ['malformed', 'malformed'])
+        self.assertEqual(self.problem_codes(self.checkout([])), ['empty'])
+    
+    def test_mixed_currencies_are_rejected(self):
+        """Test one checkout session charges a single currency"""
+        from app.models import Product
+        db.session.get(Product, self.ids[2]).currency = 'USD'
+        db.session.commit()
+        response = self.checkout([{'product_id': self.ids[0]}, {'product_id': self.ids[2]}])
+        self.assertEqual(self.problem_codes(response), ['currency'])
+
+class StripeWebhookTestCase(ServiceTestCase):
+    """Test orders are recorded once from signed Stripe webhook events"""
+    
+    SECRET = 'whsec_test'
+    
+    def setUp(self):
+        super().setUp()
+        self.app.config['STRIPE_WEBHOOK_SECRET'] = self.SECRET
+        self.create_catalog(products=3)
+        from app.models import Product
+        self.ids = [p.id for p in Product.query.order_by(Product.id)]
+    
+    def signed(self, payload, timestamp=None, secret=SECRET):
+        """Stripe-Signature header for a payload, as the Stripe CLI would send it"""
+        import hmac
+        import hashlib
+        import time
+        timestamp = int(time.time()) if timestamp is None else timestamp
+        signature = hmac.new(secret.encode(), f'{timestamp}.{payload}'.encode(), hashlib.sha256).hexdigest()
+        return {'Stripe-Signature': f't={timestamp},v1={signature}', 'Content-Type': 'application/json'}
+    
+    def event(self, event_id, event_type='checkout.session.completed', **session):
+        import json
+        checkout_session = {'id': 'cs_test_1', 'object': 'checkout.session', 'amount_total': 3300,
+                            'currency': 'eur', 'payment_status': 'paid',
+                            'customer_details': {'email': 'buyer@example.com'},
+                            'metadata': {'source': 'saas_shop', 'cart_0': f'{self.ids[0]}:2:1000,{self.ids[2]}:1:1200'}}
+        checkout_session.update(session)
+        return json.dumps({'id': event_id, 'object': 'event', 'type': event_type,
+                           'data': {'object': checkout_session}})
+    
+    def deliver(self, payload, **kwargs):
+        return self.client.post('/stripe/webhook', data=payload, headers=self.signed(payload, **kwargs))
+    
+    def test_completed_session_creates_order_once(self):
+        """Test a replayed event is acknowledged without a second order"""
+        from app.models import Order
+        payload = self.event('evt_1')
+        first = self.deliver(payload)
+        self.assertEqual(first.get_json(), {'received': True, 'duplicate': False})
+        
+        with self.count_queries() as statements:
+            for _ in range(20):
+                self.assertEqual(self.deliver(payload).get_json()['duplicate'], True)
+        self.assertEqual(len(statements), 20)
+        
+        order = Order.query.one()
+        self.assertEqual((order.customer_email, order.total_amount, order.currency, order.status),
+                         ('buyer@example.com', 33.0, 'EUR', 'completed'))
+        self.assertEqual(sorted((i.product_id, i.quantity, i.price) for i in order.order_items),
+                         [(self.ids[0], 2, 10.0), (self.ids[2], 1, 12.0)])
+        self.assertIn(b'33.00 EUR', self.client.get('/checkout/success?session_id=cs_test_1').data)
+    
+    def test_rejects_bad_signatures(self):
+        """Test tampered, stale and wrongly signed payloads are refused"""
+        import time
+        from app.models import Order
+        payload = self.event('evt_1')
+        headers = self.signed(payload)
+        tampered = payload.replace('3300', '1')
+        self.assertEqual(self.client.post('/stripe/webhook', data=tampered, headers=headers).status_code, 400)
+        self.assertEqual(self.deliver(payload, secret='whsec_other').status_code, 400)
+        self.assertEqual(self.deliver(payload, timestamp=int(time.time()) - 3600).status_code, 400)
+        self.assertEqual(self.client.post('/stripe/webhook', data=payload).status_code, 400)
+        self.assertEqual(Order.query.count(), 0)
+    
+    def test_delayed_payment_events(self):
+        """Test events of one session update its order in any order"""
+        from app.models import Order
+        self.deliver(self.event('evt_2', 'checkout.session.async_payment_failed'))
+        self.deliver(self.event('evt_1', payment_status='unpaid'))
+        self.assertEqual(Order.query.one().status, 'failed')
+        self.assertEqual(len(Order.query.one().order_items), 2)
+
+    def test_integrity_errors_other_than_duplicates_are_raised(self):
+        """Test only a concurrently recorded event counts as a duplicate, other failures reach Stripe as errors"""
+        import json
+        from unittest import mock
+        from sqlalchemy.exc import IntegrityError
+        from app import orders
+        from app.models import Order, StripeEvent
+        event = json.loads(self.event('evt_1'))
+        failure = IntegrityError('INSERT', {}, Exception('NOT NULL constraint failed'))
+        with mock.patch.dict(orders._event_handlers, {'checkout.session.completed': mock.Mock(side_effect=failure)}):
+            with self.assertRaises(IntegrityError):
+                orders.handle_event(event)
+        self.assertIsNone(db.session.get(StripeEvent, 'evt_1'))
+
+        # Another worker recorded the event between our lookup and our commit
+        recorded = StripeEvent(id='evt_1', type=event['type'])
+        with mock.patch.dict(orders._event_handlers, {'checkout.session.completed': mock.Mock(side_effect=failure)}), \
+                mock.patch.object(db.session, 'get', side_effect=[None, recorded]):
+            self.assertFalse(orders.handle_event(event))
+        self.assertEqual(Order.query.count(), 0)
+
+    def test_session_without_cart_metadata_fetches_items_in_worker(self):
+        """Test line items are fetched from Stripe by a queued job, not in the webhook"""
+        from unittest import mock
+        from app.jobs import work
+        from app.models import BackgroundJob, Order
+        self.app.config['STRIPE_SECRET_KEY'] = 'sk_test_123'
+        payload = self.event('evt_1', metadata={})
+        with mock.patch('stripe.checkout.Session.list_line_items') as list_line_items:
+            self.assertEqual(self.deliver(payload).status_code, 200)
+            list_line_items.assert_not_called()
+            self.assertEqual(BackgroundJob.query.one().kind, 'orders.fetch_line_items')
+            
+            list_line_items.return_value.auto_paging_iter.return_value = [
+                {'quantity': 3, 'price': {'unit_amount': 1100, 'product': {'metadata': {'product_id': str(self.ids[1])}}}},
+                {'quantity': 1, 'price': {'unit_amount': 500, 'product': {'metadata': {}}}}
+            ]
+            self.assertEqual(work(burst=True), 1)
+        items = Order.query.one().order_items
+        self.assertEqual([(i.product_id, i.quantity, i.price) for i in items], [(self.ids[1], 3, 11.0)])
+    
+    def test_cart_metadata_round_trip(self):
+        """Test long carts are split over metadata values Stripe accepts"""
+        from app.orders import cart_metadata, parse_cart_metadata
+        from app.checkout import resolve_cart
+        lines = resolve_cart([{'product_id': i, 'quantity': 99} for i in self.ids], 'en')
+        lines = lines * 40
+        metadata = cart_metadata(lines)
+        self.assertGreater(len(metadata), 1)
+        self.assertTrue(all(len(value) <= 500 for value in metadata.values()))
+        self.assertEqual(parse_cart_metadata(metadata),
+                         [(line.product_id, 99, line.price) for line in lines])
+
+class StripeCatalogTestCase(ServiceTestCase):
+    """Test Stripe prices are created once and reused, against a local fake Stripe server"""
+    
+    def setUp(self):
+        super().setUp()
+        from benchmarks.fake_stripe import FakeStripeServer
+        self.server = FakeStripeServer().start()
+        self.app.config['STRIPE_SECRET_KEY'] = 'sk_test_123'
+        self.app.config['STRIPE_API_BASE'] = self.server.url
+        self.create_catalog(products=3)
+        from app.models import Product
+        self.ids = [p.id for p in Product.query.order_by(Product.id)]
+    
+    def tearDown(self):
+        import stripe
+        stripe.api_base, stripe.default_http_client = 'https://api.stripe.com', None
+        self.server.stop()
+        super().tearDown()
+    
+    def calls(self, method, path):
+        return self.server.request_log.count((method, path))
+    
+    def checkout(self, *product_ids):
+        response = self.client.post('/checkout', json={'items': [{'product_id': i} for i in product_ids]})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.get_json()['session_id'].startswith('cs_test_'))
+    
+    def test_checkout_reuses_prices(self):
+        """Test prices are created on the first checkout only"""
+        for _ in range(3):
+            self.checkout(self.ids[0], self.ids[1])
+        self.assertEqual(self.calls('POST', '/v1/products'), 2)
+        self.assertEqual(self.calls('POST', '/v1/prices'), 2)
+        self.assertEqual(self.calls('POST', '/v1/checkout/sessions'), 3)
+        
+        sessions = self.server.objects.list('checkout.session')
+        prices = {price['id'] for price in self.server.objects.list('price')}
+        self.assertTrue(all(item['price'] in prices for session in sessions
+                            for item in session['line_items'].values()))
+    
+    def test_stripe_product_created_with_idempotency_key(self):
+        """Test workers creating a product's first price ask Stripe for one product"""
+        from unittest import mock
+        import stripe
+        with mock.patch.object(stripe.Product, 'create', wraps=stripe.Product.create) as create:
+            self.checkout(self.ids[0])
+        self.assertEqual(create.call_args.kwargs['idempotency_key'], f'product-{self.ids[0]}')
+
+    def test_admin_edit_keeps_untracked_price_id(self):
+        """Test saving a product keeps a price ID set before prices were tracked until its price changes"""
+        from app.models import Product
+        product = db.session.get(Product, self.ids[0])
+        product.stripe_price_id = 'price_legacy'
+        db.session.commit()
+        with self.client.session_transaction() as sess:
+            sess['admin_logged_in'] = True
+        form = {'name_uk': product.name_uk, 'name_ru': product.name_ru, 'name_de': product.name_de,
+                'name_en': product.name_en, 'price': '10.0', 'currency': 'EUR',
+                'category_id': str(product.category_id), 'is_active': 'y', 'sort_order': '0'}
+        url = f'/admin/products/edit/{product.id}'
+        self.assertEqual(self.client.post(url, data=form).status_code, 302)
+        self.assertEqual(db.session.get(Product, self.ids[0]).stripe_price_id, 'price_legacy')
+
+        self.checkout(self.ids[0])  # Creates and tracks a price for 10.00 EUR
+        self.client.post(url, data=form)
+        tracked = db.session.get(Product, self.ids[0]).stripe_price_id
+        self.assertTrue(tracked.startswith('price_') and tracked != 'price_legacy')
+
+        self.client.post(url, data=dict(form, price='12.5'))
+        self.assertIsNone(db.session.get(Product, self.ids[0]).stripe_price_id)
+
+    def test_price_change_adds_price_to_same_product(self):
+        """Test a new amount gets a new price on the existing Stripe product"""
+        from app.models import Product, StripePrice
+        self.checkout(self.ids[0])
+        db.session.get(Product, self.ids[0]).price = 19.99
+        db.session.commit()
+        self.checkout(self.ids[0])
+        self.assertEqual(self.calls('POST', '/v1/products'), 1)
+        self.assertEqual(sorted(row.unit_amount for row in StripePrice.query), [1000, 1999])
+        self.assertEqual(len({row.stripe_product_id for row in StripePrice.query}), 1)
+    
+    def test_stripe_failure_falls_back_to_price_data(self):
+        """Test checkout still works when a price cannot be created"""
+        from unittest import mock
+        import stripe
+        with mock.patch('stripe.Price.create', side_effect=stripe.error.APIConnectionError('down')):
+            self.checkout(self.ids[0])
+        session = self.server.objects.list('checkout.session')[0]
+        self.assertEqual(session['line_items']['0']['price_data']['unit_amount'], '1000')
+    
+    def test_reconcile_imports_links_and_creates(self):
+        """Test the sync command adopts prices saved on products and fills in the rest"""
+        import stripe
+        from app.models import Product
+        from app.stripe_catalog import reconcile
+        from app.stripe_client import get_stripe_client
+        client = get_stripe_client()
+        # What the admin product form used to create, without product_id metadata
+        legacy = client.create(stripe.Price, unit_amount=1000, currency='eur',
+                               product=client.create(stripe.Product, name='Product 0').id)
+        db.session.get(Product, self.ids[0]).stripe_price_id = legacy.id
+        db.session.commit()
+        
+        self.assertEqual(reconcile(), {'imported': 1, 'archived': 0, 'created': 2, 'linked': 2})
+        self.assertEqual(reconcile(), {'imported': 0, 'archived': 0, 'created': 0, 'linked': 0})
+        self.assertEqual(db.session.get(Product, self.ids[0]).stripe_price_id, legacy.id)
+        created = self.calls('POST', '/v1/prices')
+        self.checkout(*self.ids)
+        self.assertEqual(self.calls('POST', '/v1/prices'), created)
+
+    def test_archived_price_is_replaced_once(self):
+        """Test checkout after a price was archived in Stripe charges one new active price"""
+        from unittest import mock
+        import stripe
+        from app.models import Product, StripePrice
+        from app.stripe_catalog import reconcile
+        self.checkout(self.ids[0])
+        archived = StripePrice.query.one().stripe_price_id
+        self.server.objects.by_id[archived]['active'] = False
+        self.assertEqual(reconcile(create_missing=False)['archived'], 1)
+
+        with mock.patch.object(stripe.Price, 'create', wraps=stripe.Price.create) as create:
+            self.checkout(self.ids[0])
+            self.checkout(self.ids[0])
+        self.assertEqual(create.call_count, 1)
+        self.assertTrue(create.call_args.kwargs['idempotency_key'].endswith(f'-replacing-{archived}'))
+        row = StripePrice.query.one()
+        self.assertTrue(row.active)
+        self.assertNotEqual(row.stripe_price_id, archived)
+        charged = {session['line_items']['0']['price'] for session in self.server.objects.list('checkout.session')}
+        self.assertEqual(charged, {archived, row.stripe_price_id})
+
+        # A price re-activated in Stripe (or made there) takes over its key's archived row in reconcile
+        self.server.objects.by_id[row.stripe_price_id]['active'] = False
+        self.server.objects.by_id[archived]['active'] = True
+        self.assertEqual(reconcile(create_missing=False), {'imported': 1, 'archived': 1, 'created': 0, 'linked': 1})
+        self.assertEqual((StripePrice.query.one().stripe_price_id, StripePrice.query.one().active), (archived, True))
+        self.assertEqual(db.session.get(Product, self.ids[0]).stripe_price_id, archived)
+
+class StripeClientTestCase(ServiceTestCase):
+    """Test the pooled Stripe client retries, breaks the circuit and reports degraded mode"""
+    
+    def setUp(self):
+        super().setUp()
+        from benchmarks.fake_stripe import FakeStripeServer
+        self.server = FakeStripeServer().start()
+        self.app.config.update(STRIPE_SECRET_KEY='sk_test_123', STRIPE_API_BASE=self.server.url,
+                               STRIPE_RETRY_BACKOFF=0, STRIPE_MAX_RETRIES=2, STRIPE_BREAKER_THRESHOLD=3)
+        self.create_catalog(products=1)
+    
+    def tearDown(self):
+        import stripe
+        stripe.api_base, stripe.default_http_client = 'https://api.stripe.com', None
+        self.server.stop()
+        super().tearDown()
+    
+    def test_retries_reuse_idempotency_key(self):
+        """Test transient failures are retried with one idempotency key"""
+        from unittest import mock
+        import stripe
+        from app.stripe_client import get_stripe_client
+        client = get_stripe_client()
+        keys = []
+        
+        def flaky_create(**params):
+            keys.append(params['idempotency_key'])
+            if len(keys) < 3:
+                raise stripe.error.APIConnectionError('reset by peer')
+            return stripe.Price.construct_from({'id': 'price_1'}, None)
+        
+        with mock.patch.object(stripe.Price, 'create', side_effect=flaky_create):
+            self.assertEqual(client.create(stripe.Price, unit_amount=100, currency='eur').id, 'price_1')
+        self.assertEqual(len(set(keys)), 1)
+        self.assertEqual(len(keys), 3)
+        operation = client.stats()['operations']['price.create']
+        self.assertEqual((operation['ok'], operation['error'], operation['retries']), (1, 2, 2))
+        self.assertEqual(client.stats()['circuit'], 'closed')
+    
+    def test_connections_are_pooled(self):
+        """Test checkouts reuse one keep-alive connection"""
+        for _ in range(5):
+            response = self.client.post('/checkout', json={'items': [{'product_id': 1}]})
+            self.assertTrue(response.get_json()['session_id'].startswith('cs_test_'))
+        self.assertEqual(len(self.server.connections), 1)
+    
+    def test_outage_is_explicit_and_opens_circuit(self):
+        """Test checkout answers 503 instead of a fake session, then stops calling Stripe"""
+        from unittest import mock
+        import stripe
+        from app.stripe_client import get_stripe_client
+        # Resolve the price while Stripe is up, then take it down
+        self.client.post('/checkout', json={'items': [{'product_id': 1}]})
+        self.server.outage_status = 503
+        
+        response = self.client.post('/checkout', json={'items': [{'product_id': 1}]})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.get_json()['code'], 'payments_unavailable')
+        self.assertGreaterEqual(int(response.headers['Retry-After']), 1)
+        stats = get_stripe_client().stats()
+        self.assertEqual(stats['circuit'], 'open')
+        self.assertEqual(stats['operations']['checkout.session.create']['error'], 3)
+        
+        with mock.patch.object(stripe.checkout.Session, 'create') as create:
+            self.assertEqual(self.client.post('/checkout', json={'items': [{'product_id': 1}]}).status_code, 503)
+            create.assert_not_called()
+        self.assertEqual(get_stripe_client().stats()['operations']['checkout.session.create']['rejected'], 1)
+    
+    def test_declined_requests_do_not_open_circuit(self):
+        """Test Stripe answering with an error is raised as is and counts as healthy"""
+        import stripe
+        from app.stripe_client import get_stripe_client
+        client = get_stripe_client()
+        for _ in range(5):
+            with self.assertRaises(stripe.error.InvalidRequestError):
+                client.call('price.retrieve', stripe.Price.retrieve, 'price_missing')
+        self.assertEqual(client.stats()['circuit'], 'closed')
+        self.assertEqual(client.stats()['operations']['price.retrieve']['declined'], 5)
+    
+    def test_circuit_breaker_half_open(self):
+        """Test one trial call is let through after the reset timeout"""
+        import time
+        from app.stripe_client import CircuitBreaker
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual((breaker.state, breaker.allow()), ('open', False))
+        time.sleep(0.06)
+        self.assertEqual(breaker.state, 'half_open')
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'open')
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, 'closed')
+    
+    def test_status_endpoint(self):
+        """Test admins can read the circuit state and latency metrics"""
+        self.client.post('/checkout', json={'items': [{'product_id': 1}]})
+        self.assertEqual(self.client.get('/admin/stripe/status').status_code, 401)
+        with self.client.session_transaction() as session:
+            session['admin_logged_in'] = True
+        status = self.client.get('/admin/stripe/status').get_json()
+        self.assertEqual(status['circuit'], 'closed')
+        self.assertIn('p95_ms', status['operations']['checkout.session.create'])
+
+class SearchTestCase(ServiceTestCase):
+    """Test full-text search over products and posts and its incremental index updates"""
+    
+    def setUp(self):
+        super().setUp()
+        from app.models import BlogPost, User
+        self.app.config['PAGE_CACHE'] = False
+        self.create_catalog(products=0)
+        self.web = Product(name_uk='Розробка сайтів', name_ru='Разработка сайтов', name_de='Webentwicklung',
+                           name_en='Website development', description_en='Fast websites <b>built</b> for you',
+                           price=100.0, slug='web', category_id=1)
+        self.bot = Product(name_uk='Чат-бот', name_ru='Чат-бот', name_de='Chatbot', name_en='Chatbot setup',
+                           description_en='A chatbot for your website', price=50.0, slug='bot', category_id=1)
+        author = User(username='author', email='author@example.com', password_hash='-')
+        db.session.add_all([self.web, self.bot, author])
+        db.session.flush()
+        self.post = BlogPost(title='Post', title_uk='Навіщо сайт', title_ru='Зачем сайт', title_de='Warum eine Website',
+                             title_en='Why a website', content='-', content_uk='<p>Кожному магазину потрібен сайт</p>',
+                             content_ru='-', content_de='-', content_en='<p>Every shop needs a website</p>',
+                             slug='why-website', is_published=True, author_id=author.id)
+        db.session.add(self.post)
+        db.session.commit()
+    
+    def titles(self, query, **kwargs):
+        """Titles of the first page of hits"""
+        from app.search import search
+        return [hit.title for hit in search(query, kwargs.pop('language', 'en'), **kwargs).hits]
+    
+    def test_ranked_prefix_search(self):
+        """Test title matches rank first and words match as prefixes"""
+        self.assertEqual(self.titles('website')[-1], 'Chatbot setup')
+        self.assertEqual(set(self.titles('websit')), {'Website development', 'Chatbot setup', 'Why a website'})
+        self.assertEqual(self.titles('website chatbot'), ['Chatbot setup'])
+        self.assertEqual(self.titles('website', kind='post'), ['Why a website'])
+        self.assertEqual(set(self.titles('сайт', language='uk')), {'Навіщо сайт', 'Розробка сайтів'})
+        self.assertEqual(self.titles('Webentw', language='de'), ['Webentwicklung'])
+    
+    def test_query_syntax_is_not_interpreted(self):
+        """Test user input cannot inject full-text query syntax"""
+        for query in ['"website', 'website OR', 'NEAR(', '*', 'body:website', "web' & !x"]:
+            self.titles(query)
+        self.assertEqual(self.titles('   '), [])
+    
+    def test_index_follows_writes(self):
+        """Test edits, deactivation, publishing and deletes reach the index in the same commit"""
+        self.web.name_en = 'Online shop development'
+        db.session.commit()
+        self.assertEqual(self.titles('online'), ['Online shop development'])
+        self.assertNotIn('Website development', self.titles('website'))
+        
+        self.bot.is_active = False
+        self.post.is_published = False
+        db.session.commit()
+        self.assertEqual(self.titles('chatbot'), [])
+        self.assertEqual(self.titles('website', kind='post'), [])
+        
+        self.post.is_published = True
+        db.session.commit()
+        self.assertEqual(self.titles('website', kind='post'), ['Why a website'])
+        db.session.delete(self.post)
+        db.session.commit()
+        self.assertEqual(self.titles('website', kind='post'), [])
+        
+        db.session.add(Product(name_uk='Аудит', name_ru='Аудит', name_de='Audit', name_en='Website audit',
+                               price=10.0, slug='audit', category_id=1))
+        db.session.rollback()
+        self.assertEqual(self.titles('audit'), [])
+    
+    def test_rebuild_index(self):
+        """Test the index can be rebuilt from the tables"""
+        from app.search import rebuild_index
+        self.assertEqual(rebuild_index(), 3)
+        self.assertEqual(len(self.titles('websit')), 3)
+    
+    def test_api_pagination_and_snippets(self):
+        """Test /api/search pages through hits and escapes snippets around the highlights"""
+        for i in range(5):
+            db.session.add(Product(name_uk=f'Пакет {i}', name_ru=f'Пакет {i}', name_de=f'Paket {i}',
+                                   name_en=f'Website package {i}', description_en='<script>alert(1)</script> website',
+                                   price=10.0, slug=f'package-{i}', category_id=1))
+        db.session.commit()
+        first = self.client.get('/api/search?q=website&language=en&kind=product&per_page=4').get_json()
+        second = self.client.get('/api/search?q=website&language=en&kind=product&per_page=4&page=2').get_json()
+        self.assertTrue(first['has_next'])
+        self.assertFalse(second['has_next'])
+        ids = [hit['id'] for hit in first['results'] + second['results']]
+        self.assertEqual(len(ids), 7)
+        self.assertEqual(len(set(ids)), 7)
+        package = next(hit for hit in first['results'] + second['results'] if hit['title'] == 'Website package 0')
+        self.assertIn('&lt;script&gt;', package['snippet'])
+        self.assertIn('<mark>website</mark>', package['snippet'])
+        self.assertEqual(package['url'], f"/shop/product/{package['id']}")
+        
+        for query in ['language=xx', 'kind=user', 'per_page=500', 'page=0']:
+            self.assertEqual(self.client.get(f'/api/search?q=website&{query}').status_code, 400)
+    
+    def test_search_page(self):
+        """Test the search page lists hits in the visitor's language"""
+        self.client.get('/set_language/en')
+        html = self.client.get('/search?q=website').get_data(as_text=True)
+        self.assertIn('href="/blog/why-website"', html)
+        self.assertIn('<mark>', html)
+        self.assertIn('Nothing found', self.client.get('/search?q=zzz').get_data(as_text=True))
+    
+    def test_missing_index_finds_nothing(self):
+        """Test a database without the search tables answers with an empty page instead of an error"""
+        from app.search import get_backend
+        connection = db.session.connection()
+        get_backend(connection).drop(connection)
+        db.session.commit()
+        self.app.extensions.pop('search_index_ready', None)
+        self.assertEqual(self.titles('website'), [])
+        response = self.client.get('/api/search?q=website&language=en')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['results'], [])
+        self.assertEqual(self.client.get('/search?q=website').status_code, 200)
+
+class QueryPlanTestCase(ServiceTestCase):
+    """Test the storefront queries read indexes instead of scanning the large tables
+    
+    Seeds EXPLAIN_CATALOG_ROWS products (1000000 for the full-size check, smaller by
+    default to keep the suite fast), a tenth as many posts and chat threads, runs
+    ANALYZE and checks the plan of every statement the routes execute.
+    """
+    
+    LARGE_TABLES = ('products', 'blog_posts', 'chat_threads', 'homepage_blocks')
+    
+    def setUp(self):
+        super().setUp()
+        from datetime import datetime, timedelta
+        from app.models import ChatThread, HomePageBlock
+        self.app.config['PAGE_CACHE'] = False
+        rows = int(os.environ.get('EXPLAIN_CATALOG_ROWS', 20000))
+        categories = max(1, rows // 200)
+        now = datetime(2024, 1, 1)
+        db.session.execute(Category.__table__.insert(), [
+            {'name_uk': f'К{i}', 'name_ru': f'К{i}', 'name_de': f'K{i}', 'slug': f'c-{i}', 'is_active': True,
+             'sort_order': i, 'created_at': now} for i in range(categories)])
+        db.session.add(User(id=1, username='author', email='author@example.com', password_hash='-'))
+        for start in range(0, rows, 50000):
+            db.session.execute(Product.__table__.insert(), [
+                {'name_uk': f'Товар {i}', 'name_ru': f'Товар {i}', 'name_de': f'Produkt {i}', 'price': 10.0,
+                 'currency': 'EUR', 'slug': f'p-{i}', 'is_active': i % 10 != 0, 'sort_order': i % 1000,
+                 'category_id': i % categories + 1, 'created_at': now} for i in range(start, min(rows, start + 50000))])
+        db.session.execute(BlogPost.__table__.insert(), [
+            {'title': '-', 'title_uk': f'Пост {i}', 'title_ru': '-', 'title_de': '-', 'content': '-',
+             'content_uk': '-', 'content_ru': '-', 'content_de': '-', 'slug': f'post-{i}',
+             'is_published': i % 5 != 0, 'author_id': 1, 'created_at': now + timedelta(minutes=i),
+             'updated_at': now} for i in range(rows // 10)])
+        db.session.execute(ChatThread.__table__.insert(), [
+            {'session_id': f's-{i}', 'thread_id': f't-{i}', 'language': 'uk', 'is_active': True,
+             'created_at': now, 'updated_at': datetime.now() - timedelta(minutes=i)} for i in range(rows // 10)])
+        db.session.execute(HomePageBlock.__table__.insert(), [
+            {'title_uk': f'Блок {i}', 'title_ru': '-', 'title_de': '-', 'block_type': 'shop',
+             'is_active': i % 2 == 0, 'sort_order': i, 'created_at': now} for i in range(max(10, rows // 1000))])
+        db.session.commit()
+        db.session.execute(db.text('ANALYZE'))
+    
+    @contextmanager
+    def capture_statements(self):
+        """Collect (statement, parameters) of the SELECTs executed inside the block"""
+        captured = []
+        
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith(('SELECT', 'WITH')) and not executemany:
+                captured.append((statement, parameters))
+        
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            yield captured
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+    
+    def table_scans(self, captured):
+        """(table, statement) of every full scan of a large table in the statements' plans"""
+        import re
+        scans = []
+        for statement, parameters in captured:
+            plan = db.session.connection().exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).all()
+            for row in plan:
+                # "SCAN products" reads the table; "SCAN products USING INDEX ..." and "SEARCH ..." do not
+                match = re.match(r'SCAN (\w+)$', row[-1])
+                if match and match.group(1) in self.LARGE_TABLES:
+                    scans.append((match.group(1), statement))
+        return scans
+    
+    def test_storefront_queries_use_indexes(self):
+        """Test no route query falls back to a sequential scan of a large table"""
+        from app.catalog import get_catalog
+        from app.chat_sessions import expire_chat_threads
+        get_catalog()  # Reads the whole catalog once per catalog version, by design
+        with self.capture_statements() as captured:
+            for url in ['/', '/shop', '/shop/category/1', '/shop/product/2', '/blog', '/blog/post-1',
+                        '/api/products?limit=20', '/api/products?category_id=1&limit=20', '/api/products?ids=2,3',
+                        '/api/categories', '/api/search?q=product&language=uk', '/search?q=product']:
+                self.assertEqual(self.client.get(url).status_code, 200, url)
+            expire_chat_threads(days_old=365)
+        self.assertGreater(len(captured), 5)
+        self.assertEqual([s for s, _ in captured if 'FROM products' in s], [])
+        self.assertEqual(self.table_scans(captured), [])
+    
+    def test_dropped_index_is_reported(self):
+        """Test the check catches a listing query that lost its index"""
+        db.session.execute(db.text('DROP INDEX ix_blog_posts_listing'))
+        with self.capture_statements() as captured:
+            self.client.get('/blog')
+        self.assertIn('blog_posts', [table for table, _ in self.table_scans(captured)])
+
+class CatalogSnapshotTestCase(ServiceTestCase):
+    """Test the storefront reads the in-memory catalog snapshot"""
+    
+    def setUp(self):
+        super().setUp()
+        self.app.config['PAGE_CACHE'] = False
+        self.category = self.create_catalog(products=3)
+        self.ids = [p.id for p in Product.query.order_by(Product.id)]
+    
+    def test_records_are_indexed_and_read_only(self):
+        """Test lookups by id, slug and category and that records cannot be changed"""
+        from app.catalog import get_catalog
+        catalog = get_catalog()
+        product = catalog.products_by_slug['product-1']
+        self.assertIs(catalog.products[self.ids[1]], product)
+        self.assertEqual([p.id for p in catalog.products_in(self.category.id)], self.ids)
+        self.assertEqual(product.get_name('de'), 'Produkt 1')
+        self.assertEqual(product.get_description('ru'), '')  # Like the model: no ru or uk description
+        self.assertEqual(product.category.get_name('en'), 'Services')
+        with self.assertRaises(AttributeError):
+            product.price = 0
+        with self.assertRaises(AttributeError):
+            product.extra = 1
+    
+    def test_commit_swaps_in_new_snapshot(self):
+        """Test a catalog commit rebuilds the snapshot while readers keep the old one"""
+        from app.catalog import get_catalog
+        before = get_catalog()
+        self.assertIs(get_catalog(), before)
+        db.session.get(Product, self.ids[0]).is_active = False
+        db.session.commit()
+        after = get_catalog()
+        self.assertIsNot(after, before)
+        self.assertTrue(before.products[self.ids[0]].is_active)
+        self.assertEqual([p.id for p in after.active_products], self.ids[1:])
+        self.assertEqual(self.client.get(f'/shop/product/{self.ids[0]}').status_code, 200)
+        self.assertEqual(self.client.get('/shop/product/9999').status_code, 404)
+        self.assertEqual(self.client.get('/shop/category/9999').status_code, 404)
+    
+    def test_storefront_pages_run_no_catalog_queries(self):
+        """Test catalog pages, the API and the chatbot context are served from memory"""
+        from app.utils import get_catalog_context
+        urls = ['/shop', f'/shop/category/{self.category.id}', f'/shop/product/{self.ids[1]}',
+                '/api/categories', '/api/products', f'/api/products?category_id={self.category.id}&limit=2']
+        self.client.get('/set_language/en')
+        for url in urls:
+            self.client.get(url)
+        get_catalog_context('en', 'product')
+        with self.count_queries() as statements:
+            for url in urls:
+                self.assertEqual(self.client.get(url).status_code, 200, url)
+            self.assertIn('Product 2', get_catalog_context('en', 'product 2')['product_info'])
+        self.assertEqual([s for s in statements if 'FROM products' in s or 'FROM categories' in s], [])
+        html = self.client.get(f'/shop/product/{self.ids[1]}').get_data(as_text=True)
+        self.assertIn('Product 0', html)  # Related products
+
+class SingleFlightTestCase(ServiceTestCase):
+    """Test expensive cached values are rebuilt by one request while the others get the stale copy"""
+    
+    def setUp(self):
+        super().setUp()
+        from app.single_flight import get_single_flight
+        self.category = self.create_catalog()
+        self.flight = get_single_flight()
+        self.flight.wait = 2
+    
+    def run_in_threads(self, count, target):
+        import threading
+        results, barrier = [None] * count, threading.Barrier(count)
+        
+        def run(index):
+            with self.app.app_context():
+                barrier.wait()
+                results[index] = target()
+        
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+    
+    def test_concurrent_misses_build_once(self):
+        """Test concurrent lookups of a missing value wait for a single build"""
+        import time
+        builds = []
+        
+        def build():
+            builds.append(1)
+            time.sleep(0.2)
+            return 'value'
+        
+        results = self.run_in_threads(8, lambda: self.flight.get('test', 'key', 'v1', build))
+        self.assertEqual(len(builds), 1)
+        self.assertEqual({value for value, _, _ in results}, {'value'})
+        self.assertEqual(sorted(outcome for _, _, outcome in results), ['computed'] + ['waited'] * 7)
+        stats = self.flight.stats.stats()['namespaces']['test']
+        self.assertAlmostEqual(stats['coalescing_ratio'], 7 / 8)
+    
+    def test_stale_value_served_during_rebuild(self):
+        """Test lookups of a new version get the old value until the rebuild is stored"""
+        import threading
+        self.flight.get('test', 'key', 'v1', lambda: 'old')
+        started, release = threading.Event(), threading.Event()
+        
+        def slow_build():
+            started.set()
+            release.wait(5)
+            return 'new'
+        
+        def rebuild():
+            with self.app.app_context():
+                self.flight.get('test', 'key', 'v2', slow_build)
+        
+        thread = threading.Thread(target=rebuild)
+        thread.start()
+        started.wait(5)
+        self.assertEqual(self.flight.get('test', 'key', 'v2', lambda: self.fail('rebuilt twice')),
+                         ('old', 'v1', 'stale'))
+        release.set()
+        thread.join()
+        self.assertEqual(self.flight.get('test', 'key', 'v2', lambda: 'again'), ('new', 'v2', 'fresh'))
+    
+    def test_lock_held_by_another_worker(self):
+        """Test the lock in the shared store keeps this worker from rebuilding too"""
+        from app.extensions import cache
+        self.flight.get('test', 'key', 'v1', lambda: 'old')
+        self.assertTrue(cache.store.add('flight-lock:test:key', 'other-worker', 30))
+        self.assertEqual(self.flight.get('test', 'key', 'v2', lambda: 'new')[2], 'stale')
+        # Nothing to serve: wait for the other worker, then build it here when it never delivers
+        self.flight.wait = 0.1
+        self.assertEqual(self.flight.get('test', 'other', 'v1', lambda: 'built')[2], 'computed')
+        cache.store.delete('flight-lock:test:key')
+        self.assertEqual(self.flight.get('test', 'key', 'v2', lambda: 'new'), ('new', 'v2', 'computed'))
+    
+    def test_page_is_stale_while_another_worker_renders(self):
+        """Test a page keeps its previous body and ETag while its re-render is locked elsewhere"""
+        from app.extensions import cache
+        first = self.client.get('/shop')
+        product = Product.query.filter_by(slug='product-0').first()
+        product.name_uk = 'Оновлений товар'
+        db.session.commit()
+        with self.app.test_request_context('/shop'):
+            from app.page_cache import LAYOUT_NAMESPACES, _page_key
+            page_key, _ = _page_key(('catalog',) + LAYOUT_NAMESPACES, ())
+        cache.store.add(f'flight-lock:pages:{page_key}', 'other-worker', 30)
+        stale = self.client.get('/shop')
+        self.assertEqual(stale.headers['X-Page-Cache'], 'stale')
+        self.assertEqual(stale.headers['ETag'], first.headers['ETag'])
+        cache.store.delete(f'flight-lock:pages:{page_key}')
+        self.assertEqual(self.client.get('/shop').headers['X-Page-Cache'], 'miss')
+        self.assertEqual(self.client.get('/shop').headers['X-Page-Cache'], 'hit')
+        # Error pages are returned but never stored
+        self.assertEqual(self.client.get('/shop/category/9999').status_code, 404)
+        self.assertEqual(self.client.get('/shop/category/9999').status_code, 404)
+    
+    def test_file_store_add_is_exclusive(self):
+        """Test the filesystem lock is taken once until it expires"""
+        import time
+        from app.cache import FileStore
+        with tempfile.TemporaryDirectory() as directory:
+            store = FileStore(directory)
+            self.assertTrue(store.add('lock', 1, ttl=0.05))
+            self.assertFalse(store.add('lock', 2, ttl=0.05))
+            time.sleep(0.1)
+            self.assertTrue(store.add('lock', 3, ttl=30))
+            self.assertEqual(store.get('lock'), 3)
+    
+    def test_admin_status_reports_ratios(self):
+        """Test the admin endpoint reports this worker's outcomes"""
+        self.client.get('/shop')
+        self.client.get('/shop')
+        self.assertEqual(self.client.get('/admin/cache/status').status_code, 401)
+        with self.client.session_transaction() as sess:
+            sess['admin_logged_in'] = True
+        pages = self.client.get('/admin/cache/status').get_json()['namespaces']['pages']
+        self.assertEqual((pages['fresh'], pages['computed'], pages['hit_ratio']), (1, 1, 0.5))
+
+class MetricsTestCase(ServiceTestCase):
+    """Test requests, SQL, OpenAI, Stripe and cache lookups are exposed on /metrics"""
+    
+    def setUp(self):
+        super().setUp()
+        self.create_catalog(products=1)
+    
+    def sample(self, name, **labels):
+        from prometheus_client import REGISTRY
+        return REGISTRY.get_sample_value(name, labels) or 0.0
+    
+    def test_requests_and_their_sql_are_timed(self):
+        """Test each request observes its latency and the statements it ran"""
+        labels = {'endpoint': 'main.shop', 'method': 'GET', 'status': '200'}
+        requests = self.sample('http_request_duration_seconds_count', **labels)
+        observed = self.sample('db_queries_per_request_count', endpoint='main.shop')
+        queries = self.sample('db_queries_per_request_sum', endpoint='main.shop')
+        self.client.get('/shop')  # Renders the page and builds the catalog snapshot
+        self.client.get('/shop')
+        self.assertEqual(self.sample('http_request_duration_seconds_count', **labels), requests + 2)
+        self.assertEqual(self.sample('db_queries_per_request_count', endpoint='main.shop'), observed + 2)
+        self.assertGreater(self.sample('db_queries_per_request_sum', endpoint='main.shop'), queries)
+        unmatched = {'endpoint': 'unmatched', 'method': 'GET', 'status': '404'}
+        missing = self.sample('http_request_duration_seconds_count', **unmatched)
+        self.client.get('/no-such-page')
+        self.assertEqual(self.sample('http_request_duration_seconds_count', **unmatched), missing + 1)
+        body = self.client.get('/metrics').get_data(as_text=True)
+        self.assertIn('http_request_duration_seconds_bucket{endpoint="main.shop"', body)
+        self.assertIn('cache_lookups_total{cache="pages",outcome="fresh"}', body)
+    
+    def test_openai_calls_record_latency_and_tokens(self):
+        """Test content generation and chatbot completions count their tokens"""
+        from benchmarks.fake_openai import FakeOpenAIServer
+        from app.chatbot_engine import process_request
+        from app.content_generator import ContentGenerator
+        server = FakeOpenAIServer(reply_template='Three word reply').start()
+        try:
+            self.app.config.update(OPENAI_API_KEY='sk-test', OPENAI_API_BASE=server.url)
+            calls = self.sample('openai_request_duration_seconds_count', caller='content_generator',
+                                operation='chat', outcome='ok')
+            prompt = self.sample('openai_tokens_total', caller='content_generator', kind='prompt')
+            completion = self.sample('openai_tokens_total', caller='chatbot', kind='completion')
+            ContentGenerator()._chat([{'role': 'user', 'content': 'Hi'}])
+            process_request({'message': 'Hi'}, api_key='sk-test', api_base=server.url)
+        finally:
+            server.stop()
+        self.assertEqual(self.sample('openai_request_duration_seconds_count', caller='content_generator',
+                                     operation='chat', outcome='ok'), calls + 1)
+        self.assertEqual(self.sample('openai_tokens_total', caller='content_generator', kind='prompt'), prompt + 10)
+        self.assertEqual(self.sample('openai_tokens_total', caller='chatbot', kind='completion'), completion + 3)
+    
+    def test_checkout_records_stripe_latency(self):
+        """Test the checkout session call is timed by outcome"""
+        import stripe
+        from benchmarks.fake_stripe import FakeStripeServer
+        server = FakeStripeServer().start()
+        labels = {'operation': 'checkout.session.create', 'outcome': 'ok'}
+        try:
+            self.app.config.update(STRIPE_SECRET_KEY='sk_test_123', STRIPE_API_BASE=server.url)
+            before = self.sample('stripe_request_duration_seconds_count', **labels)
+            response = self.client.post('/checkout', json={'items': [{'product_id': 1}]})
+            self.assertTrue(response.get_json()['session_id'].startswith('cs_test_'))
+        finally:
+            stripe.api_base, stripe.default_http_client = 'https://api.stripe.com', None
+            server.stop()
+        self.assertEqual(self.sample('stripe_request_duration_seconds_count', **labels), before + 1)
+    
+    def test_workers_are_summed_from_multiprocess_files(self):
+        """Test /metrics adds up the values every worker wrote to the shared directory"""
+        import subprocess
+        import sys
+        from unittest import mock
+        from prometheus_client.parser import text_string_to_metric_families
+        script = 'from app.metrics import count_cache; count_cache("pages", "stale")'
+        with tempfile.TemporaryDirectory() as directory:
+            for _ in range(2):
+                subprocess.run([sys.executable, '-c', script], check=True, cwd=os.path.dirname(__file__) or '.',
+                               env={**os.environ, 'PROMETHEUS_MULTIPROC_DIR': directory},
+                               stdout=subprocess.DEVNULL)
+            with mock.patch.dict(os.environ, {'PROMETHEUS_MULTIPROC_DIR': directory}):
+                body = self.client.get('/metrics').get_data(as_text=True)
+        samples = {(s.name, tuple(sorted(s.labels.items()))): s.value
+                   for family in text_string_to_metric_families(body) for s in family.samples}
+        self.assertEqual(samples[('cache_lookups_total', (('cache', 'pages'), ('outcome', 'stale')))], 2)
+    
+    def test_token_protects_endpoint(self):
+        """Test METRICS_TOKEN requires a bearer token"""
+        self.app.config['METRICS_TOKEN'] = 'secret'
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        response = self.client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain'))
+
+    def test_endpoint_needs_token_when_required(self):
+        """Test production does not serve /metrics without METRICS_TOKEN"""
+        from unittest import mock
+        from config import ProductionConfig, TestingConfig
+        self.assertTrue(ProductionConfig.METRICS_TOKEN_REQUIRED)
+        with mock.patch.object(TestingConfig, 'METRICS_TOKEN_REQUIRED', True):
+            with self.assertLogs(level='WARNING') as logs:
+                app = create_app('testing')
+            self.assertEqual(app.test_client().get('/metrics').status_code, 404)
+            self.assertIn('METRICS_TOKEN not set', '\n'.join(logs.output))
+            with mock.patch.object(TestingConfig, 'METRICS_TOKEN', 'secret'):
+                app = create_app('testing')
+            response = app.test_client().get('/metrics', headers={'Authorization': 'Bearer secret'})
+            self.assertEqual(response.status_code, 200)
+
+class QueryBudgetTestCase(ServiceTestCase):
+    """Test every page stays within its SQL budget and runs no statement per row (N+1)"""
+    
+    # Statements of a first, uncached request once the worker holds the catalog snapshot and footer links
+    BUDGETS = (
+        ('/', 2),
+        ('/blog', 1),
+        ('/blog/post-1', 2),
+        ('/shop', 0),
+        ('/shop/category/1', 0),
+        ('/shop/product/1', 0),
+        ('/search?q=post', 1),
+        ('/api/products', 0),
+        ('/api/categories', 0),
+        ('/api/search?q=post', 1),
+    )
+    ADMIN_BUDGETS = (
+        ('/admin/', 4),
+        ('/admin/blog', 1),
+        ('/admin/products', 1),
+        ('/admin/categories', 1),
+    )
+    
+    def setUp(self):
+        super().setUp()
+        from app.catalog import get_catalog
+        from app.models import HomePageBlock, SocialLink
+        from app.page_cache import get_footer_links
+        self.create_catalog(products=5)
+        for i in range(3):
+            author = User(username=f'author{i}', email=f'author{i}@example.com', password_hash='-')
+            db.session.add(author)
+            db.session.flush()
+            db.session.add(BlogPost(title=f'Post {i}', title_uk=f'Пост {i}', title_ru=f'Пост {i}',
+                                    title_de=f'Beitrag {i}', title_en=f'Post {i}', content='-',
+                                    content_uk='<p>Текст</p>', content_ru='-', content_de='-',
+                                    slug=f'post-{i}', is_published=True, author_id=author.id))
+        db.session.add(HomePageBlock(block_type='blog', title_uk='Блог', title_ru='Блог', title_de='Blog'))
+        db.session.add(SocialLink(name='Telegram', url='https://t.me/example'))
+        db.session.commit()
+        # A preloaded worker already holds these
+        get_catalog()
+        get_footer_links()
+    
+    def test_public_pages_stay_within_budget(self):
+        """Test public pages and API endpoints"""
+        for url, budget in self.BUDGETS:
+            with self.subTest(url=url):
+                self.assert_query_budget(url, budget)
+    
+    def test_admin_pages_stay_within_budget(self):
+        """Test admin lists load their relations with the rows"""
+        with self.client.session_transaction() as sess:
+            sess['admin_logged_in'] = True
+        for url, budget in self.ADMIN_BUDGETS:
+            with self.subTest(url=url):
+                self.assert_query_budget(url, budget)
+    
+    def test_repeated_statements_are_logged_with_template_line(self):
+        """Test a lazy load per row is reported with the template that triggered it"""
+        from flask import render_template
+        with self.app.test_request_context('/admin/blog'):
+            self.app.preprocess_request()
+            render_template('admin/blog.html', posts=BlogPost.query.all())
+            with self.assertLogs(self.app.logger, 'WARNING') as logs:
+                self.app.process_response(self.app.response_class())
+        source = self.app.jinja_env.loader.get_source(self.app.jinja_env, 'admin/blog.html')[0]
+        line = next(i for i, text in enumerate(source.splitlines(), 1) if 'post.author' in text)
+        self.assertIn('3x SELECT users.id', logs.output[0])
+        self.assertIn(f'templates/admin/blog.html:{line} in block_content', logs.output[0])
+    
+    def test_unique_slug_reads_taken_slugs_once(self):
+        """Test the first free suffix is found with one query"""
+        from app.utils import unique_slug
+        for slug in ('services-1', 'services-2', 'services-10'):
+            db.session.add(Category(name_uk=slug, name_ru=slug, name_de=slug, slug=slug))
+        db.session.commit()
+        with self.count_queries() as statements:
+            self.assertEqual(unique_slug(Category, 'services'), 'services-3')
+        self.assertEqual(len(statements), 1)
+        category = Category.query.filter_by(slug='services').first()
+        self.assertEqual(unique_slug(Category, 'services', exclude_id=category.id), 'services')
+        self.assertEqual(unique_slug(Category, 'consulting'), 'consulting')
+
 if __name__ == '__main__':
     # Run tests
     unittest.main(verbosity=2)
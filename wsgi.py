@@ -1,6 +1,11 @@
 from app import create_app
+from app.catalog import warm_catalog
 
 app = create_app()
 
+# gunicorn loads this module once in the master (preload_app = True): workers fork with the catalog built
+if app.config.get('CATALOG_PRELOAD'):
+    warm_catalog(app)
+
 if __name__ == "__main__":
     app.run()